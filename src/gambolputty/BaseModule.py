@@ -9,6 +9,12 @@ import ConfigurationValidator
 import Utils
 from  functools import wraps
 
+# Conditional imports for python2/3
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
+
 
 class BaseModule:
     """
@@ -97,8 +103,9 @@ class BaseModule:
                         if self.dynamic_var_regex.search(_key) or self.dynamic_var_regex.search(_value):
                             new_key = self.dynamic_var_regex.sub(r"%(\1)s", _key)
                             new_value = self.dynamic_var_regex.sub(r"%(\1)s", _value)
+                            if new_key != _key:
+                                del value[_key]
                             value[new_key] = new_value
-                            del value[_key]
                             contains_placeholder = True
                     except:
                         pass
@@ -186,13 +193,20 @@ class BaseModule:
         return filterd_receivers
 
     def initAfterFork(self):
+        # Make sure each worker creates its own event ids.
+        if hasattr(self, 'event_factory'):
+            self.event_factory.initEventIds()
         # Wrap queue with BufferedQueue. This is done here since the buffer uses a thread to flush buffer in
         # given intervals. The thread will not survive a fork of the main process. So we need to start this
         # after the fork was executed.
+        self.wrapReceiverQueues()
+
+    def wrapReceiverQueues(self):
+        # Queues to thread pools in the same process do not need to be buffered.
         for receiver_name, receiver in self.receivers.items():
-            if hasattr(receiver, 'put'):
+            if hasattr(receiver, 'put') and not isinstance(receiver, (Queue.Queue, Utils.BufferedQueue)):
                 #print("Adding buffered queue for %s" % receiver_name)
-                self.receivers[receiver_name] = Utils.BufferedQueue(receiver, self.gp.queue_buffer_size)
+                self.receivers[receiver_name] = Utils.BufferedQueue(receiver, self.gp.queue_buffer_size, self.gp.queue_encoding == 'columns', self.gp.queue_max_latency)
 
     def commonActions(self, event):
         #if not self.input_filter or self.input_filter_matched:
@@ -210,6 +224,8 @@ class BaseModule:
         receivers = self.receivers if not self.output_filters else self.getFilteredReceivers(event)
         if not receivers:
             return
+        if self.module_type == "input" and self.gp.event_log:
+            self.gp.event_log.append([event])
         if(apply_common_actions):
             event = self.commonActions(event)
         if len(receivers) > 1:
@@ -223,10 +239,70 @@ class BaseModule:
                 receiver.put(event if not copy_event else event_clone.copy())
             copy_event = True
 
+    def sendEventBatch(self, events, apply_common_actions=True):
+        """
+        Send a list of events to the receivers.
+
+        If there is only one receiver and no output filter is configured, the whole batch is passed on in one call.
+        Otherwise each event will be sent via sendEvent.
+        """
+        if not self.receivers:
+            return
+        if self.output_filters or len(self.receivers) > 1:
+            for event in events:
+                self.sendEvent(event, apply_common_actions)
+            return
+        if self.module_type == "input" and self.gp.event_log:
+            self.gp.event_log.append(events)
+        if apply_common_actions:
+            events = [self.commonActions(event) for event in events]
+        receiver = self.receivers.values()[0]
+        self.logger.debug("Sending %s events from %s to %s" % (len(events), self, receiver))
+        if hasattr(receiver, 'receiveEventBatch'):
+            receiver.receiveEventBatch(events)
+        elif hasattr(receiver, 'receiveEvent'):
+            for event in events:
+                receiver.receiveEvent(event)
+        else:
+            for event in events:
+                receiver.put(event)
+
     def receiveEvent(self, event):
         for event in self.handleEvent(event):
             self.sendEvent(event)
 
+    def acknowledgeEvents(self, events):
+        """
+        Output modules call this after events were stored successfully.
+        If an EventBuffer is configured, the events will not be requeued on the next start.
+        """
+        if self.gp.event_log:
+            self.gp.event_log.acknowledge(self.getModuleId(), events)
+
+    def acknowledgeBufferedEvents(self, buffered_data):
+        """
+        Acknowledge callback for buffers of sinks that store formatted data. These buffer (data, event) tuples,
+        so the events can be acknowledged after the data was stored.
+        """
+        self.acknowledgeEvents([item[-1] for item in buffered_data])
+
+    def getModuleId(self):
+        return self.getConfigurationValue('id') or self.__class__.__name__
+
+    def getSpillPath(self):
+        """Directory for events spilled to disk by this module. Each process gets its own."""
+        return os.path.join(self.getConfigurationValue('spill_path'), "%s_%s" % (self.getModuleId(), self.gp.worker_index))
+
+    def releaseSpill(self):
+        """Close the spill directory of the buffer, so a new instance of this module can take over the spilled events."""
+        buffer = getattr(self, 'buffer', None)
+        if isinstance(buffer, Utils.Buffer):
+            buffer.disableSpill()
+
+    def receiveEventBatch(self, events):
+        for event in events:
+            self.receiveEvent(event)
+
     def wrapReceiveEventWithFilter(self, event_filter):
         wrapped_func = self.receiveEvent
         @wraps(wrapped_func)
@@ -1,8 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
 import multiprocessing
-import msgpack
 import signal
+import threading
 import Utils
 import BaseModule
 
@@ -16,7 +16,7 @@ class BaseMultiProcessModule(BaseModule.BaseModule, multiprocessing.Process): #
     id: Id of the module. If multiple instances of the same modules are used, id can be used to reference the correct receiver.
     filter: Filter expression to apply to incoming events. If filter succeeds, module will handle the event, else
             the event will be passed to next module unchanged.
-    pool_size: How many processes should be spawned.
+    pool_size: How many processes should be spawned. These processes only run this module, see GambolPutty.runWorkers.
     queue_size: How many events may be waiting in queue.
     queue_buffer_size: How many events will be buffered before sending them to queue.
 
@@ -49,13 +49,23 @@ class BaseMultiProcessModule(BaseModule.BaseModule, multiprocessing.Process): #
     def getInputQueue(self):
         return self.input_queue
 
+    def getPoolSize(self):
+        return self.getConfigurationValue('pool_size')
+
+    def getPoolType(self):
+        return 'process'
+
+    def start(self):
+        # GambolPutty already forked the pool processes. Just poll the input queue in this process.
+        worker = threading.Thread(target=self.run)
+        worker.daemon = True
+        worker.start()
+
     def pollQueue(self, block=True, timeout=None):
         try:
             packed_data = self.input_queue.get(block, timeout)
-            events = msgpack.unpackb(packed_data)
-            # After msgpack.uppackb we just have a normal dict. Cast this to KeyDotNotationDict.
-            for event in events:
-                yield Utils.KeyDotNotationDict(event)
+            for event in Utils.unpackEvents(packed_data):
+                yield event
         except (KeyboardInterrupt, SystemExit, ValueError, OSError):
             # Keyboard interrupt is catched in GambolPuttys main run method.
             # This will take care to shutdown all running modules.
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import pprint
-import msgpack
 import threading
 import Utils
 import BaseModule
@@ -20,6 +19,10 @@ class BaseThreadedModule(BaseModule.BaseModule, threading.Thread):
     If you happen to override one of the methods defined here, be sure to know what you
     are doing ;) You have been warned...
 
+    pool_size: Number of threads or processes to run this module in. If set, the module gets its own input queue.
+    pool_type: thread: Start pool_size threads polling the input queue in each process the module runs in.
+               process: Run the module in pool_size dedicated processes, independent of the number of workers.
+
     Configuration template:
 
     - module: SomeModuleName
@@ -28,6 +31,8 @@ class BaseThreadedModule(BaseModule.BaseModule, threading.Thread):
        add_fields:                       # <default: {}; type: dict; is: optional>
        delete_fields:                    # <default: []; type: list; is: optional>
        event_type:                       # <default: None; type: None||string; is: optional>
+       pool_size:                        # <default: None; type: None||integer; is: optional>
+       pool_type:                        # <default: 'thread'; type: string; values: ['thread', 'process']; is: optional>
        queue_size:                       # <default: 20; type: integer; is: optional>
        receivers:
          - ModuleName
@@ -47,13 +52,30 @@ class BaseThreadedModule(BaseModule.BaseModule, threading.Thread):
     def getInputQueue(self):
         return self.input_queue
 
+    def getPoolSize(self):
+        return self.getConfigurationValue('pool_size')
+
+    def getPoolType(self):
+        return self.getConfigurationValue('pool_type')
+
+    def start(self):
+        threading.Thread.start(self)
+        if self.getPoolType() != 'thread' or not self.getPoolSize():
+            return
+        for _ in xrange(1, self.getPoolSize()):
+            worker = threading.Thread(target=self.run)
+            worker.daemon = True
+            worker.start()
+
     def pollQueue(self, block=True, timeout=None):
         try:
             packed_data = self.input_queue.get(block, timeout)
-            events = msgpack.unpackb(packed_data)
-            # After msgpack.uppackb we just have a normal dict. Cast this to KeyDotNotationDict.
-            for event in events:
-                yield Utils.KeyDotNotationDict(event)
+            # Events sent from the same process are passed unserialized.
+            if isinstance(packed_data, dict):
+                yield packed_data
+                return
+            for event in Utils.unpackEvents(packed_data):
+                yield event
         except (KeyboardInterrupt, SystemExit, ValueError, OSError):
             # Keyboard interrupt is catched in GambolPuttys main run method.
             # This will take care to shutdown all running modules.
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import Utils
+
+
+class BufferedKeyValueStore(object):
+    """
+    Mixin for the key/value store modules RedisStore and KeyValueStore.
+
+    Packs and unpacks values with msgpack and provides buffered writes. enableBuffer replaces set, get, getMany,
+    delete and pop of the module with buffered versions. Values are indexed by key and passed to
+    storeBufferedValues in batches, grouped by ttl. Only the latest value of a key is sent, until then reads
+    return the buffered value. The index is shared with the flush thread of the buffer and guarded by a lock.
+
+    Modules using the buffer have to implement storeBufferedValues(values_by_ttl), returning True once the
+    values were stored.
+    """
+
+    def packValue(self, key, value):
+        try:
+            return Utils.packValue(value)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not store %s:%s in redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
+            raise
+
+    def unpackValue(self, key, value):
+        try:
+            return Utils.unpackValue(value)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not unpack %s:%s from redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
+            raise
+
+    def enableBuffer(self, flush_size, interval, maxsize):
+        # Index of buffered values by key, the latest value of a key wins.
+        self.buffered_values = {}
+        self.buffered_values_lock = threading.Lock()
+        self.set_buffer = Utils.Buffer(flush_size, self.setBufferedCallback, interval, maxsize=maxsize)
+        self._set = self.set
+        self.set = self.setBuffered
+        self._get = self.get
+        self.get = self.getBuffered
+        self._delete = self.delete
+        self.delete = self.deleteBuffered
+        self._pop = self.pop
+        self.pop = self.popBuffered
+        self._getMany = self.getMany
+        self.getMany = self.getManyBuffered
+
+    def setBuffered(self, key, value, ttl=0, pickle=True):
+        if pickle is True:
+            value = self.packValue(key, value)
+        buffered_value = {'key': key, 'ttl': ttl, 'value': value, 'packed': pickle is True}
+        with self.buffered_values_lock:
+            # Only the latest buffered value of a key is sent.
+            previous_value = self.buffered_values.get(key)
+            if previous_value:
+                previous_value['deleted'] = True
+            self.buffered_values[key] = buffered_value
+        self.set_buffer.append(buffered_value)
+
+    def setBufferedCallback(self, values):
+        # Deleted values are skipped.
+        values_by_ttl = {}
+        with self.buffered_values_lock:
+            for value in values:
+                if not value.get('deleted'):
+                    values_by_ttl.setdefault(value['ttl'], {})[value['key']] = value['value']
+        if not self.storeBufferedValues(values_by_ttl):
+            return False
+        with self.buffered_values_lock:
+            for value in values:
+                if self.buffered_values.get(value['key']) is value:
+                    del self.buffered_values[value['key']]
+        return True
+
+    def storeBufferedValuesInRedis(self, client, values_by_ttl):
+        """Send values with the same ttl with one MSET, all in one pipeline."""
+        pipe = client.pipeline(transaction=False)
+        for ttl, ttl_values in values_by_ttl.iteritems():
+            pipe.mset(ttl_values)
+            if ttl:
+                for key in ttl_values:
+                    pipe.expire(key, ttl)
+        try:
+            pipe.execute()
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not flush buffer. Exception: %s, Error: %s." % (etype, evalue))
+            return False
+        return True
+
+    def getBufferedValue(self, buffered_value, unpickle):
+        if buffered_value.get('deleted'):
+            return None
+        if unpickle and buffered_value['packed']:
+            return self.unpackValue(buffered_value['key'], buffered_value['value'])
+        return buffered_value['value']
+
+    def getBuffered(self, key, unpickle=True):
+        with self.buffered_values_lock:
+            buffered_value = self.buffered_values.get(key)
+        if buffered_value is None:
+            return self._get(key, unpickle)
+        return self.getBufferedValue(buffered_value, unpickle)
+
+    def getManyBuffered(self, keys, unpickle=True):
+        with self.buffered_values_lock:
+            buffered_values = dict((key, self.buffered_values[key]) for key in keys if key in self.buffered_values)
+        missing_keys = [key for key in keys if key not in buffered_values]
+        stored_values = dict(zip(missing_keys, self._getMany(missing_keys, unpickle)))
+        return [stored_values[key] if key in stored_values else self.getBufferedValue(buffered_values[key], unpickle) for key in keys]
+
+    def deleteBuffered(self, key):
+        with self.buffered_values_lock:
+            buffered_value = self.buffered_values.pop(key, None)
+            if buffered_value:
+                # The value is skipped when the buffer is flushed. A value sent before may still be stored.
+                buffered_value['deleted'] = True
+        self._delete(key)
+
+    def popBuffered(self, key, unpickle=True):
+        with self.buffered_values_lock:
+            buffered_value = self.buffered_values.pop(key, None)
+            if buffered_value:
+                buffered_value['deleted'] = True
+        if buffered_value is None:
+            return self._pop(key, unpickle)
+        self._delete(key)
+        if unpickle and buffered_value['packed']:
+            return self.unpackValue(key, buffered_value['value'])
+        return buffered_value['value']
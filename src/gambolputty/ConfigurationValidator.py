@@ -10,7 +10,16 @@ else:
 
 yaml_valid_config_template = {
     'Global': {'types': [dict],
-               'fields': {'workers': {'types': [int]}}},
+               'fields': {'workers': {'types': [int]},
+                          'queue_size': {'types': [int]},
+                          'queue_buffer_size': {'types': [int]},
+                          'queue_encoding': {'types': [str], 'values': ['rows', 'columns']},
+                          'queue_max_latency': {'types': [int, float]},
+                          'max_workers': {'types': [int]},
+                          'autoscale_interval': {'types': [int, float]},
+                          'cpu_affinity': {'types': [bool]},
+                          'master_cpus': {'types': [list]},
+                          'numa_aware': {'types': [bool]}}},
     'Module': {'types': [dict,str],
                'fields':  { 'id': {'types': [str]},
                             'filter': {'types': [str]},
@@ -40,7 +49,7 @@ class ConfigurationValidator():
       is: required if tls is True else optional
     """
 
-    default_module_config_keys = ('module', 'id', 'filter', 'receivers', 'pool_size', 'queue_size', 'mp_queue_buffer_size','redis_store', 'redis_key', 'redis_ttl', 'add_fields', 'delete_fields', 'event_type')
+    default_module_config_keys = ('module', 'id', 'filter', 'receivers', 'pool_size', 'pool_type', 'queue_size', 'mp_queue_buffer_size','redis_store', 'redis_key', 'redis_ttl', 'add_fields', 'delete_fields', 'event_type')
 
     @classmethod
     def validateConfiguration(self, configuration_data):
@@ -81,10 +90,13 @@ class ConfigurationValidator():
             if type(item) not in item_template['types']:
                 error_msg = "'%s' not of correct datatype. Is: %s, should be: %s. Please check your configuration." % (path, type(item), item_template['types'])
                 configuration_errors.append(error_msg)
+            if 'values' in item_template and item not in item_template['values']:
+                error_msg = "'%s' has invalid value. Is: %s, should be one of: %s. Please check your configuration." % (path, item, item_template['values'])
+                configuration_errors.append(error_msg)
             if type(item) is dict:
                 for field_key, field_value in item.items():
-                    path = "%s.%s" % (path, field_key)
-                    field_configuration_errors = self.validateConfigurationItem(field_key, field_value, path, template=item_template['fields'])
+                    field_path = "%s.%s" % (path, field_key)
+                    field_configuration_errors = self.validateConfigurationItem(field_key, field_value, field_path, template=item_template['fields'])
                     for field_configuration_error in field_configuration_errors:
                         configuration_errors.append(field_configuration_error)
         return configuration_errors
@@ -2,6 +2,8 @@
 # -*- coding: UTF-8 -*-
 from __future__ import print_function
 import pprint
+import copy
+import errno
 import Utils
 import multiprocessing
 import sys
@@ -14,6 +16,8 @@ import yaml
 import tornado.ioloop
 from collections import OrderedDict
 import ConfigurationValidator
+import StatisticCollector
+import Decorators
 
 # Conditional imports for python2/3
 try:
@@ -69,6 +73,11 @@ class GambolPutty():
         self.path_to_config_file = path_to_config_file
         self.alive = False
         self.child_processes = []
+        self.worker_pids = []
+        self.worker_spawner = None
+        self.process_groups = ['master', 'workers']
+        self.worker_index = 0
+        self.event_log = None
         self.main_process_pid = os.getpid()
         self.modules = OrderedDict()
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -136,15 +145,38 @@ class GambolPutty():
         self.workers = multiprocessing.cpu_count() - 1
         self.queue_size = 20
         self.queue_buffer_size = 50
+        self.queue_encoding = 'rows'
+        self.queue_max_latency = 1
+        self.max_workers = 0
+        self.autoscale_interval = 10
+        self.cpu_affinity = False
+        self.master_cpus = [0]
+        self.numa_aware = False
+        self.global_configuration = {}
         for idx, configuration in enumerate(self.configuration):
             if 'Global' in configuration:
                 configuration = configuration['Global']
+                self.global_configuration = copy.deepcopy(configuration)
                 if 'workers' in configuration:
                     self.workers = configuration['workers']
                 if 'queue_size' in configuration:
                     self.queue_size = configuration['queue_size']
                 if 'queue_buffer_size' in configuration:
                     self.queue_buffer_size = configuration['queue_buffer_size']
+                if 'queue_encoding' in configuration:
+                    self.queue_encoding = configuration['queue_encoding']
+                if 'queue_max_latency' in configuration:
+                    self.queue_max_latency = configuration['queue_max_latency']
+                if 'max_workers' in configuration:
+                    self.max_workers = configuration['max_workers']
+                if 'autoscale_interval' in configuration:
+                    self.autoscale_interval = configuration['autoscale_interval']
+                if 'cpu_affinity' in configuration:
+                    self.cpu_affinity = configuration['cpu_affinity']
+                if 'master_cpus' in configuration:
+                    self.master_cpus = configuration['master_cpus']
+                if 'numa_aware' in configuration:
+                    self.numa_aware = configuration['numa_aware']
                 self.configuration.pop(idx)
                 break
 
@@ -235,53 +267,116 @@ class GambolPutty():
                 self.shutDown()
             module_info['configuration']['receivers'] = [receiver_module_name]
 
-    def configureModules(self):
+    def configureModules(self, module_names=None):
         """Call configuration method of module."""
         for module_name, module_info in sorted(self.modules.items(), key=lambda x: x[1]['idx']):
+            if module_names is not None and module_name not in module_names:
+                continue
+            # Keep an untouched copy to detect changes on a reload. Configure may alter nested values.
+            module_info['configuration_snapshot'] = copy.deepcopy(module_info['configuration'])
             for module_instance in module_info['instances']:
                 module_instance.configure(module_info['configuration'])
 
-    def initEventStream(self):
+    def getReceiverNames(self, module_name):
+        """Get the names of all configured receivers of a module."""
+        receiver_names = []
+        for receiver_data in self.modules[module_name]['instances'][0].getConfigurationValue('receivers'):
+            if not receiver_data:
+                break
+            if isinstance(receiver_data, dict):
+                receiver_name, _ = iter(receiver_data.items()).next()
+            else:
+                receiver_name = receiver_data
+            receiver_names.append(receiver_name)
+        return receiver_names
+
+    def getPoolType(self, module_name):
+        instance = self.modules[module_name]['instances'][0]
+        if not hasattr(instance, 'getPoolType') or not instance.getPoolSize():
+            return None
+        return instance.getPoolType()
+
+    def getProcessGroup(self, module_name):
+        """
+        Get the group of processes a module will be run in.
+
+        Modules with a process pool run in their own processes only. All other modules run in each worker, except the
+        ones that can not run forked. These will only be run in the master.
+        """
+        if self.getPoolType(module_name) == 'process':
+            return "pool_%s" % module_name
+        if max(self.workers, self.max_workers) > 1 and self.modules[module_name]['instances'][0].can_run_forked:
+            return 'workers'
+        return 'master'
+
+    def needsQueue(self, sender_name, receiver_name):
+        """A queue is only needed if sender and receiver run in different processes or the receiver uses a pool."""
+        return self.getProcessGroup(sender_name) != self.getProcessGroup(receiver_name) or self.getPoolType(receiver_name) is not None
+
+    def getSenders(self):
+        """Get the names of all senders per receiver."""
+        senders = OrderedDict()
+        for module_name in self.modules:
+            for receiver_name in self.getReceiverNames(module_name):
+                if receiver_name not in self.modules:
+                    self.logger.error("Could not add %s as receiver for %s. Module not found." % (receiver_name, module_name))
+                    self.shutDown()
+                senders.setdefault(receiver_name, []).append(module_name)
+        return senders
+
+    def getQueueTypes(self, senders):
+        """Get the type of queue needed in front of each receiver. Receivers without a queue are not included."""
+        queue_types = {}
+        for receiver_name, sender_names in senders.items():
+            if not any(self.needsQueue(sender_name, receiver_name) for sender_name in sender_names):
+                continue
+            # Only threads of the same process will read from the queue.
+            if all(self.getProcessGroup(sender_name) == self.getProcessGroup(receiver_name) for sender_name in sender_names):
+                queue_types[receiver_name] = 'simple'
+            else:
+                queue_types[receiver_name] = 'multiprocess'
+        return queue_types
+
+    def initEventStream(self, existing_queues={}, sender_names=None):
         """
         Connect all modules
 
         The configuration allows to connect the modules via the <receivers> parameter.
         As different types of modules exists (Base, Threaded, MultiProcess), connecting one modules output
         with its receivers input can be either direct or via a queue.
+        Modules running in the same process are connected directly, unless the receiver uses a thread pool.
+        Modules running in different processes are connected via a multiprocess queue.
+        On a reload, existing queues will be reused and only the given senders will be connected.
         TODO: To prevent loops a sanity check should be performed after all modules have been connected.
         """
+        senders = self.getSenders()
         queues = {}
-        # Iterate over all configured modules.
-        for module_name, module_info in self.modules.items():
-            sender_instance = module_info['instances'][0]
-            for receiver_data in sender_instance.getConfigurationValue('receivers'):
-                if not receiver_data:
-                    break
-                if isinstance(receiver_data, dict):
-                    receiver_name, _ = iter(receiver_data.items()).next()
-                else:
-                    receiver_name = receiver_data
-                if receiver_name not in self.modules:
-                    self.logger.error("Could not add %s as receiver for %s. Module not found." % (receiver_name, module_name))
-                    self.shutDown()
-                # If we run multiprocessed and the module is not capable of running parallel, this module will only be
-                # started in the main process. Connect the module via a queue to all receivers that can run forked.
-                for receiver_instance in self.modules[receiver_name]['instances']:
-                    if (self.workers > 1 and sender_instance.can_run_forked != receiver_instance.can_run_forked):
-                        try:
-                            queue = queues[receiver_name]
-                        except KeyError:
-                            queue = self.produceQueue('multiprocess', self.queue_size, self.queue_buffer_size)
-                            queues[receiver_name] = queue
-                        receiver_instance.setInputQueue(queue)
-                # Add the receiver to senders. If a corresponding queue exist, use this else use the normal mod instance.
-                for instance in module_info['instances']:
+        for receiver_name, queue_type in self.getQueueTypes(senders).items():
+            if not hasattr(self.modules[receiver_name]['instances'][0], 'setInputQueue'):
+                self.logger.error("%s can not be connected via a queue. Please check configuration." % receiver_name)
+                self.shutDown()
+            if receiver_name in existing_queues:
+                queue = existing_queues[receiver_name]
+            elif queue_type == 'simple':
+                queue = self.produceQueue('simple', self.queue_size)
+            else:
+                queue = self.produceQueue('multiprocess', self.queue_size, self.queue_buffer_size)
+            for receiver_instance in self.modules[receiver_name]['instances']:
+                receiver_instance.setInputQueue(queue)
+            queues[receiver_name] = queue
+        # Add the receiver to senders. If a corresponding queue exist, use this else use the normal mod instance.
+        for receiver_name, module_names in senders.items():
+            for module_name in module_names:
+                if sender_names is not None and module_name not in sender_names:
+                    continue
+                for instance in self.modules[module_name]['instances']:
                     if receiver_name in queues:
                         self.logger.debug("%s will send its output to %s via a queue." % (module_name, receiver_name))
                         instance.addReceiver(receiver_name, queues[receiver_name])
                     else:
                         self.logger.debug("%s will send its output directly to %s." % (module_name, receiver_name))
-                        instance.addReceiver(receiver_name, receiver_instance)
+                        instance.addReceiver(receiver_name, self.modules[receiver_name]['instances'][0])
+        return queues
 
     def getModuleInfoById(self, module_id, silent=True):
         """
@@ -296,6 +391,11 @@ class GambolPutty():
                 self.logger.error("Get module by id %s failed. No such module." % (module_id))
             return None
 
+    def getModulesInProcess(self):
+        """Get all modules that run in the current process, ordered as they appear in the configuration."""
+        return [(module_name, module_info) for module_name, module_info in sorted(self.modules.items(), key=lambda x: x[1]['idx'])
+                if self.getProcessGroup(module_name) in self.process_groups]
+
     def initModulesAfterFork(self):
         """
         All modules are completely configured, call modules initAfterFork method.
@@ -304,25 +404,21 @@ class GambolPutty():
         The thread will not survive a fork of the main process. So we need to start this
         after the fork was executed.
         """
-        for module_name, module_info in sorted(self.modules.items(), key=lambda x: x[1]['idx']):
+        for module_name, module_info in self.getModulesInProcess():
             for instance in module_info['instances']:
-                if instance.can_run_forked:
-                    instance.initAfterFork()
-                else:
-                    print("Not calling initAfterFork on %s." % module_name)
+                instance.initAfterFork()
 
     def runModules(self):
         """
         Start the configured modules if they poll queues.
         """
         # All modules are completely configured, call modules run method if it exists.
-        for module_name, module_info in sorted(self.modules.items(), key=lambda x: x[1]['idx']):
+        # Some modules, mostly input modules, use unique io devices, that can not be polled from multiple
+        # threads/processes. These modules will only be started once from the master process and the output
+        # will be send via queue to the other processes. Modules with a process pool will only be started in
+        # their pool processes.
+        for module_name, module_info in self.getModulesInProcess():
             for instance in module_info['instances']:
-                # Some modules, mostly input modules, use unique io devices, that can not be polled from multiple
-                # threads/processes. These modules will only be started once from the master process and the output
-                # will be send via queue to the other processes.
-                if not self.is_master() and not instance.can_run_forked:
-                    continue
                 # The default 'start' method of threading.Thread/mp will call the 'run' method of the module.
                 # The module itself can then decide if it wants to be run as thread. If not, it has to return False to let Gambolputty know.
                 if getattr(instance, "start", None): # and (instance.getInputQueue() or instance.module_type in ['stand_alone', 'input'])
@@ -363,28 +459,353 @@ class GambolPutty():
         self.runWorkers()
 
     def runWorkers(self):
+        """
+        Fork the worker processes and the process pools of modules with pool_type process.
+
+        Each worker runs all modules that can run forked. Each pool process only runs its own module.
+        The master runs the modules of the workers as well as the modules that can not run forked.
+        """
         for i in range(1, self.workers):
-            worker = multiprocessing.Process(target=self.run)
+            worker = multiprocessing.Process(target=self.run, args=(['workers'], i))
             worker.start()
             self.child_processes.append(worker)
+            self.worker_pids.append(worker.pid)
+        worker_index = max(self.workers, self.max_workers)
+        for module_name in self.modules:
+            if self.getPoolType(module_name) != 'process':
+                continue
+            for i in range(0, self.modules[module_name]['instances'][0].getPoolSize()):
+                worker = multiprocessing.Process(target=self.run, args=([self.getProcessGroup(module_name)], worker_index))
+                worker_index += 1
+                worker.start()
+                self.child_processes.append(worker)
+            self.logger.info("Started %s processes for %s." % (self.modules[module_name]['instances'][0].getPoolSize(), module_name))
+        if self.max_workers > self.workers:
+            self.startWorkerSpawner()
         self.run()
 
-    def run(self):
+    def startWorkerSpawner(self):
+        """
+        Fork a process that forks additional workers on request of the master.
+
+        Workers need to be forked from a process that did not start any modules yet. So the spawner is forked
+        before the master runs its modules.
+        """
+        self.spawner_connection, spawner_connection = multiprocessing.Pipe()
+        self.spawner_lock = multiprocessing.Lock()
+        self.worker_spawner = multiprocessing.Process(target=self.runWorkerSpawner, args=(spawner_connection,))
+        self.worker_spawner.start()
+
+    def runWorkerSpawner(self, connection):
+        # Workers will be stopped by the spawner.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # On a reload the spawner updates its modules, so new workers start with the current configuration.
+        # No module runs in the spawner itself.
+        self.process_groups = []
+        signal.signal(signal.SIGHUP, self.reload)
+        self.spawned_workers = workers = {}
+        while True:
+            try:
+                command, argument = connection.recv()
+            except IOError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                command, argument = ('shutdown', None)
+            except EOFError:
+                command, argument = ('shutdown', None)
+            if command == 'start':
+                worker = multiprocessing.Process(target=self.run, args=(['workers'], argument))
+                worker.start()
+                workers[worker.pid] = worker
+                connection.send(worker.pid)
+                continue
+            for worker_pid, worker in workers.items():
+                if command == 'stop' and worker_pid != argument:
+                    continue
+                # On shutdown via ctrl+c the workers already received a SIGINT. A second one would make them exit
+                # without waiting for queued events.
+                if command == 'stop' or argument != signal.SIGINT:
+                    try:
+                        os.kill(worker_pid, signal.SIGINT)
+                    except OSError:
+                        pass
+                worker.join()
+                workers.pop(worker_pid)
+            if command == 'shutdown':
+                return
+
+    def sendToWorkerSpawner(self, command, argument=None):
+        """
+        Commands are: start <worker index>, stop <pid of worker> and shutdown <signal number that caused the shutdown>.
+        Start returns the pid of the new worker.
+        """
+        with self.spawner_lock:
+            self.spawner_connection.send((command, argument))
+            if command == 'start':
+                return self.spawner_connection.recv()
+
+    def getAutoscaleWorkersFunc(self):
+        @Decorators.setInterval(self.autoscale_interval)
+        def autoscaleWorkersFunc():
+            self.autoscaleWorkers()
+        return autoscaleWorkersFunc
+
+    def getWorkerCpuUsage(self):
+        """Get the average cpu usage of all workers since the last call. Returns None if not available."""
+        now = time.time()
+        cpu_usage = []
+        last_cpu_times = getattr(self, 'last_worker_cpu_times', {})
+        self.last_worker_cpu_times = {}
+        for pid in [self.main_process_pid] + self.worker_pids:
+            cpu_time = Utils.getProcessCpuTime(pid)
+            if cpu_time is None:
+                continue
+            self.last_worker_cpu_times[pid] = (now, cpu_time)
+            if pid in last_cpu_times:
+                last_check, last_cpu_time = last_cpu_times[pid]
+                cpu_usage.append((cpu_time - last_cpu_time) / max(now - last_check, .001))
+        if not cpu_usage:
+            return None
+        return sum(cpu_usage) / len(cpu_usage)
+
+    def autoscaleWorkers(self):
+        """
+        Fork an additional worker if the queues to the workers fill up. Retire an added worker if the queues are empty
+        and the workers are mostly idle. The number of workers will stay between workers and max_workers.
+        """
+        queues = [queue for module_name, queue in self.getAllQueues().items() if self.getProcessGroup(module_name) == 'workers']
+        if not queues or not self.alive:
+            return
+        queue_usage = max([queue.qsize() for queue in queues]) / float(self.queue_size)
+        cpu_usage = self.getWorkerCpuUsage()
+        worker_count = len(self.worker_pids) + 1
+        if queue_usage >= .8 and worker_count < self.max_workers:
+            pid = self.sendToWorkerSpawner('start', worker_count)
+            self.worker_pids.append(pid)
+            StatisticCollector.StatisticCollector().incrementCounter('workers_started')
+            self.logger.info("Queues are %d%% full. Started worker %s. Running %s workers." % (queue_usage * 100, pid, worker_count + 1))
+        elif queue_usage <= .1 and (cpu_usage is None or cpu_usage < .25) and worker_count > self.workers:
+            pid = self.worker_pids.pop()
+            self.sendToWorkerSpawner('stop', pid)
+            StatisticCollector.StatisticCollector().incrementCounter('workers_retired')
+            self.logger.info("Queues are %d%% full. Retired worker %s. Running %s workers." % (queue_usage * 100, pid, worker_count - 1))
+
+    def getCpusForWorker(self, worker_index):
+        """
+        Get the cpus a process should be pinned to.
+
+        The master (worker_index 0) runs on master_cpus. All other processes are pinned round robin to a single one
+        of the remaining cpus. If numa_aware is set, they are pinned to all remaining cpus of a NUMA node instead.
+        """
+        if worker_index == 0:
+            return self.master_cpus
+        if self.numa_aware:
+            nodes = [[cpu for cpu in node if cpu not in self.master_cpus] for node in Utils.getNumaNodes()]
+            nodes = [node for node in nodes if node] or [self.master_cpus]
+            return nodes[(worker_index - 1) % len(nodes)]
+        cpus = [cpu for cpu in range(0, multiprocessing.cpu_count()) if cpu not in self.master_cpus] or self.master_cpus
+        return [cpus[(worker_index - 1) % len(cpus)]]
+
+    def run(self, process_groups=['master', 'workers'], worker_index=0):
         # Catch Keyboard interrupt here. Catching the signal seems
         # to be more reliable then using try/except when running
         # multiple processes under pypy.
         # Register SIGINT to call shutDown for all processes.
         signal.signal(signal.SIGINT, self.shutDown)
+        # SIGHUP reloads the configuration. The master forwards it to all other processes.
+        signal.signal(signal.SIGHUP, self.scheduleReload)
         if self.is_master():
-            # Register SIGALARM only for master process. This will take care to kill all subprocesses.
-            signal.signal(signal.SIGALRM, self.restart)
+            # Register SIGALARM only for master process. Kept for compatibility, does the same as SIGHUP.
+            signal.signal(signal.SIGALRM, self.scheduleReload)
         self.alive = True
+        self.process_groups = process_groups
+        # Modules use the index to find their own files, e.g. the event log or spilled events.
+        self.worker_index = worker_index
+        if self.cpu_affinity:
+            cpus = self.getCpusForWorker(worker_index)
+            if Utils.setCpuAffinity(cpus):
+                self.logger.debug("Pinned process %s to cpus %s." % (os.getpid(), cpus))
+            else:
+                self.logger.warning("Could not pin process %s to cpus %s." % (os.getpid(), cpus))
+        if not self.is_master():
+            Utils.default_event_factory.initEventIds()
         self.initModulesAfterFork()
         self.runModules()
         if self.is_master():
             self.logger.info("GambolPutty started with %s processes(%s)." % (len(self.child_processes) + 1, os.getpid()))
+            if self.worker_spawner:
+                Utils.TimedFunctionManager.startTimedFunction(self.getAutoscaleWorkersFunc())
         tornado.ioloop.IOLoop.instance().start()
 
+    def scheduleReload(self, signum=False, frame=False):
+        """
+        Reload on the IOLoop instead of in the signal handler. The handler interrupts whichever thread is running,
+        usually the IOLoop itself.
+        """
+        tornado.ioloop.IOLoop.instance().add_callback_from_signal(self.reload)
+
+    def reload(self, signum=False, frame=False):
+        """
+        Reload the configuration file without restarting the process.
+
+        The new configuration is compared with the running one. Only modules whose configuration changed are
+        rebuilt, along with the modules referencing them by id, e.g. via redis_store. Their queues and listening
+        sockets are handed over to the new instances. All other modules and their connections keep running. Each process does this on its own, the master forwards the signal.
+        If global settings changed or the changed modules would need new queues between processes,
+        GambolPutty will be restarted instead.
+        """
+        try:
+            with open(self.path_to_config_file) as conf_file:
+                configuration = yaml.load(conf_file)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not read config file %s. Keeping current configuration. Exception: %s, Error: %s." % (self.path_to_config_file, etype, evalue))
+            return
+        configuration_errors = ConfigurationValidator.ConfigurationValidator().validateConfiguration(configuration)
+        if configuration_errors:
+            self.logger.error("Could not reload configuration due to configuration errors. Keeping current configuration.")
+            for configuration_error in configuration_errors:
+                self.logger.error(configuration_error)
+            return
+        global_configuration = {}
+        for module_info in list(configuration):
+            if isinstance(module_info, dict) and 'Global' in module_info:
+                global_configuration = module_info['Global']
+                configuration.remove(module_info)
+        old_configuration, old_modules = self.configuration, self.modules
+        old_queue_types = self.getQueueTypes(self.getSenders())
+        old_pools = set([module_name for module_name in self.modules if self.getPoolType(module_name) == 'process'])
+        old_running_module_names = [module_name for module_name, _ in self.getModulesInProcess()]
+        self.configuration, self.modules = configuration, OrderedDict()
+        self.initModulesFromConfig()
+        self.setDefaultReceivers()
+        changed_module_names = []
+        for module_name, module_info in self.modules.items():
+            old_module_info = old_modules.get(module_name)
+            if not old_module_info or old_module_info['instances'][0].__class__ != module_info['instances'][0].__class__ or \
+               old_module_info['configuration_snapshot'] != module_info['configuration']:
+                changed_module_names.append(module_name)
+        # Modules referencing a rebuilt module by id, e.g. via redis_store or backend, would keep using the old instance.
+        referencing_module_names = self.getReferencingModuleNames(changed_module_names)
+        while referencing_module_names:
+            changed_module_names.extend(referencing_module_names)
+            referencing_module_names = self.getReferencingModuleNames(changed_module_names)
+        for module_name, module_info in self.modules.items():
+            if module_name not in changed_module_names:
+                old_modules[module_name]['idx'] = module_info['idx']
+                self.modules[module_name] = old_modules[module_name]
+        removed_module_names = [module_name for module_name in old_modules if module_name not in self.modules]
+        self.configureModules(changed_module_names)
+        new_pools = set([module_name for module_name in self.modules if self.getPoolType(module_name) == 'process'])
+        # Multiprocess queues can only be shared with processes forked after their creation.
+        new_queue_types = self.getQueueTypes(self.getSenders())
+        missing_queues = [receiver_name for receiver_name, queue_type in new_queue_types.items()
+                          if queue_type == 'multiprocess' and old_queue_types.get(receiver_name) != 'multiprocess']
+        if global_configuration != self.global_configuration or missing_queues or old_pools != new_pools:
+            self.configuration, self.modules = old_configuration, old_modules
+            if self.is_master():
+                self.logger.info("Configuration change needs new processes or queues. Restarting GambolPutty.")
+                self.restart()
+            return
+        if not changed_module_names and not removed_module_names:
+            self.configuration, self.modules = old_configuration, old_modules
+            self.logger.info("Configuration did not change.")
+            return
+        if self.is_master():
+            self.logger.info("Reloading configuration. Changed modules: %s. Removed modules: %s." % (changed_module_names, removed_module_names))
+            for worker in self.child_processes:
+                os.kill(worker.pid, signal.SIGHUP)
+            if self.worker_spawner:
+                os.kill(self.worker_spawner.pid, signal.SIGHUP)
+        elif self.process_groups == []:
+            for worker_pid in self.spawned_workers:
+                os.kill(worker_pid, signal.SIGHUP)
+        # Hand over the existing queues of rebuilt modules.
+        existing_queues = {}
+        for receiver_name, queue_type in new_queue_types.items():
+            if receiver_name in old_modules and old_queue_types.get(receiver_name) == queue_type:
+                existing_queues[receiver_name] = old_modules[receiver_name]['instances'][0].getInputQueue()
+        queues = self.initEventStream(existing_queues, changed_module_names)
+        running_module_names = [module_name for module_name, _ in self.getModulesInProcess()]
+        # Point unchanged modules to the new instances of their receivers.
+        for module_name, module_info in self.modules.items():
+            if module_name in changed_module_names:
+                continue
+            for instance in module_info['instances']:
+                for receiver_name, receiver in instance.receivers.items():
+                    if receiver_name not in changed_module_names:
+                        continue
+                    # The old queue may not be used anymore, e.g. if the pool_size of the receiver was removed.
+                    if isinstance(receiver, Utils.BufferedQueue):
+                        receiver.flushBuffer()
+                    if self.needsQueue(module_name, receiver_name):
+                        instance.receivers[receiver_name] = queues[receiver_name]
+                    else:
+                        instance.receivers[receiver_name] = self.modules[receiver_name]['instances'][0]
+                if module_name in running_module_names:
+                    instance.wrapReceiverQueues()
+        # Spill directories are bound to the module id, hand them over to the new instances.
+        for module_name in old_running_module_names:
+            if module_name in changed_module_names:
+                for instance in old_modules[module_name]['instances']:
+                    instance.releaseSpill()
+        for module_name in running_module_names:
+            if module_name not in changed_module_names:
+                continue
+            for instance in self.modules[module_name]['instances']:
+                instance.initAfterFork()
+                if getattr(instance, "start", None):
+                    instance.start()
+        self.shutDownReplacedModules(old_modules, [module_name for module_name in old_running_module_names
+                                                   if module_name in changed_module_names or module_name in removed_module_names])
+
+    def getReferencingModuleNames(self, module_names):
+        """Get the modules not in module_names, that reference one of them by id in their configuration."""
+        referencing_module_names = []
+        for module_name, module_info in self.modules.items():
+            if module_name in module_names:
+                continue
+            for option_name, value in (module_info['configuration'] or {}).items():
+                # Receivers are rewired after a reload.
+                if option_name not in ['id', 'receivers'] and isinstance(value, basestring) and value in module_names:
+                    referencing_module_names.append(module_name)
+                    break
+        return referencing_module_names
+
+    def shutDownReplacedModules(self, old_modules, module_names):
+        """Shut down old instances after a reload. Instances whose queue was not handed over may work off their queue first."""
+        old_instances = [(module_name, instance) for module_name in module_names for instance in old_modules[module_name]['instances']]
+        # Inputs first, so no new events will enter the replaced modules.
+        self.drainReplacedInstances(sorted(old_instances, key=lambda x: x[1].module_type != "input"))
+
+    def drainReplacedInstances(self, old_instances, wait_loops=0):
+        """
+        Shut down all old instances with an empty queue. Check the others again in .5 seconds, up to 10 times.
+        Waiting is done via the IOLoop, so all other modules keep running in the meantime.
+        """
+        waiting_instances = []
+        for module_name, instance in old_instances:
+            if wait_loops < 10 and self.hasOrphanedEvents(module_name, instance):
+                waiting_instances.append((module_name, instance))
+                continue
+            instance.shutDown()
+            for receiver in instance.receivers.values():
+                if isinstance(receiver, Utils.BufferedQueue):
+                    receiver.flushBuffer()
+        if waiting_instances:
+            io_loop = tornado.ioloop.IOLoop.instance()
+            io_loop.add_timeout(io_loop.time() + .5, lambda: self.drainReplacedInstances(waiting_instances, wait_loops + 1))
+
+    def hasOrphanedEvents(self, module_name, instance):
+        """True if the queue of an old instance still has events and was not handed over to a new instance."""
+        queue = instance.getInputQueue() if hasattr(instance, 'getInputQueue') else None
+        if not queue or queue.qsize() == 0:
+            return False
+        if module_name not in self.modules:
+            return True
+        new_instance = self.modules[module_name]['instances'][0]
+        return not hasattr(new_instance, 'getInputQueue') or new_instance.getInputQueue() is not queue
+
     def restart(self, signum=False, frame=False):
         for worker in list(self.child_processes):
             os.kill(worker.pid, signal.SIGINT)
@@ -405,6 +826,9 @@ class GambolPutty():
         self.alive = False
         self.shutDownModules()
         Utils.TimedFunctionManager.stopTimedFunctions()
+        if self.is_master() and self.worker_spawner:
+            self.sendToWorkerSpawner('shutdown', signum)
+            self.worker_spawner.join()
         tornado.ioloop.IOLoop.instance().stop()
         if self.is_master():
             self.logger.info("Shutdown complete.")
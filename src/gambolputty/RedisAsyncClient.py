@@ -16,63 +16,373 @@
 
 """Blocking and non-blocking Redis client implementations using IOStream."""
 
+import sys
 import logging
 import socket
+import threading
+import itertools
 from collections import deque
 from tornado.ioloop import IOLoop
-from tornado.iostream import IOStream
+from tornado.iostream import IOStream, StreamClosedError
 
 
 def encode(request):
     """Encode request (command, *args) to redis bulk bytes.
 
     Note that command is a string defined by redis.
-    All elements in args should be a string.
+    Arguments that are not strings will be converted via str, unicode is encoded as utf-8.
     """
     assert isinstance(request, tuple)
-    data = '*%d\r\n' % len(request) + ''.join(['$%d\r\n%s\r\n' % (len(str(x)), x) for x in request])
-    return data
-
-def decode(read_buffer):
-    """Decode redis buffer to python object."""
-    assert isinstance(read_buffer, deque)
-    first_line = read_buffer.popleft()
-    c = first_line[0]
-    if c == '+':
-        return first_line[1:-2]
-    elif c == '-':
-        return RedisError(first_line[1:-2], data)
-    elif c == ':':
-        return int(first_line[1:])
-    elif c == '$':
-        number = int(first_line[1:])
-        if number == -1:
-            return None
-        else:
-            return read_buffer[0][:number]
-    elif c == '*':
-        number = int(first_line[1:])
-        if number == -1:
-            return None
+    arguments = [x.encode('utf-8') if isinstance(x, unicode) else str(x) for x in request]
+    return '*%d\r\n' % len(arguments) + ''.join(['$%d\r\n%s\r\n' % (len(x), x) for x in arguments])
+
+class IncompleteReply(Exception):
+    """Raised by RedisReplyParser when the buffer does not yet hold a complete reply."""
+    pass
+
+class RedisReplyParser(object):
+    """Parse redis replies from a reusable read buffer.
+
+    Received data is appended to one bytearray. Consumed replies are only cut off the buffer on the next feed,
+    once all data was consumed or more than compact_size bytes are unused. So many replies received in one
+    read are parsed without copying the remaining data for each of them.
+
+    Error replies are returned as RedisError instances, not raised.
+    """
+    compact_size = 65536
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def feed(self, data):
+        if self.position and (self.position == len(self.buffer) or self.position > self.compact_size):
+            del self.buffer[:self.position]
+            self.position = 0
+        self.buffer.extend(data)
+
+    def getReply(self):
+        """Return the next complete reply. Raises IncompleteReply if more data is needed."""
+        start = self.position
+        try:
+            return self.readReply()
+        except IncompleteReply:
+            self.position = start
+            raise
+
+    def readLine(self):
+        end = self.buffer.find('\r\n', self.position)
+        if end == -1:
+            raise IncompleteReply()
+        line = str(self.buffer[self.position:end])
+        self.position = end + 2
+        return line
+
+    def readReply(self):
+        line = self.readLine()
+        reply_type = line[:1]
+        if reply_type == '+':
+            return line[1:]
+        elif reply_type == '-':
+            return RedisError(line[1:])
+        elif reply_type == ':':
+            return int(line[1:])
+        elif reply_type == '$':
+            length = int(line[1:])
+            if length == -1:
+                return None
+            end = self.position + length
+            if end + 2 > len(self.buffer):
+                raise IncompleteReply()
+            value = str(self.buffer[self.position:end])
+            self.position = end + 2
+            return value
+        elif reply_type == '*':
+            count = int(line[1:])
+            if count == -1:
+                return None
+            return [self.readReply() for _ in xrange(0, count)]
+        raise ProtocolError('Reply cannot start with %r.' % reply_type)
+
+class AsyncRedisConnection(object):
+    """A single non-blocking connection to a redis server.
+
+    Commands can be executed from any thread. They are collected and written to the server on the next IOLoop
+    iteration, so many commands share one write and are pipelined. Replies are matched to their callbacks
+    in order.
+
+    If the connection is lost, all callbacks waiting for a reply get a ConnectionError. The connection is then
+    reestablished every <reconnect_interval> seconds. Commands executed in the meantime are sent after the
+    reconnect, after authentication, db selection and resubscription of all channels and patterns.
+    """
+
+    def __init__(self, address, io_loop=None, password=None, db=0, reconnect_interval=1, socket_timeout=10):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.address = address
+        self.io_loop = io_loop or IOLoop.instance()
+        self.password = password
+        self.db = db
+        self.reconnect_interval = reconnect_interval
+        self.socket_timeout = socket_timeout
+        self.parser = None
+        self.stream = None
+        self.connected = False
+        self.connect_failed = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.outgoing = []
+        self.outgoing_callbacks = []
+        self.flush_scheduled = False
+        # Callbacks waiting for a reply, in the order of the sent commands.
+        self.callbacks = deque()
+        self.message_callback = None
+        self.channels = set()
+        self.patterns = set()
+        self.io_loop.add_callback(self.connect)
+
+    def connect(self):
+        if self.closed or self.stream:
+            return
+        self.parser = RedisReplyParser()
+        redis_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        redis_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = IOStream(redis_socket, io_loop=self.io_loop)
+        self.stream.set_close_callback(self.onClose)
+        self.stream.connect(self.address, self.onConnect)
+        self.io_loop.add_timeout(self.io_loop.time() + self.socket_timeout, self.checkConnectTimeout(self.stream))
+
+    def checkConnectTimeout(self, stream):
+        def connectTimeout():
+            if stream is self.stream and not self.connected:
+                self.logger.warning("Connecting to redis server at %s:%s timed out." % self.address)
+                stream.close()
+        return connectTimeout
+
+    def onConnect(self):
+        self.connected = True
+        self.connect_failed = False
+        commands = []
+        if self.password:
+            commands.append((('AUTH', self.password), self.checkReply))
+        if self.db:
+            commands.append((('SELECT', self.db), self.checkReply))
+        for command, callback in commands:
+            self.callbacks.append(callback)
+        if self.channels:
+            commands.append((('SUBSCRIBE',) + tuple(self.channels), None))
+        if self.patterns:
+            commands.append((('PSUBSCRIBE',) + tuple(self.patterns), None))
+        if commands:
+            self.stream.write(''.join([encode(command) for command, callback in commands]))
+        self.readReplies()
+        self.flush()
+
+    def checkReply(self, reply):
+        if isinstance(reply, RedisError):
+            self.logger.error("Redis server at %s:%s refused connection setup. Server said: %s." % (self.address[0], self.address[1], reply))
+
+    def onClose(self):
+        was_connected, self.connected = self.connected, False
+        error = ConnectionError('%s redis server at %s:%s.' % ('Lost connection to' if was_connected else 'Could not connect to', self.address[0], self.address[1]))
+        if self.stream and self.stream.error:
+            error = ConnectionError('%s Error: %s.' % (error, self.stream.error))
+        self.stream = None
+        callbacks, self.callbacks = self.callbacks, deque()
+        for callback in callbacks:
+            self.runCallback(callback, error)
+        if self.closed:
+            return
+        if was_connected or not self.connect_failed:
+            self.logger.warning("%s Reconnecting every %ss." % (error, self.reconnect_interval))
+        self.connect_failed = not was_connected
+        self.io_loop.add_timeout(self.io_loop.time() + self.reconnect_interval, self.connect)
+
+    def close(self, wait_for_replies=True):
+        """Close the connection. No reconnect will be tried, commands executed afterwards are discarded.
+
+        Commands executed before are still sent. With wait_for_replies, the connection is closed once their
+        replies were received. Otherwise e.g. a pending BLPOP would keep the connection open.
+        """
+        self.io_loop.add_callback(self.closeWhenIdle, wait_for_replies)
+
+    def closeWhenIdle(self, wait_for_replies=True):
+        with self.lock:
+            self.closed = True
+        if not self.stream:
+            return
+        self.flush()
+        if not wait_for_replies or not self.callbacks:
+            self.stream.close()
+
+    def execute(self, command, callback=None):
+        """Execute a command like ('SET', 'foo', 'bar'). The callback gets the reply or a RedisError."""
+        self.write([command], [callback])
+
+    def executeMany(self, commands, callback=None):
+        """Execute a list of commands in one pipeline. The callback gets the list of replies."""
+        replies = []
+        def collectReply(reply):
+            replies.append(reply)
+            if callback and len(replies) == len(commands):
+                callback(replies)
+        self.write(commands, [collectReply] * len(commands))
+
+    def subscribe(self, channels, callback):
+        """Subscribe to channels. Messages and subscription replies will be passed to callback.
+
+        Once subscribed, only other subscriptions can be executed via this connection.
+        """
+        self.message_callback = callback
+        self.io_loop.add_callback(self.addSubscriptions, 'SUBSCRIBE', channels)
+
+    def psubscribe(self, patterns, callback):
+        self.message_callback = callback
+        self.io_loop.add_callback(self.addSubscriptions, 'PSUBSCRIBE', patterns)
+
+    def addSubscriptions(self, command, names):
+        (self.channels if command == 'SUBSCRIBE' else self.patterns).update(names)
+        # Otherwise onConnect will subscribe.
+        if self.connected:
+            self.write([(command,) + tuple(names)], [])
+
+    def write(self, commands, callbacks):
+        data = ''.join([encode(command) for command in commands])
+        with self.lock:
+            if self.closed:
+                return
+            self.outgoing.append(data)
+            self.outgoing_callbacks.extend(callbacks)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.io_loop.add_callback(self.flush)
+
+    def flush(self):
+        with self.lock:
+            self.flush_scheduled = False
+            if not self.connected or not self.outgoing:
+                return
+            outgoing, self.outgoing = self.outgoing, []
+            callbacks, self.outgoing_callbacks = self.outgoing_callbacks, []
+        self.callbacks.extend(callbacks)
+        try:
+            self.stream.write(''.join(outgoing))
+        except StreamClosedError:
+            # onClose will pass a ConnectionError to the callbacks.
+            pass
+
+    def readReplies(self):
+        try:
+            self.stream.read_bytes(65536, self.onRead, partial=True)
+        except StreamClosedError:
+            pass
+
+    def onRead(self, data):
+        self.parser.feed(data)
+        while True:
+            try:
+                reply = self.parser.getReply()
+            except IncompleteReply:
+                break
+            except (ProtocolError, ValueError):
+                etype, evalue, etb = sys.exc_info()
+                self.logger.error("Could not parse reply of redis server at %s:%s. Exception: %s, Error: %s." % (self.address[0], self.address[1], etype, evalue))
+                self.stream.close()
+                return
+            if self.callbacks:
+                self.runCallback(self.callbacks.popleft(), reply)
+            elif self.message_callback:
+                self.runCallback(self.message_callback, reply)
+        if self.closed and not self.callbacks:
+            self.stream.close()
+        elif self.stream:
+            self.readReplies()
+
+    def runCallback(self, callback, reply):
+        if not callback:
+            return
+        try:
+            callback(reply)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Uncaught exception in redis callback %s. Exception: %s, Error: %s." % (callback, etype, evalue), exc_info=True)
+
+class AsyncRedisClient(object):
+    """A non-blocking Redis client.
+
+    Example usage::
+
+        def handle_reply(reply):
+            print 'Redis reply: %r' % reply
+
+        redis_client = AsyncRedisClient(('127.0.0.1', 6379))
+        redis_client.execute(('SET', 'foo', 'bar'))
+        redis_client.execute(('GET', 'foo'), handle_reply)
+        IOLoop.instance().start()
+
+    Commands are spread round robin over <pool_size> pipelined connections. Blocking commands like BLPOP and
+    subscriptions need a connection of their own, see getConnection.
+    """
+
+    def __init__(self, address, io_loop=None, password=None, db=0, pool_size=1, reconnect_interval=1, socket_timeout=10):
+        """Creates a AsyncRedisClient.
+
+        address is the tuple of redis server address that can be connect by
+        IOStream. It can be to ('127.0.0.1', 6379).
+        """
+        self.address = address
+        self.io_loop = io_loop or IOLoop.instance()
+        self.connection_settings = {'io_loop': self.io_loop,
+                                    'password': password,
+                                    'db': db,
+                                    'reconnect_interval': reconnect_interval,
+                                    'socket_timeout': socket_timeout}
+        self.connections = [AsyncRedisConnection(self.address, **self.connection_settings) for _ in xrange(0, pool_size)]
+        self.pooled_connections = itertools.cycle(self.connections)
+        self.dedicated_connections = []
+        self.idle_connections = []
+
+    def getConnection(self):
+        """Get a connection that is not shared with other users of this client. Return it via releaseConnection."""
+        if self.idle_connections:
+            connection = self.idle_connections.pop()
         else:
-            result = []
-            while number:
-                line = read_buffer.popleft()
-                c = line[0]
-                if c == '$':
-                    length  = int(line[1:])
-                    element = read_buffer.popleft()[:length]
-                    result.append(element)
-                else:
-                    if c == ':':
-                        element = int(line[1:])
-                    else:
-                        element = read_buffer.popleft()[:-2]
-                    result.append(element)
-                number -= 1
-            return result
-    else:
-        raise RedisError('bulk cannot startswith %r' % c, data)
+            connection = AsyncRedisConnection(self.address, **self.connection_settings)
+        self.dedicated_connections.append(connection)
+        return connection
+
+    def releaseConnection(self, connection):
+        self.dedicated_connections.remove(connection)
+        if connection.message_callback:
+            # Subscribed connections can not be reused.
+            connection.close()
+            return
+        self.idle_connections.append(connection)
+
+    def execute(self, command, callback=None):
+        self.pooled_connections.next().execute(command, callback)
+
+    # Kept for compatibility.
+    fetch = execute
+
+    def executeMany(self, commands, callback=None):
+        self.pooled_connections.next().executeMany(commands, callback)
+
+    def subscribe(self, channels, callback):
+        """Subscribe to channels on a dedicated connection. Returns the connection."""
+        connection = self.getConnection()
+        connection.subscribe(channels, callback)
+        return connection
+
+    def psubscribe(self, patterns, callback):
+        connection = self.getConnection()
+        connection.psubscribe(patterns, callback)
+        return connection
+
+    def close(self, wait_for_replies=True):
+        """Destroys this redis client, freeing any file descriptors used."""
+        for connection in self.connections + self.dedicated_connections + self.idle_connections:
+            connection.close(wait_for_replies)
 
 class RedisClient(object):
     """A blocking Redis client.
@@ -81,17 +391,15 @@ class RedisClient(object):
     that are running an IOLoop will want to use `AsyncRedisClient` instead.
     Typical usage looks like this::
 
-        redis_client = redisclient.RedisClient(('127.0.0.1', 6379))
-        try:
-            result = redis_client.fetch(('set', 'foo', 'bar'))
-            print result
-        except redisclient.RedisError, e:
-            print "Error:", e
+        redis_client = RedisAsyncClient.RedisClient(('127.0.0.1', 6379))
+        result = redis_client.fetch(('set', 'foo', 'bar'))
+        if isinstance(result, RedisAsyncClient.RedisError):
+            print "Error:", result
     """
-    def __init__(self, address):
+    def __init__(self, address, **kwargs):
         self.address = address
         self._io_loop = IOLoop()
-        self._async_client = AsyncRedisClient(self.address, self._io_loop)
+        self._async_client = AsyncRedisClient(self.address, self._io_loop, **kwargs)
         self._result = None
         self._closed = False
 
@@ -102,176 +410,31 @@ class RedisClient(object):
         """Closes the RedisClient, freeing any resources used."""
         if not self._closed:
             self._async_client.close()
-            self._io_loop.close()
+            self._io_loop.close(all_fds=True)
             self._closed = True
 
-    def fetch(self, request, **kwargs):
-        """Executes a request, returning an `result`.
+    def fetch(self, request):
+        """Executes a request, returning the reply.
 
         The request may be a tuple object. like ('set','foo','bar')
-
-        If an error occurs during the fetch, we raise an `RedisError`.
+        Error replies are returned as `RedisError`.
         """
         def callback(result):
             self._result = result
             self._io_loop.stop()
-        self._async_client.fetch(request, callback, **kwargs)
+        self._async_client.execute(request, callback)
         self._io_loop.start()
         result = self._result
         self._result = None
         return result
 
-class AsyncRedisClient(object):
-    """An non-blocking Redis client.
-
-    Example usage::
-
-        import ioloop
-
-        def handle_request(result):
-            print 'Redis reply: %r' % result
-            ioloop.IOLoop.instance().stop()
-
-        redis_client = AsyncRedisClient(('127.0.0.1', 6379))
-        redis_client.fetch(('set', 'foo', 'bar'), None)
-        redis_client.fetch(('get', 'foo'), handle_request)
-        ioloop.IOLoop.instance().start()
-
-    This class implements a Redis client on top of Tornado's IOStreams.
-    It does not currently implement all applicable parts of the Redis
-    specification, but it does enough to work with major redis server APIs
-    (mostly tested against the LIST/HASH/PUBSUB API so far).
-
-    This class has not been tested extensively in production and
-    should be considered somewhat experimental as of the release of
-    tornado 1.2.  It is intended to become the default tornado
-    AsyncRedisClient implementation.
-    """
-
-    def __init__(self, address, io_loop=None, socket_timeout=10):
-        """Creates a AsyncRedisClient.
-
-        address is the tuple of redis server address that can be connect by
-        IOStream. It can be to ('127.0.0.1', 6379).
-        """
-        self.address         = address
-        self.io_loop         = io_loop or IOLoop.instance()
-        self._callback_queue = deque()
-        self._callback       = None
-        self._read_buffer    = None
-        self._result_queue   = deque()
-        self.socket          = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(socket_timeout)
-        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.stream          = IOStream(self.socket, self.io_loop)
-        self.stream.connect(self.address, self._wait_result)
-
-    def close(self):
-        """Destroys this redis client, freeing any file descriptors used.
-        Not needed in normal use, but may be helpful in unittests that
-        create and destroy redis clients.  No other methods may be called
-        on the AsyncRedisClient after close().
-        """
-        self.stream.close()
-
-    def fetch(self, request, callback):
-        """Executes a request, calling callback with an redis `result`.
-
-        The request should be a string tuple. like ('set', 'foo', 'bar')
-
-        If an error occurs during the fetch, a `RedisError` exception will
-        throw out. You can use try...except to catch the exception (if any)
-        in the callback.
-        """
-        self._callback_queue.append(callback)
-        self.stream.write(encode(request))
-
-    def _wait_result(self):
-        """Read a completed result data from the redis server."""
-        self._read_buffer = deque()
-        self.stream.read_until('\r\n', self._on_read_first_line)
-
-    def _maybe_callback(self):
-        """Try call callback in _callback_queue when we read a redis result."""
-        try:
-            read_buffer    = self._read_buffer
-            callback       = self._callback
-            result_queue   = self._result_queue
-            callback_queue = self._callback_queue
-            if result_queue:
-                result_queue.append(read_buffer)
-                read_buffer = result_queue.popleft()
-            if callback_queue:
-                callback = self._callback = callback_queue.popleft()
-            if callback:
-                callback(decode(read_buffer))
-        except Exception:
-            logging.error('Uncaught callback exception', exc_info=True)
-            self.close()
-            raise
-        finally:
-            self._wait_result()
-
-    def _on_read_first_line(self, data):
-        self._read_buffer.append(data)
-        c = data[0]
-        if c in ':+-':
-            self._maybe_callback()
-        elif c == '$':
-            if data[:3] == '$-1':
-                self._maybe_callback()
-            else:
-                length = int(data[1:])
-                self.stream.read_bytes(length+2, self._on_read_bulk_body)
-        elif c == '*':
-            if data[1] in '-0' :
-                self._maybe_callback()
-            else:
-                self._multibulk_number = int(data[1:])
-                self.stream.read_until('\r\n', self._on_read_multibulk_bulk_head)
-
-    def _on_read_bulk_body(self, data):
-        self._read_buffer.append(data)
-        self._maybe_callback()
-
-    def _on_read_multibulk_bulk_head(self, data):
-        self._read_buffer.append(data)
-        c = data[0]
-        if c == '$':
-            length = int(data[1:])
-            self.stream.read_bytes(length+2, self._on_read_multibulk_bulk_body)
-        else:
-            self._maybe_callback()
-
-    def _on_read_multibulk_bulk_body(self, data):
-        self._read_buffer.append(data)
-        self._multibulk_number -= 1
-        if self._multibulk_number:
-            self.stream.read_until('\r\n', self._on_read_multibulk_bulk_head)
-        else:
-            self._maybe_callback()
-
 class RedisError(Exception):
-    """Exception thrown for an unsuccessful Redis request.
+    """Exception for an unsuccessful Redis request."""
+    pass
 
-    Attributes:
+class ConnectionError(RedisError):
+    """The connection to the redis server was lost before the reply arrived."""
+    pass
 
-    data - Redis error data error code, e.g. -(ERR).
-    """
-    def __init__(self, message, data=None):
-        self.data = data
-        Exception.__init__(self, '(Error): %s' % message)
-
-
-def test():
-    def handle_request(result):
-        print 'Redis reply: %r' % result
-    redis_client = AsyncRedisClient(('localhost', 6379))
-    redis_client.fetch(('subscribe', 'GamboPutty'), handle_request)
-    #redis_client.fetch(('set', 'foo', 'bar'), handle_request)
-    #redis_client.fetch(('get', 'foo'), lambda x:(handle_request(x),IOLoop.instance().stop()))
-    IOLoop.instance().start()
-
-if __name__ == '__main__':
-    test()
\ No newline at end of file
+class ProtocolError(RedisError):
+    pass
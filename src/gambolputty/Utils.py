@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 import ast
+import re
+import binascii
+import ctypes
+import ctypes.util
+import fcntl
+import glob
+import itertools
 import datetime
 import copy
 import random
@@ -8,12 +15,21 @@ import os
 import sys
 import subprocess
 import logging
+import mmap
+import multiprocessing
 import signal
+import threading
 import Decorators
+import StatisticCollector
 import socket
+import struct
 import types
 import platform
 import pylru
+import cPickle
+import zlib
+import hashlib
+import tornado.ioloop
 
 
 # Conditional imports for python2/3
@@ -114,21 +130,391 @@ def restartMainProcess():
                       [sys.executable] + sys.argv)
             sys.exit(0)
 
+def getProcessCpuTime(pid):
+    """
+    Return user + system cpu time of a process in seconds.
+
+    Only works on systems providing a /proc filesystem. Returns None if the cpu time could not be read.
+    """
+    try:
+        with open("/proc/%s/stat" % pid) as stat_file:
+            # The process name may contain spaces, so split after its closing bracket.
+            stats = stat_file.read().rsplit(")", 1)[1].split()
+        return (int(stats[11]) + int(stats[12])) / float(os.sysconf('SC_CLK_TCK'))
+    except (IOError, IndexError, ValueError, OSError):
+        return None
+
+def parseCpuList(cpu_list):
+    """Parse a cpu list in the format used by the kernel, e.g. "0-3,8-11", into a list of cpu ids."""
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        if "-" in cpu_range:
+            first_cpu, last_cpu = cpu_range.split("-")
+            cpus.extend(range(int(first_cpu), int(last_cpu) + 1))
+        else:
+            cpus.append(int(cpu_range))
+    return cpus
+
+def getNumaNodes():
+    """
+    Return the cpu ids of each NUMA node as list of lists.
+
+    If no NUMA information is available, all cpus will be returned as one node.
+    """
+    nodes = []
+    for node_path in sorted(glob.glob("/sys/devices/system/node/node[0-9]*"), key=lambda path: int(path.rsplit("node", 1)[1])):
+        try:
+            with open("%s/cpulist" % node_path) as cpu_list:
+                cpus = parseCpuList(cpu_list.read())
+        except IOError:
+            continue
+        if cpus:
+            nodes.append(cpus)
+    if not nodes:
+        nodes.append(range(0, multiprocessing.cpu_count()))
+    return nodes
+
+def _getLibc():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    return libc
+
+def setCpuAffinity(cpus, pid=0):
+    """
+    Restrict a process to the given cpu ids. A pid of 0 means the current process.
+
+    Uses os.sched_setaffinity if available (python >= 3.3). Otherwise sched_setaffinity is called via ctypes,
+    which only works on Linux. Returns False if the affinity could not be set.
+    """
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(pid, cpus)
+            return True
+        except OSError:
+            return False
+    try:
+        mask = (ctypes.c_ulong * 16)()
+        bits_per_item = ctypes.sizeof(ctypes.c_ulong) * 8
+        for cpu in cpus:
+            mask[cpu // bits_per_item] |= 1 << (cpu % bits_per_item)
+        return _getLibc().sched_setaffinity(pid, ctypes.sizeof(mask), mask) == 0
+    except (OSError, AttributeError, TypeError, IndexError):
+        return False
+
+def getCpuAffinity(pid=0):
+    """Return the cpu ids a process may run on or None if not available."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(pid))
+    try:
+        mask = (ctypes.c_ulong * 16)()
+        if _getLibc().sched_getaffinity(pid, ctypes.sizeof(mask), mask) != 0:
+            return None
+    except (OSError, AttributeError, TypeError):
+        return None
+    bits_per_item = ctypes.sizeof(ctypes.c_ulong) * 8
+    return [idx * bits_per_item + bit for idx, item in enumerate(mask) for bit in xrange(0, bits_per_item) if item & (1 << bit)]
+
 def getDefaultEventDict(dict={}, caller_class_name='', received_from=False, event_type="Unknown"):
     default_dict = { "data": "",
-                     "gambolputty": {
-                         'pid': os.getpid(),
-                         'event_type': event_type,
-                         'event_id': "%032x%s" % (random.getrandbits(128), os.getpid()),
-                         'source_module': caller_class_name,
-                         'received_from': received_from,
-                         'received_by': MY_HOSTNAME
-                     }
+                     "gambolputty": EventMetadata(os.getpid(), event_type, default_event_factory.getEventId(), caller_class_name, received_from, MY_HOSTNAME)
                 }
     default_dict.update(dict)
     default_dict = KeyDotNotationDict(default_dict)
     return default_dict
 
+class EventFactory:
+    """
+    Create new events. Use this in modules that create lots of events, e.g. inputs.
+
+    The static gambolputty metadata is set up only once. Event ids are built from a random per process prefix,
+    a counter and the process id. This is a lot cheaper than getting 128 random bits for each event.
+    After a fork initEventIds needs to be called, so each worker produces its own ids. For modules this is
+    done in BaseModule.initAfterFork.
+    """
+    def __init__(self, caller_class_name='', event_type="Unknown"):
+        self.caller_class_name = caller_class_name
+        self.event_type = event_type
+        self.initEventIds()
+
+    def initEventIds(self):
+        self.pid = os.getpid()
+        event_id_format = "%s%%010x%s" % (binascii.hexlify(os.urandom(11)), self.pid)
+        self.event_ids = itertools.imap(event_id_format.__mod__, itertools.count())
+
+    def getEventId(self):
+        return self.event_ids.next()
+
+    def getEvent(self, dict=None, received_from=False):
+        metadata = EventMetadata(self.pid, self.event_type, self.event_ids.next(), self.caller_class_name, received_from, MY_HOSTNAME)
+        if not dict:
+            return KeyDotNotationDict(data="", gambolputty=metadata)
+        event = KeyDotNotationDict(dict) if "gambolputty" in dict else KeyDotNotationDict(dict, gambolputty=metadata)
+        if "data" not in dict:
+            event["data"] = ""
+        return event
+
+default_event_factory = EventFactory()
+
+class EventMetadata(object):
+    """
+    Compact container for the gambolputty metadata of an event.
+
+    It behaves like a dictionary, so the metadata can still be accessed via e.g. event['gambolputty']['event_id']
+    or event['gambolputty.event_id']. Keys other than the default fields are kept in an extra dictionary.
+    Standard fields can not be removed, deleting them will set them to None.
+
+    When sent via a multiprocess queue, the metadata is packed as a small msgpack array (see packEvents).
+    On the receiving side it will only be unpacked on first access.
+    """
+    __slots__ = ('pid', 'event_type', 'event_id', 'source_module', 'received_from', 'received_by', 'extra', 'packed')
+
+    field_names = ('pid', 'event_type', 'event_id', 'source_module', 'received_from', 'received_by')
+    field_names_set = frozenset(field_names)
+
+    def __init__(self, pid=None, event_type="Unknown", event_id=None, source_module='', received_from=False, received_by=MY_HOSTNAME, extra=None):
+        self.pid = pid
+        self.event_type = event_type
+        self.event_id = event_id
+        self.source_module = source_module
+        self.received_from = received_from
+        self.received_by = received_by
+        self.extra = extra
+        self.packed = None
+
+    @classmethod
+    def fromPacked(cls, packed):
+        metadata = cls.__new__(cls)
+        metadata.packed = packed
+        return metadata
+
+    def pack(self):
+        if self.packed is not None:
+            return self.packed
+        return msgpack.packb((self.pid, self.event_type, self.event_id, self.source_module, self.received_from, self.received_by, self.extra))
+
+    def unpack(self):
+        self.pid, self.event_type, self.event_id, self.source_module, self.received_from, self.received_by, self.extra = msgpack.unpackb(self.packed)
+        self.packed = None
+
+    def __getitem__(self, key):
+        if self.packed is not None:
+            self.unpack()
+        if key in self.field_names_set:
+            return getattr(self, key)
+        if self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if self.packed is not None:
+            self.unpack()
+        if key in self.field_names_set:
+            setattr(self, key, value)
+            return
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def __delitem__(self, key):
+        if self.packed is not None:
+            self.unpack()
+        if key in self.field_names_set:
+            setattr(self, key, None)
+            return
+        if not self.extra:
+            raise KeyError(key)
+        del self.extra[key]
+
+    def __contains__(self, key):
+        if self.packed is not None:
+            self.unpack()
+        return key in self.field_names_set or (self.extra is not None and key in self.extra)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        if self.packed is not None:
+            self.unpack()
+        return list(self.field_names) + (self.extra.keys() if self.extra else [])
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    iterkeys = __iter__
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def update(self, other):
+        for key, value in other.items():
+            self[key] = value
+
+    def toDict(self):
+        return dict(self.items())
+
+    def copy(self):
+        if self.packed is not None:
+            return EventMetadata.fromPacked(self.packed)
+        return EventMetadata(self.pid, self.event_type, self.event_id, self.source_module, self.received_from, self.received_by, dict(self.extra) if self.extra else None)
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        if self.packed is not None:
+            return EventMetadata.fromPacked(self.packed)
+        return EventMetadata(self.pid, self.event_type, self.event_id, self.source_module, self.received_from, self.received_by, copy.deepcopy(self.extra, memo))
+
+    def __reduce__(self):
+        if self.packed is not None:
+            self.unpack()
+        return (EventMetadata, (self.pid, self.event_type, self.event_id, self.source_module, self.received_from, self.received_by, self.extra))
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, EventMetadata)):
+            return self.toDict() == dict(other.items())
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return repr(self.toDict())
+
+EVENT_METADATA_EXT_TYPE = 42
+EVENT_MISSING_VALUE_EXT_TYPE = 43
+# Marks a zeromq multipart message holding a batch of events, see packZmqBatch.
+ZMQ_BATCH_FRAME = 'gambolputty:batch:1'
+
+def serializeDefault(obj):
+    """
+    Default function for json.dumps and msgpack.packb. Use this when events are serialized for external consumers.
+    """
+    if isinstance(obj, EventMetadata):
+        return obj.toDict()
+    raise TypeError("%r is not serializable" % (obj, ))
+
+def getSerializableEvent(event):
+    """
+    Return the event with its metadata as plain dictionary. Use this for serializers without a default function,
+    like ujson or yajl. The event itself is not changed.
+    """
+    metadata = event.get('gambolputty', None)
+    if not isinstance(metadata, EventMetadata):
+        return event
+    event = dict(event)
+    event['gambolputty'] = metadata.toDict()
+    return event
+
+def _packEventMetadata(obj):
+    if isinstance(obj, EventMetadata):
+        return msgpack.ExtType(EVENT_METADATA_EXT_TYPE, obj.pack())
+    raise TypeError("%r is not serializable" % (obj, ))
+
+def _unpackEventMetadata(code, data):
+    if code == EVENT_METADATA_EXT_TYPE:
+        return EventMetadata.fromPacked(data)
+    if code == EVENT_MISSING_VALUE_EXT_TYPE:
+        return _missing_value
+    return msgpack.ExtType(code, data)
+
+# Marks a field that is not present in an event when using the columnar encoding.
+_missing_value = msgpack.ExtType(EVENT_MISSING_VALUE_EXT_TYPE, "") if msgpack_avaiable else None
+
+def packEvents(events, columnar=False):
+    """
+    Serialize a list of events to be sent via a multiprocess queue.
+
+    If columnar is True, the events are packed as a key table plus one value array per key.
+    For homogeneous events, e.g. the output of a RegexParser, this saves sending the field names for each event.
+    Fields missing in an event are marked with a special ext type.
+    """
+    if not columnar:
+        return msgpack.packb(events, default=_packEventMetadata)
+    keys = list(set().union(*events))
+    dict_get = dict.get
+    columns = [[dict_get(event, key, _missing_value) for event in events] for key in keys]
+    has_missing_values = any(len(event) != len(keys) for event in events)
+    return msgpack.packb({'keys': keys, 'columns': columns, 'has_missing_values': has_missing_values}, default=_packEventMetadata)
+
+def unpackEvents(packed_events):
+    """
+    Deserialize a list of events packed via packEvents.
+    After msgpack.uppackb we just have a normal dict. Cast this to KeyDotNotationDict.
+    """
+    events = msgpack.unpackb(packed_events, ext_hook=_unpackEventMetadata)
+    if not isinstance(events, dict):
+        return [KeyDotNotationDict(event) for event in events]
+    keys = events['keys']
+    if not events['has_missing_values']:
+        return [KeyDotNotationDict(itertools.izip(keys, values)) for values in itertools.izip(*events['columns'])]
+    return [KeyDotNotationDict((key, value) for key, value in itertools.izip(keys, values) if value is not _missing_value) for values in itertools.izip(*events['columns'])]
+
+def packZmqBatch(items, topic=None):
+    """
+    Get the frames of a zeromq multipart message for a batch of events or formatted strings.
+
+    The message consists of an optional topic frame, the ZMQ_BATCH_FRAME marker and the list of items, packed with
+    msgpack. Event metadata is kept as msgpack extension type. Subscribers filter by the first frame, so the topic
+    needs to be a frame of its own.
+    """
+    frames = [ZMQ_BATCH_FRAME, msgpack.packb(items, default=_packEventMetadata)]
+    if topic:
+        frames.insert(0, topic)
+    return frames
+
+def unpackZmqBatch(frames):
+    """
+    Get topic and items of a multipart message sent via packZmqBatch. Frames may be zmq.Frame objects,
+    then the items are unpacked from the frame buffer without copying it first.
+    Returns None if the message is not a batch.
+    """
+    topic = None
+    if len(frames) == 3:
+        topic = getattr(frames[0], 'bytes', frames[0])
+        frames = frames[1:]
+    if len(frames) != 2 or getattr(frames[0], 'bytes', frames[0]) != ZMQ_BATCH_FRAME:
+        return None
+    return topic, msgpack.unpackb(getattr(frames[1], 'buffer', frames[1]), ext_hook=_unpackEventMetadata)
+
+def packValue(value):
+    """
+    Serialize a value to be stored in a key value store, e.g. by RedisStore.
+    Byte strings and unicode strings keep their type.
+    """
+    if not msgpack_avaiable:
+        return cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+    return msgpack.packb(value, use_bin_type=True, default=_packEventMetadata)
+
+def unpackValue(packed_value):
+    """
+    Deserialize a value packed via packValue.
+    Values pickled by former versions are still read, until they expired.
+    """
+    if not msgpack_avaiable:
+        return cPickle.loads(packed_value)
+    try:
+        return msgpack.unpackb(packed_value, raw=False, ext_hook=_unpackEventMetadata)
+    except Exception:
+        try:
+            return cPickle.loads(packed_value)
+        except Exception:
+            pass
+        raise
+
 def replaceVarsAndCompileString(code_as_string, replacement):
     """
     Parse a string to python code.
@@ -219,10 +605,82 @@ def mapDynamicValue(value, mapping_dict={}, use_strftime=False):
             logging.getLogger("mapDynamicValue").error("%sMapping failed for %s. Mapping data: %s. Exception: %s, Error: %s." % (value, mapping_dict, etype, evalue))
             return False
 
+class KeyValueTokenizer:
+    """
+    Split a string of key value pairs into a dictionary, e.g. firewall logs like:
+    date=2015-05-10 srcip=10.1.100.11 action="accept" msg="Connection \\"allowed\\""
+
+    Values may be quoted with double or single quotes, separators inside quotes are part of the value.
+    A backslash escapes the next character. Pairs without a key value separator are skipped.
+    If whitelist is set, only those keys are extracted. Prefix is prepended to all extracted keys.
+
+    Strings without quotes or escapes are split with str.split, all others with a precompiled regex.
+    """
+
+    def __init__(self, line_separator, kv_separator, prefix=None, whitelist=None):
+        self.line_separator = line_separator
+        self.kv_separator = kv_separator
+        self.prefix = prefix
+        self.whitelist = set(whitelist) if whitelist else None
+        line_separator, kv_separator = re.escape(line_separator), re.escape(kv_separator)
+        if len(self.line_separator) == 1 and len(self.kv_separator) == 1:
+            # Keys can not contain the line separator, so a key always starts right after a separator.
+            key_pattern = '([^%s%s]+)' % (kv_separator, line_separator)
+            plain_value_pattern = '[^%s\\\\]*(?:\\\\.[^%s\\\\]*)*' % (line_separator, line_separator)
+        else:
+            key_pattern = '(?:^|(?<=%s))((?:(?!%s|%s).)+)' % (line_separator, kv_separator, line_separator)
+            plain_value_pattern = '(?:\\\\.|(?!%s)[^\\\\])*' % line_separator
+        self.regex = re.compile('%s%s(?:"([^"\\\\]*(?:\\\\.[^"\\\\]*)*)"|\'([^\'\\\\]*(?:\\\\.[^\'\\\\]*)*)\'|(%s))' %
+                                (key_pattern, kv_separator, plain_value_pattern), re.DOTALL)
+        self.unescape_regex = re.compile(r'\\(.)', re.DOTALL)
+
+    def tokenize(self, string):
+        if '"' in string or "'" in string or '\\' in string:
+            return self.tokenizeQuoted(string)
+        kv_separator = self.kv_separator
+        whitelist = self.whitelist
+        prefix = self.prefix
+        kv_dict = {}
+        for pair in string.split(self.line_separator):
+            key, separator, value = pair.partition(kv_separator)
+            if not separator or (whitelist and key not in whitelist):
+                continue
+            if prefix:
+                key = prefix + key
+            kv_dict[key] = value
+        return kv_dict
+
+    def tokenizeQuoted(self, string):
+        whitelist = self.whitelist
+        prefix = self.prefix
+        unescape = '\\' in string
+        matches = self.regex.findall(string)
+        if not whitelist and not prefix and not unescape:
+            return dict([(key, double_quoted_value or single_quoted_value or value) for key, double_quoted_value, single_quoted_value, value in matches])
+        kv_dict = {}
+        for key, double_quoted_value, single_quoted_value, value in matches:
+            if whitelist and key not in whitelist:
+                continue
+            value = double_quoted_value or single_quoted_value or value
+            if unescape and '\\' in value:
+                value = self.unescape_regex.sub(r'\1', value)
+            if prefix:
+                key = prefix + key
+            kv_dict[key] = value
+        return kv_dict
+
 class Buffer:
-    def __init__(self, flush_size=None, callback=None, interval=1, maxsize=5000):
+    """
+    Collect items and pass them to <callback> in batches of <flush_size> or every <interval> seconds.
+
+    If the callback fails, the items are kept and more than <maxsize> items will block put until the next
+    successful flush. With enableSpill, items above <maxsize> will be spilled to disk instead, see SpillQueue.
+    Spilled batches are sent before the items in memory, so the order of the items is kept.
+    """
+    def __init__(self, flush_size=None, callback=None, interval=1, maxsize=5000, acknowledge_callback=None):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.flush_size = flush_size
+        self.acknowledge_callback = acknowledge_callback
         self.buffer = []
         self.maxsize = maxsize
         self.append = self.put
@@ -231,6 +689,28 @@ class Buffer:
         self.flush_timed_func = self.getTimedFlushMethod()
         self.timed_func_handle = TimedFunctionManager.startTimedFunction(self.flush_timed_func)
         self.is_flushing = False
+        self.spill = None
+        self.stats_collector = StatisticCollector.StatisticCollector()
+
+    def enableSpill(self, path, max_bytes=1073741824, segment_size=16777216):
+        try:
+            self.spill = SpillQueue(path, max_bytes, segment_size)
+        except (IOError, OSError, mmap.error):
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not open spill directory %s. Exception: %s, Error: %s." % (path, etype, evalue))
+            return False
+        if self.spill.event_count:
+            self.logger.warning("Found %s spilled events in %s. Will send them first." % (self.spill.event_count, path))
+        return True
+
+    def disableSpill(self):
+        """Stop spilling and close the spill directory, e.g. to hand it over to another buffer. Spilled events stay on disk."""
+        if not self.spill:
+            return
+        while self.is_flushing:
+            time.sleep(.00001)
+        spill, self.spill = self.spill, None
+        spill.close()
 
     def stopInterval(self):
         TimedFunctionManager.stopTimedFunctions(self.timed_func_handle)
@@ -252,42 +732,379 @@ class Buffer:
         while self.is_flushing:
             time.sleep(.00001)
         while len(self.buffer) > self.maxsize:
+            if self.spill and self.spillBuffer():
+                break
             self.logger.warning("Maximum number of items (%s) in buffer reached. Waiting for flush." % self.maxsize)
             time.sleep(1)
         self.buffer.append(item)
         if self.flush_size and len(self.buffer) == self.flush_size:
             self.flush()
 
+    def spillBuffer(self):
+        """
+        Move the oldest batch of items to disk, to make room for new ones. Returns False if the disk quota is exhausted.
+        The spilled items are older than the ones kept in memory, so the order is kept when spilled batches are sent first.
+        """
+        batch = self.buffer[:self.flush_size or len(self.buffer) - self.maxsize]
+        if not self.spill.put(batch):
+            self.logger.warning("Spill quota of %s bytes exhausted." % self.spill.max_bytes)
+            return False
+        self.stats_collector.incrementCounter('buffer_spilled_events', len(batch))
+        del self.buffer[:len(batch)]
+        return True
+
+    def drainSpill(self):
+        """
+        Send the spilled batches of the oldest segment. Returns True if no spilled batches are left.
+        Only one segment is sent per flush, so put does not wait for the whole spill to be drained.
+        """
+        oldest_segment = self.spill.segments[0] if self.spill.segments else None
+        while self.spill.batch_count and self.spill.segments[0] is oldest_segment:
+            batch = self.spill.peek()
+            if not self.flush_callback(batch):
+                return False
+            if self.acknowledge_callback:
+                self.acknowledge_callback(batch)
+            self.spill.pop()
+            self.stats_collector.incrementCounter('buffer_drained_events', len(batch))
+        return not self.spill.batch_count
+
     def flush(self):
-        if self.bufsize() == 0 or self.is_flushing:
+        if (self.bufsize() == 0 and not (self.spill and self.spill.batch_count)) or self.is_flushing:
             return
         self.is_flushing = True
         self.stopInterval()
-        success = self.flush_callback(self.buffer)
-        if success:
-            self.buffer = []
+        if not self.spill or self.drainSpill():
+            success = self.buffer and self.flush_callback(self.buffer)
+            if success:
+                if self.acknowledge_callback:
+                    self.acknowledge_callback(self.buffer)
+                self.buffer = []
         self.startInterval()
         self.is_flushing = False
 
     def bufsize(self):
         return len(self.buffer)
 
+class IOLoopBuffer:
+    """
+    Collect items and pass them to <callback> in batches of <flush_size> or every <interval> seconds, like Buffer.
+
+    Flushes run on the tornado IOLoop instead of a timer thread. The callback is called with a batch of at most
+    <flush_size> items and a function, that has to be called with True or False once the batch was stored. So it can wait for the reply
+    of an asynchronous client without blocking the IOLoop. Only one batch is stored at a time, a failed batch
+    is put back in front of the buffer and sent again on the next flush. If only some items failed, e.g. as the
+    connection was lost midway, the function can be called with True and a list of these items. Only they are sent
+    again, the rest of the batch counts as stored. Callbacks should only ask for a retry on connection errors,
+    items the server rejected would fail again.
+    Like Buffer, put blocks while more than <maxsize> items are waiting. Puts from the IOLoop itself never block.
+    """
+    def __init__(self, flush_size=None, callback=None, interval=1, maxsize=5000, acknowledge_callback=None, io_loop=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.flush_size = flush_size
+        self.flush_callback = callback
+        self.maxsize = maxsize
+        self.acknowledge_callback = acknowledge_callback
+        self.io_loop = io_loop or tornado.ioloop.IOLoop.instance()
+        self.buffer = []
+        self.in_flight = []
+        self.flush_scheduled = False
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.timed_flush = tornado.ioloop.PeriodicCallback(self.flush, interval * 1000, io_loop=self.io_loop)
+        self.io_loop.add_callback(self.timed_flush.start)
+        self.append = self.put
+
+    def put(self, item):
+        with self.lock:
+            while self.bufsize() > self.maxsize and tornado.ioloop.IOLoop.current(instance=False) is not self.io_loop:
+                self.logger.warning("Maximum number of items (%s) in buffer reached. Waiting for flush." % self.maxsize)
+                self.not_full.wait(1)
+            self.buffer.append(item)
+            if not self.flush_size or len(self.buffer) < self.flush_size or self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.io_loop.add_callback(self.flush)
+
+    def flush(self):
+        with self.lock:
+            self.flush_scheduled = False
+            if self.in_flight or not self.buffer:
+                return
+            batch_size = self.flush_size or len(self.buffer)
+            self.in_flight, self.buffer = self.buffer[:batch_size], self.buffer[batch_size:]
+        try:
+            self.flush_callback(self.in_flight, self.onFlushed)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not flush buffer. Exception: %s, Error: %s." % (etype, evalue))
+            self.onFlushed(False)
+
+    def onFlushed(self, success, failed_items=None):
+        with self.lock:
+            batch, self.in_flight = self.in_flight, []
+            if not success:
+                failed_items, batch = batch, []
+            elif failed_items:
+                failed_ids = set(id(item) for item in failed_items)
+                batch = [item for item in batch if id(item) not in failed_ids]
+            if failed_items:
+                self.buffer[0:0] = failed_items
+            self.not_full.notify_all()
+            flush_again = self.flush_size and len(self.buffer) >= self.flush_size
+        if batch and self.acknowledge_callback:
+            self.acknowledge_callback(batch)
+        if flush_again:
+            self.io_loop.add_callback(self.flush)
+
+    def stop(self):
+        """Stop the timed flush and send the remaining items."""
+        self.io_loop.add_callback(self.timed_flush.stop)
+        self.io_loop.add_callback(self.flush)
+
+    def bufsize(self):
+        return len(self.buffer) + len(self.in_flight)
+
+class SpillQueue:
+    """
+    Queue of event batches stored in memory mapped segment files in <path>.
+
+    Each batch is written as a msgpack record, prefixed with its length and number of events. Segment files
+    are created with <segment_size> bytes, a batch larger than that gets a segment of its own. Segments are
+    deleted once all their batches were popped. Writes fail if the size of all pending batches would exceed
+    <max_bytes>. Segments left over from a previous run are read back on init, already popped batches of the
+    first segment will be returned again.
+    Only one SpillQueue at a time can use a directory. It is locked until close, or until the process exits.
+    """
+    record_header = struct.Struct('!II')
+
+    def __init__(self, path, max_bytes=1073741824, segment_size=16777216):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.segments = []
+        self.segment_counter = 0
+        self.pending_bytes = 0
+        self.batch_count = 0
+        self.event_count = 0
+        self.lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        # Two processes writing and draining the same segments would corrupt them.
+        self.lock_file = open(os.path.join(path, 'lock'), 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            self.lock_file.close()
+            raise IOError("Spill directory %s is in use by another process." % path)
+        for segment_path in sorted(glob.glob(os.path.join(path, '*.spill'))):
+            if not os.path.getsize(segment_path):
+                os.remove(segment_path)
+                continue
+            self.openSegment(segment_path)
+
+    def openSegment(self, segment_path, size=0):
+        if size:
+            with open(segment_path, 'wb') as segment_file:
+                segment_file.truncate(size)
+        segment_file = open(segment_path, 'r+b')
+        segment = {'path': segment_path, 'file': segment_file, 'map': mmap.mmap(segment_file.fileno(), 0), 'read_pos': 0, 'write_pos': 0}
+        self.segment_counter = max(self.segment_counter, int(os.path.basename(segment_path)[:-6]) + 1)
+        self.segments.append(segment)
+        # Find the end of a segment left over from a previous run. Unused space of a segment is zero filled.
+        segment_map = segment['map']
+        while segment['write_pos'] + self.record_header.size <= len(segment_map):
+            length, events_count = self.record_header.unpack_from(segment_map, segment['write_pos'])
+            if not length:
+                break
+            segment['write_pos'] += self.record_header.size + length
+            self.batch_count += 1
+            self.event_count += events_count
+        self.pending_bytes += segment['write_pos']
+        return segment
+
+    def put(self, events):
+        payload = packEvents(events)
+        record_size = self.record_header.size + len(payload)
+        with self.lock:
+            if self.pending_bytes + record_size > self.max_bytes:
+                return False
+            segment = self.segments[-1] if self.segments else None
+            if not segment or segment['write_pos'] + record_size > len(segment['map']):
+                segment_path = os.path.join(self.path, "%020d.spill" % self.segment_counter)
+                segment = self.openSegment(segment_path, max(self.segment_size, record_size))
+            position = segment['write_pos']
+            segment['map'][position + self.record_header.size:position + record_size] = payload
+            self.record_header.pack_into(segment['map'], position, len(payload), len(events))
+            segment['write_pos'] += record_size
+            self.pending_bytes += record_size
+            self.batch_count += 1
+            self.event_count += len(events)
+        return True
+
+    def peek(self):
+        """Return the oldest batch without removing it."""
+        with self.lock:
+            if not self.batch_count:
+                return None
+            segment = self.segments[0]
+            position = segment['read_pos'] + self.record_header.size
+            length, _ = self.record_header.unpack_from(segment['map'], segment['read_pos'])
+            return unpackEvents(segment['map'][position:position + length])
+
+    def pop(self):
+        """Remove the oldest batch."""
+        with self.lock:
+            if not self.batch_count:
+                return
+            segment = self.segments[0]
+            length, events_count = self.record_header.unpack_from(segment['map'], segment['read_pos'])
+            segment['read_pos'] += self.record_header.size + length
+            self.pending_bytes -= self.record_header.size + length
+            self.batch_count -= 1
+            self.event_count -= events_count
+            if segment['read_pos'] >= segment['write_pos']:
+                self.closeSegment(self.segments.pop(0), delete=True)
+
+    def closeSegment(self, segment, delete=False):
+        segment['map'].close()
+        segment['file'].close()
+        if delete:
+            os.remove(segment['path'])
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment['map'].flush()
+                self.closeSegment(segment)
+            self.segments = []
+            self.lock_file.close()
+
+class TokenBucket:
+    """
+    Simple token bucket to pace a producer to a given rate.
+
+    Tokens are refilled with <rate> tokens per second up to <burst> tokens. Taking more tokens than available
+    is allowed, the caller will then be put to sleep until the debt is paid off. This way batches larger than
+    the bucket size still keep the overall rate.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = burst if burst else max(self.rate, 1)
+        self.tokens = self.burst
+        self.last_refill = time.time()
+
+    def setRate(self, rate):
+        self.refill()
+        self.rate = float(rate)
+
+    def refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def consume(self, count=1):
+        self.refill()
+        self.tokens -= count
+        if self.tokens < 0 and self.rate > 0:
+            time.sleep(-self.tokens / self.rate)
+
 class BufferedQueue:
-    def __init__(self, queue, buffersize=500):
+    """
+    Send events to a queue in batches.
+
+    The batch size adapts to the load. Each time a batch fills up, the next batch may grow twice as large,
+    up to <buffersize> events. If a batch does not fill up before its oldest event waited for <max_latency>
+    seconds, it will be flushed early and the next batch will be sized to the number of events seen in that time.
+    So under heavy load few large batches are sent while sparse events do not wait longer than needed.
+
+    The observed batch sizes and queueing delays are counted in the StatisticCollector and can be requested
+    via getStatistics.
+    """
+    def __init__(self, queue, buffersize=500, columnar=False, max_latency=1):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.queue = queue
         self.buffersize = buffersize
-        self.buffer = Buffer(buffersize, self.sendBuffer, 5)
+        self.columnar = columnar
+        self.max_latency = max_latency
+        self.batch_size = 1
+        self.buffer = []
+        self.first_put_time = None
+        self.put_time_sum = 0
+        self.lock = threading.Lock()
+        self.stats_collector = StatisticCollector.StatisticCollector()
+        self.resetStatistics()
+        self.timed_func_handle = None
+        self.startInterval()
 
     def startInterval(self):
-        self.buffer.startInterval()
+        self.timed_func_handle = TimedFunctionManager.startTimedFunction(self.getTimedFlushMethod())
+
+    def stopInterval(self):
+        TimedFunctionManager.stopTimedFunctions(self.timed_func_handle)
+
+    def getTimedFlushMethod(self):
+        # Check twice per latency budget. Flushing batches older than half the budget keeps the delay below max_latency.
+        @Decorators.setInterval(self.max_latency / 2.0)
+        def timedFlush():
+            with self.lock:
+                if self.buffer and time.time() - self.first_put_time >= self.max_latency / 2.0:
+                    # Sparse events, adjust batch size to the number of events received in time.
+                    self.batch_size = max(1, len(self.buffer))
+                    self.flush()
+        return timedFlush
 
     def put(self, payload):
-        self.buffer.append(payload)
+        now = time.time()
+        with self.lock:
+            if not self.buffer:
+                self.first_put_time = now
+            self.buffer.append(payload)
+            self.put_time_sum += now
+            if len(self.buffer) >= self.batch_size:
+                # Batch filled up, allow larger batches.
+                self.batch_size = min(self.buffersize, self.batch_size * 2)
+                self.flush()
+
+    def flushBuffer(self):
+        with self.lock:
+            self.flush()
+
+    def flush(self):
+        """Send buffered events. Caller must hold self.lock."""
+        if not self.buffer:
+            return
+        buffered_events = len(self.buffer)
+        queueing_delay = buffered_events * time.time() - self.put_time_sum
+        if not self.sendBuffer(self.buffer):
+            return
+        self.buffer = []
+        self.put_time_sum = 0
+        self.sent_batches += 1
+        self.sent_events += buffered_events
+        self.queueing_delay_sum += queueing_delay
+        self.stats_collector.incrementCounter('queue_batches')
+        self.stats_collector.incrementCounter('queue_batched_events', buffered_events)
+        self.stats_collector.incrementCounter('queue_batch_delay', queueing_delay)
+
+    def getStatistics(self, reset=False):
+        """Return number of sent batches, average batch size and average queueing delay per event in seconds."""
+        statistics = {'batch_count': self.sent_batches,
+                      'batch_size': self.batch_size,
+                      'avg_batch_size': self.sent_events / float(self.sent_batches) if self.sent_batches else 0,
+                      'avg_queueing_delay': self.queueing_delay_sum / self.sent_events if self.sent_events else 0}
+        if reset:
+            self.resetStatistics()
+        return statistics
+
+    def resetStatistics(self):
+        self.sent_batches = 0
+        self.sent_events = 0
+        self.queueing_delay_sum = 0
 
     def sendBuffer(self, buffered_data):
         try:
-            buffered_data = msgpack.packb(buffered_data)
+            buffered_data = packEvents(buffered_data, self.columnar)
             self.queue.put(buffered_data)
             return True
         except (KeyboardInterrupt, SystemExit):
@@ -301,17 +1118,15 @@ class BufferedQueue:
     def get(self, block=True, timeout=None):
         try:
             buffered_data = self.queue.get(block, timeout)
-            buffered_data = msgpack.unpackb(buffered_data)
-            # After msgpack.uppackb we just have a normal dict. Cast this to KeyDotNotationDict.
-            for data in buffered_data:
-                yield KeyDotNotationDict(data)
+            for data in unpackEvents(buffered_data):
+                yield data
         except (KeyboardInterrupt, SystemExit, ValueError, OSError):
             # Keyboard interrupt is catched in GambolPuttys main run method.
             # This will take care to shutdown all running modules.
             pass
 
     def qsize(self):
-        return self.buffer.bufsize() + self.queue.qsize()
+        return len(self.buffer) + self.queue.qsize()
 
     def __getattr__(self, name):
         return getattr(self.queue, name)
@@ -518,15 +1333,264 @@ class ZeroMqMpQueue:
         return self.queue_size
 
 class MemoryCache():
-
+    """
+    In process lru cache. pylru is not thread safe, so access is guarded by a lock. Modules with a thread pool share
+    one cache.
+    """
     def __init__(self, size=1000):
         self.lru_dict = pylru.lrucache(size)
+        self.lock = threading.Lock()
 
     def set(self, key, value):
-        self.lru_dict[key] = value
+        with self.lock:
+            self.lru_dict[key] = value
+
+    def get(self, key):
+        with self.lock:
+            return self.lru_dict[key]
+
+    def unset(self, key):
+        with self.lock:
+            return self.lru_dict.pop(key)
+
+
+class EnrichmentCache:
+    """
+    Read through cache for values that are expensive to get, like http responses or xpath results.
+
+    Values are kept in an in process lru cache for <ttl> seconds. If a redis_store is set, values not found in
+    the lru cache are looked up in redis, before the value is computed. Computed values are stored in both.
+
+    If the compute function raises or returns None, None is cached for <negative_ttl> seconds, so failing
+    lookups are not repeated for each event. Failed lookups are not stored in redis.
+
+    Expired values are still returned for <stale_ttl> seconds, while they are refreshed in the background.
+    Refreshes are passed to <executor>, e.g. to run them on the request threads of a module. By default, each
+    refresh gets a thread of its own. A key is refreshed only once at a time.
+
+    If a key is loaded by one thread, other threads asking for the same key wait for its result instead of
+    loading it again.
+
+    With prefetch, the values of a batch of keys are read from redis in one round trip.
+
+    Hits and misses of the lru cache (l1) and redis (l2) are counted with the cache_hits_ and cache_misses_
+    counters of the StatisticCollector.
+    """
+
+    def __init__(self, size=1000, ttl=60, negative_ttl=10, stale_ttl=0, redis_store=None, redis_ttl=60, executor=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.entries = pylru.lrucache(size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.redis_store = redis_store
+        self.redis_ttl = redis_ttl
+        self.executor = executor or self.runInThread
+        self.lock = threading.Lock()
+        # Events of running loads, by key.
+        self.loading = {}
+        self.stats_collector = StatisticCollector.StatisticCollector()
+        self.setCounterNames(self.__class__.__name__, 0)
+
+    def setCounterNames(self, module_id, worker_index):
+        # Hit ratios are reported per cache level and worker.
+        self.counters = {}
+        for cache_level in ['l1', 'l2']:
+            cache_name = "%s_%s_worker_%s" % (module_id, cache_level, worker_index)
+            self.counters[cache_level] = ("cache_hits_%s" % cache_name, "cache_misses_%s" % cache_name)
+
+    def countLookup(self, cache_level, hit):
+        self.stats_collector.incrementCounter(self.counters[cache_level][0 if hit else 1])
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+
+    def getCached(self, key, compute_func=None):
+        """
+        Return the value of key from the lru cache. Raises KeyError if key is not cached.
+        If compute_func is set, stale values are returned as well and refreshed via compute_func.
+        """
+        with self.lock:
+            try:
+                value, expires_at = self.entries[key]
+            except KeyError:
+                value = expires_at = None
+        now = time.time()
+        if expires_at is not None and now < expires_at:
+            self.countLookup('l1', True)
+            return value
+        if value is not None and compute_func and now < expires_at + self.stale_ttl:
+            self.countLookup('l1', True)
+            self.refresh(key, compute_func)
+            return value
+        self.countLookup('l1', False)
+        raise KeyError(key)
+
+    def get(self, key, compute_func):
+        """Return the value of key from the lru cache, from redis or by calling compute_func."""
+        try:
+            return self.getCached(key, compute_func)
+        except KeyError:
+            return self.load(key, compute_func)
+
+    def prefetch(self, keys):
+        """Get the values of all keys missing in the lru cache from redis in one round trip, e.g. for a batch of events."""
+        if not self.redis_store:
+            return
+        now = time.time()
+        with self.lock:
+            missing_keys = list(set(key for key in keys if key not in self.entries or self.entries.peek(key)[1] <= now))
+        if not missing_keys:
+            return
+        try:
+            values = self.redis_store.getMany(missing_keys)
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not get %s keys from redis. Exception: %s, Error: %s." % (len(missing_keys), etype, evalue))
+            return
+        for key, value in zip(missing_keys, values):
+            # Misses are counted, when the key is loaded.
+            if value is not None:
+                self.countLookup('l2', True)
+                self.set(key, value)
+
+    def refresh(self, key, compute_func):
+        # The load is registered before it is started, so further hits on the stale value do not start it again.
+        with self.lock:
+            if key in self.loading:
+                return
+            loaded = self.loading[key] = threading.Event()
+            loaded.value = None
+        self.executor(lambda: self.runLoad(key, compute_func, loaded))
+
+    def runInThread(self, function):
+        refresh_thread = threading.Thread(target=function)
+        refresh_thread.daemon = True
+        refresh_thread.start()
+
+    def load(self, key, compute_func):
+        """Look key up in redis or compute its value. Concurrent loads of the same key share the first one."""
+        with self.lock:
+            loaded = self.loading.get(key)
+            is_loading = loaded is not None
+            if not is_loading:
+                loaded = self.loading[key] = threading.Event()
+                loaded.value = None
+        if is_loading:
+            loaded.wait()
+            return loaded.value
+        return self.runLoad(key, compute_func, loaded)
+
+    def runLoad(self, key, compute_func, loaded):
+        try:
+            loaded.value = self.loadValue(key, compute_func)
+        finally:
+            with self.lock:
+                del self.loading[key]
+            loaded.set()
+        return loaded.value
+
+    def loadValue(self, key, compute_func):
+        if self.redis_store:
+            try:
+                value = self.redis_store.get(key)
+            except:
+                etype, evalue, etb = sys.exc_info()
+                self.logger.error("Could not get %s from redis. Exception: %s, Error: %s." % (key, etype, evalue))
+                value = None
+            self.countLookup('l2', value is not None)
+            if value is not None:
+                self.set(key, value)
+                return value
+        try:
+            value = compute_func()
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.warning("Could not compute value for %s. Exception: %s, Error: %s." % (key, etype, evalue))
+            value = None
+        self.set(key, value)
+        if value is not None and self.redis_store:
+            try:
+                self.redis_store.set(key, value, self.redis_ttl)
+            except:
+                etype, evalue, etb = sys.exc_info()
+                self.logger.error("Could not store %s in redis. Exception: %s, Error: %s." % (key, etype, evalue))
+        return value
+
+
+class SharedMemoryCache:
+    """
+    Fixed size hash table in an anonymous memory map. Create it before the workers are forked, so all of them
+    use the same memory. Values are stored msgpacked.
+
+    The table has <size> slots of <slot_size> bytes. A key can be stored in one of two neighbouring slots,
+    if both are taken, one of them is overwritten. Values that do not fit in a slot are not cached.
+
+    Writes are not locked. Each slot stores a checksum of its content, so an entry read while another
+    worker overwrites it is treated as a miss.
+
+    Slot layout: checksum (4 bytes), key length (4 bytes), value length (4 bytes), key, msgpacked value.
+    """
+    header = struct.Struct('<iII')
+
+    def __init__(self, size=16384, slot_size=1024):
+        self.size = max(2, size)
+        self.slot_size = slot_size
+        self.max_data_size = slot_size - self.header.size
+        self.map = mmap.mmap(-1, self.size * self.slot_size)
+
+    def getSlots(self, key):
+        slot = struct.unpack('<Q', hashlib.md5(key).digest()[:8])[0] % self.size
+        return slot, (slot + 1) % self.size
+
+    def readSlot(self, slot):
+        """Return key and packed value of a slot or None, None for empty or inconsistent slots."""
+        position = slot * self.slot_size
+        checksum, key_length, value_length = self.header.unpack_from(self.map, position)
+        if not key_length or key_length + value_length > self.max_data_size:
+            return None, None
+        position += self.header.size
+        data = self.map[position:position + key_length + value_length]
+        if zlib.crc32(data) != checksum:
+            return None, None
+        return data[:key_length], data[key_length:]
 
     def get(self, key):
-        return self.lru_dict[key]
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        for slot in self.getSlots(key):
+            slot_key, packed_value = self.readSlot(slot)
+            if slot_key == key:
+                return msgpack.unpackb(packed_value, raw=False)
+        raise KeyError(key)
+
+    def set(self, key, value):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        data = key + msgpack.packb(value, use_bin_type=True)
+        if not key or len(data) > self.max_data_size:
+            return False
+        slots = self.getSlots(key)
+        target_slot = None
+        for slot in slots:
+            slot_key, _ = self.readSlot(slot)
+            if slot_key is None or slot_key == key:
+                target_slot = slot
+                break
+        if target_slot is None:
+            # Both slots are taken, replace one of them at random.
+            target_slot = slots[random.getrandbits(1)]
+        position = target_slot * self.slot_size
+        self.map[position + self.header.size:position + self.header.size + len(data)] = data
+        self.header.pack_into(self.map, position, zlib.crc32(data), len(key), len(data) - len(key))
+        return True
 
     def unset(self, key):
-        return self.lru_dict.pop(key)
\ No newline at end of file
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        for slot in self.getSlots(key):
+            if self.readSlot(slot)[0] == key:
+                self.header.pack_into(self.map, slot * self.slot_size, 0, 0, 0)
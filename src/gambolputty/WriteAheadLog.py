@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import glob
+import time
+import struct
+import zlib
+import logging
+import threading
+import Decorators
+import Utils
+
+
+def readOffsetFile(path, default=None):
+    try:
+        with open(path) as offset_file:
+            return int(offset_file.read())
+    except (IOError, ValueError):
+        return default
+
+def writeOffsetFile(path, offset):
+    # Write to a temporary file first, so readers never see a partially written offset.
+    tmp_path = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp_path, 'w') as offset_file:
+        offset_file.write("%s" % offset)
+    os.rename(tmp_path, path)
+
+def readRangesFile(path):
+    try:
+        with open(path) as ranges_file:
+            return OffsetRanges.fromString(ranges_file.read())
+    except (IOError, ValueError):
+        return None
+
+def acknowledge(log_path, consumer_name, ranges):
+    """
+    Acknowledge the records in ranges of the log in log_path for consumer_name.
+    This only writes the acknowledgement file, so it can be used for logs owned by another process.
+    """
+    try:
+        writeOffsetFile(os.path.join(log_path, 'acks', consumer_name), ranges)
+    except (IOError, OSError):
+        etype, evalue, etb = sys.exc_info()
+        logging.getLogger("WriteAheadLog").error("Could not write acknowledged offsets for %s. Exception: %s, Error: %s." % (consumer_name, etype, evalue))
+
+
+class OffsetRanges:
+    """
+    Sorted, non overlapping ranges of offsets. Each range is a [first, last] list, both offsets included.
+
+    Stored as e.g. "0-41,45-99". A single number, as written by former versions, covers all offsets up to it.
+    """
+    def __init__(self, ranges=None):
+        self.ranges = ranges or []
+
+    @classmethod
+    def fromString(cls, data):
+        ranges = []
+        for range_string in data.strip().split(','):
+            if not range_string:
+                continue
+            if '-' not in range_string:
+                ranges.append([0, int(range_string)])
+                continue
+            first, last = range_string.split('-')
+            ranges.append([int(first), int(last)])
+        offset_ranges = cls()
+        offset_ranges.update(ranges)
+        return offset_ranges
+
+    def __str__(self):
+        return ",".join("%d-%d" % (first, last) for first, last in self.ranges)
+
+    def __nonzero__(self):
+        return bool(self.ranges)
+
+    def add(self, offsets):
+        self.update([[offset, offset] for offset in offsets])
+
+    def update(self, ranges):
+        merged = []
+        for first, last in sorted(self.ranges + [list(offset_range) for offset_range in ranges]):
+            if merged and first <= merged[-1][1] + 1:
+                if last > merged[-1][1]:
+                    merged[-1][1] = last
+                continue
+            merged.append([first, last])
+        self.ranges = merged
+
+    def discardBelow(self, offset):
+        """Forget all offsets below offset."""
+        ranges = [offset_range for offset_range in self.ranges if offset_range[1] >= offset]
+        if ranges and ranges[0][0] < offset:
+            ranges[0] = [offset, ranges[0][1]]
+        self.ranges = ranges
+
+    def getFirstMissing(self, offset):
+        """Return the first offset not covered, starting at offset."""
+        for first, last in self.ranges:
+            if first > offset:
+                break
+            if last >= offset:
+                offset = last + 1
+        return offset
+
+    def getNextCovered(self, offset):
+        """Return the first covered offset above offset or None."""
+        for first, last in self.ranges:
+            if last > offset:
+                return max(first, offset + 1)
+        return None
+
+    def contains(self, offset):
+        return self.getFirstMissing(offset) != offset
+
+
+class WriteAheadLog:
+    """
+    Segmented append only log of events.
+
+    Each event is stored as a record with a monotonic offset. Records are appended to the active segment
+    file, which is rolled over once it grows above <segment_size> bytes. Segment files are named after the
+    offset of their first record.
+
+    Appends are only written to the os buffers. The log is synced to disk with a single fsync, as soon as
+    <sync_bytes> were appended or at the latest after <sync_interval> seconds (group commit).
+
+    The expected consumers are registered via setConsumers. Each consumer acknowledges the ranges of offsets it
+    is done with, by writing them to a file in the acks directory. A consumer may write several files, one per
+    process, named <consumer>@<process>. A record is done once it is covered for all registered consumers.
+    A consumer without acknowledgements has not passed any record yet.
+    Records missing between the acknowledged ranges of a consumer for more than <gap_timeout> seconds are
+    treated as done as well. These are events the consumer never got, e.g. because they were filtered on their way.
+    Segments that only contain done records can be truncated.
+
+    Record layout: offset (8 bytes), payload length (4 bytes), crc32 of payload (4 bytes), payload.
+    """
+    header = struct.Struct('!QIi')
+
+    def __init__(self, path, segment_size=67108864, sync_interval=.05, sync_bytes=1048576, gap_timeout=3600):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.acks_path = os.path.join(path, 'acks')
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.sync_bytes = sync_bytes
+        self.gap_timeout = gap_timeout
+        self.consumers = set()
+        # First time a gap in the acknowledgements of a consumer was seen, by (consumer, first missing offset).
+        self.gaps = {}
+        self.lock = threading.Lock()
+        self.segment_file = None
+        self.timed_func_handle = None
+        self.open()
+
+    def open(self):
+        for path in (self.path, self.acks_path):
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        self.base_offset = readOffsetFile(os.path.join(self.path, 'base_offset'), 0)
+        segments = self.getSegments()
+        if not segments:
+            self.next_offset = self.base_offset
+            self.openSegment(self.next_offset)
+            return
+        # Only the last segment may contain a partially written record.
+        segment_base, segment_path = segments[-1]
+        self.next_offset = segment_base
+        valid_size = 0
+        for offset, payload, end_position in self.readSegment(segment_path):
+            self.next_offset = offset + 1
+            valid_size = end_position
+        if valid_size < os.path.getsize(segment_path):
+            self.logger.warning("Truncating incomplete record at position %s in %s." % (valid_size, segment_path))
+            with open(segment_path, 'r+b') as segment_file:
+                segment_file.truncate(valid_size)
+        self.segment_file = open(segment_path, 'ab')
+        self.segment_base = segment_base
+        self.segment_bytes = valid_size
+        self.unsynced_bytes = 0
+
+    def openSegment(self, base_offset):
+        self.segment_file = open(os.path.join(self.path, "%020d.log" % base_offset), 'ab')
+        self.segment_base = base_offset
+        self.segment_bytes = 0
+        self.unsynced_bytes = 0
+
+    def getSegments(self):
+        """Return a sorted list of (base offset, path) tuples of all segment files."""
+        segments = []
+        for segment_path in glob.glob(os.path.join(self.path, '*.log')):
+            try:
+                segments.append((int(os.path.basename(segment_path)[:-4]), segment_path))
+            except ValueError:
+                continue
+        return sorted(segments)
+
+    def readSegment(self, segment_path):
+        """Yield (offset, payload, end position) of all complete records in a segment."""
+        header_size = self.header.size
+        with open(segment_path, 'rb') as segment_file:
+            position = 0
+            while True:
+                header = segment_file.read(header_size)
+                if len(header) < header_size:
+                    return
+                offset, length, checksum = self.header.unpack(header)
+                payload = segment_file.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                position += header_size + length
+                yield offset, payload, position
+
+    def startInterval(self):
+        self.timed_func_handle = Utils.TimedFunctionManager.startTimedFunction(self.getTimedSyncMethod())
+
+    def stopInterval(self):
+        if self.timed_func_handle:
+            Utils.TimedFunctionManager.stopTimedFunctions(self.timed_func_handle)
+            self.timed_func_handle = None
+
+    def getTimedSyncMethod(self):
+        @Decorators.setInterval(self.sync_interval)
+        def timedSync():
+            self.sync()
+        return timedSync
+
+    def append(self, events):
+        """Append events to the log and return their offsets."""
+        records = []
+        offsets = []
+        with self.lock:
+            for event in events:
+                payload = Utils.packEvents([event])
+                records.append(self.header.pack(self.next_offset, len(payload), zlib.crc32(payload)))
+                records.append(payload)
+                offsets.append(self.next_offset)
+                self.next_offset += 1
+            data = "".join(records)
+            self.segment_file.write(data)
+            self.segment_bytes += len(data)
+            self.unsynced_bytes += len(data)
+            if self.segment_bytes >= self.segment_size:
+                self.rollSegment()
+            elif self.unsynced_bytes >= self.sync_bytes:
+                self.syncSegment()
+        return offsets
+
+    def rollSegment(self):
+        """Close the active segment and start a new one. Caller must hold self.lock."""
+        self.syncSegment()
+        self.segment_file.close()
+        self.openSegment(self.next_offset)
+
+    def sync(self):
+        with self.lock:
+            if self.unsynced_bytes:
+                self.syncSegment()
+
+    def syncSegment(self):
+        """Write the active segment to disk. Caller must hold self.lock."""
+        self.segment_file.flush()
+        os.fsync(self.segment_file.fileno())
+        self.unsynced_bytes = 0
+
+    def readEvents(self, from_offset=0, to_offset=None):
+        """Yield (offset, event) for all records with from_offset <= offset < to_offset."""
+        for segment_base, segment_path in self.getSegments():
+            if to_offset is not None and segment_base >= to_offset:
+                return
+            for offset, payload, _ in self.readSegment(segment_path):
+                if offset < from_offset:
+                    continue
+                if to_offset is not None and offset >= to_offset:
+                    return
+                yield offset, Utils.unpackEvents(payload)[0]
+
+    def setConsumers(self, consumers):
+        self.consumers = set(consumers)
+
+    def acknowledge(self, consumer_name, ranges):
+        """Mark all records in ranges as done for consumer_name."""
+        acknowledge(self.path, consumer_name, ranges)
+
+    def getAcknowledgedRanges(self):
+        """Return the acknowledged ranges by consumer, merged over the files of all processes."""
+        ranges_by_consumer = {}
+        for ack_path in glob.glob(os.path.join(self.acks_path, '*')):
+            if ack_path.endswith('.tmp'):
+                continue
+            ranges = readRangesFile(ack_path)
+            if ranges is None:
+                continue
+            consumer_name = os.path.basename(ack_path).rsplit('@', 1)[0]
+            ranges_by_consumer.setdefault(consumer_name, OffsetRanges()).update(ranges.ranges)
+        return ranges_by_consumer
+
+    def getPendingOffset(self):
+        """Return the offset of the first record not done for all registered consumers."""
+        ranges_by_consumer = self.getAcknowledgedRanges()
+        now = time.time()
+        gaps = {}
+        pending_offset = self.next_offset
+        for consumer_name in self.consumers:
+            ranges = ranges_by_consumer.get(consumer_name, OffsetRanges())
+            offset = ranges.getFirstMissing(self.base_offset)
+            while offset < pending_offset:
+                next_covered = ranges.getNextCovered(offset)
+                if next_covered is None or self.gap_timeout is None:
+                    break
+                gaps[(consumer_name, offset)] = first_seen = self.gaps.get((consumer_name, offset), now)
+                if now - first_seen < self.gap_timeout:
+                    break
+                offset = ranges.getFirstMissing(next_covered)
+            pending_offset = min(pending_offset, offset)
+        self.gaps = gaps
+        return max(self.base_offset, pending_offset)
+
+    def isDone(self, offset, ranges_by_consumer):
+        for consumer_name in self.consumers:
+            if consumer_name not in ranges_by_consumer or not ranges_by_consumer[consumer_name].contains(offset):
+                return False
+        return True
+
+    def setBaseOffset(self, offset):
+        """All records below offset are done, no matter what consumers acknowledged before."""
+        writeOffsetFile(os.path.join(self.path, 'base_offset'), offset)
+        self.base_offset = offset
+
+    def expireAcknowledgements(self):
+        """
+        Delete acknowledgement files that only cover records below the base offset, e.g. those of retired workers.
+        Files of running processes will be written again with their next acknowledgement.
+        """
+        for ack_path in glob.glob(os.path.join(self.acks_path, '*')):
+            if ack_path.endswith('.tmp'):
+                continue
+            ranges = readRangesFile(ack_path)
+            if ranges is None:
+                continue
+            ranges.discardBelow(self.base_offset)
+            if ranges:
+                continue
+            try:
+                os.remove(ack_path)
+            except OSError:
+                pass
+
+    def truncate(self, offset):
+        """Delete all segments that only contain records below offset. The active segment is always kept."""
+        with self.lock:
+            active_segment_base = self.segment_base
+        segments = self.getSegments()
+        removed_segments = 0
+        for idx, (segment_base, segment_path) in enumerate(segments[:-1]):
+            next_segment_base = segments[idx + 1][0]
+            if next_segment_base > offset or segment_base >= active_segment_base:
+                break
+            os.remove(segment_path)
+            removed_segments += 1
+        return removed_segments
+
+    def getSize(self):
+        return sum(os.path.getsize(segment_path) for _, segment_path in self.getSegments())
+
+    def close(self):
+        self.stopInterval()
+        with self.lock:
+            if self.segment_file and not self.segment_file.closed:
+                self.syncSegment()
+                self.segment_file.close()
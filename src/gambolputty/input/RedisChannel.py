@@ -1,6 +1,4 @@
 # -*- coding: utf-8 -*-
-import sys
-from tornado import autoreload
 import RedisAsyncClient
 import BaseModule
 import Utils
@@ -18,6 +16,9 @@ class RedisChannel(BaseModule.BaseModule):
     db: Redis db.
     password: Redis password.
 
+    The subscription is made via RedisAsyncClient on the IOLoop of the master process. If the connection to redis
+    is lost, the channel is subscribed again after the reconnect. Messages published in the meantime are lost.
+
     Configuration template:
 
     - RedisChannel:
@@ -37,36 +38,22 @@ class RedisChannel(BaseModule.BaseModule):
     def configure(self, configuration):
          # Call parent configure method
         BaseModule.BaseModule.configure(self, configuration)
-        try:
-            self.client = RedisAsyncClient.AsyncRedisClient(address=(self.getConfigurationValue('server'), self.getConfigurationValue('port')))
-            if self.getConfigurationValue('db') != 0:
-                self.client.fetch(('select', self.getConfigurationValue('db')), self.checkReply)
-            if self.getConfigurationValue('password'):
-                self.client.fetch(('select', self.getConfigurationValue('password')), self.checkReply)
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not connect to redis store at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('server'), etype, evalue))
-            self.gp.shutDown()
-        try:
-            self.client.fetch(('subscribe', self.getConfigurationValue('channel')), self.receiveEvent)
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not subscribe to channel at redis store at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('server'), etype, evalue))
-        #autoreload.add_reload_hook(self.shutDown)
-        #ioloop = IOLoop.instance()
-        #ioloop.make_current()
-        #try:
-        #    ioloop.start()
-        #except ValueError:
-            # Ignore errors like "ValueError: I/O operation on closed kqueue fd". These might be thrown during a reload.
-        #    pass
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
+        self.client = None
+
+    def initAfterFork(self):
+        self.client = RedisAsyncClient.AsyncRedisClient(address=(self.getConfigurationValue('server'), self.getConfigurationValue('port')),
+                                                        password=self.getConfigurationValue('password'),
+                                                        db=self.getConfigurationValue('db'))
+        self.client.subscribe([self.getConfigurationValue('channel')], self.receiveEvent)
+        BaseModule.BaseModule.initAfterFork(self)
 
-    def checkReply(self, answer):
-        if answer != "OK":
-            self.logger.error("Could not connect to server %s. Server said: %s." % (self.getConfigurationValue('server'), answer))
-            self.gp.shutDown()
+    def shutDown(self):
+        if self.client:
+            self.client.close(wait_for_replies=False)
+        BaseModule.BaseModule.shutDown(self)
 
     def handleEvent(self, event):
-        if event[0] != 'message':
+        if isinstance(event, RedisAsyncClient.RedisError) or event[0] != 'message':
             return
-        yield Utils.getDefaultEventDict(dict={"received_from": '%s' % event[1], "data": event[2]}, caller_class_name=self.__class__.__name__)
\ No newline at end of file
+        yield self.event_factory.getEvent({"received_from": '%s' % event[1], "data": event[2]})
\ No newline at end of file
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-import sys
-import redis
+import Queue
+import threading
+import RedisAsyncClient
 import BaseThreadedModule
 import Utils
 import Decorators
@@ -17,6 +18,16 @@ class RedisList(BaseThreadedModule.BaseThreadedModule):
     db: Redis db.
     password: Redis password.
     timeout: Timeout in seconds.
+    batch_size: Maximum number of items to get from each list per round trip.
+
+    The lists are read via RedisAsyncClient on the IOLoop of the process, on a connection of its own.
+    Up to batch_size items of each list are fetched and removed in one MULTI/LRANGE/LTRIM/EXEC transaction and sent
+    to the receivers as one batch. As the transaction is atomic, the module can run in all workers without getting
+    an item twice. Only if all lists are empty, BLPOP is used to wait for the next item.
+    Popped batches are handed to the module thread, which sends them on. While the thread is busy with earlier
+    batches, no further items are popped, so slow receivers do not block the IOLoop.
+    On shutdown, the batches popped ahead and the items of a running transaction are still sent on.
+    If the connection to redis is lost, reading is resumed after the reconnect.
 
     Configuration template:
 
@@ -27,6 +38,7 @@ class RedisList(BaseThreadedModule.BaseThreadedModule):
         db:                       # <default: 0; type: integer; is: optional>
         password:                 # <default: None; type: None||string; is: optional>
         timeout:                  # <default: 0; type: integer; is: optional>
+        batch_size:               # <default: 100; type: integer; is: optional>
         receivers:
           - NextModule
     """
@@ -38,26 +50,129 @@ class RedisList(BaseThreadedModule.BaseThreadedModule):
     def configure(self, configuration):
          # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.lists = self.getConfigurationValue('lists')
         self.timeout = self.getConfigurationValue('timeout')
-        self.client = redis.StrictRedis(host=self.getConfigurationValue('server'),
-                                        port=self.getConfigurationValue('port'),
-                                        password=self.getConfigurationValue('password'),
-                                        db=self.getConfigurationValue('db'))
-        try:
-            self.client.ping()
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not connect to redis store at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('server'), etype, evalue))
-            self.gp.shutDown()
+        self.batch_size = self.getConfigurationValue('batch_size')
+        self.client = None
+        # Batches popped ahead while the module thread sends on the current one.
+        self.event_queue = Queue.Queue(maxsize=2)
+        self.reading_paused = False
+        self.waiting_for_item = False
+
+    def initAfterFork(self):
+        self.client = RedisAsyncClient.AsyncRedisClient(address=(self.getConfigurationValue('server'), self.getConfigurationValue('port')),
+                                                        password=self.getConfigurationValue('password'),
+                                                        db=self.getConfigurationValue('db'))
+        # A blocking pop would hold back all other commands on a shared connection.
+        self.connection = self.client.getConnection()
+        self.popEvents()
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def run(self):
+        if not self.receivers:
+            self.logger.error("Shutting down module %s since no receivers are set." % (self.__class__.__name__))
+            return
         while self.alive:
             try:
-                event = self.client.blpop(self.lists, timeout=self.timeout)
-            except:
-                exc_type, exc_value, exc_tb = sys.exc_info()
-                self.logger.error("Could not read data from redis list(s) %s. Exception: %s, Error: %s." % (self.lists, exc_type, exc_value))
+                events = self.event_queue.get(timeout=.5)
+            except Queue.Empty:
                 continue
-            event = Utils.getDefaultEventDict(dict={"received_from": '%s' % (event[0]), "data": event[1]}, caller_class_name=self.__class__.__name__)
-            self.sendEvent(event)
\ No newline at end of file
+            self.client.io_loop.add_callback(self.resumeReading)
+            self.sendEventBatch(events)
+
+    def popEvents(self):
+        if not self.alive:
+            return
+        if self.batch_size < 2:
+            self.popEvent()
+            return
+        commands = [('MULTI',)]
+        for list_name in self.lists:
+            commands.append(('LRANGE', list_name, 0, self.batch_size - 1))
+            commands.append(('LTRIM', list_name, self.batch_size, -1))
+        commands.append(('EXEC',))
+        self.connection.executeMany(commands, self.receivePoppedEvents)
+
+    def popEvent(self):
+        if not self.alive:
+            return
+        self.waiting_for_item = True
+        self.connection.execute(('BLPOP',) + tuple(self.lists) + (self.timeout,), self.receivePoppedEvent)
+
+    def receivePoppedEvents(self, replies):
+        # Errors of queued commands are only reported by EXEC.
+        transaction_reply = replies[-1]
+        if isinstance(transaction_reply, RedisAsyncClient.RedisError) or transaction_reply is None:
+            self.handleError(transaction_reply)
+            return
+        events = []
+        for list_name, items in zip(self.lists, transaction_reply[::2]):
+            if isinstance(items, RedisAsyncClient.RedisError):
+                self.handleError(items)
+                return
+            for item in items:
+                events.append(self.event_factory.getEvent({"received_from": list_name, "data": item}))
+        if not events:
+            # Wait for the next item.
+            self.popEvent()
+            return
+        self.queueEvents(events)
+
+    def receivePoppedEvent(self, reply):
+        self.waiting_for_item = False
+        if isinstance(reply, RedisAsyncClient.RedisError):
+            self.handleError(reply)
+            return
+        if reply:
+            self.queueEvents([self.event_factory.getEvent({"received_from": '%s' % (reply[0]), "data": reply[1]})])
+            return
+        self.popEvent()
+
+    def queueEvents(self, events):
+        self.event_queue.put_nowait(events)
+        if not self.alive:
+            # Popped while shutting down, the module thread is gone.
+            self.sendQueuedEvents()
+            return
+        if self.event_queue.full():
+            # Resumed by the module thread via resumeReading.
+            self.reading_paused = True
+            return
+        self.popEvents()
+
+    def resumeReading(self):
+        if not self.reading_paused or self.connection.closed:
+            return
+        self.reading_paused = False
+        self.popEvents()
+
+    def sendQueuedEvents(self):
+        while True:
+            try:
+                events = self.event_queue.get_nowait()
+            except Queue.Empty:
+                return
+            self.sendEventBatch(events)
+
+    def handleError(self, error):
+        if self.connection.closed:
+            return
+        self.logger.error("Could not read data from redis list(s) %s. Error: %s." % (self.lists, error))
+        if isinstance(error, RedisAsyncClient.ConnectionError):
+            # Commands executed while the connection is down will be sent after the reconnect.
+            self.popEvents()
+            return
+        # Do not retry a failing command in a tight loop.
+        self.client.io_loop.add_timeout(self.client.io_loop.time() + 1, self.popEvents)
+
+    def shutDown(self):
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
+        if self.client:
+            # Items of a running transaction are already removed from the lists, wait for its reply.
+            # A pending BLPOP would keep the connection open.
+            self.client.close(wait_for_replies=not self.waiting_for_item)
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        # Send on the batches popped ahead, before the receivers are shut down.
+        self.sendQueuedEvents()
@@ -46,6 +46,7 @@ class Sniffer(BaseThreadedModule.BaseThreadedModule):
 
     def configure(self, configuration):
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.interface = self.getConfigurationValue('interface')
         self.promiscous_mode = 1 if self.getConfigurationValue('promiscous') else 0
         self.kv_store = self.getConfigurationValue('key_value_store') if self.getConfigurationValue('key_value_store') else {}
@@ -94,7 +95,7 @@ class Sniffer(BaseThreadedModule.BaseThreadedModule):
             if not packet:
                 continue
             p = self.decodePacket(packet, 'eth')
-            decoded_packet = Utils.getDefaultEventDict({'protocols': ['ethernet'], 'data': packet, 'packet_size': pcap_header.getlen()}, caller_class_name=self.__class__.__name__)
+            decoded_packet = self.event_factory.getEvent({'protocols': ['ethernet'], 'data': packet, 'packet_size': pcap_header.getlen()})
             decoded_packet['gambolputty']['event_type'] = 'PcapSniffer'
             dest_mac, source_mac, proto_type = struct.unpack("!6s6sH", packet[:14])
             decoded_packet['source_mac'] = ':'.join('%02x' % ord(byte) for byte in source_mac)
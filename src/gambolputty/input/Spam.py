@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
+import sys
+import time
+import itertools
 import Utils
 import BaseThreadedModule
-import pprint
-import time
 import Decorators
 
 
@@ -13,16 +14,33 @@ class Spam(BaseThreadedModule.BaseThreadedModule):
 
     Use this module to load test GambolPutty.
 
-    event: Send custom event data.
-    sleep: Time to wait between sending events.
+    All events are pre-rendered as templates when the module is configured. For each emitted event only
+    the event_id and the timestamp field are set. Nested values are shared between the emitted events.
+
+    event: Send custom event data. If a list of dicts is given, each dict will be used as a template.
+    events_file: Replay lines from this file. Each line will be used as data field of a template.
+    template_count: Render event this many times. Use the $(template_id) placeholder to create distinct templates.
+    timestamp_field: Set current time in this field. Set to None to disable.
+    sleep: Time to wait between sending batches.
     events_count: Only send configured number of events. 0 means no limit.
+    batch_size: Number of events to send to the receivers in one go.
+    rate: Target rate in events per second. 0 means no limit.
+    burst: Maximum number of events that may be sent in a burst above rate. Defaults to one second worth of events.
+    ramp_time: Time in seconds to linearly ramp up from 1% of rate to rate.
 
     Configuration template:
 
     - Spam:
-        event:                    # <default: {}; type: dict; is: optional>
+        event:                    # <default: {}; type: dict||list; is: optional>
+        events_file:              # <default: None; type: None||string; is: optional>
+        template_count:           # <default: 1; type: integer; is: optional>
+        timestamp_field:          # <default: 'timestamp'; type: None||string; is: optional>
         sleep:                    # <default: 0; type: int||float; is: optional>
         events_count:             # <default: 0; type: int; is: optional>
+        batch_size:               # <default: 1; type: integer; is: optional>
+        rate:                     # <default: 0; type: int||float; is: optional>
+        burst:                    # <default: None; type: None||integer; is: optional>
+        ramp_time:                # <default: 0; type: int||float; is: optional>
         receivers:
           - NextModule
     """
@@ -34,19 +52,80 @@ class Spam(BaseThreadedModule.BaseThreadedModule):
     def configure(self, configuration):
         # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
-        self.event = self.getConfigurationValue("event")
         self.sleep = self.getConfigurationValue("sleep")
-        #pprint.pprint(self.configuration_data)
+        self.max_events_count = self.getConfigurationValue("events_count")
+        self.batch_size = self.getConfigurationValue("batch_size")
+        self.timestamp_field = self.getConfigurationValue("timestamp_field")
+        self.rate = self.getConfigurationValue("rate")
+        self.ramp_time = self.getConfigurationValue("ramp_time")
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
+        self.templates = self.renderTemplates()
+        if not self.templates:
+            self.logger.error("No event templates to send. Please check configuration.")
+            self.gp.shutDown()
+
+    def renderTemplates(self):
+        templates = []
+        if self.getConfigurationValue("events_file"):
+            try:
+                with open(self.getConfigurationValue("events_file")) as events_file:
+                    for line in events_file:
+                        line = line.rstrip("\r\n")
+                        if line:
+                            templates.append({"data": line})
+            except IOError:
+                etype, evalue, etb = sys.exc_info()
+                self.logger.error("Could not read events file %s. Exception: %s, Error: %s." % (self.getConfigurationValue("events_file"), etype, evalue))
+                return []
+        elif isinstance(self.getConfigurationValue("event"), list):
+            templates = self.getConfigurationValue("event")
+        else:
+            for template_id in xrange(0, self.getConfigurationValue("template_count")):
+                template = self.getConfigurationValue("event", {'template_id': template_id})
+                if template is False:
+                    self.logger.error("Could not render event template %s." % template_id)
+                    return []
+                templates.append(template)
+        return [self.event_factory.getEvent(template) for template in templates]
+
+    def renderEvent(self, template, now):
+        event = Utils.KeyDotNotationDict(template)
+        metadata = template['gambolputty'].copy()
+        metadata['event_id'] = self.event_factory.getEventId()
+        # Templates are rendered before a possible fork.
+        metadata['pid'] = self.event_factory.pid
+        dict.__setitem__(event, 'gambolputty', metadata)
+        if self.timestamp_field:
+            event[self.timestamp_field] = now
+        return event
+
+    def getRateLimiter(self):
+        if not self.rate:
+            return None
+        bucket = Utils.TokenBucket(self.rate, self.getConfigurationValue("burst"))
+        if self.ramp_time:
+            bucket.setRate(self.rate * .01)
+        return bucket
 
     def run(self):
+        templates = itertools.cycle(self.templates)
+        rate_limiter = self.getRateLimiter()
+        started_at = time.time()
         counter = 0
-        max_events_count = self.getConfigurationValue("events_count")
         while self.alive:
-            event = Utils.getDefaultEventDict(self.event, caller_class_name=self.__class__.__name__) # self.getConfigurationValue("event")
-            self.sendEvent(event)
+            batch_size = self.batch_size
+            if self.max_events_count:
+                batch_size = min(batch_size, self.max_events_count - counter)
+            if rate_limiter:
+                if self.ramp_time:
+                    rate_limiter.setRate(self.rate * min(1, max(.01, (time.time() - started_at) / self.ramp_time)))
+                rate_limiter.consume(batch_size)
+            now = time.time()
+            self.sendEventBatch([self.renderEvent(templates.next(), now) for _ in xrange(0, batch_size)])
             if self.sleep > 0:
                 time.sleep(self.sleep)
-            counter += 1
-            if (counter - max_events_count == 0):
+            counter += batch_size
+            if (counter - self.max_events_count == 0):
                 time.sleep(2)
                 self.gp.shutDown()
+                return
@@ -27,6 +27,7 @@ class StdIn(BaseThreadedModule.BaseThreadedModule):
 
     def configure(self, configuration):
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.multiline = self.getConfigurationValue('multiline')
         self.stream_end_signal = self.getConfigurationValue('stream_end_signal')
 
@@ -41,15 +42,15 @@ class StdIn(BaseThreadedModule.BaseThreadedModule):
             data = sys.stdin.readline()
             if data.__len__() > 0:
                 if not self.multiline:
-                    self.sendEvent(Utils.getDefaultEventDict({"received_from": 'stdin://%s' % hostname, "data": data}, caller_class_name=self.__class__.__name__))
+                    self.sendEvent(self.event_factory.getEvent({"received_from": 'stdin://%s' % hostname, "data": data}))
                 else:
                     if self.stream_end_signal and self.stream_end_signal == data:
-                        self.sendEvent(Utils.getDefaultEventDict({"received_from": 'stdin://%s' % hostname, "data": multiline_data}, caller_class_name=self.__class__.__name__))
+                        self.sendEvent(self.event_factory.getEvent({"received_from": 'stdin://%s' % hostname, "data": multiline_data}))
                         multiline_data = ""
                         continue
                     multiline_data += data
             else: # an empty line means stdin has been closed
                 if multiline_data.__len__() > 0:
-                    self.sendEvent(Utils.getDefaultEventDict({"received_from": 'stdin://%s' % hostname, "data": multiline_data}, caller_class_name=self.__class__.__name__))
+                    self.sendEvent(self.event_factory.getEvent({"received_from": 'stdin://%s' % hostname, "data": multiline_data}))
                 self.gp.shutDown()
                 self.alive = False
\ No newline at end of file
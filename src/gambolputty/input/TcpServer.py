@@ -34,6 +34,7 @@ class ConnectionHandler(object):
         self.stream = stream
         self.address = address
         (self.host, self.port) = self.address
+        self.received_from = "%s:%d" % (self.host, self.port)
         self.stream.set_close_callback(self._on_close)
         try:
             if not self.stream.closed():
@@ -92,7 +93,7 @@ class ConnectionHandler(object):
         self.stream.close()
 
     def sendEvent(self, data):
-        self.gp_module.sendEvent(Utils.getDefaultEventDict({"data": data}, caller_class_name="TcpServer", received_from="%s:%d" % (self.host, self.port)))
+        self.gp_module.sendEvent(self.gp_module.event_factory.getEvent({"data": data}, received_from=self.received_from))
 
 @Decorators.ModuleDocstringParser
 class TcpServer(BaseModule.BaseModule):
@@ -111,6 +112,9 @@ class TcpServer(BaseModule.BaseModule):
     regex_separator:   If mode is line, set separator between lines. Here regex can be used.
     chunksize:  If mode is stream, set chunksize in bytes to read from stream.
     max_buffer_size: Max kilobytes to in receiving buffer.
+    reuse_port: Let each worker bind its own socket via SO_REUSEPORT instead of sharing one socket. The kernel will
+                then balance new connections over the workers. Combined with the cpu_affinity global setting, connections
+                are handled on the cpus of the worker that accepted them. Needs Linux >= 3.9.
 
     Configuration template:
 
@@ -126,6 +130,7 @@ class TcpServer(BaseModule.BaseModule):
         regex_separator:                 # <default: None; type: None||string; is: optional>
         chunksize:                       # <default: 16384; type: integer; is: optional>
         max_buffer_size:                 # <default: 10240; type: integer; is: optional>
+        reuse_port:                      # <default: False; type: boolean; is: optional>
         receivers:
           - NextModule
     """
@@ -134,14 +139,40 @@ class TcpServer(BaseModule.BaseModule):
     """Set module type"""
     can_run_forked = True
 
+    listening_sockets = {}
+    """Sockets by module id, interface and port. On a configuration reload the new instance takes over the sockets of the old one."""
+
     def configure(self, configuration):
         # Call parent configure method
         BaseModule.BaseModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.server = False
         self.max_buffer_size = self.getConfigurationValue('max_buffer_size') * 10240 #* 10240
         self.start_ioloop = False
+        self.sockets = []
+        # With reuse_port each process binds its own sockets after the fork.
+        if not self.getConfigurationValue('reuse_port') and not self.bindSockets():
+            return
+        autoreload.add_reload_hook(self.shutDown)
+
+    def getListeningSocketsKey(self):
+        return (self.getModuleId(), self.getConfigurationValue("interface"), self.getConfigurationValue("port"))
+
+    def bindSockets(self):
+        sockets_key = self.getListeningSocketsKey()
         try:
-            self.sockets = bind_sockets(self.getConfigurationValue("port"), self.getConfigurationValue("interface"), backlog=128)
+            # Duplicate the sockets of a previous instance. So no connection attempt will be refused during a reload.
+            self.sockets = [socket.fromfd(server_socket.fileno(), server_socket.family, server_socket.type) for server_socket in self.listening_sockets.get(sockets_key, [])]
+        except socket.error:
+            self.sockets = []
+        if self.sockets:
+            self.listening_sockets[sockets_key] = self.sockets
+            return True
+        try:
+            if self.getConfigurationValue('reuse_port'):
+                self.sockets = bind_sockets(self.getConfigurationValue("port"), self.getConfigurationValue("interface"), backlog=128, reuse_port=True)
+            else:
+                self.sockets = bind_sockets(self.getConfigurationValue("port"), self.getConfigurationValue("interface"), backlog=128)
             for server_socket in self.sockets:
                 server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         except:
@@ -149,10 +180,13 @@ class TcpServer(BaseModule.BaseModule):
             self.logger.error("Could not listen on %s:%s. Exception: %s, Error: %s." % (self.getConfigurationValue("interface"),
                                                                                         self.getConfigurationValue("port"), etype, evalue))
             self.gp.shutDown()
-            return
-        autoreload.add_reload_hook(self.shutDown)
+            return False
+        self.listening_sockets[sockets_key] = self.sockets
+        return True
 
     def initAfterFork(self):
+        if self.getConfigurationValue('reuse_port') and not self.bindSockets():
+            return
         ssl_options = None
         if self.getConfigurationValue("tls"):
             ssl_options = { 'certfile': self.getConfigurationValue("cert"),
@@ -162,6 +196,9 @@ class TcpServer(BaseModule.BaseModule):
         BaseModule.BaseModule.initAfterFork(self)
 
     def shutDown(self):
+        # Keep the sockets of a new instance, which took them over on a reload.
+        if getattr(self, 'sockets', None) and self.listening_sockets.get(self.getListeningSocketsKey()) is self.sockets:
+            del self.listening_sockets[self.getListeningSocketsKey()]
         try:
             self.server.stop()
             self.sockets.close()
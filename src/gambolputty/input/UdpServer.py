@@ -78,7 +78,7 @@ class ThreadedUdpRequestHandler(SocketServer.BaseRequestHandler):
                 return
             host = self.client_address[0]
             port = self.client_address[1]
-            event = Utils.getDefaultEventDict({"data": data}, received_from="%s:%s" % (host, port),caller_class_name='UdpServer')
+            event = self.udp_server_instance.event_factory.getEvent({"data": data}, received_from="%s:%s" % (host, port))
             self.udp_server_instance.sendEvent(event)
         except socket.error, e:
            self.logger.warning("Error occurred while reading from socket. Error: %s" % (e))
@@ -123,6 +123,7 @@ class UdpServer(BaseModule.BaseModule):
     def configure(self, configuration):
         # Call parent configure method
         BaseModule.BaseModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.server = False
 
     def start(self):
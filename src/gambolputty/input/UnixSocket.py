@@ -33,7 +33,7 @@ class ConnectionHandler(object):
             self.stream.read_until_regex(b'\r?\n', self._on_read_line)
 
     def _on_read_line(self, data):
-        self.gp_module.sendEvent(Utils.getDefaultEventDict({"data": data}, caller_class_name='UnixSocket', received_from=self.address))
+        self.gp_module.sendEvent(self.gp_module.event_factory.getEvent({"data": data}, received_from=self.address))
         if not self.stream.closed():
             self.stream.read_until_regex(b'\r?\n', self._on_read_line)
 
@@ -59,6 +59,7 @@ class UnixSocket(BaseThreadedModule.BaseThreadedModule):
     def configure(self, configuration):
         # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.running = False
 
     def start(self):
@@ -17,6 +17,13 @@ class Zmq(BaseThreadedModule.BaseThreadedModule):
     pattern: One of 'pull', 'sub'
     hwm: Highwatermark for sending/receiving socket.
 
+    Messages are received without copying and the socket is drained as long as messages are waiting.
+    Multipart messages sent by ZmqSink with send_batches contain a msgpack packed batch of events. These are unpacked
+    and passed on as one batch. Events keep their gambolputty metadata, formatted strings are set as event data.
+    With the sub pattern, the topic of a batch is set as event field topic.
+    Single part messages are handled as before. With the sub pattern, the message is split into topic and data
+    at the first space.
+
     Configuration template:
 
     - Zmq:
@@ -36,8 +43,11 @@ class Zmq(BaseThreadedModule.BaseThreadedModule):
     def configure(self, configuration):
         # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.topic = self.getConfigurationValue('topic')
         self.pattern = self.getConfigurationValue('pattern')
+        self.poll_timeout_in_ms = 500
+        self.max_messages_per_poll = 500
         self.context = zmq.Context()
         if self.pattern == 'pull':
             self.socket = self.context.socket(zmq.PULL)
@@ -83,10 +93,24 @@ class Zmq(BaseThreadedModule.BaseThreadedModule):
             self.logger.error("Could not connect to zeromq at %s:%s. Exception: %s, Error: %s." % (server_addr, server_port, etype, evalue))
             self.gp.shutDown()
 
-    def getEventFromZmq(self):
+    def getEventsFromZmq(self):
+        """
+        Drain the socket, up to max_messages_per_poll messages. Yields lists of events.
+        """
         try:
-            event = self.socket.recv()
-            yield event
+            for _ in xrange(0, self.max_messages_per_poll):
+                frames = self.socket.recv_multipart(zmq.NOBLOCK, copy=False)
+                batch = Utils.unpackZmqBatch(frames)
+                if batch:
+                    yield self.getEventsFromBatch(*batch)
+                    continue
+                event = self.event_factory.getEvent({"data": frames[-1].bytes})
+                if self.pattern == 'sub':
+                    topic, event['data'] = event['data'].split(' ', 1)
+                    event['topic'] = topic
+                yield [event]
+        except zmq.error.Again:
+            pass
         except zmq.error.ContextTerminated:
             pass
         except:
@@ -95,23 +119,39 @@ class Zmq(BaseThreadedModule.BaseThreadedModule):
                 return
             self.logger.error("Could not read data from zeromq. Exception: %s, Error: %s." % (exc_type, exc_value))
 
+    def getEventsFromBatch(self, topic, items):
+        events = []
+        for item in items:
+            event = self.event_factory.getEvent(item if isinstance(item, dict) else {"data": item})
+            if topic is not None and self.pattern == 'sub':
+                event['topic'] = topic
+            events.append(event)
+        return events
+
     def run(self):
         if not self.receivers:
             self.logger.error("Shutting down module %s since no receivers are set." % (self.__class__.__name__))
             return
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
         while self.alive:
-            for event in self.getEventFromZmq():
-                event = Utils.getDefaultEventDict({"data": event}, caller_class_name="Zmq")
-                if self.pattern == 'sub':
-                    topic, event['data'] = event['data'].split(' ', 1)
-                    event['topic'] = topic
-                self.sendEvent(event)
+            # Poll with a timeout, so the socket can be closed in this thread on shutdown.
+            if not poller.poll(self.poll_timeout_in_ms):
+                continue
+            for events in self.getEventsFromZmq():
+                self.sendEventBatch(events)
+        self.closeSocket()
 
-    def shutDown(self):
-        BaseThreadedModule.BaseThreadedModule.shutDown(self)
+    def closeSocket(self):
         try:
-            self.socket.close()
+            self.socket.close(linger=0)
             self.context.term()
         except AttributeError:
             pass
+
+    def shutDown(self):
         # Call parent shutDown method.
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
+        # A running thread closes the socket itself. Closing it from here would interrupt a pending receive.
+        if not self.is_alive():
+            self.closeSocket()
@@ -19,6 +19,8 @@ class ZmqTornado(BaseModule.BaseModule):
     hwm: Highwatermark for sending/receiving socket.
     separator: When using the sub pattern, messages can have a topic. Set separator to split message from topic.
 
+    Multipart messages sent by ZmqSink with send_batches are unpacked and passed on as one batch of events.
+
     Configuration template:
 
     - ZmqTornado:
@@ -44,6 +46,7 @@ class ZmqTornado(BaseModule.BaseModule):
     def configure(self, configuration):
          # Call parent configure method
         BaseModule.BaseModule.configure(self, configuration)
+        self.event_factory = Utils.EventFactory(caller_class_name=self.__class__.__name__)
         self.client = None
         self.topic = self.getConfigurationValue('topic')
         self.separator = self.getConfigurationValue('separator')
@@ -90,11 +93,16 @@ class ZmqTornado(BaseModule.BaseModule):
             self.logger.error("Could not connect to zeromq at %s:%s. Exception: %s, Error: %s." % (server_addr, server_port, etype, evalue))
             self.gp.shutDown()
 
-    def onReceive(self, data):
-        data = data[0]
+    def onReceive(self, frames):
+        batch = Utils.unpackZmqBatch(frames)
+        if batch:
+            topic, items = batch
+            self.sendEventBatch([self.event_factory.getEvent(item if isinstance(item, dict) else {"data": item}) for item in items])
+            return
+        data = frames[0]
         if self.separator:
             topic, data = data.split(self.separator)
-        event = Utils.getDefaultEventDict({"data": data}, caller_class_name="ZmqTornado")
+        event = self.event_factory.getEvent({"data": data})
         self.sendEvent(event)
 
     def shutDown(self):
@@ -1,38 +1,52 @@
 # -*- coding: utf-8 -*-
-import copy
-import gc
-import random
+import os
+import sys
+import threading
 import BaseThreadedModule
 import Utils
 import Decorators
-import sys
+import WriteAheadLog
 
 
 @Decorators.ModuleDocstringParser
 class EventBuffer(BaseThreadedModule.BaseThreadedModule):
     """
-    Store received events in a persistent backend until the event was successfully handled.
+    Store received events in a local write ahead log until the event was successfully handled.
     Events, that did not get handled correctly, will be requeued when GambolPutty is restarted.
 
-    At the moment only RedisStore is supported as backend.
+    Each process writes the events created by its input modules to its own log in <path>/process_<idx>.
+    The log is split into segment files of <segment_size> bytes. Appends are synced to disk at the latest
+    after <sync_interval> seconds or as soon as <sync_bytes> were written, with a single fsync for all events
+    appended in the meantime.
+
+    All configured output modules are registered as consumers of the logs. Output modules acknowledge the offsets
+    of the events they stored successfully, e.g. after the flush of their buffer. Segments are deleted once all
+    output modules acknowledged their events. An output module that did not acknowledge anything yet keeps all events.
+    On startup all events not acknowledged by all output modules are sent again by their source input module.
 
-    As a technical note: This module is based on pythons garbage collection. If an event is
-    created, a copy of the event is stored in the persistence backend. If it gets garbage collected,
-    the event will be deleted from the backend.
-    When used, this module forces a garbage collection every <gc_interval> seconds.
-    This approach seemed to be the fastest and simplest with a small drawback:
-    IMPORTANT: It is not absolutely guaranteed, that an event will be collected, thus the event will
-    not be deleted from the backend data. This can cause a limited amount of duplicate events being
-    send to the sinks.
+    An event that was dropped or filtered on its way is never acknowledged. Once an output module acknowledged
+    later events, such gaps are treated as done after <gap_timeout> seconds. Keep this well above the time an
+    output module may hold back events, e.g. while its backend is down. Events that were in flight when GambolPutty
+    crashed may be sent twice.
     With an elasticsearch sink, this should be no problem, as long as your document id
-    stays the same for the same event data. This is also true for the default event_id.
+    stays the same for the same event data.
+
+    path: Directory to store the logs in.
+    segment_size: Roll over to a new segment file when the current one reaches this size in bytes.
+    sync_interval: Maximum time in seconds until appended events are synced to disk.
+    sync_bytes: Sync to disk as soon as this many bytes were appended.
+    gap_timeout: Seconds after which events missing between acknowledged events are treated as done.
+    replay: Requeue unacknowledged events on startup.
 
     Configuration template:
 
     - EventBuffer:
-        backend:            # <default: 'RedisStore'; type: string; is: optional>
-        gc_interval:        # <default: 5; type: integer; is: optional>
-        key_prefix:         # <default: "gambolputty:eventbuffer"; type: string; is: optional>
+        path:               # <default: '/var/lib/gambolputty/event_log'; type: string; is: optional>
+        segment_size:       # <default: 67108864; type: integer; is: optional>
+        sync_interval:      # <default: 0.05; type: int||float; is: optional>
+        sync_bytes:         # <default: 1048576; type: integer; is: optional>
+        gap_timeout:        # <default: 3600; type: int||float; is: optional>
+        replay:             # <default: True; type: boolean; is: optional>
        """
 
     module_type = "stand_alone"
@@ -42,105 +56,137 @@ class EventBuffer(BaseThreadedModule.BaseThreadedModule):
     def configure(self, configuration):
         # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
-        self.key_prefix = self.getConfigurationValue('key_prefix')
-        self.key_buffer = {}
-        self.flush_interval = self.getConfigurationValue('gc_interval')
-        self.requeue_events_done = False
-        backend_info = self.gp.getModuleInfoById(self.getConfigurationValue('backend'))
-        if not backend_info:
-            self.logger.error("Could not find %s backend for persistant storage." % (self.getConfigurationValue('backend')))
+        self.path = self.getConfigurationValue('path')
+        self.sync_interval = self.getConfigurationValue('sync_interval')
+        self.log = None
+        self.timed_func_handle = None
+        # Acknowledged offset ranges by (log id, consumer name) of this process. changed_ranges need to be written.
+        self.acknowledged_ranges = {}
+        self.changed_ranges = set()
+        self.acknowledge_lock = threading.Lock()
+
+    def initAfterFork(self):
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
+        # The log is bound to the process index, so a restarted worker will find its own log again.
+        self.log_id = "process_%s" % self.gp.worker_index
+        try:
+            self.log = WriteAheadLog.WriteAheadLog(os.path.join(self.path, self.log_id), self.getConfigurationValue('segment_size'),
+                                                   self.sync_interval, self.getConfigurationValue('sync_bytes'), self.getConfigurationValue('gap_timeout'))
+        except (IOError, OSError):
+            etype, evalue, etb = sys.exc_info()
+            self.logger.error("Could not open event log in %s. Exception: %s, Error: %s." % (self.path, etype, evalue))
             self.gp.shutDown()
             return
-        self.persistence_backend = backend_info['instances'][0]
-        Utils.KeyDotNotationDict.persistence_backend = self.persistence_backend
-        Utils.KeyDotNotationDict.key_prefix = self.key_prefix
-        # Monkeypatch Utils.KeyDotNotationDict to add/delete event to persistence backend.
-        def removeFromPersistenceBackendOnGarbageCollect(self):
-            Utils.KeyDotNotationDict.___del___(self)
-            # Only act if we hold an event.
-            if "event_id" not in self.get("gambolputty", {}):
-                return
-            #print "Removing from backend"
-            try:
-                key = "%s:%s" % (Utils.KeyDotNotationDict.key_prefix, self['gambolputty']['event_id'])
-                Utils.KeyDotNotationDict.persistence_backend.delete(key)
-            except:
-                pass
-        Utils.KeyDotNotationDict.___del___ = Utils.KeyDotNotationDict.__del__
-        Utils.KeyDotNotationDict.__del__ = removeFromPersistenceBackendOnGarbageCollect
-
-        def addToPersistenceBackendOnInit(self, *args):
-            Utils.KeyDotNotationDict.___init___(self, *args)
-            # Only act if we hold an event.
-            if "event_id" not in self.get("gambolputty", {}):
-                return
+        self.log.setConsumers(self.getConsumerNames())
+        self.gp.event_log = self
+
+    def getConsumerNames(self):
+        """All output modules acknowledge the events they stored."""
+        consumer_names = set()
+        for module_name, module_info in self.gp.modules.items():
+            instance = module_info['instances'][0]
+            if instance.module_type == "output":
+                consumer_names.add(instance.getModuleId())
+        return consumer_names
+
+    def append(self, events):
+        """Store events created by an input module and tag them with their log offset."""
+        for event, offset in zip(events, self.log.append(events)):
+            event['gambolputty']['event_log'] = (self.log_id, offset)
+
+    def acknowledge(self, consumer_name, events):
+        """Remember the offsets per log stored by consumer_name. Offsets are written in getTimedAcknowledgeFunc."""
+        offsets_by_log = {}
+        for event in events:
             try:
-                key = "%s:%s" % (Utils.KeyDotNotationDict.key_prefix, self['gambolputty']['event_id'])
-                # Store a simple dict in backend, not a KeyDotNotationDict.
-                # Also, store a copy, as the dict might get buffered in persistence_backend and we do not
-                # want any changes made to new_dict to propagate to persistence_backend.
-                Utils.KeyDotNotationDict.persistence_backend.set(key, dict.copy(self), False)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not store event in persistance backend. Exception: %s, Error: %s." % (etype, evalue))
-                pass
-            print "Added to backend"
-        Utils.KeyDotNotationDict.___init___ = Utils.KeyDotNotationDict.__init__
-        Utils.KeyDotNotationDict.__init__ = addToPersistenceBackendOnInit
-
-        def returnSimpleKeyDotDictOnCopy(self):
-            """
-            When creating a copy of an event, we do not want to store/remove this in/from the persistence backend.
-            When the original event is requeued it will pass through all modules again, thus creating the
-            same copies etc.
-            A removeFromPersistenceBackendOnGarbageCollect would fail anyways, since the new key is unknown to the
-            backend. Still we can skip removing for speedups.
-            """
-            new_dict = Utils.KeyDotNotationDict()
-            new_dict.__init__ = Utils.KeyDotNotationDict.___init___
-            new_dict.__del__ = Utils.KeyDotNotationDict.__del__
-            new_dict.update(copy.deepcopy(super(Utils.KeyDotNotationDict, self)))
-            if "event_id" in new_dict.get("gambolputty", {}):
-                new_dict['gambolputty']['event_id'] = "%032x" % random.getrandbits(128)
-            return new_dict
-        Utils.KeyDotNotationDict.copy = returnSimpleKeyDotDictOnCopy
-
-    def getTimedGarbageCollectFunc(self):
-        @Decorators.setInterval(self.flush_interval, call_on_init=True)
-        def timedGarbageCollect():
-            if not self.requeue_events_done:
-                self.requeueEvents()
-                self.requeue_events_done = True
-            gc.collect()
-        return timedGarbageCollect
-
-    def requeueEvents(self):
+                log_id, offset = event['gambolputty']['event_log']
+            except (KeyError, TypeError):
+                continue
+            offsets_by_log.setdefault(log_id, []).append(offset)
+        if not offsets_by_log:
+            return
+        with self.acknowledge_lock:
+            for log_id, offsets in offsets_by_log.items():
+                key = (log_id, consumer_name)
+                self.acknowledged_ranges.setdefault(key, WriteAheadLog.OffsetRanges()).add(offsets)
+                self.changed_ranges.add(key)
+
+    def getTimedAcknowledgeFunc(self):
+        @Decorators.setInterval(self.sync_interval)
+        def timedAcknowledge():
+            self.writeAcknowledgements()
+        return timedAcknowledge
+
+    def writeAcknowledgements(self):
+        with self.acknowledge_lock:
+            changed_ranges, self.changed_ranges = self.changed_ranges, set()
+            for key in list(self.acknowledged_ranges):
+                log_id, consumer_name = key
+                log_path = os.path.join(self.path, log_id)
+                ack_path = os.path.join(log_path, 'acks', "%s@%s" % (consumer_name, self.log_id))
+                ranges = self.acknowledged_ranges[key]
+                # Offsets below the base offset of the log are done, no need to write them again.
+                ranges.discardBelow(WriteAheadLog.readOffsetFile(os.path.join(log_path, 'base_offset'), 0))
+                if not ranges:
+                    del self.acknowledged_ranges[key]
+                    continue
+                # Each process keeps its own acknowledgements, events of one log may be stored by several workers.
+                # Files expired by the owner of the log are written again.
+                if key in changed_ranges or not os.path.exists(ack_path):
+                    WriteAheadLog.acknowledge(log_path, "%s@%s" % (consumer_name, self.log_id), ranges)
+        pending_offset = self.log.getPendingOffset()
+        if pending_offset > self.log.base_offset:
+            self.log.setBaseOffset(pending_offset)
+            self.log.expireAcknowledgements()
+        self.log.truncate(pending_offset)
+
+    def replayEvents(self):
+        """Send all events not acknowledged by the output modules again via their source input module."""
+        from_offset = self.log.getPendingOffset()
+        to_offset = self.log.next_offset
+        if from_offset >= to_offset:
+            return 0
         input_modules = {}
         for module_name, module_info in self.gp.modules.items():
             instance = module_info['instances'][0]
             if instance.module_type == "input":
                 input_modules[instance.__class__.__name__] = instance
-        for key in self.persistence_backend.iterKeys():
-            if not key.startswith("%s" % self.key_prefix):
+        self.logger.warning("Found %s unfinished events. Requeing..." % (to_offset - from_offset))
+        # Replayed events will be appended again, so start a new segment to not read them twice.
+        with self.log.lock:
+            self.log.rollSegment()
+        requeue_counter = 0
+        ranges_by_consumer = self.log.getAcknowledgedRanges()
+        for offset, event in self.log.readEvents(from_offset, to_offset):
+            if self.log.isDone(offset, ranges_by_consumer):
                 continue
-            self.logger.warning("Found %s unfinished events. Requeing..." % (len(keys)))
-            requeue_counter = 0
-            for key in keys:
-                event = self.persistence_backend.pop(key)
-                if not event:
-                    continue
-                if "source_module" not in event.get("gambolputty", {}):
-                    self.logger.warning("Could not requeue event. Source module info not found in event data.")
-                    continue
-                source_module = event["gambolputty"]["source_module"]
-                if source_module not in input_modules:
-                    self.logger.error("Could not requeue event. Module %s not found." % (source_module))
-                    continue
-                requeue_counter += 1
-                input_modules[source_module].sendEvent(Utils.KeyDotNotationDict(event))
-            self.logger.warning("Done. Requeued %s of %s events." % (requeue_counter, len(keys)))
-            self.logger.warning("Note: If more than one gp instance is running, requeued events count may differ from total events.")
-            event = None
+            source_module = event['gambolputty'].get('source_module')
+            if source_module not in input_modules:
+                self.logger.error("Could not requeue event. Module %s not found." % (source_module))
+                continue
+            requeue_counter += 1
+            input_modules[source_module].sendEvent(event, apply_common_actions=False)
+        # The replayed events got new offsets. Make sure they are on disk, before the old ones are dropped.
+        self.log.sync()
+        self.log.setBaseOffset(to_offset)
+        self.log.expireAcknowledgements()
+        self.log.truncate(to_offset)
+        self.logger.warning("Done. Requeued %s of %s events." % (requeue_counter, to_offset - from_offset))
+        return requeue_counter
 
     def start(self):
-        self.timedFuncHandle = Utils.TimedFunctionManager.startTimedFunction(self.getTimedGarbageCollectFunc())
\ No newline at end of file
+        if not self.log:
+            return
+        self.log.startInterval()
+        self.timed_func_handle = Utils.TimedFunctionManager.startTimedFunction(self.getTimedAcknowledgeFunc())
+        if self.getConfigurationValue('replay'):
+            self.replayEvents()
+
+    def shutDown(self):
+        if self.timed_func_handle:
+            Utils.TimedFunctionManager.stopTimedFunctions(self.timed_func_handle)
+            self.timed_func_handle = None
+        if self.log:
+            self.writeAcknowledgements()
+            self.log.close()
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
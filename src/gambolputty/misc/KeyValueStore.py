@@ -1,22 +1,26 @@
 # -*- coding: utf-8 -*-
 import sys
-import cPickle
 import redis
 import BaseThreadedModule
+import BufferedKeyValueStore
 import Decorators
 import Utils
 
 
 @Decorators.ModuleDocstringParser
-class KeyValueStore(BaseThreadedModule.BaseThreadedModule):
+class KeyValueStore(BaseThreadedModule.BaseThreadedModule, BufferedKeyValueStore.BufferedKeyValueStore):
     """
     A simple wrapper around the python simplekv module.
 
     It can be used to store results of modules in all simplekv supported backends.
+    Values are serialized with msgpack. Values pickled by former versions can still be read.
+    getMany and setMany get or set the values of many keys at once. With the RedisStore backend, this
+    only needs one round trip.
 
     When set, the following options cause RedisStore to use a buffer for setting values.
     Multiple values are set via the pipe command, which speeds up storage. Still this comes at a price.
     Buffered values, that have not yet been send to redis, will be lost when GambolPutty crashes.
+    Buffered values are returned by get, before they were sent to the backend.
 
     backend: backends supported by [simplekv](http://pythonhosted.org//simplekv/)
     store_interval_in_secs: Sending data to redis in x seconds intervals.
@@ -64,18 +68,7 @@ class KeyValueStore(BaseThreadedModule.BaseThreadedModule):
 
         self.set_buffer = None
         if self.getConfigurationValue('store_interval_in_secs') or self.getConfigurationValue('batch_size'):
-            if backend == 'RedisStore':
-                self.set_buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.setRedisBufferedCallback, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
-            else:
-                 self.set_buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.setBufferedCallback, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
-            self._set = self.set
-            self.set = self.setBuffered
-            self._get = self.get
-            self.get = self.getBuffered
-            self._delete = self.delete
-            self.delete = self.deleteBuffered
-            self._pop = self.pop
-            self.pop = self.popBuffered
+            self.enableBuffer(self.getConfigurationValue('batch_size'), self.getConfigurationValue('store_interval_in_secs'), self.getConfigurationValue('backlog_size'))
 
     def getRedisClient(self):
         if not self.getConfigurationValue('cluster') or len(self.getConfigurationValue('cluster')) == 0:
@@ -167,96 +160,72 @@ class KeyValueStore(BaseThreadedModule.BaseThreadedModule):
 
     def set(self, key, value, ttl=0, pickle=True):
         if pickle is True:
-            try:
-                value = cPickle.dumps(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not store %s:%s in redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            value = self.packValue(key, value)
         if ttl:
             self.kv_store.put(key, value, ttl_secs=ttl)
         else:
             self.kv_store.put(key, value)
 
-    def setBuffered(self, key, value, ttl=0, pickle=True):
+    def setMany(self, values, ttl=0, pickle=True):
+        """Set all key/value pairs of the values dictionary. The RedisStore backend needs one round trip."""
+        if not values:
+            return
         if pickle is True:
-            try:
-                value = cPickle.dumps(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not store %s:%s in redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            values = dict((key, self.packValue(key, value)) for key, value in values.iteritems())
+        if self.getConfigurationValue('backend') != 'RedisStore':
+            for key, value in values.iteritems():
+                self.set(key, value, ttl, pickle=False)
+            return
+        pipe = self.backend_client.pipeline(transaction=False)
+        pipe.mset(values)
         if ttl:
-            self.set_buffer.append({'key':key, 'ttl': ttl, 'value': value})
-        else:
-            self.set_buffer.append({'key':key, 'value': value})
-
-    def setBufferedCallback(self, values):
-        for value in values:
-            if 'ttl' in value:
-                self._set(value['key'], value['value'], value['ttl'])
-            else:
-                self._set(value['key'], value['value'])
-
-    def setRedisBufferedCallback(self, values):
-        pipe = self.backend_client.pipeline()
-        for value in values:
-            if 'ttl' in value:
-                pipe.setex(value['key'], value['ttl'], value['value'])
-            else:
-                pipe.set(value['key'], value['value'])
-        try:
-            pipe.execute()
-            return True
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not flush buffer. Exception: %s, Error: %s." % (etype, evalue))
+            for key in values:
+                pipe.expire(key, ttl)
+        pipe.execute()
+
+    def storeBufferedValues(self, values_by_ttl):
+        if self.getConfigurationValue('backend') == 'RedisStore':
+            return self.storeBufferedValuesInRedis(self.backend_client, values_by_ttl)
+        for ttl, ttl_values in values_by_ttl.iteritems():
+            for key, value in ttl_values.iteritems():
+                self._set(key, value, ttl, pickle=False)
+        return True
 
     def get(self, key, unpickle=True):
         value = self.kv_store.get(key)
         if unpickle and value:
-            try:
-                value = cPickle.loads(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not unpickle %s:%s from redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            value = self.unpackValue(key, value)
         return value
 
-    def getBuffered(self, key, unpickle=True):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            return self.set_buffer.buffer[value_idx]
-        except:
-            return self._get(key, unpickle)
+    def getMany(self, keys, unpickle=True):
+        """Return the values of all keys. Missing keys are returned as None. The RedisStore backend needs one round trip."""
+        if not keys:
+            return []
+        if self.getConfigurationValue('backend') == 'RedisStore':
+            values = self.backend_client.mget(keys)
+        else:
+            values = []
+            for key in keys:
+                try:
+                    values.append(self.kv_store.get(key))
+                except KeyError:
+                    values.append(None)
+        if unpickle:
+            values = [self.unpackValue(key, value) if value else value for key, value in zip(keys, values)]
+        return values
 
     def delete(self, key):
         self.kv_store.delete(key)
 
-    def deleteBuffered(self, key):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            self.set_buffer.buffer.pop(value_idx)
-            return
-        except:
-            self._delete(key)
-
     def pop(self, key, unpickle=True):
         value = self.get(key, unpickle)
         if value:
             self.delete(key)
         return value
 
-    def popBuffered(self, key, unpickle=True):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            return self.set_buffer.buffer.pop(value_idx)
-        except:
-            return self._pop(key, unpickle)
-
     def shutDown(self):
         try:
-            self.buffer.flush()
+            self.set_buffer.flush()
         except:
             pass
         BaseThreadedModule.BaseThreadedModule.shutDown(self)
@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 import sys
 import redis
-import cPickle
 import BaseThreadedModule
+import BufferedKeyValueStore
 import Decorators
 import Utils
 
 
 @Decorators.ModuleDocstringParser
-class RedisStore(BaseThreadedModule.BaseThreadedModule):
+class RedisStore(BaseThreadedModule.BaseThreadedModule, BufferedKeyValueStore.BufferedKeyValueStore):
     """
     A simple wrapper around the redis python module.
 
     It can be used to store results of modules in a redis key/value store.
+    Values are serialized with msgpack. Values pickled by former versions can still be read.
+    getMany and setMany get or set the values of many keys in one round trip, e.g. for a batch of events.
 
         server: Redis server to connect to.
         cluster: Dictionary of redis masters as keys and pack_followers as values, e.g.: {'172.16.0.1:6379': '172.16.0.2:6379'}
@@ -28,6 +30,7 @@ class RedisStore(BaseThreadedModule.BaseThreadedModule):
     When set, the following options cause RedisStore to use a buffer for setting values.
     Multiple values are set via the pipe command, which speeds up storage. Still this comes at a price.
     Buffered values, that have not yet been send to redis, will be lost when GambolPutty crashes.
+    Buffered values are returned by get, before they were sent to redis.
 
         store_interval_in_secs: Sending data to redis in x seconds intervals.
         batch_size: Sending data to redis if count is above, even if store_interval_in_secs is not reached.
@@ -70,15 +73,7 @@ class RedisStore(BaseThreadedModule.BaseThreadedModule):
             self.gp.shutDown()
         self.set_buffer = None
         if self.getConfigurationValue('store_interval_in_secs') or self.getConfigurationValue('batch_size'):
-            self.set_buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.setBufferedCallback, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
-            self._set = self.set
-            self.set = self.setBuffered
-            self._get = self.get
-            self.get = self.getBuffered
-            self._delete = self.delete
-            self.delete = self.deleteBuffered
-            self._pop = self.pop
-            self.pop = self.popBuffered
+            self.enableBuffer(self.getConfigurationValue('batch_size'), self.getConfigurationValue('store_interval_in_secs'), self.getConfigurationValue('backlog_size'))
 
     def getRedisClient(self):
         try:
@@ -136,90 +131,55 @@ class RedisStore(BaseThreadedModule.BaseThreadedModule):
 
     def set(self, key, value, ttl=0, pickle=True):
         if pickle is True:
-            try:
-                value = cPickle.dumps(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not store %s:%s in redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            value = self.packValue(key, value)
         if ttl:
             self.client.setex(key, ttl, value)
         else:
             self.client.set(key, value)
 
-    def setBuffered(self, key, value, ttl=0, pickle=True):
+    def setMany(self, values, ttl=0, pickle=True):
+        """Set all key/value pairs of the values dictionary in one round trip."""
+        if not values:
+            return
         if pickle is True:
-            try:
-                value = cPickle.dumps(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not store %s:%s in redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            values = dict((key, self.packValue(key, value)) for key, value in values.iteritems())
+        pipe = self.client.pipeline(transaction=False)
+        pipe.mset(values)
         if ttl:
-            self.set_buffer.append({'key':key, 'ttl': ttl, 'value': value})
-        else:
-            self.set_buffer.append({'key':key, 'value': value})
-
-    def setBufferedCallback(self, values):
-        pipe = self.client.pipeline()
-        for value in values:
-            if 'ttl' in value:
-                pipe.setex(value['key'], value['ttl'], value['value'])
-            else:
-                pipe.set(value['key'], value['value'])
-        try:
-            pipe.execute()
-            return True
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not flush buffer. Exception: %s, Error: %s." % (etype, evalue))
+            for key in values:
+                pipe.expire(key, ttl)
+        pipe.execute()
 
+    def storeBufferedValues(self, values_by_ttl):
+        return self.storeBufferedValuesInRedis(self.client, values_by_ttl)
 
     def get(self, key, unpickle=True):
         value = self.client.get(key)
         if unpickle and value:
-            try:
-                value = cPickle.loads(value)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.error("Could not unpickle %s:%s from redis. Exception: %s, Error: %s." % (key, value, etype, evalue))
-                raise
+            value = self.unpackValue(key, value)
         return value
 
-    def getBuffered(self, key, unpickle=True):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            return self.set_buffer.buffer[value_idx]
-        except:
-            return self._get(key, unpickle)
+    def getMany(self, keys, unpickle=True):
+        """Return the values of all keys in one round trip. Missing keys are returned as None."""
+        if not keys:
+            return []
+        values = self.client.mget(keys)
+        if unpickle:
+            values = [self.unpackValue(key, value) if value else value for key, value in zip(keys, values)]
+        return values
 
     def delete(self, key):
         self.client.delete(key)
 
-    def deleteBuffered(self, key):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            self.set_buffer.buffer.pop(value_idx)
-            return
-        except:
-            self._delete(key)
-
     def pop(self, key, unpickle=True):
         value = self.get(key, unpickle)
         if value:
             self.delete(key)
         return value
 
-    def popBuffered(self, key, unpickle=True):
-        try:
-            value_idx = next(index for (index, entry) in enumerate(self.set_buffer.buffer) if entry["key"] == key)
-            return self.set_buffer.buffer.pop(value_idx)
-        except:
-            return self._pop(key, unpickle)
-
     def shutDown(self):
         try:
-            self.buffer.flush()
+            self.set_buffer.flush()
         except:
             pass
         BaseThreadedModule.BaseThreadedModule.shutDown(self)
@@ -18,6 +18,10 @@ class SimpleStats(BaseThreadedModule.BaseThreadedModule):
     this will start another process. So if you use SimpleStats, you will see workers + 1 processes in the process
     list.
 
+    queue_batch_statistics: Log average size and average queueing delay of the event batches sent between the workers.
+    spill_statistics: Log number of events output modules spilled to disk and drained from disk again.
+    cache_statistics: Log hit ratio of module caches, e.g. of the ModifyFields hash cache, per worker.
+
     Configuration template:
 
     - SimpleStats:
@@ -25,6 +29,9 @@ class SimpleStats(BaseThreadedModule.BaseThreadedModule):
         event_type_statistics:         # <default: True; type: boolean; is: optional>
         receive_rate_statistics:       # <default: True; type: boolean; is: optional>
         waiting_event_statistics:      # <default: False; type: boolean; is: optional>
+        queue_batch_statistics:        # <default: False; type: boolean; is: optional>
+        spill_statistics:              # <default: False; type: boolean; is: optional>
+        cache_statistics:              # <default: False; type: boolean; is: optional>
         emit_as_event:                 # <default: False; type: boolean; is: optional>
     """
 
@@ -69,6 +76,14 @@ class SimpleStats(BaseThreadedModule.BaseThreadedModule):
             self.receiveRateStatistics()
         if self.getConfigurationValue('event_type_statistics'):
             self.eventTypeStatistics()
+        if self.getConfigurationValue('queue_batch_statistics'):
+            self.queueBatchStatistics()
+        if self.getConfigurationValue('spill_statistics'):
+            self.spillStatistics()
+        if self.getConfigurationValue('cache_statistics'):
+            self.cacheStatistics()
+        if self.gp.max_workers > self.gp.workers:
+            self.workerStatistics()
         #if self.getConfigurationValue('waiting_event_statistics'):
         #    self.eventsInQueuesStatistics()
 
@@ -92,6 +107,61 @@ class SimpleStats(BaseThreadedModule.BaseThreadedModule):
                 self.sendEvent(Utils.getDefaultEventDict({"total_count": count, "count_per_sec": (count/self.interval), "field_name": event_name, "interval": self.interval }, caller_class_name="Statistics", event_type="statistic"))
             self.mp_stats_collector.resetCounter(event_type)
 
+    def queueBatchStatistics(self):
+        batch_count = self.mp_stats_collector.getCounter('queue_batches')
+        if batch_count == 0:
+            return
+        self.logger.info(">> Queue batch stats")
+        avg_batch_size = self.mp_stats_collector.getCounter('queue_batched_events') / float(batch_count)
+        avg_queueing_delay = self.mp_stats_collector.getCounter('queue_batch_delay') / self.mp_stats_collector.getCounter('queue_batched_events')
+        self.logger.info("Batches sent in %ss: %s%s%s, avg. batch size: %s%.1f%s, avg. queueing delay: %s%.4fs%s" % (self.interval, Utils.AnsiColors.YELLOW, batch_count, Utils.AnsiColors.ENDC, Utils.AnsiColors.YELLOW, avg_batch_size, Utils.AnsiColors.ENDC, Utils.AnsiColors.YELLOW, avg_queueing_delay, Utils.AnsiColors.ENDC))
+        if self.emit_as_event:
+            self.sendEvent(Utils.getDefaultEventDict({"batch_count": batch_count, "avg_batch_size": avg_batch_size, "avg_queueing_delay": avg_queueing_delay, "field_name": "queue_batches", "interval": self.interval }, caller_class_name="Statistics", event_type="statistic"))
+        for counter_name in ['queue_batches', 'queue_batched_events', 'queue_batch_delay']:
+            self.mp_stats_collector.resetCounter(counter_name)
+
+    def spillStatistics(self):
+        spilled_events = self.mp_stats_collector.getCounter('buffer_spilled_events')
+        drained_events = self.mp_stats_collector.getCounter('buffer_drained_events')
+        if spilled_events == 0 and drained_events == 0:
+            return
+        self.logger.info(">> Spill stats")
+        self.logger.info("Events spilled to disk in %ss: %s%s%s, drained: %s%s%s" % (self.interval, Utils.AnsiColors.YELLOW, spilled_events, Utils.AnsiColors.ENDC, Utils.AnsiColors.YELLOW, drained_events, Utils.AnsiColors.ENDC))
+        if self.emit_as_event:
+            self.sendEvent(Utils.getDefaultEventDict({"spilled_events": spilled_events, "drained_events": drained_events, "field_name": "spill", "interval": self.interval }, caller_class_name="Statistics", event_type="statistic"))
+        for counter_name in ['buffer_spilled_events', 'buffer_drained_events']:
+            self.mp_stats_collector.resetCounter(counter_name)
+
+    def cacheStatistics(self):
+        counters = self.mp_stats_collector.getAllCounters()
+        cache_names = sorted(set(counter_name[len('cache_hits_'):] for counter_name in counters.keys() if counter_name.startswith('cache_hits_')) |
+                             set(counter_name[len('cache_misses_'):] for counter_name in counters.keys() if counter_name.startswith('cache_misses_')))
+        if not cache_names:
+            return
+        self.logger.info(">> Cache stats")
+        for cache_name in cache_names:
+            hits = self.mp_stats_collector.getCounter('cache_hits_%s' % cache_name)
+            misses = self.mp_stats_collector.getCounter('cache_misses_%s' % cache_name)
+            if hits + misses == 0:
+                continue
+            hit_ratio = hits / float(hits + misses)
+            self.logger.info("Cache %s: hits: %s, misses: %s, hit ratio: %s%.2f%%%s" % (cache_name, hits, misses, Utils.AnsiColors.YELLOW, hit_ratio * 100, Utils.AnsiColors.ENDC))
+            if self.emit_as_event:
+                self.sendEvent(Utils.getDefaultEventDict({"hits": hits, "misses": misses, "hit_ratio": hit_ratio, "field_name": "cache_%s" % cache_name, "interval": self.interval }, caller_class_name="Statistics", event_type="statistic"))
+            self.mp_stats_collector.resetCounter('cache_hits_%s' % cache_name)
+            self.mp_stats_collector.resetCounter('cache_misses_%s' % cache_name)
+
+    def workerStatistics(self):
+        worker_count = len(self.gp.worker_pids) + 1
+        workers_started = self.mp_stats_collector.getCounter('workers_started')
+        workers_retired = self.mp_stats_collector.getCounter('workers_retired')
+        self.logger.info(">> Worker stats")
+        self.logger.info("Running workers: %s%s%s, started: %s, retired: %s" % (Utils.AnsiColors.YELLOW, worker_count, Utils.AnsiColors.ENDC, workers_started, workers_retired))
+        if self.emit_as_event:
+            self.sendEvent(Utils.getDefaultEventDict({"worker_count": worker_count, "workers_started": workers_started, "workers_retired": workers_retired, "field_name": "workers", "interval": self.interval }, caller_class_name="Statistics", event_type="statistic"))
+        for counter_name in ['workers_started', 'workers_retired']:
+            self.mp_stats_collector.resetCounter(counter_name)
+
     def eventsInQueuesStatistics(self):
         if len(self.module_queues) == 0:
             return
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 import pprint
 import socket
+import struct
 import sys
+import threading
+import collections
 import Utils
 import pygeoip
 import BaseThreadedModule
@@ -17,8 +20,10 @@ class AddGeoInfo(BaseThreadedModule.BaseThreadedModule):
     {'city': 'Hanover', 'region_name': '06', 'area_code': 0, 'time_zone': 'Europe/Berlin', 'dma_code': 0, 'metro_code': None, 'country_code3': 'DEU', 'latitude': 52.36670000000001, 'postal_code': '', 'longitude': 9.716700000000003, 'country_code': 'DE', 'country_name': 'Germany', 'continent': 'EU'}
 
     geoip_dat_path: path to maxmind geoip database file.
+    database_cache: mmap maps the database file into memory once, the pages are shared by all workers. memory reads the whole file in each worker. standard reads from the file on each lookup.
     source_fields: list of fields to use for lookup. The first list entry that produces a hit is used.
     target: field to populate with the geoip data. If none is provided, the field will be added directly to the event.
+    cache_size: Maximum number of networks and hostnames in the lookup cache. One cached record is used for all addresses of its network, e.g. a /24.
     geo_info_fields: fields to add. Available field names:
      - area_code
      - city
@@ -38,9 +43,11 @@ class AddGeoInfo(BaseThreadedModule.BaseThreadedModule):
 
     - AddGeoInfo:
         geoip_dat_path:           # <type: string; is: required>
+        database_cache:           # <default: 'mmap'; type: string; values: ['mmap', 'memory', 'standard']; is: optional>
         geo_info_fields:          # <default: None; type: list; is: optional>
         source_fields:            # <default: ["x_forwarded_for", "remote_ip"]; type: list; is: optional>
         target_field:             # <default: None; type: None||string; is: optional>
+        cache_size:               # <default: 65536; type: integer; is: optional>
         receivers:
           - NextModule
     """
@@ -48,12 +55,17 @@ class AddGeoInfo(BaseThreadedModule.BaseThreadedModule):
     module_type = "modifier"
     """Set module type"""
 
+    database_cache_flags = {'mmap': pygeoip.MMAP_CACHE,
+                            'memory': pygeoip.MEMORY_CACHE,
+                            'standard': pygeoip.STANDARD}
+
     def configure(self, configuration):
         # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
         self.gi = False
         try:
-            self.gi = pygeoip.GeoIP(configuration['geoip_dat_path'], pygeoip.MEMORY_CACHE)
+            # The database is opened before the workers are forked, so a mmapped file is shared by all of them.
+            self.gi = pygeoip.GeoIP(configuration['geoip_dat_path'], self.database_cache_flags[self.getConfigurationValue('database_cache')])
         except:
             etype, evalue, etb = sys.exc_info()
             self.logger.error("Could not init %s. Exception: %s, Error: %s. " % (self.__class__.__name__, etype, evalue))
@@ -62,47 +74,93 @@ class AddGeoInfo(BaseThreadedModule.BaseThreadedModule):
             return False
         self.geo_info_fields = self.getConfigurationValue('geo_info_fields')
         self.target_field = self.getConfigurationValue('target_field')
+        self.source_fields = self.getConfigurationValue('source_fields')
+        self.network_cache = NetworkPrefixCache(self.getConfigurationValue('cache_size'))
+        self.host_cache = Utils.MemoryCache(size=max(1, self.getConfigurationValue('cache_size') / 16))
+        # The netmask of a lookup is stored in the GeoIP instance, so lookups must not run concurrently.
+        self.lookup_lock = threading.Lock()
 
     def handleEvent(self, event):
-        for lookup_field_name in self.getConfigurationValue('source_fields'):
+        self.addGeoInfo(event, {})
+        yield event
+
+    def receiveEventBatch(self, events):
+        if self.getConfigurationValue('filter'):
+            BaseThreadedModule.BaseThreadedModule.receiveEventBatch(self, events)
+            return
+        # Each distinct address is only looked up once per batch.
+        batch_lookups = {}
+        for event in events:
+            self.addGeoInfo(event, batch_lookups)
+        self.sendEventBatch(events)
+
+    def addGeoInfo(self, event, batch_lookups):
+        for lookup_field_name in self.source_fields:
             try:
                 lookup_field_name_value = event[lookup_field_name]
             except KeyError:
                 continue
             if not lookup_field_name_value or lookup_field_name_value == "-":
                 continue
-            if isinstance(lookup_field_name_value, str):
-                geo_info_fields = self.getGeoIpInfo(lookup_field_name_value)
+            geo_info_fields = None
+            if isinstance(lookup_field_name_value, basestring):
+                geo_info_fields = self.getCachedGeoIpInfo(lookup_field_name_value, batch_lookups)
             elif isinstance(lookup_field_name_value, list):
                 for field_value in lookup_field_name_value:
-                    geo_info_fields = self.getGeoIpInfo(field_value)
+                    geo_info_fields = self.getCachedGeoIpInfo(field_value, batch_lookups)
                     if geo_info_fields:
                         break
             if geo_info_fields:
                 if self.target_field:
-                    event[self.target_field] = geo_info_fields
+                    # Cached records are shared, so each event gets its own copy.
+                    event[self.target_field] = geo_info_fields.copy()
                 else:
                     event.update(geo_info_fields)
                 break
-        yield event
 
-    @Decorators.memoize
+    def getCachedGeoIpInfo(self, hostname_or_ip, batch_lookups):
+        try:
+            return batch_lookups[hostname_or_ip]
+        except KeyError:
+            pass
+        except TypeError:
+            return None
+        geo_info_fields = batch_lookups[hostname_or_ip] = self.getGeoIpInfo(hostname_or_ip)
+        return geo_info_fields
+
     def getGeoIpInfo(self, hostname_or_ip):
-        all_geo_info_fields = {}
-        if self.is_valid_ipv4_address(hostname_or_ip) or self.is_valid_ipv6_address(hostname_or_ip):
-            lookup_type = "ip_address"
-        else:
-            lookup_type = "host"
-        if lookup_type == "ip_address":
+        address, address_bits = parseIpAddress(hostname_or_ip)
+        if address is None:
             try:
-                all_geo_info_fields = self.gi.record_by_addr(hostname_or_ip)
-            except Exception,e:
+                return self.host_cache.get(hostname_or_ip)
+            except KeyError:
                 pass
-        else:
             try:
                 all_geo_info_fields = self.gi.record_by_name(hostname_or_ip)
             except:
-                pass
+                all_geo_info_fields = {}
+            geo_info_fields = self.getConfiguredGeoInfoFields(all_geo_info_fields)
+            self.host_cache.set(hostname_or_ip, geo_info_fields)
+            return geo_info_fields
+        try:
+            return self.network_cache.get(address, address_bits)
+        except KeyError:
+            pass
+        with self.lookup_lock:
+            try:
+                all_geo_info_fields = self.gi.record_by_addr(hostname_or_ip)
+                prefix_length = self.gi.last_netmask()
+            except:
+                # Failed lookups are not cached, the netmask is not valid.
+                return {}
+        geo_info_fields = self.getConfiguredGeoInfoFields(all_geo_info_fields)
+        if prefix_length:
+            self.network_cache.set(address, address_bits, prefix_length, geo_info_fields)
+        return geo_info_fields
+
+    def getConfiguredGeoInfoFields(self, all_geo_info_fields):
+        if not all_geo_info_fields:
+            return {}
         if not self.geo_info_fields:
             return all_geo_info_fields
         configured_geo_info_fields = {}
@@ -114,22 +172,75 @@ class AddGeoInfo(BaseThreadedModule.BaseThreadedModule):
         return configured_geo_info_fields
 
 
-    def is_valid_ipv4_address(self, address):
+def parseIpAddress(hostname_or_ip):
+    """Return the address as integer and the number of address bits, or None, None for hostnames."""
+    if isinstance(hostname_or_ip, unicode):
         try:
-            addr = socket.inet_pton(socket.AF_INET, address)
-        except AttributeError: 
+            hostname_or_ip = hostname_or_ip.encode('ascii')
+        except UnicodeEncodeError:
+            return None, None
+    try:
+        return ipv4_struct.unpack(socket.inet_pton(socket.AF_INET, hostname_or_ip))[0], 32
+    except (socket.error, TypeError):
+        pass
+    try:
+        high, low = ipv6_struct.unpack(socket.inet_pton(socket.AF_INET6, hostname_or_ip))
+        return high << 64 | low, 128
+    except (socket.error, TypeError):
+        return None, None
+
+ipv4_struct = struct.Struct('!I')
+ipv6_struct = struct.Struct('!QQ')
+
+
+class NetworkPrefixCache:
+    """
+    Cache values that are the same for all addresses of a network, like geoip records.
+
+    Networks are stored in one dictionary per prefix length, keyed by the network part of the address. A lookup
+    checks the dictionary of each prefix length in the cache. Geoip databases only use a few different prefix lengths,
+    so this needs a few dictionary lookups instead of walking a bit trie node by node. The networks of a geoip database
+    do not overlap, so at most one of the dictionaries contains the address.
+
+    If more than max_size networks are stored, the oldest networks are removed.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max(1, max_size)
+        # Per address size, a list of (shift, networks) tuples, one per prefix length.
+        self.tables = {32: [], 128: []}
+        self.prefix_tables = {}
+        self.insert_order = collections.deque()
+
+    def __len__(self):
+        return len(self.insert_order)
+
+    def get(self, address, address_bits):
+        for shift, networks in self.tables[address_bits]:
             try:
-                addr= socket.inet_aton(address)
-            except socket.error:
-                return False
-            return address.count('.') == 3
-        except socket.error: 
-            return False
-        return True
+                return networks[address >> shift]
+            except KeyError:
+                continue
+        raise KeyError(address)
 
-    def is_valid_ipv6_address(self, address):
+    def set(self, address, address_bits, prefix_length, value):
+        shift = address_bits - prefix_length
         try:
-            addr= socket.inet_pton(socket.AF_INET6, address)
-        except socket.error: 
-            return False
-        return True
\ No newline at end of file
+            networks = self.prefix_tables[(address_bits, prefix_length)]
+        except KeyError:
+            networks = self.prefix_tables[(address_bits, prefix_length)] = {}
+            self.tables[address_bits].append((shift, networks))
+        network = address >> shift
+        if network not in networks:
+            if len(self.insert_order) >= self.max_size:
+                self.removeOldest()
+            self.insert_order.append((address_bits, prefix_length, network))
+        networks[network] = value
+
+    def removeOldest(self):
+        address_bits, prefix_length, network = self.insert_order.popleft()
+        networks = self.prefix_tables[(address_bits, prefix_length)]
+        del networks[network]
+        if not networks:
+            del self.prefix_tables[(address_bits, prefix_length)]
+            self.tables[address_bits] = [(shift, table) for shift, table in self.tables[address_bits] if table is not networks]
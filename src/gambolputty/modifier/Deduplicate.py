@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import sys
+import math
+import time
+import array
+import struct
+import threading
+import hashlib
+import multiprocessing
+import BaseThreadedModule
+import StatisticCollector
+import Decorators
+
+md5 = hashlib.md5
+# Signed 64 bit values stay plain ints, unsigned ones above sys.maxint would be longs.
+unpackDigest = struct.Struct('<qq').unpack
+BLOCK_TYPECODE = 'l'
+BLOCK_BYTES = 8
+# Ten six bit chunks of a 64 bit hash select the bits within a block.
+MAX_HASH_COUNT = 10
+BIT_MASKS = [1 << bit for bit in xrange(0, 63)] + [-sys.maxint - 1]
+
+@Decorators.ModuleDocstringParser
+class Deduplicate(BaseThreadedModule.BaseThreadedModule):
+    """
+    Drop events that were already seen within a time window.
+
+    Events are identified by <key>, e.g. the event_id, which stays the same for events requeued by EventBuffer,
+    or the data field for messages sent twice by syslog relays. Keys longer than a few bytes are not stored,
+    instead they are hashed into a pair of blocked Bloom filters with a fixed size of <memory_budget> bytes.
+    Keys are added to the current filter, lookups check both filters. Every <window> seconds the older filter
+    is cleared and becomes the current one. So a duplicate is detected for at least <window> seconds and at
+    most for twice that time.
+
+    As with all Bloom filters, some events will be dropped although they were not seen before (false positives).
+    The rate depends on the number of keys per window. Set <capacity> to the expected number of events in
+    <window> seconds. The number of hash functions is chosen to minimize the false positive rate for this
+    capacity. The estimated false positive rate is logged on each rotation.
+
+    Duplicates do not refresh their key, so a key that keeps recurring is let through again after two windows.
+
+    With shared set to True, the filters are placed in shared memory, so all workers use the same filters.
+    Checking and adding a key is guarded by a lock shared by all workers.
+
+    key: Identifies an event. May contain event fields, e.g. '$(data)'.
+    window: Time in seconds after which the older filter is cleared.
+    capacity: Expected number of events per window.
+    memory_budget: Size of both filters in bytes.
+    shared: Share filters between workers.
+
+    Configuration template:
+
+    - Deduplicate:
+        key:                        # <default: '$(gambolputty.event_id)'; type: string; is: optional>
+        window:                     # <default: 300; type: integer; is: optional>
+        capacity:                   # <default: 500000; type: integer; is: optional>
+        memory_budget:              # <default: 1048576; type: integer; is: optional>
+        shared:                     # <default: False; type: boolean; is: optional>
+        receivers:
+          - NextModule
+    """
+
+    module_type = "modifier"
+    """Set module type"""
+
+    def configure(self, configuration):
+        # Call parent configure method
+        BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
+        self.window = self.getConfigurationValue('window')
+        # Each filter gets half of the memory budget.
+        self.block_count = max(1, self.getConfigurationValue('memory_budget') / 2 / BLOCK_BYTES)
+        self.filter_bits = self.block_count * BLOCK_BYTES * 8
+        self.hash_count = max(1, min(MAX_HASH_COUNT, int(round(float(self.filter_bits) / self.getConfigurationValue('capacity') * math.log(2)))))
+        self.stats_collector = StatisticCollector.StatisticCollector()
+        if self.getConfigurationValue('shared'):
+            # Raw shared memory will be inherited by the forked workers.
+            self.filters = [multiprocessing.RawArray(BLOCK_TYPECODE, self.block_count), multiprocessing.RawArray(BLOCK_TYPECODE, self.block_count)]
+            self.filter_state = multiprocessing.RawArray('d', [0, time.time() + self.window, 0, 0])
+            self.lock = multiprocessing.Lock()
+        else:
+            self.filters = [array.array(BLOCK_TYPECODE, [0]) * self.block_count, array.array(BLOCK_TYPECODE, [0]) * self.block_count]
+            self.filter_state = [0, time.time() + self.window, 0, 0]
+            self.lock = threading.Lock()
+        self.checked_count = 0
+        self.dropped_count = 0
+
+    def getBlockAndMask(self, key):
+        """
+        Blocked Bloom filter: all bits of a key are set in a single 64 bit block, so a lookup only needs one
+        memory access per filter. The block is selected by the first half of the md5 digest, the bits within
+        the block by six bit chunks of the second half.
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        elif not isinstance(key, str):
+            key = str(key)
+        hash_a, hash_b = unpackDigest(md5(key).digest())
+        mask = 0
+        for _ in xrange(self.hash_count):
+            mask |= BIT_MASKS[hash_b & 63]
+            hash_b >>= 6
+        return hash_a % self.block_count, mask
+
+    def rotate(self, now):
+        """Clear the older filter and make it the current one. Caller must hold self.lock."""
+        self.logger.info("Rotating filters. Checked %s, dropped %s events. Estimated false positive rate: %.6f." % (self.checked_count, self.dropped_count, self.getFalsePositiveRate()))
+        current_filter_idx = 1 - int(self.filter_state[0])
+        self.filters[current_filter_idx][:] = array.array(BLOCK_TYPECODE, [0]) * self.block_count
+        self.filter_state[2 + current_filter_idx] = 0
+        self.filter_state[0] = current_filter_idx
+        self.filter_state[1] = now + self.window
+        self.checked_count = self.dropped_count = 0
+
+    def getFalsePositiveRate(self):
+        """
+        Estimate the probability that a new key is reported as seen, based on the number of keys in both filters.
+        This is the rate of a standard Bloom filter, the blocked layout is slightly worse.
+        """
+        not_false_positive = 1.0
+        for filter_idx in (0, 1):
+            keys_count = self.filter_state[2 + filter_idx]
+            not_false_positive *= 1 - (1 - math.exp(-self.hash_count * keys_count / float(self.filter_bits))) ** self.hash_count
+        return 1 - not_false_positive
+
+    def isDuplicate(self, key):
+        """Check if key was seen before. If not, add it to the current filter."""
+        block_idx, mask = self.getBlockAndMask(key)
+        now = time.time()
+        # Blocks are updated by read-modify-write. Without the lock, concurrent updates would erase each others bits.
+        with self.lock:
+            if now >= self.filter_state[1]:
+                self.rotate(now)
+            current_filter_idx = int(self.filter_state[0])
+            current_filter = self.filters[current_filter_idx]
+            self.checked_count += 1
+            block = current_filter[block_idx]
+            if block & mask == mask or self.filters[1 - current_filter_idx][block_idx] & mask == mask:
+                # Not added again, else a key recurring more often than the window would never be forgotten.
+                self.dropped_count += 1
+                return True
+            current_filter[block_idx] = block | mask
+            self.filter_state[2 + current_filter_idx] += 1
+            return False
+
+    def handleEvent(self, event):
+        key = self.getConfigurationValue('key', event)
+        # Events without the key fields can not be checked.
+        if key is not False and self.isDuplicate(key):
+            self.stats_collector.incrementCounter('deduplicate_dropped_events')
+            return
+        yield event
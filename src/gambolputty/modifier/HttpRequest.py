@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 import sys
-import urllib2
 import socket
+import httplib
+import urlparse
+import threading
+import collections
+import Queue
 import BaseThreadedModule
 import Decorators
+import Utils
 
 
 @Decorators.ModuleDocstringParser
@@ -11,16 +16,43 @@ class HttpRequest(BaseThreadedModule.BaseThreadedModule):
     """
     Issue an arbitrary http request and store the response in a configured field.
 
+    Responses are cached per url for <cache_ttl> seconds. Failed requests are cached for <negative_cache_ttl>
+    seconds. Expired responses are still used for <cache_stale_ttl> seconds, while they are requested again
+    in the background by the request threads. Cache hits and misses are reported by SimpleStats (cache_statistics).
+
     This module supports the storage of the responses in an redis db. If redis_store is set,
     it will first try to retrieve the response from redis via the key setting.
     If that fails, it will execute the http request and store the result in redis.
 
+    Requests are executed by <concurrency> threads, so a slow server does not stall the module.
+    Connections are kept open and reused for further requests to the same host.
+    If a request for an url is already running, events requesting the same url wait for its response.
+    Events are sent on as soon as their response arrived (ordering: completion) or in the order they were
+    received (ordering: input). At most <max_pending_events> events wait for responses, further events block.
+    Events that waited for a response are sent on by the module thread only, the request threads hand the
+    responses over to it.
+
+    url: Url to request.
+    socket_timeout: Timeout in seconds for connecting and reading a response.
+    target_field: Field to store the response in.
+    concurrency: Maximum number of requests running at the same time.
+    ordering: completion: send events on as soon as their response arrived. input: keep the order of the events.
+    max_pending_events: Maximum number of events waiting for responses.
+    cache_size: Maximum number of cached responses.
+
     Configuration template:
 
     - HttpRequest:
         url:                                    # <type: string; is: required>
         socket_timeout:                         # <default: 25; type: integer; is: optional>
         target_field:                           # <default: "gambolputty_http_request"; type: string; is: optional>
+        concurrency:                            # <default: 10; type: integer; is: optional>
+        ordering:                               # <default: 'completion'; type: string; values: ['completion', 'input']; is: optional>
+        max_pending_events:                     # <default: 1000; type: integer; is: optional>
+        cache_size:                             # <default: 1000; type: integer; is: optional>
+        cache_ttl:                              # <default: 60; type: integer; is: optional>
+        negative_cache_ttl:                     # <default: 10; type: integer; is: optional>
+        cache_stale_ttl:                        # <default: 0; type: integer; is: optional>
         redis_store:                            # <default: None; type: None||string; is: optional>
         redis_key:                              # <default: None; type: None||string; is: optional if redis_store is None else required>
         redis_ttl:                              # <default: 60; type: integer; is: optional>
@@ -30,47 +62,248 @@ class HttpRequest(BaseThreadedModule.BaseThreadedModule):
     module_type = "modifier"
     """Set module type"""
 
+    max_redirects = 5
+
     def configure(self, configuration):
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
-        socket.setdefaulttimeout(self.getConfigurationValue('socket_timeout'))
         # Get redis client module.
         if self.getConfigurationValue('redis_store'):
             mod_info = self.gp.getModuleInfoById(self.getConfigurationValue('redis_store'))
             self.redis_store = mod_info['instances'][0]
         else:
             self.redis_store = None
+        self.request_queue = Queue.Queue()
+        self.cache = Utils.EnrichmentCache(size=self.getConfigurationValue('cache_size'),
+                                           ttl=self.getConfigurationValue('cache_ttl'),
+                                           negative_ttl=self.getConfigurationValue('negative_cache_ttl'),
+                                           stale_ttl=self.getConfigurationValue('cache_stale_ttl'),
+                                           redis_store=self.redis_store,
+                                           redis_ttl=self.getConfigurationValue('redis_ttl'),
+                                           executor=self.queueRefresh)
+        self.cache.setCounterNames(self.getModuleId(), self.gp.worker_index)
+        self.keep_order = self.getConfigurationValue('ordering') == 'input'
+        self.connection_pool = HttpConnectionPool(self.getConfigurationValue('socket_timeout'), self.getConfigurationValue('concurrency'))
+        # Responses by cache key, handed over from the request threads to the module thread.
+        self.completed_requests = Queue.Queue()
+        self.request_threads = []
+        # Events waiting for a response, by cache key.
+        self.requests_in_flight = {}
+        self.requests_lock = threading.Lock()
+        # Events in the order they were received, only used if ordering is input.
+        self.ordered_events = collections.deque()
+        self.emit_lock = threading.Lock()
+        self.pending_events = threading.BoundedSemaphore(self.getConfigurationValue('max_pending_events'))
+
+    def initAfterFork(self):
+        # Threads do not survive a fork, so they are started in each worker.
+        self.startRequestThreads()
+        self.cache.setCounterNames(self.getModuleId(), self.gp.worker_index)
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
+
+    def startRequestThreads(self):
+        with self.requests_lock:
+            if self.request_threads:
+                return
+            for _ in xrange(0, self.getConfigurationValue('concurrency')):
+                request_thread = threading.Thread(target=self.processRequests)
+                request_thread.daemon = True
+                request_thread.start()
+                self.request_threads.append(request_thread)
+
+    def start(self):
+        # The module thread sends on the events whose responses arrived, events of the input queue are handled
+        # by threads of their own.
+        threading.Thread.start(self)
+        if not self.input_queue:
+            return
+        pool_size = self.getPoolSize() if self.getPoolType() == 'thread' and self.getPoolSize() else 1
+        for _ in xrange(0, pool_size):
+            worker = threading.Thread(target=BaseThreadedModule.BaseThreadedModule.run, args=(self,))
+            worker.daemon = True
+            worker.start()
+
+    def run(self):
+        while self.alive:
+            try:
+                cache_key, result = self.completed_requests.get(timeout=.5)
+            except Queue.Empty:
+                continue
+            if cache_key is not None:
+                self.completeRequest(cache_key, result)
+            elif self.keep_order:
+                self.emitOrderedEvents()
+
+    def receiveEventBatch(self, events):
+        if self.redis_store and not self.getConfigurationValue('filter'):
+            # Get the responses of the whole batch from redis in one round trip.
+            self.cache.prefetch([self.getConfigurationValue('redis_key', event) for event in events])
+        BaseThreadedModule.BaseThreadedModule.receiveEventBatch(self, events)
 
     def handleEvent(self, event):
         request_url = self.getConfigurationValue('url', event)
         target_field_name = self.getConfigurationValue('target_field', event)
-        if not request_url or not target_field_name:
+        if request_url and target_field_name:
+            cache_key = self.getConfigurationValue('redis_key', event) if self.redis_store else request_url
+            try:
+                result = self.cache.getCached(cache_key, lambda: self.fetchUrl(request_url))
+                if result is not None:
+                    event[target_field_name] = result
+            except KeyError:
+                self.requestUrl(event, request_url, target_field_name, cache_key)
+                return
+        if not self.keep_order:
             yield event
             return
-        result = None
-        if self.redis_store:
-            redis_key = self.getConfigurationValue('redis_key', event)
-            result = self.redis_store.get(redis_key)
-        if result is None:
-            try:
-                result = self.execRequest(request_url).read()
-                if result and self.redis_store:
-                    self.redis_store.set(redis_key, result, self.getConfigurationValue('redis_ttl'))
-            except:
-                yield event
+        # Events that need no request still have to wait for the events received before them.
+        self.pending_events.acquire()
+        with self.emit_lock:
+            self.ordered_events.append([event, True])
+        # Wake up the module thread to send it on.
+        self.completed_requests.put((None, None))
+
+    def requestUrl(self, event, request_url, target_field_name, cache_key):
+        if not self.request_threads:
+            self.startRequestThreads()
+        self.pending_events.acquire()
+        pending_event = [event, False]
+        if self.keep_order:
+            with self.emit_lock:
+                self.ordered_events.append(pending_event)
+        with self.requests_lock:
+            waiting_events = self.requests_in_flight.get(cache_key)
+            if waiting_events is not None:
+                waiting_events.append((pending_event, target_field_name))
                 return
-        event[target_field_name] =  result
-        yield event
+            self.requests_in_flight[cache_key] = [(pending_event, target_field_name)]
+        self.request_queue.put((cache_key, request_url))
 
-    def execRequest(self, url):
+    def queueRefresh(self, refresh_func):
+        """Stale responses are requested again by the request threads."""
+        if not self.request_threads:
+            self.startRequestThreads()
+        self.request_queue.put(refresh_func)
+
+    def processRequests(self):
+        while self.alive:
+            request = self.request_queue.get()
+            if callable(request):
+                request()
+                continue
+            cache_key, request_url = request
+            # Looks the response up in redis first and stores it in the cache.
+            result = self.cache.load(cache_key, lambda: self.fetchUrl(request_url))
+            self.completed_requests.put((cache_key, result))
+
+    def fetchUrl(self, request_url):
         try:
-            response = urllib2.urlopen(url)
-            return response
-        except urllib2.HTTPError, e:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Request to %s failed. Exception: %s, Error: %s" % (url, etype, evalue))
-            raise
-        except urllib2.URLError, e:
+            return self.execRequest(request_url)
+        except:
             etype, evalue, etb = sys.exc_info()
-            self.logger.error("Request to %s failed. Exception: %s, Error: %s" % (url, etype, evalue))
-            raise
-        return False
\ No newline at end of file
+            self.logger.error("Request to %s failed. Exception: %s, Error: %s" % (request_url, etype, evalue))
+            return None
+
+    def completeRequest(self, cache_key, result):
+        """Store the response in all events waiting for it and send them on. Only called by the module thread."""
+        with self.requests_lock:
+            waiting_events = self.requests_in_flight.pop(cache_key)
+        if result is not None:
+            for pending_event, target_field_name in waiting_events:
+                pending_event[0][target_field_name] = result
+        if self.keep_order:
+            for pending_event, _ in waiting_events:
+                pending_event[1] = True
+            self.emitOrderedEvents()
+            return
+        for pending_event, _ in waiting_events:
+            self.sendEvent(pending_event[0])
+            self.pending_events.release()
+
+    def emitOrderedEvents(self):
+        """Send on all events at the head of the queue whose responses arrived."""
+        with self.emit_lock:
+            while self.ordered_events and self.ordered_events[0][1]:
+                event = self.ordered_events.popleft()[0]
+                self.sendEvent(event)
+                self.pending_events.release()
+
+    def execRequest(self, url):
+        """Return the response body or None, if the server responded with an error."""
+        for _ in xrange(0, self.max_redirects + 1):
+            status, headers, body = self.connection_pool.request(url)
+            if status in (301, 302, 303, 307) and 'location' in headers:
+                url = urlparse.urljoin(url, headers['location'])
+                continue
+            if status >= 400:
+                self.logger.error("Request to %s failed. Status: %s" % (url, status))
+                return None
+            return body
+        self.logger.error("Request to %s failed. Too many redirects." % url)
+        return None
+
+    def shutDown(self):
+        self.connection_pool.close()
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
+
+
+class HttpConnectionPool:
+    """
+    Keep up to max_idle open connections per host and reuse them for further requests.
+    """
+
+    connection_classes = {'http': httplib.HTTPConnection,
+                          'https': httplib.HTTPSConnection}
+
+    def __init__(self, timeout, max_idle):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_connections = collections.defaultdict(list)
+        self.lock = threading.Lock()
+
+    def acquire(self, scheme, host):
+        with self.lock:
+            try:
+                return self.idle_connections[(scheme, host)].pop(), True
+            except IndexError:
+                pass
+        return self.connection_classes[scheme](host, timeout=self.timeout), False
+
+    def release(self, scheme, host, connection):
+        with self.lock:
+            idle_connections = self.idle_connections[(scheme, host)]
+            if len(idle_connections) < self.max_idle:
+                idle_connections.append(connection)
+                return
+        connection.close()
+
+    def request(self, url):
+        """Issue a GET request and return status, headers and body of the response."""
+        scheme, host, path, query, _ = urlparse.urlsplit(url)
+        if scheme not in self.connection_classes:
+            raise ValueError("Unsupported url scheme %s" % scheme)
+        path = path or '/'
+        if query:
+            path = "%s?%s" % (path, query)
+        while True:
+            connection, reused = self.acquire(scheme, host)
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                # The server may have closed an idle connection in the meantime, retry with a new one.
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(scheme, host, connection)
+            return response.status, dict(response.getheaders()), body
+
+    def close(self):
+        with self.lock:
+            for idle_connections in self.idle_connections.values():
+                for connection in idle_connections:
+                    connection.close()
+            self.idle_connections.clear()
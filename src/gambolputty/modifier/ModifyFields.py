@@ -3,9 +3,21 @@ import pprint
 import sys
 import re
 import hashlib
+import hmac
+import itertools
 import BaseThreadedModule
 import Utils
 import Decorators
+import StatisticCollector
+
+try:
+    import numpy
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# Batches smaller than this are not worth the overhead of creating a numpy array.
+NUMPY_MIN_BATCH_SIZE = 64
 
 
 @Decorators.ModuleDocstringParser
@@ -13,6 +25,9 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
     """
     Simple module to insert/delete/change field values.
 
+    The map and cast actions handle batches of events in one pass per field. If numpy is installed, it is used
+    to cast larger batches to int and float.
+
     Configuration templates:
 
     # Keep all fields listed in source_fields, discard all others.
@@ -45,6 +60,14 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         receivers:
           - NextModule
 
+    # Rename a field.
+    - ModifyFields:
+        action: rename                              # <type: string; is: required>
+        source_field:                               # <type: string; is: required>
+        target_field:                               # <type: string; is: required>
+        receivers:
+          - NextModule
+
     # Replace field values matching string "old" in data dictionary with "new".
     - ModifyFields:
         action: string_replace                      # <type: string; is: required>
@@ -74,6 +97,8 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
           - NextModule
 
     # Split source field to target fields based on key value pairs.
+    # Values may be quoted with double or single quotes. A backslash escapes the next character.
+    # If whitelist is set, only keys in whitelist are extracted.
     - ModifyFields:
         action: key_value                           # <type: string; is: required>
         line_separator:                             # <type: string; is: required>
@@ -81,16 +106,19 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         source_field:                               # <type: list; is: required>
         target_field:                               # <default: None; type: None||string; is: optional>
         prefix:                                     # <default: None; type: None||string; is: optional>
+        whitelist:                                  # <default: None; type: None||list; is: optional>
         receivers:
           - NextModule
 
     # Split source field to target fields based on key value pairs using regex.
+    # The regex needs to contain two groups, one for the key and one for the value.
     - ModifyFields:
         action: key_value_regex                     # <type: string; is: required>
         regex:                                      # <type: string; is: required>
         source_field:                               # <type: list; is: required>
         target_field:                               # <default: None; type: None||string; is: optional>
         prefix:                                     # <default: None; type: None||string; is: optional>
+        whitelist:                                  # <default: None; type: None||list; is: optional>
         receivers:
           - NextModule
 
@@ -152,14 +180,28 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
     # If target_fields is provided, it should have the same length as source_fields.
     # If target_fields is not provided, source_fields will be replaced with the hashed value.
     # Hash algorithm can be any of the in hashlib supported algorithms.
+    # If hmac_key is set, a keyed HMAC is created instead of a plain hash.
+    # The last cache_size hashes are kept in a LRU cache per worker. Set cache_size to 0 to disable the cache.
     - ModifyFields:
         action: hash                                # <type: string; is: required>
         algorithm: sha1                             # <default: "md5"; type: string; is: optional;>
         salt:                                       # <default: None; type: None||string; is: optional;>
+        hmac_key:                                   # <default: None; type: None||string; is: optional;>
+        cache_size:                                 # <default: 10000; type: integer; is: optional;>
         source_fields:                              # <type: list; is: required>
         target_fields:                              # <default: []; type: list; is: optional>
         receivers:
           - NextModule
+
+    # Apply a list of actions in one module.
+    # Each item of actions is the configuration of one of the actions above, e.g. {action: delete, source_fields: [url]}.
+    # The actions are compiled into a single function when the module is configured. This is a lot faster
+    # than a chain of ModifyFields modules, since each event only passes one module.
+    - ModifyFields:
+        action: plan                                # <type: string; is: required>
+        actions:                                    # <type: list; is: required>
+        receivers:
+          - NextModule
 """
 
     module_type = "modifier"
@@ -203,9 +245,6 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         self.source_fields = self.getConfigurationValue('source_fields') if "source_fields" in self.configuration_data else []
         self.target_field = self.getConfigurationValue('target_field') if "target_field" in self.configuration_data else []
         self.target_fields = self.getConfigurationValue('target_fields') if "target_fields" in self.configuration_data else []
-        # Call action specific configure method.
-        if "configure_%s_action" % self.action in dir(self):
-            getattr(self, "configure_%s_action" % self.action)()
         # Get action specific method
         try:
             self.event_handler = getattr(self, "%s" % self.action)
@@ -213,6 +252,14 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
             etype, evalue, etb = sys.exc_info()
             self.logger.error("ModifyFields action called that does not exist: %s. Exception: %s, Error: %s" % (self.action, etype, evalue))
             self.gp.shutDown()
+        # Actions that support batches set their own batch handler.
+        self.batch_handler = None
+        # Call action specific configure method. This may replace the event handler with a compiled one.
+        if "configure_%s_action" % self.action in dir(self):
+            getattr(self, "configure_%s_action" % self.action)()
+        # Filtered events are handled one by one.
+        if self.getConfigurationValue('filter'):
+            self.batch_handler = None
 
     def configure_split_action(self):
         self.separator = self.getConfigurationValue('separator')
@@ -220,10 +267,21 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
     def configure_key_value_action(self):
         self.line_separator = self.getConfigurationValue('line_separator')
         self.kv_separator = self.getConfigurationValue('kv_separator')
+        if not self.line_separator or not self.kv_separator:
+            self.logger.error("line_separator and kv_separator must not be empty.")
+            self.gp.shutDown()
+            return
         self.prefix = self.getConfigurationValue('prefix')
+        self.kv_tokenizer = Utils.KeyValueTokenizer(self.line_separator, self.kv_separator, self.prefix, self.getConfigurationValue('whitelist'))
 
     def configure_key_value_regex_action(self):
+        # Each match has to be a key value pair.
+        if getattr(self, 'regex', None) and self.regex.groups != 2:
+            self.logger.error("Regex %s for key_value_regex needs exactly two groups, got %s." % (self.regex.pattern, self.regex.groups))
+            self.gp.shutDown()
+            return
         self.prefix = self.getConfigurationValue('prefix')
+        self.whitelist = set(self.getConfigurationValue('whitelist')) if self.getConfigurationValue('whitelist') else None
 
     def configure_join_action(self):
         self.separator = self.getConfigurationValue('separator')
@@ -236,6 +294,10 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         self.salt = self.getConfigurationValue('salt') if self.getConfigurationValue('salt') else ""
         self.algorithm = self.getConfigurationValue('algorithm')
         if self.algorithm == "murmur":
+            if self.getConfigurationValue('hmac_key'):
+                self.logger.error("HMAC is not supported for murmur hashes.")
+                self.gp.shutDown()
+                return
             try:
                 import mmh3
                 self.hash_func = mmh3.hash
@@ -252,10 +314,237 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
                 self.gp.shutDown()
                 return
             self.hash_func = self.hashlibFunc
+            if self.getConfigurationValue('hmac_key'):
+                # Copying a prepared hmac object saves setting up the key pads for each value.
+                self.hmac = hmac.new(self.getConfigurationValue('hmac_key'), digestmod=self.hashlib_func)
+                self.hash_func = self.hmacFunc
+        self.hash_cache = Utils.MemoryCache(size=self.getConfigurationValue('cache_size')) if self.getConfigurationValue('cache_size') else None
+        self.stats_collector = StatisticCollector.StatisticCollector()
+        self.setCacheCounterNames()
+        self.batch_handler = self.hashBatch
+
+    def setCacheCounterNames(self):
+        # Hit ratios are reported per worker.
+        cache_name = "%s_worker_%s" % (self.getModuleId(), self.gp.worker_index)
+        self.cache_hits_counter = "cache_hits_%s" % cache_name
+        self.cache_misses_counter = "cache_misses_%s" % cache_name
+
+    def initAfterFork(self):
+        if self.action in ['hash', 'anonymize']:
+            self.setCacheCounterNames()
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def hashlibFunc(self, string):
         return self.hashlib_func(string).hexdigest()
 
+    def hmacFunc(self, string):
+        hmac_copy = self.hmac.copy()
+        hmac_copy.update(string)
+        return hmac_copy.hexdigest()
+
+    def getHash(self, value):
+        """
+        Return the hash of value. Hashes of recently seen values are taken from the cache.
+        The cache is keyed by the string that is hashed. Values like 1, 1.0 and True are equal, but their strings are not.
+        """
+        string = "%s%s" % (self.salt, value)
+        if self.hash_cache is None:
+            return self.hash_func(string)
+        try:
+            hashed_value = self.hash_cache.get(string)
+            self.stats_collector.incrementCounter(self.cache_hits_counter)
+            return hashed_value
+        except KeyError:
+            pass
+        self.stats_collector.incrementCounter(self.cache_misses_counter)
+        hashed_value = self.hash_func(string)
+        self.hash_cache.set(string, hashed_value)
+        return hashed_value
+
+    def configure_map_action(self):
+        # Dynamic maps need to be resolved per event.
+        if self.configuration_data['map']['contains_placeholder']:
+            return
+        mapping = self.getConfigurationValue('map')
+        source_field = self.source_field
+        target_field = self.target_field if self.target_field else "%s_mapped" % self.source_field
+        missing = object()
+
+        def mapEvent(event):
+            try:
+                event[target_field] = mapping[event[source_field]]
+            except KeyError:
+                pass
+            return event
+
+        def mapBatch(events):
+            events_with_field = [event for event in events if source_field in event]
+            get_mapped = mapping.get
+            values = [get_mapped(event[source_field], missing) for event in events_with_field]
+            for event, value in itertools.izip(events_with_field, values):
+                if value is not missing:
+                    event[target_field] = value
+            return events
+
+        self.event_handler = mapEvent
+        self.batch_handler = mapBatch
+
+    def configure_cast_to_int_action(self):
+        self.compileCastAction(*cast_actions['cast_to_int'])
+
+    def configure_cast_to_float_action(self):
+        self.compileCastAction(*cast_actions['cast_to_float'])
+
+    def configure_cast_to_str_action(self):
+        self.compileCastAction(*cast_actions['cast_to_str'])
+
+    def configure_cast_to_bool_action(self):
+        self.compileCastAction(*cast_actions['cast_to_bool'])
+
+    def compileCastAction(self, cast_func, default_value, numpy_cast_func=None):
+        """
+        Replace the event handler of a cast action with a closure and set a batch handler.
+
+        The batch handler converts all values of a field in one pass, using numpy if available. If one of the
+        values can not be converted, the column is converted value by value, like the event handler does.
+        """
+        source_fields = tuple(self.source_fields)
+        if not numpy_available:
+            numpy_cast_func = None
+
+        def castValue(value):
+            try:
+                return cast_func(value)
+            except ValueError:
+                return default_value
+
+        def castEvent(event):
+            for field in source_fields:
+                try:
+                    event[field] = cast_func(event[field])
+                except ValueError:
+                    event[field] = default_value
+                except KeyError:
+                    pass
+            return event
+
+        def castBatch(events):
+            for field in source_fields:
+                events_with_field = [event for event in events if field in event]
+                column = [event[field] for event in events_with_field]
+                try:
+                    if numpy_cast_func and len(column) >= NUMPY_MIN_BATCH_SIZE:
+                        values = numpy_cast_func(column)
+                    else:
+                        values = [cast_func(value) for value in column]
+                except (ValueError, TypeError, OverflowError):
+                    values = [castValue(value) for value in column]
+                for event, value in itertools.izip(events_with_field, values):
+                    event[field] = value
+            return events
+
+        self.event_handler = castEvent
+        self.batch_handler = castBatch
+
+    def configure_plan_action(self):
+        self.plan_handler, self.batch_handler = self.compilePlan(self.getConfigurationValue('actions'))
+        self.event_handler = self.plan_handler
+
+    def compilePlan(self, actions):
+        """
+        Compile a list of action configurations into two functions, one for single events and one for batches.
+
+        Simple actions are inlined with their field paths and option values resolved. All other actions are
+        configured as a separate ModifyFields instance and called from the compiled function.
+        """
+        namespace = {'mapDynamicValue': Utils.mapDynamicValue}
+        lines = []
+        for idx, action_configuration in enumerate(actions):
+            action_module = ModifyFields(gp=self.gp)
+            action_module.configure(action_configuration)
+            compile_step_method = getattr(self, "compile_%s_step" % action_module.action, None)
+            if compile_step_method:
+                lines.extend(compile_step_method(action_module, "step_%s" % idx, namespace))
+            else:
+                namespace["step_%s" % idx] = action_module.event_handler
+                lines.append("event = step_%s(event)" % idx)
+        if not lines:
+            lines.append("pass")
+        source = "def applyPlan(event):\n"
+        source += "".join("    %s\n" % line for line in lines)
+        source += "    return event\n\n"
+        source += "def applyPlanBatch(events):\n"
+        source += "    plan_events = []\n"
+        source += "    for event in events:\n"
+        source += "".join("        %s\n" % line for line in lines)
+        source += "        plan_events.append(event)\n"
+        source += "    return plan_events\n"
+        self.logger.debug("Compiled plan:\n%s" % source)
+        exec compile(source, "<%s plan>" % self.getModuleId(), 'exec') in namespace
+        return namespace['applyPlan'], namespace['applyPlanBatch']
+
+    def compile_delete_step(self, action_module, name, namespace):
+        return ["event.pop(%r, None)" % field for field in action_module.source_fields]
+
+    def compile_insert_step(self, action_module, name, namespace):
+        namespace[name] = action_module.getConfigurationValue('value')
+        target = getFieldPath(action_module.target_field)
+        if action_module.configuration_data['value']['contains_placeholder']:
+            return ["%s = mapDynamicValue(%s, event)" % (target, name)]
+        return ["%s = %s" % (target, name)]
+
+    def compile_rename_step(self, action_module, name, namespace):
+        source = getFieldPath(action_module.source_field)
+        return ["try:",
+                "    %s_value = %s" % (name, source),
+                "    del %s" % source,
+                "    %s = %s_value" % (getFieldPath(action_module.target_field), name),
+                "except KeyError:",
+                "    pass"]
+
+    def compile_map_step(self, action_module, name, namespace):
+        if action_module.configuration_data['map']['contains_placeholder']:
+            namespace[name] = action_module.event_handler
+            return ["event = %s(event)" % name]
+        namespace[name] = action_module.getConfigurationValue('map')
+        target_field = action_module.target_field if action_module.target_field else "%s_mapped" % action_module.source_field
+        return ["try:",
+                "    %s = %s[%s]" % (getFieldPath(target_field), name, getFieldPath(action_module.source_field)),
+                "except KeyError:",
+                "    pass"]
+
+    def compileCastStep(self, action_module, name, namespace):
+        cast_func, default_value, _ = cast_actions[action_module.action]
+        namespace[name] = cast_func
+        namespace["%s_default" % name] = default_value
+        lines = []
+        for field in action_module.source_fields:
+            field_path = getFieldPath(field)
+            lines.extend(["try:",
+                          "    %s = %s(%s)" % (field_path, name, field_path),
+                          "except ValueError:",
+                          "    %s = %s_default" % (field_path, name),
+                          "except KeyError:",
+                          "    pass"])
+        return lines
+
+    compile_cast_to_int_step = compile_cast_to_float_step = compile_cast_to_str_step = compile_cast_to_bool_step = compileCastStep
+
+    def plan(self, event):
+        """
+        Apply all actions of the compiled plan.
+
+        @param event: dictionary
+        @return: event: dictionary
+        """
+        return self.plan_handler(event)
+
+    def receiveEventBatch(self, events):
+        if not self.batch_handler:
+            BaseThreadedModule.BaseThreadedModule.receiveEventBatch(self, events)
+            return
+        self.sendEventBatch(self.batch_handler(events))
+
     def handleEvent(self, event):
         try:
             event = self.event_handler(event)
@@ -315,6 +604,21 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
 
 
 
+    def rename(self, event):
+        """
+        Rename source field to target field.
+
+        @param event: dictionary
+        @return: event: dictionary
+        """
+        try:
+            value = event[self.source_field]
+            del event[self.source_field]
+            event[self.target_field] = value
+        except KeyError:
+            pass
+        return event
+
     def concat(self, event):
         """
         Field names listed in ['source_fields'] will be concatenated to a new string.
@@ -386,6 +690,7 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
           source_field:                               # <type: list; is: required>
           target_field:                               # <default: None; type: None||string; is: optional>
           prefix:                                     # <default: None; type: None||string; is: optional>
+          whitelist:                                  # <default: None; type: None||list; is: optional>
           receivers:
             - NextModule
 
@@ -393,14 +698,9 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         @return: event: dictionary
         """
         try:
-            if self.line_separator:
-                kv_dict = dict(kv.split(self.kv_separator) for kv in event[self.source_field].split(self.line_separator))
-            else:
-                kv_dict = event[self.source_field].split(self.kv_separator)
-        except:
+            kv_dict = self.kv_tokenizer.tokenize(event[self.source_field])
+        except (KeyError, TypeError, AttributeError):
             return event
-        if self.prefix:
-            kv_dict = dict(map(lambda (key, value): ("%s%s" % (self.prefix, str(key)), value), kv_dict.items()))
         if self.target_field:
             event[self.target_field] = kv_dict
         else:
@@ -417,6 +717,7 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
           source_field:                               # <type: list; is: required>
           target_field:                               # <default: None; type: None||string; is: optional>
           prefix:                                     # <default: None; type: None||string; is: optional>
+          whitelist:                                  # <default: None; type: None||list; is: optional>
           receivers:
             - NextModule
 
@@ -426,11 +727,19 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         @return: event: dictionary
         """
         try:
-            kv_dict = dict(re.findall(self.regex, event[self.source_field]))
-        except:
+            matches = self.regex.findall(event[self.source_field])
+        except (KeyError, TypeError):
             return event
-        if self.prefix:
-            kv_dict = dict(map(lambda (key, value): ("%s%s" % (self.prefix, str(key)), value), kv_dict.items()))
+        if not self.prefix and not self.whitelist:
+            kv_dict = dict(matches)
+        else:
+            kv_dict = {}
+            for key, value in matches:
+                if self.whitelist and key not in self.whitelist:
+                    continue
+                if self.prefix:
+                    key = "%s%s" % (self.prefix, key)
+                kv_dict[key] = value
         if self.target_field:
             event[self.target_field] = kv_dict
         else:
@@ -583,7 +892,67 @@ class ModifyFields(BaseThreadedModule.BaseThreadedModule):
         for idx, field in enumerate(self.source_fields):
             target_fieldname = field if not self.target_fields else self.target_fields[idx]
             try:
-                event[target_fieldname] = self.hash_func("%s%s" % (self.salt, event[field]))
+                event[target_fieldname] = self.getHash(event[field])
             except:
                 pass
-        return event
\ No newline at end of file
+        return event
+
+    def hashBatch(self, events):
+        """
+        Hash the values of a batch of events. Each distinct value is only hashed once.
+        Values are distinguished by type as well, as e.g. 1 and 1.0 are equal but hashed differently.
+
+        @param events: list
+        @return: events: list
+        """
+        for idx, field in enumerate(self.source_fields):
+            target_fieldname = field if not self.target_fields else self.target_fields[idx]
+            hashed_values = {}
+            for event in events:
+                try:
+                    value = event[field]
+                except KeyError:
+                    continue
+                try:
+                    value_key = (value.__class__, value)
+                    try:
+                        hashed_value = hashed_values[value_key]
+                    except KeyError:
+                        hashed_value = hashed_values[value_key] = self.getHash(value)
+                    except TypeError:
+                        hashed_value = self.getHash(value)
+                    event[target_fieldname] = hashed_value
+                except:
+                    pass
+        return events
+
+
+def getFieldPath(field_name):
+    """Return the python expression to access a field. Dot separated names are resolved to nested dictionary lookups."""
+    keys = field_name.split(".")
+    # List indices depend on the event, so these paths are resolved by KeyDotNotationDict.
+    if len(keys) == 1 or any(key.isdigit() for key in keys):
+        return "event[%r]" % field_name
+    return "event%s" % "".join("[%r]" % key for key in keys)
+
+def castToInt(value):
+    return int(float(value))
+
+def numpyCastToFloat(column):
+    values = numpy.array(column, dtype=numpy.float64)
+    # Numpy converts None to nan. Let python decide about those values.
+    if not numpy.isfinite(values).all():
+        raise ValueError("Column contains values that are not finite.")
+    return values.tolist()
+
+def numpyCastToInt(column):
+    values = numpy.array(column, dtype=numpy.float64)
+    if not numpy.isfinite(values).all() or numpy.abs(values).max() >= 2**63:
+        raise ValueError("Column contains values out of int64 range.")
+    return values.astype(numpy.int64).tolist()
+
+# Cast function, default value for values that can not be cast and numpy cast function per action.
+cast_actions = {'cast_to_int': (castToInt, 0, numpyCastToInt),
+                'cast_to_float': (float, 0, numpyCastToFloat),
+                'cast_to_str': (str, "", None),
+                'cast_to_bool': (bool, False, None)}
@@ -16,4 +16,5 @@ class DevNullSink(BaseThreadedModule.BaseThreadedModule):
     """Set module type"""
 
     def handleEvent(self, event):
+        self.acknowledgeEvents([event])
         yield None
\ No newline at end of file
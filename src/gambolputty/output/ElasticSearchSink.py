@@ -56,6 +56,9 @@ class ElasticSearchSink(BaseThreadedModule.BaseThreadedModule):
     store_interval_in_secs:     Send data to es in x seconds intervals.
     batch_size: Sending data to es if event count is above, even if store_interval_in_secs is not reached.
     backlog_size:   Maximum count of events waiting for transmission. If backlog size is exceeded no new events will be processed.
+    spill_path: If set, events exceeding backlog_size are spilled to disk in this directory instead of blocking.
+                Spilled events will be sent first, when elasticsearch is reachable again.
+    spill_max_bytes:    Disk quota for spilled events. If exceeded, new events will block again.
 
     Configuration template:
 
@@ -76,6 +79,8 @@ class ElasticSearchSink(BaseThreadedModule.BaseThreadedModule):
         store_interval_in_secs:                   # <default: 5; type: integer; is: optional>
         batch_size:                               # <default: 500; type: integer; is: optional>
         backlog_size:                             # <default: 1000; type: integer; is: optional>
+        spill_path:                               # <default: None; type: None||string; is: optional>
+        spill_max_bytes:                          # <default: 1073741824; type: integer; is: optional>
     """
 
     module_type = "output"
@@ -101,7 +106,11 @@ class ElasticSearchSink(BaseThreadedModule.BaseThreadedModule):
 
     def initAfterFork(self):
         # As the buffer uses a threaded timed function to flush its buffer and thread will not survive a fork, init buffer here.
-        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
+        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'), acknowledge_callback=self.acknowledgeEvents)
+        if self.getConfigurationValue('spill_path'):
+            if not self.buffer.enableSpill(self.getSpillPath(), self.getConfigurationValue('spill_max_bytes')):
+                self.gp.shutDown()
+                return
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def connect(self):
@@ -161,8 +170,8 @@ class ElasticSearchSink(BaseThreadedModule.BaseThreadedModule):
             if self.ttl:
                 header['index']['_ttl'] = self.ttl
             try:
-                json_data.append("\n".join((json.dumps(header), json.dumps(event), "\n")))
-            except UnicodeDecodeError:
+                json_data.append("\n".join((json.dumps(header), json.dumps(Utils.getSerializableEvent(event)), "\n")))
+            except (UnicodeDecodeError, TypeError, ValueError):
                 etype, evalue, etb = sys.exc_info()
                 self.logger.error("Could not json encode %s. Exception: %s, Error: %s." % (event, etype, evalue))
         json_data = "".join(json_data)
@@ -20,6 +20,8 @@ class FileSink(BaseThreadedModule.BaseThreadedModule):
     batch_size: sending data to es if event count is above, even if store_interval_in_secs is not reached.
     backlog_size: maximum count of events waiting for transmission. Events above count will be dropped.
     compress: Compress output as gzip or snappy file. For this to be effective, the chunk size should not be too small.
+    spill_path: If set, events exceeding backlog_size are spilled to disk in this directory instead of blocking.
+    spill_max_bytes: Disk quota for spilled events. If exceeded, new events will block again.
 
     Configuration template:
 
@@ -30,6 +32,8 @@ class FileSink(BaseThreadedModule.BaseThreadedModule):
         batch_size:                           # <default: 500; type: integer; is: optional>
         backlog_size:                         # <default: 5000; type: integer; is: optional>
         compress:                             # <default: None; type: None||string; values: [None,'gzip','snappy']; is: optional>
+        spill_path:                           # <default: None; type: None||string; is: optional>
+        spill_max_bytes:                      # <default: 1073741824; type: integer; is: optional>
     """
 
     module_type = "output"
@@ -58,9 +62,16 @@ class FileSink(BaseThreadedModule.BaseThreadedModule):
             except ImportError:
                 self.logger.error('Snappy compression selected but snappy module could not be loaded.')
                 self.gp.shutDown()
-        self.buffer = Utils.Buffer(self.batch_size, self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.backlog_size)
+        self.buffer = Utils.Buffer(self.batch_size, self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.backlog_size, acknowledge_callback=self.acknowledgeEvents)
         Utils.TimedFunctionManager.startTimedFunction(self.closeStaleFileHandles)
 
+    def initAfterFork(self):
+        if self.getConfigurationValue('spill_path'):
+            if not self.buffer.enableSpill(self.getSpillPath(), self.getConfigurationValue('spill_max_bytes')):
+                self.gp.shutDown()
+                return
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
+
     @Decorators.setInterval(60)
     def closeStaleFileHandles(self):
         """
@@ -70,7 +70,7 @@ class GraphiteSink(BaseThreadedModule.BaseThreadedModule):
             return False
 
     def initAfterFork(self):
-        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
+        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'), acknowledge_callback=self.acknowledgeBufferedEvents)
         self.connection = self.connect()
         if not self.connection:
             self.gp.shutDown()
@@ -78,19 +78,22 @@ class GraphiteSink(BaseThreadedModule.BaseThreadedModule):
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def handleEvent(self, event):
+        # All lines of an event are buffered together, so the event is acknowledged once all of them were sent.
+        lines = []
         for format in self.formats:
             mapped_data = self.mapDynamicValue(format, event)
             if mapped_data:
-                self.buffer.append("%s %s" % (mapped_data, int(time.time())))
+                lines.append("%s %s\n" % (mapped_data, int(time.time())))
+        if lines:
+            self.buffer.append(("".join(lines), event))
+        else:
+            self.acknowledgeEvents([event])
         yield None
 
-    def storeData(self, events):
-        for event in events:
+    def storeData(self, buffered_data):
+        for lines, event in buffered_data:
             try:
-                if not event.endswith("\n"):
-                    event += "\n"
-                self.connection.send(event)
-                return True
+                self.connection.send(lines)
             except:
                 etype, evalue, etb = sys.exc_info()
                 self.logger.error("Server communication error. Exception: %s, Error: %s." % (etype, evalue))
@@ -108,6 +111,8 @@ class GraphiteSink(BaseThreadedModule.BaseThreadedModule):
                     self.gp.shutDown()
                 else:
                     self.logger.info("Reconnection to %s successful." % (self.connection_data))
+                return False
+        return True
 
     def shutDown(self):
         try:
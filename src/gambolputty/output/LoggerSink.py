@@ -41,4 +41,5 @@ class LoggerSink(BaseThreadedModule.BaseThreadedModule):
                 continue
             self.logger.info("%s" % (output))
         self.printing = False
+        self.acknowledgeEvents([event])
         yield None
\ No newline at end of file
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
-import sys
-import redis
+import json
+import collections
+import RedisAsyncClient
 import BaseThreadedModule
 import Utils
 import Decorators
@@ -17,6 +18,18 @@ class RedisChannelSink(BaseThreadedModule.BaseThreadedModule):
     db: Redis db.
     password: Redis password.
     format: Which event fields to send on, e.g. '%(@timestamp)s - %(url)s - %(country_code)s'. If not set, the whole event dict is send.
+    serializer: Serialize the whole event dict with str, msgpack or json. Not used if format is set.
+                str sends the python representation of the event, as former versions did.
+    store_interval_in_secs: Publish buffered events in x seconds intervals.
+    batch_size: Publish buffered events if count is above, even if store_interval_in_secs is not reached.
+    backlog_size: Maximum count of events waiting for publication. If reached, handling of further events blocks until
+                  the buffer was sent.
+
+    Events are published via RedisAsyncClient on the IOLoop of the process. All PUBLISH commands of a batch are sent
+    in one pipeline, grouped by channel. The order of the events of one channel is kept.
+    Only one pipeline is sent at a time. If redis does not keep up or the connection is lost, events pile up to
+    backlog_size and the module stops taking new events. After a reconnect, only the events whose PUBLISH did not reach
+    redis are sent again. Events redis refused are logged and dropped.
 
     Configuration template:
 
@@ -27,6 +40,7 @@ class RedisChannelSink(BaseThreadedModule.BaseThreadedModule):
         db:                         # <default: 0; type: integer; is: optional>
         password:                   # <default: None; type: None||string; is: optional>
         format:                     # <default: None; type: None||string; is: optional>
+        serializer:                 # <default: 'str'; type: string; values: ['str', 'msgpack', 'json']; is: optional>
         store_interval_in_secs:     # <default: 5; type: integer; is: optional>
         batch_size:                 # <default: 500; type: integer; is: optional>
         backlog_size:               # <default: 5000; type: integer; is: optional>
@@ -40,35 +54,54 @@ class RedisChannelSink(BaseThreadedModule.BaseThreadedModule):
          # Call parent configure method
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
         self.format = self.getConfigurationValue('format')
-        try:
-            self.client = redis.Redis(host=self.getConfigurationValue('server'),
-                                      port=self.getConfigurationValue('port'),
-                                      password=self.getConfigurationValue('password'),
-                                      db=self.getConfigurationValue('db'))
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not connect to redis store at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('server'),etype, evalue))
+        self.serialize = str
+        if self.getConfigurationValue('serializer') == 'json':
+            self.serialize = lambda event: json.dumps(event, default=Utils.serializeDefault)
+        if self.getConfigurationValue('serializer') == 'msgpack':
+            try:
+                msgpack_module = __import__('msgpack')
+                self.serialize = lambda event: msgpack_module.packb(event, default=Utils.serializeDefault)
+            except ImportError:
+                self.logger.error('Msgpack serializer selected but msgpack module could not be loaded.')
+                self.gp.shutDown()
 
     def initAfterFork(self):
-        #self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
+        self.client = RedisAsyncClient.AsyncRedisClient(address=(self.getConfigurationValue('server'), self.getConfigurationValue('port')),
+                                                        password=self.getConfigurationValue('password'),
+                                                        db=self.getConfigurationValue('db'))
+        self.buffer = Utils.IOLoopBuffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'), acknowledge_callback=self.acknowledgeBufferedEvents)
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
+    def storeData(self, buffered_data, callback):
+        items_by_channel = collections.OrderedDict()
+        for item in buffered_data:
+            items_by_channel.setdefault(item[0], []).append(item)
+        items = [item for channel_items in items_by_channel.itervalues() for item in channel_items]
+        def onReplies(replies):
+            # Only resend events that did not reach the server. Events the server refused are dropped.
+            failed_items = []
+            for item, reply in zip(items, replies):
+                if isinstance(reply, RedisAsyncClient.ConnectionError):
+                    failed_items.append(item)
+                elif isinstance(reply, RedisAsyncClient.RedisError):
+                    self.logger.error("Could not publish event to redis channel %s at %s. Dropping it. Error: %s." % (item[0], self.getConfigurationValue('server'), reply))
+            if failed_items:
+                self.logger.warning("Could not publish %s events to redis channel(s) at %s. Will retry. Error: %s." % (len(failed_items), self.getConfigurationValue('server'), replies[-1]))
+            callback(True, failed_items)
+        self.client.executeMany([('PUBLISH', channel, publish_data) for channel, publish_data, event in items], onReplies)
+
     def handleEvent(self, event):
         if self.format:
             publish_data = Utils.mapDynamicValue(self.format, event)
         else:
-            publish_data = event
-        try:
-            self.client.publish(self.getConfigurationValue('channel', event), publish_data)
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not publish event to redis channel %s at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('channel', event), self.getConfigurationValue('server'), etype, evalue))
+            publish_data = self.serialize(event)
+        self.buffer.append((self.getConfigurationValue('channel', event), publish_data, event))
         yield None
 
-    def __handleEvent(self, event):
-        if self.format:
-            publish_data = Utils.mapDynamicValue(self.format, event)
-        else:
-            publish_data = event
-        self.buffer.append(publish_data)
-        yield None
\ No newline at end of file
+    def shutDown(self):
+        try:
+            self.buffer.stop()
+            self.client.close()
+        except AttributeError:
+            pass
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
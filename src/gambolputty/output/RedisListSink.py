@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
-import sys
-import redis
+import RedisAsyncClient
 import BaseThreadedModule
 import Utils
 import Decorators
@@ -19,7 +18,12 @@ class RedisListSink(BaseThreadedModule.BaseThreadedModule):
     format: Which event fields to send on, e.g. '%(@timestamp)s - %(url)s - %(country_code)s'. If not set the whole event dict is send.
     store_interval_in_secs: Send data to redis in x seconds intervals.
     batch_size: Send data to redis if event count is above, even if store_interval_in_secs is not reached.
-    backlog_size: Maximum count of events waiting for transmission. Events above count will be dropped.
+    backlog_size: Maximum count of events waiting for transmission. If reached, handling of further events blocks until
+                  the buffer was sent.
+
+    Events are sent via RedisAsyncClient on the IOLoop of the process. All events of a batch are pushed with a single
+    RPUSH. If the connection to redis is lost, the batch is sent again after the reconnect. If redis refuses the
+    RPUSH, e.g. as the key holds no list, the batch is logged and dropped.
 
     Configuration template:
 
@@ -44,41 +48,38 @@ class RedisListSink(BaseThreadedModule.BaseThreadedModule):
         BaseThreadedModule.BaseThreadedModule.configure(self, configuration)
         self.format = self.getConfigurationValue('format')
         self.list = self.getConfigurationValue('list')
-        self.client = redis.StrictRedis(host=self.getConfigurationValue('server'),
-                                          port=self.getConfigurationValue('port'),
-                                          password=self.getConfigurationValue('password'),
-                                          db=self.getConfigurationValue('db'))
-        try:
-            self.client.ping()
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error("Could not connect to redis store at %s. Exception: %s, Error: %s." % (self.getConfigurationValue('server'),etype, evalue))
-            self.gp.shutDown()
 
     def initAfterFork(self):
-        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
+        self.client = RedisAsyncClient.AsyncRedisClient(address=(self.getConfigurationValue('server'), self.getConfigurationValue('port')),
+                                                        password=self.getConfigurationValue('password'),
+                                                        db=self.getConfigurationValue('db'))
+        self.buffer = Utils.IOLoopBuffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'), acknowledge_callback=self.acknowledgeBufferedEvents)
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
-    def storeData(self, buffered_data):
-        try:
-            self.client.rpush(self.list, *buffered_data)
-            return True
-        except:
-            exc_type, exc_value, exc_tb = sys.exc_info()
-            self.logger.error("Could not add event to redis list %s. Exception: %s, Error: %s." % (self.list, exc_type, exc_value))
-            return False
+    def storeData(self, buffered_data, callback):
+        def onReply(reply):
+            if isinstance(reply, RedisAsyncClient.ConnectionError):
+                self.logger.warning("Could not add events to redis list %s. Will retry. Error: %s." % (self.list, reply))
+                callback(False)
+                return
+            if isinstance(reply, RedisAsyncClient.RedisError):
+                # Retrying a command the server refused, e.g. with WRONGTYPE, would fail again.
+                self.logger.error("Could not add %s events to redis list %s. Dropping them. Error: %s." % (len(buffered_data), self.list, reply))
+            callback(True)
+        self.client.execute(('RPUSH', self.list) + tuple(publish_data for publish_data, event in buffered_data), onReply)
 
     def handleEvent(self, event):
         if self.format:
             publish_data = Utils.mapDynamicValue(self.format, event)
         else:
             publish_data = event
-        self.buffer.append(publish_data)
+        self.buffer.append((publish_data, event))
         yield None
 
     def shutDown(self):
         try:
-            self.buffer.flush()
-        except:
+            self.buffer.stop()
+            self.client.close()
+        except AttributeError:
             pass
-        BaseThreadedModule.BaseThreadedModule.shutDown(self)
\ No newline at end of file
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
@@ -45,4 +45,5 @@ class StdOutSink(BaseThreadedModule.BaseThreadedModule):
         else:
             print "%s" % output
         self.printing = False
+        self.acknowledgeEvents([event])
         yield None
@@ -60,6 +60,7 @@ class SyslogSink(BaseThreadedModule.BaseThreadedModule):
             self.syslogger.info(Utils.mapDynamicValue(self.format, event))
         else:
             self.syslogger.info(event)
+        self.acknowledgeEvents([event])
         yield None
 
     def shutDown(self):
@@ -5,7 +5,6 @@ from cStringIO import StringIO
 import pywebhdfs
 from pywebhdfs.webhdfs import PyWebHdfsClient
 import BaseThreadedModule
-import multiprocessing
 import Decorators
 import Utils
 import time
@@ -24,8 +23,10 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
     format: Which event fields to send on, e.g. '%(@timestamp)s - %(url)s - %(country_code)s'. If not set the whole event dict is send.
     store_interval_in_secs: Send data to webhdfs in x seconds intervals.
     batch_size: Send data to webhdfs if event count is above, even if store_interval_in_secs is not reached.
-    backlog_size: Maximum count of events waiting for transmission. Events above count will be dropped.
+    backlog_size: Maximum count of events waiting for transmission. If backlog size is exceeded no new events will be processed.
     compress: Compress output as gzip file. For this to be effective, the chunk size should not be too small.
+    spill_path: If set, events exceeding backlog_size are spilled to disk in this directory instead of blocking.
+    spill_max_bytes: Disk quota for spilled events. If exceeded, new events will block again.
 
     Configuration template:
 
@@ -39,6 +40,8 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
         batch_size:                           # <default: 1000; type: integer; is: optional>
         backlog_size:                         # <default: 5000; type: integer; is: optional>
         compress:                             # <default: None; type: None||string; values: [None,'gzip','snappy']; is: optional>
+        spill_path:                           # <default: None; type: None||string; is: optional>
+        spill_max_bytes:                      # <default: 1073741824; type: integer; is: optional>
     """
 
     module_type = "output"
@@ -53,7 +56,6 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
         urllib3_logger.setLevel(logging.CRITICAL)
         self.server, self.port = self.getConfigurationValue('server').split(':')
         self.user = self.getConfigurationValue('user')
-        self.events_container = []
         self.batch_size = self.getConfigurationValue('batch_size')
         self.backlog_size = self.getConfigurationValue('backlog_size')
         self.path = self.getConfigurationValue('path')
@@ -72,9 +74,6 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
             except ImportError:
                 self.logger.error('Snappy compression selected but snappy module could not be loaded.')
                 self.gp.shutDown()
-        self.is_storing = False
-        self.lock = multiprocessing.Lock()
-        self.timed_store_func = self.getTimedStoreFunc()
 
     def getHdfsClient(self):
         try:
@@ -85,14 +84,6 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
             return None
         return hdfs
 
-    def getTimedStoreFunc(self):
-        @Decorators.setInterval(self.getConfigurationValue('store_interval_in_secs'))
-        def timedStoreEvents():
-            if self.is_storing or self.lock._semlock._is_mine():
-                return
-            self.storeEvents(self.events_container)
-        return timedStoreEvents
-
     def ensureFileExists(self, path):
         try:
             self.hdfs.get_file_dir_status(path)
@@ -132,20 +123,17 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
 
     def initAfterFork(self):
         self.hdfs = self.getHdfsClient()
-        Utils.TimedFunctionManager.startTimedFunction(self.timed_store_func)
+        # As the buffer uses a threaded timed function to flush its buffer and thread will not survive a fork, init buffer here.
+        self.buffer = Utils.Buffer(self.batch_size, self.storeEvents, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.backlog_size, acknowledge_callback=self.acknowledgeEvents)
+        if self.getConfigurationValue('spill_path'):
+            if not self.buffer.enableSpill(self.getSpillPath(), self.getConfigurationValue('spill_max_bytes')):
+                self.gp.shutDown()
+                return
         # Call parent run method
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def handleEvent(self, event):
-        # Wait till a running store is finished to avoid strange race conditions while manipulating self.events_container.
-        while self.is_storing:
-            time.sleep(.0001)
-        while len(self.events_container) > self.backlog_size:
-            self.logger.warning("Maximum number of items (%s) in buffer reached. Waiting for flush." % self.maxsize)
-            time.sleep(1)
-        self.events_container.append(event)
-        if len(self.events_container) == self.batch_size:
-            self.storeEvents(self.events_container)
+        self.buffer.append(event)
         yield None
 
     def storeEvents(self, events):
@@ -155,8 +143,7 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
         A better approach seems to be to retry the write a number of times before failing.
         """
         if len(events) == 0:
-            return
-        self.is_storing = True
+            return True
         path = time.strftime(self.path)
         self.ensureDirExists(path)
         write_data = collections.defaultdict(str)
@@ -191,8 +178,16 @@ class WebHdfsSink(BaseThreadedModule.BaseThreadedModule):
                     # Issue error after max retries.
                     etype, evalue, etb = sys.exc_info()
                     self.logger.error('Max write retries reached. Could no log event %s. Exception: %s, Error: %s.' % (event, etype, evalue))
-        self.events_container = []
-        self.is_storing = False
+                    # Keep events in buffer, they will be sent again on next flush.
+                    return False
+        return True
+
+    def shutDown(self):
+        try:
+            self.buffer.flush()
+        except:
+            pass
+        BaseThreadedModule.BaseThreadedModule.shutDown(self)
 
     def compressGzip(self, data):
         buffer = StringIO()
@@ -22,6 +22,13 @@ class ZmqSink(BaseThreadedModule.BaseThreadedModule):
     store_interval_in_secs: Send data to redis in x seconds intervals.
     batch_size: Send data to redis if event count is above, even if store_interval_in_secs is not reached.
     backlog_size: Maximum count of events waiting for transmission. Events above count will be dropped.
+    send_batches: Send all buffered events in one multipart message, see below. If False, each event is sent as message
+                  of its own, prefixed with the topic.
+
+    With send_batches, the events of a flush are packed with msgpack into a single message, as frames [topic, marker, batch].
+    The topic frame is only sent if topic is set. The Zmq and ZmqTornado input modules unpack these batches. Events keep
+    their gambolputty metadata. If the high water mark is reached, sending is retried on the next flush.
+    Other consumers will not understand this format, so batches need to be enabled explicitly.
 
     Configuration template:
 
@@ -35,9 +42,10 @@ class ZmqSink(BaseThreadedModule.BaseThreadedModule):
         store_interval_in_secs:     # <default: 5; type: integer; is: optional>
         batch_size:                 # <default: 500; type: integer; is: optional>
         backlog_size:               # <default: 5000; type: integer; is: optional>
+        send_batches:               # <default: False; type: boolean; is: optional>
     """
 
-    module_type = "input"
+    module_type = "output"
     """Set module type"""
     can_run_forked = True
 
@@ -48,6 +56,7 @@ class ZmqSink(BaseThreadedModule.BaseThreadedModule):
         self.topic = self.getConfigurationValue('topic')
         self.format = self.getConfigurationValue('format')
         self.mode = self.getConfigurationValue('mode')
+        self.send_batches = self.getConfigurationValue('send_batches')
         if self.mode == "bind":
             self.can_run_forked = False
 
@@ -79,15 +88,23 @@ class ZmqSink(BaseThreadedModule.BaseThreadedModule):
 
     def initAfterFork(self):
         self.initZmqContext()
-        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'))
+        self.buffer = Utils.Buffer(self.getConfigurationValue('batch_size'), self.storeData, self.getConfigurationValue('store_interval_in_secs'), maxsize=self.getConfigurationValue('backlog_size'), acknowledge_callback=self.acknowledgeBufferedEvents)
         BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
 
     def storeData(self, buffered_data):
         try:
-            for data in buffered_data:
-                #print "Sending %s.\n" % data
-                self.client.send("%s" % data)
+            if self.send_batches:
+                # Wait a moment for the high water mark to clear, but do not block the buffer forever.
+                if not self.client.poll(1000, zmq.POLLOUT):
+                    return False
+                self.client.send_multipart(Utils.packZmqBatch([publish_data for publish_data, event in buffered_data], self.topic), zmq.NOBLOCK, copy=False)
+                return True
+            for publish_data, event in buffered_data:
+                #print "Sending %s.\n" % publish_data
+                self.client.send("%s" % publish_data)
             return True
+        except zmq.error.Again:
+            return False
         except zmq.error.ContextTerminated:
             pass
         except:
@@ -100,11 +117,14 @@ class ZmqSink(BaseThreadedModule.BaseThreadedModule):
     def handleEvent(self, event):
         if self.format:
             publish_data = Utils.mapDynamicValue(self.format, event)
+        elif self.send_batches:
+            # The whole batch will be packed at once.
+            publish_data = event
         else:
-            publish_data = msgpack.packb(event)
-        if self.topic:
+            publish_data = msgpack.packb(event, default=Utils.serializeDefault)
+        if self.topic and not self.send_batches:
              publish_data = "%s %s" % (self.topic, publish_data)
-        self.buffer.append(publish_data)
+        self.buffer.append((publish_data, event))
         yield None
 
     def shutDown(self):
@@ -164,7 +164,7 @@ class JsonParser(BaseThreadedModule.BaseThreadedModule):
                 if self.drop_original:
                     event.pop(source_field, None)
         try:
-            encode_data = json.dumps(encode_data)
+            encode_data = json.dumps(Utils.getSerializableEvent(encode_data))
         except:
             etype, evalue, etb = sys.exc_info()
             self.logger.warning("Could not json encode event data: %s. Exception: %s, Error: %s." % (event, etype, evalue))
@@ -4,6 +4,7 @@ import sys
 import types
 import msgpack
 import BaseThreadedModule
+import Utils
 import Decorators
 
 
@@ -101,7 +102,7 @@ class MsgPackParser(BaseThreadedModule.BaseThreadedModule):
                 if self.drop_original:
                     event.pop(source_field, None)
         try:
-            encode_data = msgpack.packb(encode_data)
+            encode_data = msgpack.packb(encode_data, default=Utils.serializeDefault)
         except:
             etype, evalue, etb = sys.exc_info()
             self.logger.warning("Could not msgpack encode event data: %s. Exception: %s, Error: %s." % (event, etype, evalue))
@@ -2,6 +2,7 @@
 from ua_parser import user_agent_parser
 import types
 import BaseThreadedModule
+import StatisticCollector
 import Decorators
 import Utils
 
@@ -27,14 +28,22 @@ class UserAgentParser(BaseThreadedModule.BaseThreadedModule):
                                              'minor': '3',
                                              'patch': '5'}}}
 
+    Parsed user agents are cached in two levels. Each worker has its own small cache (l1), user agents not found
+    there are looked up in a cache shared by all workers (l2). Only user agents missing in both are parsed.
+    Hits and misses of both levels are reported by SimpleStats (cache_statistics).
+
     source_fields:  Input field to parse.
     target_field: field to update with parsed info fields.
+    cache_size: Number of parsed user agents cached per worker.
+    shared_cache_size: Number of parsed user agents cached in shared memory. Set to 0 to disable the shared cache.
 
     Configuration template:
 
     - LineParser:
         source_fields:               # <type: string||list; is: required>
         target_field:                # <default: 'user_agent_info'; type:string; is: optional>
+        cache_size:                  # <default: 1000; type: integer; is: optional>
+        shared_cache_size:           # <default: 16384; type: integer; is: optional>
         receivers:
           - NextModule
     """
@@ -50,19 +59,55 @@ class UserAgentParser(BaseThreadedModule.BaseThreadedModule):
         if isinstance(self.source_fields, types.StringTypes):
             self.source_fields = [self.source_fields]
         self.target_field = self.getConfigurationValue('target_field')
-        self.in_mem_cache = Utils.MemoryCache(size=1000)
+        self.in_mem_cache = Utils.MemoryCache(size=self.getConfigurationValue('cache_size'))
+        self.shared_cache = None
+        if self.getConfigurationValue('shared_cache_size') > 0:
+            if Utils.msgpack_avaiable:
+                # Created before the workers are forked, so all of them share the same memory.
+                self.shared_cache = Utils.SharedMemoryCache(size=self.getConfigurationValue('shared_cache_size'))
+            else:
+                self.logger.warning("Shared cache disabled, msgpack module is not available.")
+        self.stats_collector = StatisticCollector.StatisticCollector()
+        self.setCacheCounterNames()
+
+    def setCacheCounterNames(self):
+        # Hit ratios are reported per cache level and worker.
+        self.cache_counters = {}
+        for cache_level in ['l1', 'l2']:
+            cache_name = "%s_%s_worker_%s" % (self.getModuleId(), cache_level, self.gp.worker_index)
+            self.cache_counters[cache_level] = ("cache_hits_%s" % cache_name, "cache_misses_%s" % cache_name)
+
+    def initAfterFork(self):
+        self.setCacheCounterNames()
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
+
+    def getUserAgentInfo(self, user_agent):
+        try:
+            ua_info = self.in_mem_cache.get(user_agent)
+            self.stats_collector.incrementCounter(self.cache_counters['l1'][0])
+            return ua_info
+        except KeyError:
+            self.stats_collector.incrementCounter(self.cache_counters['l1'][1])
+        if self.shared_cache:
+            try:
+                ua_info = self.shared_cache.get(user_agent)
+                self.stats_collector.incrementCounter(self.cache_counters['l2'][0])
+                self.in_mem_cache.set(user_agent, ua_info)
+                return ua_info
+            except KeyError:
+                self.stats_collector.incrementCounter(self.cache_counters['l2'][1])
+        ua_info = user_agent_parser.Parse(user_agent)
+        # Drop the 'string' field to avoid duplicate data. The parser caches its results as well, so the
+        # field may already be gone.
+        ua_info.pop('string', None)
+        if self.shared_cache:
+            self.shared_cache.set(user_agent, ua_info)
+        self.in_mem_cache.set(user_agent, ua_info)
+        return ua_info
 
     def handleEvent(self, event):
         for source_field in self.source_fields:
             if source_field not in event:
                 continue
-            # Try to get it from cache.
-            try:
-                ua_info = self.in_mem_cache.get(event[source_field])
-            except KeyError:
-                # Drop the 'string' field to avoid duplicate data.
-                ua_info = user_agent_parser.Parse(event[source_field])
-                ua_info.pop('string')
-                self.in_mem_cache.set(event[source_field], ua_info)
-            event[self.target_field] = ua_info
+            event[self.target_field] = self.getUserAgentInfo(event[source_field])
         yield event
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from lxml import etree
 import sys
+import hashlib
 import BaseThreadedModule
 import Utils
 import Decorators
@@ -15,6 +16,10 @@ class XPathParser(BaseThreadedModule.BaseThreadedModule):
     it will first try to retrieve the result from redis via the key setting.
     If that fails, it will execute the xpath query and store the result in redis.
 
+    Results are cached in process for <cache_ttl> seconds, by redis_key or else by query and xml document.
+    Documents that could not be parsed are cached for <negative_cache_ttl> seconds. Cache hits and misses
+    are reported by SimpleStats (cache_statistics).
+
     Configuration template:
 
     - XPathParser:
@@ -24,6 +29,9 @@ class XPathParser(BaseThreadedModule.BaseThreadedModule):
         redis_store:                           # <default: None; type: None||string; is: optional>
         redis_key:                             # <default: None; type: None||string; is: optional if redis_store is None else required>
         redis_ttl:                             # <default: 60; type: integer; is: optional>
+        cache_size:                            # <default: 1000; type: integer; is: optional>
+        cache_ttl:                             # <default: 60; type: integer; is: optional>
+        negative_cache_ttl:                    # <default: 10; type: integer; is: optional>
         receivers:
           - NextModule
     """
@@ -40,6 +48,28 @@ class XPathParser(BaseThreadedModule.BaseThreadedModule):
             self.redis_store = mod_info['instances'][0]
         else:
             self.redis_store = None
+        self.cache = Utils.EnrichmentCache(size=self.getConfigurationValue('cache_size'),
+                                           ttl=self.getConfigurationValue('cache_ttl'),
+                                           negative_ttl=self.getConfigurationValue('negative_cache_ttl'),
+                                           redis_store=self.redis_store,
+                                           redis_ttl=self.redis_ttl)
+        self.cache.setCounterNames(self.getModuleId(), self.gp.worker_index)
+
+    def initAfterFork(self):
+        self.cache.setCounterNames(self.getModuleId(), self.gp.worker_index)
+        BaseThreadedModule.BaseThreadedModule.initAfterFork(self)
+
+    def receiveEventBatch(self, events):
+        if self.getConfigurationValue('filter'):
+            BaseThreadedModule.BaseThreadedModule.receiveEventBatch(self, events)
+            return
+        if self.redis_store:
+            # Get the results of the whole batch from redis in one round trip.
+            self.cache.prefetch([self.getConfigurationValue('redis_key', event) for event in events if self.getConfigurationValue('source_field', event) in event])
+        for event in events:
+            for _ in self.handleEvent(event):
+                pass
+        self.sendEventBatch(events)
 
     def castToList(self, value):
         list = []
@@ -61,24 +91,27 @@ class XPathParser(BaseThreadedModule.BaseThreadedModule):
         if source_field not in event:
             yield event
             return
-        result = None
+        xml_string = event[source_field].decode('utf8').encode('ascii', 'ignore')
+        query = self.getConfigurationValue('query', event)
         if self.redis_store:
-            redis_key = self.getConfigurationValue('redis_key', event)
-            result = self.redis_store.get(redis_key)
-        if result is None:
-            xml_string = event[source_field].decode('utf8').encode('ascii', 'ignore')
-            try:
-                xml_root = etree.fromstring(xml_string)
-                xml_tree = etree.ElementTree(xml_root)
-                result =  xml_tree.xpath(self.getConfigurationValue('query', event))
-                if(type(result) == list):
-                    result = self.castToList(result)
-                if self.redis_store:
-                    self.redis_store.set(redis_key, result, self.redis_ttl)
-            except:
-                etype, evalue, etb = sys.exc_info()
-                self.logger.warning("Could not parse xml doc %s Exception: %s, Error: %s." % (xml_string, etype, evalue))
+            cache_key = self.getConfigurationValue('redis_key', event)
+        else:
+            cache_key = "%s:%s" % (query, hashlib.md5(xml_string).hexdigest())
+        result = self.cache.get(cache_key, lambda: self.executeQuery(xml_string, query))
         if result:
             target_field_name = self.getConfigurationValue('target_field', event)
             event[target_field_name] = result
-        yield event
\ No newline at end of file
+        yield event
+
+    def executeQuery(self, xml_string, query):
+        try:
+            xml_root = etree.fromstring(xml_string)
+            xml_tree = etree.ElementTree(xml_root)
+            result = xml_tree.xpath(query)
+            if(type(result) == list):
+                result = self.castToList(result)
+            return result
+        except:
+            etype, evalue, etb = sys.exc_info()
+            self.logger.warning("Could not parse xml doc %s Exception: %s, Error: %s." % (xml_string, etype, evalue))
+            return None
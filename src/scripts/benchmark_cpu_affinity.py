@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare events per second and queueing latency of floating and pinned workers.
+#
+# A producer process sends batches of httpd access log lines through a multiprocessing queue to <workers>
+# worker processes that parse them with a regex. With pinning, the producer runs on cpu 0, like the
+# master with cpu_affinity and master_cpus: [0], and the workers are pinned to the remaining cpus
+# (or NUMA nodes with --numa). Only meaningful on machines with more than one cpu.
+#
+# Usage: benchmark_cpu_affinity.py [workers cpu_count-1] [seconds 10] [--numa]
+
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+import multiprocessing
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+workers = int(arguments[0]) if len(arguments) > 0 else max(1, multiprocessing.cpu_count() - 1)
+seconds = int(arguments[1]) if len(arguments) > 1 else 10
+numa_aware = "--numa" in sys.argv
+batch_size = 50
+
+access_log_regex = re.compile('(?P<remote_ip>\d+\.\d+\.\d+\.\d+)\s+(?P<identd>\w+|-)\s+(?P<user>\w+|-)\s+\[(?P<datetime>\d+\/\w+\/\d+:\d+:\d+:\d+\s.\d+)\]\s+\"(?P<http_method>\w+) (?P<uri>\S+) (?P<http_version>\S+)\"\s+(?P<http_status>\d+)\s+(?P<bytes_send>\d+)\s+\"(?P<referer>[^"]*)\"\s+\"(?P<user_agent>[^"]*)\"')
+access_log_line = '192.168.2.20 - - [28/Jul/2006:10:27:10 -0300] "GET /cgi-bin/try/?param1=Test HTTP/1.0" 200 3395 "http://www.example.com/" "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:32.0) Gecko/20100101 Firefox/32.0"'
+
+def getCpus(worker_index):
+    if worker_index == 0:
+        return [0]
+    if numa_aware:
+        nodes = [[cpu for cpu in node if cpu != 0] for node in Utils.getNumaNodes()]
+        nodes = [node for node in nodes if node] or [[0]]
+        return nodes[(worker_index - 1) % len(nodes)]
+    cpus = range(1, multiprocessing.cpu_count()) or [0]
+    return [cpus[(worker_index - 1) % len(cpus)]]
+
+def produce(queue, pinned, stop_at):
+    if pinned:
+        Utils.setCpuAffinity(getCpus(0))
+    batch = [access_log_line] * batch_size
+    while time.time() < stop_at:
+        queue.put((time.time(), batch))
+    for _ in xrange(0, workers):
+        queue.put(None)
+
+def consume(worker_index, queue, results, pinned):
+    if pinned:
+        Utils.setCpuAffinity(getCpus(worker_index))
+    events = 0
+    latencies = []
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        produced_at, batch = item
+        latencies.append(time.time() - produced_at)
+        for line in batch:
+            access_log_regex.match(line).groupdict()
+        events += len(batch)
+    results.put((events, latencies))
+
+def benchmark(name, pinned):
+    queue = multiprocessing.Queue(20)
+    results = multiprocessing.Queue()
+    consumers = [multiprocessing.Process(target=consume, args=(idx, queue, results, pinned)) for idx in xrange(1, workers + 1)]
+    for consumer in consumers:
+        consumer.start()
+    started_at = time.time()
+    produce(queue, pinned, started_at + seconds)
+    events = 0
+    latencies = []
+    for _ in consumers:
+        worker_events, worker_latencies = results.get()
+        events += worker_events
+        latencies.extend(worker_latencies)
+    took = time.time() - started_at
+    for consumer in consumers:
+        consumer.join()
+    latencies.sort()
+    print("%-10s %10d events/s   p50 %7.2fms   p99 %7.2fms   p99.9 %7.2fms" % (name, events / took,
+          latencies[len(latencies) / 2] * 1000, latencies[int(len(latencies) * .99)] * 1000, latencies[int(len(latencies) * .999)] * 1000))
+
+if __name__ == '__main__':
+    if Utils.getCpuAffinity() is None:
+        print("Cpu affinity not supported on this system.")
+        sys.exit(1)
+    print("%d cpus, %d NUMA node(s), %d workers, batch size %d." % (multiprocessing.cpu_count(), len(Utils.getNumaNodes()), workers, batch_size))
+    benchmark("floating", False)
+    benchmark("pinned", True)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Measure checks per second of the Deduplicate modifier, with local and with shared filters.
+# Half of the keys are duplicates. The measured false positive rate is printed next to the estimated one.
+#
+# Usage: benchmark_deduplicate.py [count 500000] [capacity 500000] [memory_budget 1048576]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import mock
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/modifier")
+import Deduplicate
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+capacity = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+memory_budget = int(sys.argv[3]) if len(sys.argv) > 3 else 1048576
+
+def benchmarkDeduplicate(shared):
+    deduplicate = Deduplicate.Deduplicate(gp=mock.Mock())
+    deduplicate.configure({'capacity': capacity, 'memory_budget': memory_budget, 'shared': shared})
+    keys = ["%032x" % (counter / 2) for counter in xrange(0, count)]
+    start = time.time()
+    dropped = 0
+    for key in keys:
+        dropped += deduplicate.isDuplicate(key)
+    took = time.time() - start
+    false_positives = dropped - count / 2
+    print("%-8s %10d checks/s, false positive rate: %.6f, estimated: %.6f" % ("shared" if shared else "local", count / took,
+                                                                           float(false_positives) / (count / 2), deduplicate.getFalsePositiveRate()))
+
+if __name__ == '__main__':
+    print("%d keys, capacity %d, memory budget %d bytes." % (count, capacity, memory_budget))
+    benchmarkDeduplicate(False)
+    benchmarkDeduplicate(True)
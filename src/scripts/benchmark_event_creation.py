@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare events created per second via Utils.getDefaultEventDict and Utils.EventFactory.
+#
+# Usage: benchmark_event_creation.py [count 1000000]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+def getRandomEventDict(dict={}, caller_class_name='', received_from=False, event_type="Unknown"):
+    """ The former way of creating an event with 128 random bits as event id. """
+    default_dict = { "data": "",
+                     "gambolputty": {
+                         'pid': os.getpid(),
+                         'event_type': event_type,
+                         'event_id': "%032x%s" % (random.getrandbits(128), os.getpid()),
+                         'source_module': caller_class_name,
+                         'received_from': received_from,
+                         'received_by': Utils.MY_HOSTNAME
+                     }
+                }
+    default_dict.update(dict)
+    return Utils.KeyDotNotationDict(default_dict)
+
+def benchmark(name, func):
+    start = time.time()
+    for _ in xrange(0, count):
+        func()
+    took = time.time() - start
+    print("%-35s %10d events/s" % (name, count / took))
+
+if __name__ == '__main__':
+    data = {"data": "192.168.2.20 - - [28/Jul/2006:10:27:10 -0300] \"GET /cgi-bin/try/ HTTP/1.0\" 200 3395"}
+    event_factory = Utils.EventFactory(caller_class_name="Benchmark")
+    benchmark("random event id", lambda: getRandomEventDict(data, caller_class_name="Benchmark", received_from="127.0.0.1:5151"))
+    benchmark("Utils.getDefaultEventDict", lambda: Utils.getDefaultEventDict(data, caller_class_name="Benchmark", received_from="127.0.0.1:5151"))
+    benchmark("Utils.EventFactory.getEvent", lambda: event_factory.getEvent(data, received_from="127.0.0.1:5151"))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare events per second of the write ahead log used by EventBuffer with storing each event in redis,
+# like the former redis backed EventBuffer did (one SET on event creation, one DEL when the event is done).
+#
+# Events are appended in batches of <batch_size> and acknowledged once per batch, like a sink after a flush.
+# The write ahead log is run with group commit and, for reference, with an fsync after each batch.
+# The redis benchmark is skipped if no redis server is reachable on localhost:6379.
+#
+# Usage: benchmark_event_log.py [count 100000] [batch_size 50] [path /tmp]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+import WriteAheadLog
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+path = sys.argv[3] if len(sys.argv) > 3 else "/tmp"
+
+access_log_line = '192.168.2.20 - - [28/Jul/2006:10:27:10 -0300] "GET /cgi-bin/try/?param1=Test HTTP/1.0" 200 3395 "http://www.example.com/" "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:32.0) Gecko/20100101 Firefox/32.0"'
+
+def getBatch(event_factory):
+    return [event_factory.getEvent({'data': access_log_line}, received_from="127.0.0.1:5151") for _ in xrange(0, batch_size)]
+
+def benchmarkWriteAheadLog(name, sync_interval, sync_bytes):
+    event_factory = Utils.EventFactory(caller_class_name='TcpServer')
+    log_path = tempfile.mkdtemp(dir=path)
+    log = WriteAheadLog.WriteAheadLog(log_path, sync_interval=sync_interval, sync_bytes=sync_bytes)
+    log.setConsumers(['StdOutSink'])
+    log.startInterval()
+    acknowledged_ranges = WriteAheadLog.OffsetRanges()
+    start = time.time()
+    for _ in xrange(0, count / batch_size):
+        offsets = log.append(getBatch(event_factory))
+        acknowledged_ranges.add(offsets)
+        log.acknowledge('StdOutSink', acknowledged_ranges)
+        log.truncate(log.getPendingOffset())
+    log.close()
+    took = time.time() - start
+    shutil.rmtree(log_path)
+    print("%-24s %10d events/s" % (name, count / took))
+
+def benchmarkRedis():
+    try:
+        import redis
+        client = redis.StrictRedis()
+        client.ping()
+    except Exception:
+        print("%-24s skipped, no redis server on localhost:6379." % "redis set/delete")
+        return
+    event_factory = Utils.EventFactory(caller_class_name='TcpServer')
+    start = time.time()
+    for _ in xrange(0, count / batch_size):
+        keys = []
+        for event in getBatch(event_factory):
+            key = "gambolputty:eventbuffer:%s" % event['gambolputty']['event_id']
+            client.set(key, Utils.packEvents([event]))
+            keys.append(key)
+        for key in keys:
+            client.delete(key)
+    took = time.time() - start
+    print("%-24s %10d events/s" % ("redis set/delete", count / took))
+
+if __name__ == '__main__':
+    print("%d events, batch size %d, log in %s." % (count, batch_size, path))
+    benchmarkWriteAheadLog("wal group commit 50ms", .05, 1048576)
+    benchmarkWriteAheadLog("wal fsync per batch", .05, 1)
+    benchmarkRedis()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare events per second of the ModifyFields hash action with and without the LRU cache, for single
+# events and for batches of <batch_size> events.
+#
+# Low cardinality: values are drawn from 1000 distinct client ips, like an access log of a small site.
+# High cardinality: nearly every value is new, so the cache only adds overhead.
+#
+# Usage: benchmark_hash_cache.py [count 200000] [batch_size 100] [algorithm sha1]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import mock
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/modifier")
+import Utils
+import ModifyFields
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+algorithm = sys.argv[3] if len(sys.argv) > 3 else "sha1"
+
+def getIps(cardinality):
+    ips = ["10.%d.%d.%d" % (idx >> 16 & 255, idx >> 8 & 255, idx & 255) for idx in xrange(0, cardinality)]
+    return [random.choice(ips) for _ in xrange(0, count)]
+
+def benchmark(name, values, configuration, batched):
+    module = ModifyFields.ModifyFields(gp=mock.Mock())
+    module.configure(dict({'action': 'hash', 'algorithm': algorithm, 'source_fields': ['remote_ip'], 'hmac_key': 'Spam'}, **configuration))
+    events = [Utils.getDefaultEventDict({'remote_ip': value}) for value in values]
+    start = time.time()
+    if batched:
+        for idx in xrange(0, count, batch_size):
+            module.hashBatch(events[idx:idx + batch_size])
+    else:
+        for event in events:
+            module.hash(event)
+    took = time.time() - start
+    print("%-40s %10d events/s" % (name, count / took))
+
+if __name__ == '__main__':
+    print("%d events, batch size %d, hmac %s." % (count, batch_size, algorithm))
+    for cardinality_name, values in [('low cardinality', getIps(1000)), ('high cardinality', getIps(count * 10))]:
+        benchmark("%s, no cache" % cardinality_name, values, {'cache_size': 0}, False)
+        benchmark("%s, cache" % cardinality_name, values, {'cache_size': 10000}, False)
+        benchmark("%s, no cache, batched" % cardinality_name, values, {'cache_size': 0}, True)
+        benchmark("%s, cache, batched" % cardinality_name, values, {'cache_size': 10000}, True)
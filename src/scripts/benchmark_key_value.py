@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare lines per second of the key value tokenizer used by ModifyFields.key_value with the former
+# implementation (str.split for pairs and key/value) and with a generic key_value_regex.
+#
+# Samples are firewall logs in the FortiGate and iptables format. The FortiGate lines contain quoted values
+# with spaces, which the former implementation could not split. These lines are counted as failed.
+#
+# Usage: benchmark_key_value.py [count 100000]
+
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+samples = ['date=2015-05-10 time=11:37:47 logid="0000000013" type="traffic" subtype="forward" level="notice" vd="vdom1" '
+           'eventtime=1557513467369913239 srcip=10.1.100.11 srcport=58012 srcintf="port12" srcintfrole="undefined" '
+           'dstip=23.59.154.35 dstport=80 dstintf="port11" dstintfrole="undefined" srcuuid="ae28f494-5735-51e9-f247-d1d2ce663f4b" '
+           'poluuid="ccb269e0-5735-51e9-a218-a397dd08b7eb" sessionid=105048 proto=6 action="close" policyid=1 policytype="policy" '
+           'service="HTTP" dstcountry="Canada" srccountry="Reserved" trandisp="snat" transip=172.16.200.2 transport=58012 '
+           'appid=34050 app="HTTP.BROWSER_Firefox" appcat="Web.Client" apprisk="elevated" duration=116 sentbyte=1188 '
+           'rcvdbyte=1224 sentpkt=17 rcvdpkt=16 msg="Connection closed by client"',
+           'IN=eth0 OUT= MAC=00:15:17:a1:b2:c3:00:1b:21:d4:e5:f6:08:00 SRC=192.168.2.20 DST=192.168.2.1 LEN=60 TOS=0x00 '
+           'PREC=0x00 TTL=64 ID=54321 DF PROTO=TCP SPT=51515 DPT=22 WINDOW=29200 RES=0x00 SYN URGP=0']
+lines = [samples[idx % len(samples)] for idx in xrange(0, count)]
+
+def splitPairs(line):
+    return dict(kv.split('=') for kv in line.split(' '))
+
+def benchmark(name, tokenize):
+    failed = 0
+    start = time.time()
+    for line in lines:
+        try:
+            tokenize(line)
+        except ValueError:
+            failed += 1
+    took = time.time() - start
+    print("%-28s %10d lines/s, failed: %d" % (name, count / took, failed))
+
+if __name__ == '__main__':
+    print("%d lines." % count)
+    benchmark("str.split (former)", splitPairs)
+    kv_regex = re.compile('([^= ]+)=("[^"]*"|[^ ]*)')
+    benchmark("key_value_regex", lambda line: dict(kv_regex.findall(line)))
+    benchmark("tokenizer", Utils.KeyValueTokenizer(' ', '=').tokenize)
+    benchmark("tokenizer, prefix", Utils.KeyValueTokenizer(' ', '=', prefix='fw_').tokenize)
+    benchmark("tokenizer, 5 key whitelist", Utils.KeyValueTokenizer(' ', '=', whitelist=['srcip', 'dstip', 'action', 'SRC', 'DST']).tokenize)
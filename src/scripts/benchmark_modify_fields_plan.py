@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare events per second of a chain of ten ModifyFields modules with a single ModifyFields module that
+# applies the same actions as a compiled plan. Events are sent one by one and in batches of <batch_size>.
+#
+# Usage: benchmark_modify_fields_plan.py [count 100000] [batch_size 100]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import mock
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/modifier")
+import Utils
+import ModifyFields
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+actions = [{'action': 'delete', 'source_fields': ['referer', 'user_agent']},
+           {'action': 'rename', 'source_field': 'status', 'target_field': 'http_status'},
+           {'action': 'rename', 'source_field': 'size', 'target_field': 'bytes_send'},
+           {'action': 'cast_to_int', 'source_fields': ['http_status', 'bytes_send']},
+           {'action': 'cast_to_float', 'source_fields': ['request_time']},
+           {'action': 'map', 'source_field': 'http_status', 'map': {200: 'OK', 404: 'Not Found'}},
+           {'action': 'insert', 'target_field': 'site', 'value': 'www.example.com'},
+           {'action': 'insert', 'target_field': 'request', 'value': '$(method) $(url)'},
+           {'action': 'cast_to_str', 'source_fields': ['remote_port']},
+           {'action': 'delete', 'source_fields': ['method']}]
+
+class Counter:
+
+    def __init__(self):
+        self.count = 0
+
+    def receiveEvent(self, event):
+        self.count += 1
+
+    def receiveEventBatch(self, events):
+        self.count += len(events)
+
+def getModule(configuration):
+    module = ModifyFields.ModifyFields(gp=mock.Mock())
+    module.configure(configuration)
+    return module
+
+def getChain(counter):
+    modules = [getModule(dict(action)) for action in actions]
+    for module, receiver in zip(modules, modules[1:] + [counter]):
+        module.addReceiver(receiver.__class__.__name__, receiver)
+    return modules[0]
+
+def getPlan(counter):
+    module = getModule({'action': 'plan', 'actions': [dict(action) for action in actions]})
+    module.addReceiver('Counter', counter)
+    return module
+
+def getEvents():
+    return [Utils.getDefaultEventDict({'referer': '-', 'user_agent': 'Mozilla/5.0', 'status': '200', 'size': '3395', 'request_time': '0.012',
+                                       'method': 'GET', 'url': '/index.html', 'remote_port': 51515}) for _ in xrange(0, count)]
+
+def benchmark(name, get_first_module, batched):
+    counter = Counter()
+    first_module = get_first_module(counter)
+    events = getEvents()
+    start = time.time()
+    if batched:
+        for idx in xrange(0, count, batch_size):
+            first_module.receiveEventBatch(events[idx:idx + batch_size])
+    else:
+        for event in events:
+            first_module.receiveEvent(event)
+    took = time.time() - start
+    assert counter.count == count
+    print("%-24s %10d events/s" % (name, count / took))
+
+if __name__ == '__main__':
+    print("%d events, %d actions, batch size %d." % (count, len(actions), batch_size))
+    benchmark("chain of 10 modules", getChain, False)
+    benchmark("compiled plan", getPlan, False)
+    benchmark("chain, batched", getChain, True)
+    benchmark("compiled plan, batched", getPlan, True)
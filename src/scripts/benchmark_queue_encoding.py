@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare bytes per event and events per second of the row and columnar queue encoding
+# on events as produced by a RegexParser for httpd access logs.
+#
+# Usage: benchmark_queue_encoding.py [count 200000] [batch_size 50]
+
+from __future__ import print_function
+import os
+import re
+import sys
+import time
+import random
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+access_log_regex = re.compile('(?P<remote_ip>\d+\.\d+\.\d+\.\d+)\s+(?P<identd>\w+|-)\s+(?P<user>\w+|-)\s+\[(?P<datetime>\d+\/\w+\/\d+:\d+:\d+:\d+\s.\d+)\]\s+\"(?P<http_method>\w+) (?P<uri>\S+) (?P<http_version>\S+)\"\s+(?P<http_status>\d+)\s+(?P<bytes_send>\d+)\s+\"(?P<referer>[^"]*)\"\s+\"(?P<user_agent>[^"]*)\"\s+(?P<request_time>\d+)\s+(?P<virtual_host>\S+)\s+(?P<server_port>\d+)\s+(?P<x_forwarded_for>\S+)\s+(?P<cache_status>\S+)\s+(?P<upstream_addr>\S+)\s+(?P<upstream_status>\S+)\s+(?P<ssl_protocol>\S+)\s+(?P<ssl_cipher>\S+)')
+
+def getAccessLogEvents(event_factory):
+    events = []
+    for _ in xrange(0, batch_size):
+        line = '%d.%d.%d.%d - - [28/Jul/2006:10:27:10 -0300] "GET /cgi-bin/try/%d/?param1=Test HTTP/1.0" %d %d "http://www.example.com/" "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:32.0) Gecko/20100101 Firefox/32.0" %d www.example.com 80 - MISS 10.0.0.1:8080 200 TLSv1.2 ECDHE-RSA-AES128-GCM-SHA256' % \
+               (random.randint(1, 254), random.randint(1, 254), random.randint(1, 254), random.randint(1, 254), random.randint(1, 10000), random.choice([200, 301, 404]), random.randint(100, 50000), random.randint(1, 5000))
+        event = event_factory.getEvent({'data': line}, received_from="127.0.0.1:5151")
+        event.update(access_log_regex.match(line).groupdict())
+        event['gambolputty']['event_type'] = 'httpd_access_log'
+        events.append(event)
+    return events
+
+def benchmark(name, events, columnar):
+    batches = count / batch_size
+    packed_bytes = 0
+    start = time.time()
+    for _ in xrange(0, batches):
+        packed_events = Utils.packEvents(events, columnar)
+        packed_bytes += len(packed_events)
+        Utils.unpackEvents(packed_events)
+    took = time.time() - start
+    print("%-10s %6d bytes/event %10d events/s" % (name, packed_bytes / (batches * batch_size), (batches * batch_size) / took))
+
+if __name__ == '__main__':
+    events = getAccessLogEvents(Utils.EventFactory(caller_class_name="TcpServer"))
+    print("%d fields per event, batch size %d." % (len(events[0]), batch_size))
+    benchmark("rows", events, False)
+    benchmark("columns", events, True)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare publishing each event with a synchronous PUBLISH to the buffered, pipelined publishing of RedisChannelSink.
+#
+# If no redis server is given, the redis stand-in of the tests is started on localhost. Absolute numbers against
+# a real redis server will be higher, the difference between one round trip per event and one per batch stays.
+#
+# Usage: benchmark_redis_channel_sink.py [count 50000] [batch_size 500] [server:port]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import threading
+import mock
+import redis
+import msgpack
+import tornado.ioloop
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/output")
+sys.path.append(pathname + "/../tests")
+import Utils
+import RedisChannelSink
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+server = sys.argv[3] if len(sys.argv) > 3 else None
+
+def getEvents():
+    return [Utils.getDefaultEventDict({'data': "It's my belief that these sheep are laborin' under the misapprehension that they're birds.",
+                                       'channel': idx % 4}) for idx in xrange(0, count)]
+
+def report(name, took):
+    print("%-28s %10d events/s" % (name, count / took))
+
+def benchmarkSynchronousPublish(host, port, events):
+    client = redis.StrictRedis(host=host, port=port)
+    start = time.time()
+    for event in events:
+        client.publish('gambolputty:benchmark:%s' % event['channel'], msgpack.packb(event, default=Utils.serializeDefault))
+    report("PUBLISH per event", time.time() - start)
+
+def benchmarkRedisChannelSink(host, port, events):
+    gp = mock.Mock()
+    gp.event_log = None
+    redis_channel_sink = RedisChannelSink.RedisChannelSink(gp=gp)
+    redis_channel_sink.configure({'channel': 'gambolputty:benchmark:$(channel)', 'server': host, 'port': port,
+                                  'batch_size': batch_size, 'store_interval_in_secs': 1})
+    redis_channel_sink.initAfterFork()
+    io_loop_thread = threading.Thread(target=tornado.ioloop.IOLoop.instance().start)
+    io_loop_thread.daemon = True
+    io_loop_thread.start()
+    start = time.time()
+    for event in events:
+        redis_channel_sink.receiveEvent(event)
+    while redis_channel_sink.buffer.bufsize() >= batch_size:
+        time.sleep(.001)
+    # Only the last, incomplete batch is left. Do not wait for the store interval.
+    redis_channel_sink.buffer.stop()
+    while redis_channel_sink.buffer.bufsize():
+        time.sleep(.001)
+    report("RedisChannelSink pipelined", time.time() - start)
+    redis_channel_sink.shutDown()
+
+if __name__ == '__main__':
+    if server:
+        host, port = server.split(":")
+        port = int(port)
+    else:
+        import RedisStandIn
+        host, port = '127.0.0.1', RedisStandIn.RedisStandIn().port
+    print("%d events, batch size %d, redis at %s:%s." % (count, batch_size, host, port))
+    events = getEvents()
+    benchmarkSynchronousPublish(host, port, events)
+    benchmarkRedisChannelSink(host, port, events)
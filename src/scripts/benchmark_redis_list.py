@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare reading a redis list with RedisList per item (BLPOP) and in batches (MULTI/LRANGE/LTRIM/EXEC).
+#
+# If no redis server is given, the redis stand-in of the tests is started on localhost. Absolute numbers against
+# a real redis server will be higher, the difference between one round trip per item and one per batch stays.
+#
+# Usage: benchmark_redis_list.py [count 20000] [batch_size 100] [server:port]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import mock
+import redis
+import tornado.ioloop
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/input")
+sys.path.append(pathname + "/../tests")
+import RedisList
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+server = sys.argv[3] if len(sys.argv) > 3 else None
+
+list_name = "gambolputty:benchmark:list"
+data = "It's my belief that these sheep are laborin' under the misapprehension that they're birds."
+
+class CountingReceiver:
+
+    def __init__(self):
+        self.count = 0
+
+    def receiveEvent(self, event):
+        self.receiveEventBatch([event])
+
+    def receiveEventBatch(self, events):
+        self.count += len(events)
+        if self.count >= count:
+            # Called from the module thread.
+            tornado.ioloop.IOLoop.instance().add_callback(tornado.ioloop.IOLoop.instance().stop)
+
+def fillList(client):
+    client.delete(list_name)
+    for idx in xrange(0, count, 1000):
+        client.rpush(list_name, *[data] * min(1000, count - idx))
+
+def benchmark(name, host, port, batch_size):
+    gp = mock.Mock()
+    gp.event_log = None
+    redis_list = RedisList.RedisList(gp=gp)
+    redis_list.configure({'lists': [list_name], 'server': host, 'port': port, 'batch_size': batch_size})
+    redis_list.addReceiver('CountingReceiver', CountingReceiver())
+    start = time.time()
+    redis_list.initAfterFork()
+    redis_list.start()
+    tornado.ioloop.IOLoop.instance().start()
+    took = time.time() - start
+    redis_list.shutDown()
+    # Let the pending BLPOP be closed before the list is filled again.
+    io_loop = tornado.ioloop.IOLoop.instance()
+    io_loop.add_timeout(io_loop.time() + .2, io_loop.stop)
+    io_loop.start()
+    print("%-28s %10d items/s" % (name, count / took))
+
+if __name__ == '__main__':
+    if server:
+        host, port = server.split(":")
+        port = int(port)
+    else:
+        import RedisStandIn
+        host, port = '127.0.0.1', RedisStandIn.RedisStandIn().port
+    print("%d items, batch size %d, redis at %s:%s." % (count, batch_size, host, port))
+    client = redis.StrictRedis(host=host, port=port)
+    fillList(client)
+    benchmark("BLPOP per item", host, port, 1)
+    fillList(client)
+    benchmark("MULTI/LRANGE/LTRIM batches", host, port, batch_size)
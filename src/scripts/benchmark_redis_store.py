@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare single key access of RedisStore with batched access via getMany/setMany, and pickle with msgpack.
+#
+# If no redis server is given, a small redis stand-in speaking the redis protocol is started on localhost.
+# It only knows the commands used here. Absolute numbers against a real redis server will be higher, the
+# difference between one round trip per key and one per batch stays.
+#
+# Usage: benchmark_redis_store.py [count 20000] [batch_size 100] [server:port]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import cPickle
+import threading
+import SocketServer
+import mock
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/misc")
+import Utils
+import RedisStore
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+server = sys.argv[3] if len(sys.argv) > 3 else None
+
+facet_value = {'other_event_fields': {'remote_ip': '192.168.2.20', 'user_agent': u'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:32.0)'},
+               'facets': ['/cgi-bin/try/', '/index.html', '/images/logo.png', '/favicon.ico']}
+
+class RedisStandInHandler(SocketServer.StreamRequestHandler):
+    # Replies are written in one piece on flush.
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def readCommand(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in xrange(0, int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def writeValue(self, value):
+        if value is None:
+            self.wfile.write("$-1\r\n")
+        else:
+            self.wfile.write("$%d\r\n%s\r\n" % (len(value), value))
+
+    def handle(self):
+        data = self.server.data
+        while True:
+            arguments = self.readCommand()
+            if arguments is None:
+                return
+            command = arguments[0].upper()
+            if command == 'PING':
+                self.wfile.write("+PONG\r\n")
+            elif command == 'GET':
+                self.writeValue(data.get(arguments[1]))
+            elif command in ('SET', 'SETEX', 'MSET'):
+                values = {'SET': arguments[1:3], 'SETEX': [arguments[1], arguments[3]], 'MSET': arguments[1:]}[command]
+                for idx in xrange(0, len(values), 2):
+                    data[values[idx]] = values[idx + 1]
+                self.wfile.write("+OK\r\n")
+            elif command == 'MGET':
+                self.wfile.write("*%d\r\n" % (len(arguments) - 1))
+                for key in arguments[1:]:
+                    self.writeValue(data.get(key))
+            elif command in ('EXPIRE', 'DEL'):
+                self.wfile.write(":1\r\n")
+            else:
+                self.wfile.write("-ERR unknown command %s\r\n" % command)
+            self.wfile.flush()
+
+class RedisStandIn(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def startRedisStandIn():
+    redis_stand_in = RedisStandIn(('127.0.0.1', 0), RedisStandInHandler)
+    redis_stand_in.data = {}
+    server_thread = threading.Thread(target=redis_stand_in.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return '127.0.0.1', redis_stand_in.server_address[1]
+
+def getRedisStore(host, port):
+    redis_store = RedisStore.RedisStore(gp=mock.Mock())
+    redis_store.configure({'server': host, 'port': port})
+    return redis_store
+
+def report(name, took):
+    print("%-28s %10d keys/s" % (name, count / took))
+
+def benchmarkSerialization():
+    start = time.time()
+    for _ in xrange(0, count):
+        cPickle.loads(cPickle.dumps(facet_value))
+    report("cPickle dumps/loads", time.time() - start)
+    start = time.time()
+    for _ in xrange(0, count):
+        Utils.unpackValue(Utils.packValue(facet_value))
+    report("msgpack pack/unpack", time.time() - start)
+
+def benchmarkSingleKeys(redis_store, keys):
+    start = time.time()
+    for key in keys:
+        redis_store.set(key, facet_value, 60)
+    report("set per key", time.time() - start)
+    start = time.time()
+    for key in keys:
+        redis_store.get(key)
+    report("get per key", time.time() - start)
+
+def benchmarkBatches(redis_store, keys):
+    batches = [keys[idx:idx + batch_size] for idx in xrange(0, len(keys), batch_size)]
+    start = time.time()
+    for batch in batches:
+        redis_store.setMany(dict((key, facet_value) for key in batch), 60)
+    report("setMany mset + expire", time.time() - start)
+    start = time.time()
+    for batch in batches:
+        redis_store.getMany(batch)
+    report("getMany mget", time.time() - start)
+
+if __name__ == '__main__':
+    if server:
+        host, port = server.split(":")
+        port = int(port)
+    else:
+        host, port = startRedisStandIn()
+    print("%d keys, batch size %d, redis at %s:%s." % (count, batch_size, host, port))
+    benchmarkSerialization()
+    redis_store = getRedisStore(host, port)
+    keys = ["gambolputty:benchmark:%d" % idx for idx in xrange(0, count)]
+    benchmarkSingleKeys(redis_store, keys)
+    benchmarkBatches(redis_store, keys)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare the per worker user agent cache with the two level cache (per worker l1, shared l2) of UserAgentParser.
+#
+# User agents are drawn from a zipf like distribution over <distinct> user agent strings, which resembles the
+# long tail seen in access logs: a few browsers make up most of the traffic, many rare ones the rest.
+# Each of <workers> processes parses <count>/<workers> user agents, all processes run at the same time.
+#
+# Usage: benchmark_user_agent_cache.py [count 200000] [workers 15] [distinct 20000] [exponent 1.0]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import random
+import bisect
+import multiprocessing
+from ua_parser import user_agent_parser
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+import Utils
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+workers = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+distinct = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+exponent = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+
+user_agent_templates = ["Mozilla/5.0 (Windows NT %(os)s; WOW64; rv:%(major)s.0) Gecko/20100101 Firefox/%(major)s.%(minor)s",
+                        "Mozilla/5.0 (Windows NT %(os)s; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/%(major)s.0.%(minor)s.%(patch)s Safari/537.36",
+                        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_%(os)s) AppleWebKit/600.%(minor)s.%(patch)s (KHTML, like Gecko) Version/%(major)s.0 Safari/600.%(minor)s.%(patch)s",
+                        "Mozilla/5.0 (Linux; Android 4.%(os)s; SM-G%(patch)s Build/KOT49H) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/%(major)s.0.%(minor)s Mobile Safari/537.36",
+                        "Mozilla/5.0 (iPhone; CPU iPhone OS %(major)s_%(minor)s like Mac OS X) AppleWebKit/600.1.%(patch)s (KHTML, like Gecko) Version/%(major)s.0 Mobile/12B%(os)s Safari/600.1.4",
+                        "Mozilla/5.0 (compatible; MSIE %(major)s.0; Windows NT %(os)s; Trident/%(minor)s.0)"]
+
+def getUserAgents():
+    random.seed(42)
+    user_agents = set()
+    while len(user_agents) < distinct:
+        values = {'os': random.choice(['5.1', '6.1', '6.2', '6.3', '10']), 'major': random.randint(4, 40), 'minor': random.randint(0, 2000), 'patch': random.randint(0, 200)}
+        user_agents.add(random.choice(user_agent_templates) % values)
+    user_agents = sorted(user_agents)
+    random.shuffle(user_agents)
+    return user_agents
+
+def getSample(user_agents, size, seed):
+    cumulative_weights = []
+    total = 0
+    for rank in xrange(1, len(user_agents) + 1):
+        total += 1 / float(rank) ** exponent
+        cumulative_weights.append(total)
+    random.seed(seed)
+    return [user_agents[bisect.bisect(cumulative_weights, random.random() * total)] for _ in xrange(0, size)]
+
+def parse(user_agent):
+    ua_info = user_agent_parser.Parse(user_agent)
+    ua_info.pop('string', None)
+    return ua_info
+
+def runWorker(sample, shared_cache, results):
+    l1_cache = Utils.MemoryCache(size=1000)
+    l1_hits = l2_hits = parsed = 0
+    start = time.time()
+    for user_agent in sample:
+        try:
+            l1_cache.get(user_agent)
+            l1_hits += 1
+            continue
+        except KeyError:
+            pass
+        if shared_cache:
+            try:
+                l1_cache.set(user_agent, shared_cache.get(user_agent))
+                l2_hits += 1
+                continue
+            except KeyError:
+                pass
+        ua_info = parse(user_agent)
+        if shared_cache:
+            shared_cache.set(user_agent, ua_info)
+        l1_cache.set(user_agent, ua_info)
+        parsed += 1
+    results.put((l1_hits, l2_hits, parsed, time.time() - start))
+
+def benchmark(name, samples, shared_cache):
+    # The parser keeps a small cache of its own, clear it so each run starts cold.
+    if hasattr(user_agent_parser, '_parse_cache'):
+        user_agent_parser._parse_cache.clear()
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=runWorker, args=(sample, shared_cache, results)) for sample in samples]
+    start = time.time()
+    for process in processes:
+        process.start()
+    worker_results = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    took = time.time() - start
+    l1_hits, l2_hits, parsed = [sum(result[idx] for result in worker_results) for idx in (0, 1, 2)]
+    print("%-22s %8d ua/s, l1 hit ratio: %5.1f%%, l2 hit ratio: %5.1f%%, parsed: %d" % (name, count / took, l1_hits * 100.0 / count,
+                                                                                    l2_hits * 100.0 / max(1, count - l1_hits), parsed))
+
+if __name__ == '__main__':
+    print("%d user agents, %d workers, %d distinct user agents, zipf exponent %.2f." % (count, workers, distinct, exponent))
+    user_agents = getUserAgents()
+    samples = [getSample(user_agents, count / workers, seed) for seed in xrange(0, workers)]
+    benchmark("per worker lru 1000", samples, None)
+    benchmark("l1 1000 + shared 16384", samples, Utils.SharedMemoryCache(size=16384))
+    benchmark("l1 1000 + shared 65536", samples, Utils.SharedMemoryCache(size=65536))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare sending one zeromq message per event to sending msgpacked batches of events as multipart messages,
+# as done by ZmqSink with send_batches. Events are received via the Zmq input module, for push/pull and pub/sub.
+#
+# Usage: benchmark_zmq.py [count 100000] [batch_size 500]
+
+from __future__ import print_function
+import os
+import sys
+import time
+import socket
+import threading
+import mock
+import msgpack
+import zmq
+
+pathname = os.path.abspath(__file__)
+pathname = pathname[:pathname.rfind("/")]
+sys.path.append(pathname + "/../gambolputty")
+sys.path.append(pathname + "/../gambolputty/input")
+import Utils
+import Zmq
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+class CountingReceiver:
+
+    def __init__(self):
+        self.count = 0
+        self.done = threading.Event()
+
+    def receiveEvent(self, event):
+        self.receiveEventBatch([event])
+
+    def receiveEventBatch(self, events):
+        self.count += len(events)
+        if self.count >= count:
+            self.done.set()
+
+def getFreePort():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, 0)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def getEvents():
+    return [Utils.getDefaultEventDict({'data': "It's my belief that these sheep are laborin' under the misapprehension that they're birds."})
+            for _ in xrange(0, count)]
+
+def sendPerEvent(sender, events, topic):
+    for event in events:
+        data = msgpack.packb(event, default=Utils.serializeDefault)
+        sender.send("%s %s" % (topic, data) if topic else data)
+
+def sendBatches(sender, events, topic):
+    for idx in xrange(0, count, batch_size):
+        sender.send_multipart(Utils.packZmqBatch(events[idx:idx + batch_size], topic), copy=False)
+
+def benchmark(name, pattern, send_method, events):
+    port = getFreePort()
+    gp = mock.Mock()
+    gp.event_log = None
+    zmq_input = Zmq.Zmq(gp=gp)
+    # High water marks above the event count, so pub/sub does not drop messages.
+    zmq_input.configure({'address': '127.0.0.1:%s' % port, 'pattern': pattern, 'hwm': count})
+    receiver = CountingReceiver()
+    zmq_input.addReceiver('CountingReceiver', receiver)
+    context = zmq.Context()
+    sender = context.socket(zmq.PUSH if pattern == 'pull' else zmq.PUB)
+    sender.setsockopt(zmq.SNDHWM, count)
+    sender.connect('tcp://127.0.0.1:%s' % port)
+    zmq_input.start()
+    # Give the subscriber time to connect.
+    time.sleep(.5)
+    start = time.time()
+    send_method(sender, events, 'gambolputty' if pattern == 'sub' else None)
+    receiver.done.wait(60)
+    took = time.time() - start
+    zmq_input.shutDown()
+    sender.close(linger=0)
+    context.term()
+    print("%-36s %10d events/s" % (name, receiver.count / took))
+
+if __name__ == '__main__':
+    print("%d events, batch size %d." % (count, batch_size))
+    events = getEvents()
+    benchmark("push/pull message per event", 'pull', sendPerEvent, events)
+    benchmark("push/pull multipart batches", 'pull', sendBatches, events)
+    benchmark("pub/sub message per event", 'sub', sendPerEvent, events)
+    benchmark("pub/sub multipart batches", 'sub', sendBatches, events)
@@ -27,6 +27,8 @@ class MockGambolPutty(mock.Mock):
     def __init__(self):
         mock.Mock.__init__(self)
         self.modules = {}
+        self.worker_index = 0
+        self.event_log = None
 
     def getModuleInfoById(self, module_name):
         try:
@@ -71,6 +73,10 @@ class MockReceiver(mock.Mock):
         self.handleEvent(event)
         return event
 
+    def receiveEventBatch(self, events):
+        for event in events:
+            self.receiveEvent(event)
+
     def handleEvent(self, event):
         self.events.append(event)
 
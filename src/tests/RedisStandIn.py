@@ -0,0 +1,187 @@
+import socket
+import select
+import threading
+import SocketServer
+
+
+class RedisStandInHandler(SocketServer.StreamRequestHandler):
+    """Speaks enough of the redis protocol to test the redis modules without a redis server."""
+    disable_nagle_algorithm = True
+    # Replies to pipelined commands are sent in one piece, see flushIfIdle.
+    wbufsize = 65536
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.server.connections.append(self.connection)
+        self.write_lock = threading.Lock()
+        self.transaction = None
+
+    def readCommand(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        arguments = []
+        for _ in xrange(0, int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def isClosed(self):
+        if self.connection not in self.server.connections:
+            return True
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except (socket.error, select.error):
+            return True
+
+    def encode(self, value):
+        if value is None:
+            return "$-1\r\n"
+        if isinstance(value, bool):
+            return "+OK\r\n"
+        if isinstance(value, int):
+            return ":%d\r\n" % value
+        if isinstance(value, list):
+            return "*%d\r\n%s" % (len(value), ''.join([self.encode(item) for item in value]))
+        if isinstance(value, Exception):
+            return "-ERR %s\r\n" % value
+        return "$%d\r\n%s\r\n" % (len(value), value)
+
+    def write(self, value, flush=True):
+        with self.write_lock:
+            self.wfile.write(self.encode(value))
+            if flush:
+                self.wfile.flush()
+
+    def reply(self, value):
+        self.write(value, flush=False)
+
+    def flushIfIdle(self):
+        """Send the buffered replies once all received commands were handled."""
+        if self.rfile._rbuf.tell() or select.select([self.connection], [], [], 0)[0]:
+            return
+        with self.write_lock:
+            self.wfile.flush()
+
+    def handle(self):
+        while True:
+            try:
+                arguments = self.readCommand()
+                if arguments is None:
+                    return
+                self.server.commands.append(arguments)
+                self.handleCommand(arguments)
+                self.flushIfIdle()
+            except socket.error:
+                return
+
+    def handleCommand(self, arguments):
+        command = arguments[0].upper()
+        if command == 'SUBSCRIBE':
+            for channel in arguments[1:]:
+                with self.server.lock:
+                    self.server.subscribers.setdefault(channel, []).append(self)
+                    count = len(self.server.subscribers[channel])
+                self.reply(['subscribe', channel, count])
+        elif command == 'MULTI':
+            self.transaction = []
+            self.reply(True)
+        elif command == 'EXEC':
+            transaction, self.transaction = self.transaction, None
+            self.reply([self.execute(arguments) for arguments in transaction])
+        elif self.transaction is not None:
+            self.transaction.append(arguments)
+            self.reply("QUEUED")
+        else:
+            if command == 'BLPOP':
+                # Do not hold back the replies of earlier commands while waiting.
+                with self.write_lock:
+                    self.wfile.flush()
+            self.reply(self.execute(arguments))
+
+    def execute(self, arguments):
+        server = self.server
+        command = arguments[0].upper()
+        with server.lock:
+            if command in ('PING', 'AUTH', 'SELECT'):
+                return True
+            elif command == 'ECHO':
+                return arguments[1]
+            elif command == 'SET':
+                server.data[arguments[1]] = arguments[2]
+                return True
+            elif command == 'GET':
+                return server.data.get(arguments[1])
+            elif command == 'DEL':
+                return len([server.data.pop(key) for key in arguments[1:] if key in server.data])
+            elif command in ('RPUSH', 'LPUSH'):
+                values = server.data.setdefault(arguments[1], [])
+                if not isinstance(values, list):
+                    return Exception("WRONGTYPE Operation against a key holding the wrong kind of value")
+                for value in arguments[2:]:
+                    values.append(value) if command == 'RPUSH' else values.insert(0, value)
+                server.condition.notify_all()
+                return len(values)
+            elif command == 'LLEN':
+                return len(server.data.get(arguments[1], []))
+            elif command == 'LRANGE':
+                stop = int(arguments[3])
+                return server.data.get(arguments[1], [])[int(arguments[2]):None if stop == -1 else stop + 1]
+            elif command == 'LTRIM':
+                values = server.data.get(arguments[1], [])
+                stop = int(arguments[3])
+                values[:] = values[int(arguments[2]):None if stop == -1 else stop + 1]
+                return True
+            elif command == 'BLPOP':
+                # Stop waiting once the connection was closed.
+                while not self.isClosed():
+                    for key in arguments[1:-1]:
+                        if server.data.get(key):
+                            return [key, server.data[key].pop(0)]
+                    server.condition.wait(.1)
+                return None
+            elif command == 'PUBLISH':
+                subscribers = server.subscribers.get(arguments[1], [])
+                for subscriber in subscribers:
+                    subscriber.write(['message', arguments[1], arguments[2]])
+                return len(subscribers)
+            return Exception("unknown command '%s'" % command)
+
+class RedisStandIn(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        SocketServer.TCPServer.__init__(self, ('127.0.0.1', port), RedisStandInHandler)
+        self.port = self.server_address[1]
+        self.data = {}
+        self.commands = []
+        self.subscribers = {}
+        self.connections = []
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        server_thread = threading.Thread(target=self.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+    def handle_error(self, request, client_address):
+        # Clients going away are expected.
+        pass
+
+    def dropConnections(self):
+        """Close all client connections, like a restarted redis server would."""
+        with self.lock:
+            self.subscribers = {}
+            connections, self.connections = self.connections, []
+            self.condition.notify_all()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def stop(self):
+        self.dropConnections()
+        self.shutdown()
+        self.server_close()
@@ -38,5 +38,48 @@ class TestAddGeoInfo(ModuleBaseTestCase.ModuleBaseTestCase):
         for event in self.test_object.handleEvent(dict):
             self.assertEqual(event['country_code'], 'US')
 
+    def configureWithMockedDatabase(self, cache_size=65536):
+        with mock.patch.object(AddGeoInfo.pygeoip, 'GeoIP') as geoip:
+            database = geoip.return_value
+            database.record_by_addr.side_effect = lambda address: {'country_code': 'US', 'city': address}
+            database.last_netmask.return_value = 24
+            self.test_object.configure({'source_fields': ['f1'],
+                                        'geoip_dat_path': 'GeoIP.dat',
+                                        'target_field': 'geoip',
+                                        'geo_info_fields': ['country_code'],
+                                        'cache_size': cache_size})
+        return database
+
+    def testRecordsAreCachedPerNetwork(self):
+        database = self.configureWithMockedDatabase()
+        for ip in ['99.124.167.129', '99.124.167.1', '99.124.168.1', '99.124.167.129']:
+            for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'f1': ip})):
+                self.assertEqual(event['geoip'], {'country_code': 'US'})
+        self.assertEqual(database.record_by_addr.call_count, 2)
+
+    def testBatchLookup(self):
+        database = self.configureWithMockedDatabase()
+        receiver = mock.Mock()
+        self.test_object.addReceiver('MockReceiver', receiver)
+        events = [Utils.getDefaultEventDict({'f1': ip}) for ip in ['99.124.167.129', '99.124.167.1', '2001:db8::1', '2001:db8::1', '-']]
+        self.test_object.receiveEventBatch(events)
+        events = receiver.receiveEventBatch.call_args[0][0]
+        self.assertEqual([event.get('geoip', None) for event in events], [{'country_code': 'US'}] * 4 + [None])
+        self.assertEqual(database.record_by_addr.call_count, 2)
+
+    def testNetworkPrefixCache(self):
+        cache = AddGeoInfo.NetworkPrefixCache(2)
+        address, address_bits = AddGeoInfo.parseIpAddress('192.168.2.20')
+        cache.set(address, address_bits, 24, 'Spam')
+        cache.set(AddGeoInfo.parseIpAddress('10.1.2.3')[0], 32, 8, 'Eggs')
+        self.assertEqual(cache.get(AddGeoInfo.parseIpAddress('192.168.2.1')[0], 32), 'Spam')
+        self.assertEqual(cache.get(AddGeoInfo.parseIpAddress('10.200.0.1')[0], 32), 'Eggs')
+        self.assertRaises(KeyError, cache.get, AddGeoInfo.parseIpAddress('192.168.3.1')[0], 32)
+        # The oldest network is removed.
+        cache.set(AddGeoInfo.parseIpAddress('172.16.0.1')[0], 32, 16, 'Bacon')
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(KeyError, cache.get, address, address_bits)
+        self.assertEqual(AddGeoInfo.parseIpAddress('www.example.com'), (None, None))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import extendSysPath
+import shutil
+import tempfile
+import unittest2
+import mock
+import Utils
+
+class TestBuffer(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.sink_available = False
+        self.stored_events = []
+        self.buffer = Utils.Buffer(10, self.storeData, interval=60, maxsize=20)
+
+    def tearDown(self):
+        self.buffer.stopInterval()
+        shutil.rmtree(self.path)
+
+    def storeData(self, events):
+        if not self.sink_available:
+            return False
+        self.stored_events.extend(event['data'] for event in events)
+        return True
+
+    def putEvents(self, start, end):
+        for counter in xrange(start, end):
+            self.buffer.put(Utils.getDefaultEventDict({'data': counter}))
+
+    def testSpilledEventsAreDrainedInOrder(self):
+        self.buffer.enableSpill(self.path, segment_size=4096)
+        self.putEvents(0, 100)
+        self.assertTrue(self.buffer.spill.event_count > 0)
+        # Only the overflow is spilled, the newest items stay in memory.
+        self.assertTrue(10 <= self.buffer.bufsize() <= 21)
+        self.assertEquals(self.buffer.buffer[-1]['data'], 99)
+        self.sink_available = True
+        # Each flush drains one segment.
+        flush_count = 0
+        while self.buffer.spill.batch_count or self.buffer.bufsize():
+            self.buffer.flush()
+            flush_count += 1
+        self.assertTrue(flush_count > 1)
+        self.assertEquals(self.stored_events, range(0, 100))
+        self.assertEquals(self.buffer.spill.event_count, 0)
+        self.assertEquals(self.buffer.spill.pending_bytes, 0)
+
+    def testIOLoopBufferOnlyResendsFailedItems(self):
+        io_loop = mock.Mock()
+        acknowledged = []
+        batches = []
+        buffer = Utils.IOLoopBuffer(3, lambda batch, callback: batches.append((batch, callback)), acknowledge_callback=acknowledged.extend, io_loop=io_loop)
+        for counter in xrange(0, 4):
+            buffer.put(counter)
+        buffer.flush()
+        batch, callback = batches.pop()
+        self.assertEquals(batch, [0, 1, 2])
+        callback(True, [batch[2]])
+        self.assertEquals(acknowledged, [0, 1])
+        buffer.flush()
+        batch, callback = batches.pop()
+        self.assertEquals(batch, [2, 3])
+        callback(False)
+        self.assertEquals(acknowledged, [0, 1])
+        self.assertEquals(buffer.buffer, [2, 3])
+
+    def testSpillQuota(self):
+        spill = Utils.SpillQueue(self.path, max_bytes=1024)
+        batch = [Utils.getDefaultEventDict({'data': 'Spam' * 20}) for _ in xrange(0, 5)]
+        self.assertTrue(spill.put(batch))
+        self.assertFalse(spill.put(batch))
+        self.assertEquals(spill.batch_count, 1)
+
+    def testLeftoverSegmentsAreReadBack(self):
+        spill = Utils.SpillQueue(self.path, segment_size=256)
+        for counter in xrange(0, 10):
+            spill.put([Utils.getDefaultEventDict({'data': counter})])
+        spill.pop()
+        spill.close()
+        spill = Utils.SpillQueue(self.path, segment_size=256)
+        events = []
+        while spill.batch_count:
+            events.extend(event['data'] for event in spill.peek())
+            spill.pop()
+        # Batches popped from the first segment before the restart are returned again.
+        self.assertEquals(events, range(0, 10))
+
+    def testSpillDirectoryIsLocked(self):
+        spill = Utils.SpillQueue(self.path)
+        self.assertRaises(IOError, Utils.SpillQueue, self.path)
+        self.assertTrue(self.buffer.enableSpill(self.path) is False)
+        spill.close()
+        self.assertTrue(self.buffer.enableSpill(self.path))
+        # A reloaded module hands the directory over to its new instance.
+        self.buffer.disableSpill()
+        self.assertEquals(self.buffer.spill, None)
+        Utils.SpillQueue(self.path).close()
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,45 @@
+import extendSysPath
+import time
+import Queue
+import unittest2
+import Utils
+
+class TestBufferedQueue(unittest2.TestCase):
+
+    def setUp(self):
+        self.queue = Queue.Queue()
+        self.buffered_queue = Utils.BufferedQueue(self.queue, buffersize=16, max_latency=.2)
+
+    def tearDown(self):
+        self.buffered_queue.stopInterval()
+
+    def getBatchSizes(self):
+        batch_sizes = []
+        while not self.queue.empty():
+            batch_sizes.append(len(Utils.unpackEvents(self.queue.get())))
+        return batch_sizes
+
+    def testBatchSizeGrowsUnderLoad(self):
+        for counter in xrange(0, 100):
+            self.buffered_queue.put({'data': counter})
+        self.assertEquals(self.getBatchSizes()[:6], [1, 2, 4, 8, 16, 16])
+        self.assertEquals(self.buffered_queue.batch_size, 16)
+
+    def testSparseEventsAreFlushedEarly(self):
+        for counter in xrange(0, 31):
+            self.buffered_queue.put({'data': counter})
+        self.getBatchSizes()
+        self.buffered_queue.put({'data': 'Spam'})
+        self.buffered_queue.put({'data': 'Eggs'})
+        time.sleep(.3)
+        self.assertEquals(self.getBatchSizes(), [2])
+        self.assertEquals(self.buffered_queue.batch_size, 2)
+
+    def testStatistics(self):
+        for counter in xrange(0, 7):
+            self.buffered_queue.put({'data': counter})
+        statistics = self.buffered_queue.getStatistics(reset=True)
+        self.assertEquals(statistics['batch_count'], 3)
+        self.assertAlmostEqual(statistics['avg_batch_size'], 7 / 3.0)
+        self.assertTrue(0 <= statistics['avg_queueing_delay'] < .1)
+        self.assertEquals(self.buffered_queue.getStatistics()['batch_count'], 0)
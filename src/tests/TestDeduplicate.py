@@ -0,0 +1,58 @@
+import extendSysPath
+import ModuleBaseTestCase
+import unittest2
+import mock
+import Utils
+import Deduplicate
+
+class TestDeduplicate(ModuleBaseTestCase.ModuleBaseTestCase):
+
+    def setUp(self):
+        super(TestDeduplicate, self).setUp(Deduplicate.Deduplicate(gp=mock.Mock()))
+
+    def getEvents(self, data):
+        events = []
+        for value in data:
+            events.extend(self.test_object.handleEvent(Utils.getDefaultEventDict({'data': value})))
+        return [event['data'] for event in events]
+
+    def testDuplicatesAreDropped(self):
+        self.test_object.configure({'key': '$(data)'})
+        self.checkConfiguration()
+        self.assertEquals(self.getEvents(['Spam', 'Eggs', 'Spam', 'Eggs', 'Bacon']), ['Spam', 'Eggs', 'Bacon'])
+
+    def testEventIdIsDefaultKey(self):
+        self.test_object.configure({})
+        event = Utils.getDefaultEventDict({'data': 'Spam'})
+        self.assertEquals(len(list(self.test_object.handleEvent(event))), 1)
+        self.assertEquals(len(list(self.test_object.handleEvent(event))), 0)
+        self.assertEquals(len(list(self.test_object.handleEvent(Utils.getDefaultEventDict({'data': 'Spam'})))), 1)
+
+    def testKeysAreForgottenAfterTwoWindows(self):
+        self.test_object.configure({'key': '$(data)'})
+        self.getEvents(['Spam'])
+        self.test_object.rotate(self.test_object.filter_state[1])
+        # Still known from the previous window. Duplicates do not refresh the key.
+        self.assertEquals(self.getEvents(['Spam']), [])
+        self.test_object.rotate(self.test_object.filter_state[1])
+        self.assertEquals(self.getEvents(['Spam']), ['Spam'])
+
+    def testSharedFilters(self):
+        self.test_object.configure({'key': '$(data)', 'shared': True})
+        self.assertEquals(self.getEvents(['Spam', 'Spam', 'Eggs']), ['Spam', 'Eggs'])
+        self.test_object.rotate(self.test_object.filter_state[1])
+        self.test_object.rotate(self.test_object.filter_state[1])
+        self.assertEquals(self.getEvents(['Spam']), ['Spam'])
+
+    def testFalsePositiveRate(self):
+        self.test_object.configure({'capacity': 10000, 'memory_budget': 16384})
+        self.assertEquals(self.test_object.getFalsePositiveRate(), 0)
+        dropped = 0
+        for counter in xrange(0, 10000):
+            dropped += self.test_object.isDuplicate(counter)
+        estimated_rate = self.test_object.getFalsePositiveRate()
+        self.assertTrue(0 < estimated_rate < 0.1)
+        self.assertTrue(dropped < 10000 * estimated_rate * 3)
+
+if __name__ == '__main__':
+    unittest2.main()
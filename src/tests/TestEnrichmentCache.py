@@ -0,0 +1,99 @@
+import extendSysPath
+import time
+import threading
+import unittest2
+import mock
+import Utils
+import StatisticCollector
+
+class TestEnrichmentCache(unittest2.TestCase):
+
+    def setUp(self):
+        self.computed_keys = []
+        self.stats_collector = StatisticCollector.StatisticCollector()
+
+    def getCache(self, **kwargs):
+        cache = Utils.EnrichmentCache(**kwargs)
+        cache.setCounterNames('TestEnrichmentCache', 0)
+        for counter_names in cache.counters.values():
+            for counter_name in counter_names:
+                self.stats_collector.resetCounter(counter_name)
+        return cache
+
+    def getCounters(self, cache, cache_level):
+        return [self.stats_collector.getCounter(counter_name) for counter_name in cache.counters[cache_level]]
+
+    def compute(self, key, delay=0):
+        self.computed_keys.append(key)
+        time.sleep(delay)
+        if key == 'Bacon':
+            raise ValueError("No bacon.")
+        return key.upper()
+
+    def testValuesAreCached(self):
+        cache = self.getCache(ttl=60)
+        self.assertEqual(cache.get('Spam', lambda: self.compute('Spam')), 'SPAM')
+        self.assertEqual(cache.get('Spam', lambda: self.compute('Spam')), 'SPAM')
+        self.assertEqual(self.computed_keys, ['Spam'])
+        self.assertEqual(self.getCounters(cache, 'l1'), [1, 1])
+
+    def testErrorsAreCachedNegatively(self):
+        cache = self.getCache(ttl=60, negative_ttl=.1)
+        self.assertIsNone(cache.get('Bacon', lambda: self.compute('Bacon')))
+        self.assertIsNone(cache.get('Bacon', lambda: self.compute('Bacon')))
+        self.assertEqual(self.computed_keys, ['Bacon'])
+        time.sleep(.15)
+        self.assertIsNone(cache.get('Bacon', lambda: self.compute('Bacon')))
+        self.assertEqual(self.computed_keys, ['Bacon', 'Bacon'])
+
+    def testStaleValuesAreRefreshedInBackground(self):
+        cache = self.getCache(ttl=.1, stale_ttl=60)
+        cache.get('Spam', lambda: self.compute('Spam'))
+        time.sleep(.15)
+        cache.set('Spam', 'STALE SPAM', ttl=-1)
+        self.assertEqual(cache.getCached('Spam', lambda: self.compute('Spam')), 'STALE SPAM')
+        wait_until = time.time() + 5
+        while len(self.computed_keys) < 2 and time.time() < wait_until:
+            time.sleep(.01)
+        time.sleep(.05)
+        self.assertEqual(cache.getCached('Spam'), 'SPAM')
+        # Without a compute function, stale values are not returned.
+        cache.set('Spam', 'STALE SPAM', ttl=-1)
+        self.assertRaises(KeyError, cache.getCached, 'Spam')
+
+    def testStaleValuesAreRefreshedOnceViaExecutor(self):
+        refreshes = []
+        cache = self.getCache(stale_ttl=60, executor=refreshes.append)
+        cache.set('Spam', 'STALE SPAM', ttl=-1)
+        for _ in xrange(0, 5):
+            self.assertEqual(cache.getCached('Spam', lambda: self.compute('Spam')), 'STALE SPAM')
+        self.assertEqual(len(refreshes), 1)
+        refreshes[0]()
+        self.assertEqual(cache.getCached('Spam'), 'SPAM')
+        self.assertEqual(self.computed_keys, ['Spam'])
+
+    def testConcurrentMissesAreCoalesced(self):
+        cache = self.getCache()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('Spam', lambda: self.compute('Spam', .2)))) for _ in xrange(0, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['SPAM'] * 5)
+        self.assertEqual(self.computed_keys, ['Spam'])
+
+    def testRedisStore(self):
+        redis_store = mock.Mock()
+        redis_store.get.side_effect = lambda key: 'EGGS' if key == 'Eggs' else None
+        cache = self.getCache(redis_store=redis_store, redis_ttl=30)
+        self.assertEqual(cache.get('Eggs', lambda: self.compute('Eggs')), 'EGGS')
+        self.assertEqual(cache.get('Spam', lambda: self.compute('Spam')), 'SPAM')
+        self.assertIsNone(cache.get('Bacon', lambda: self.compute('Bacon')))
+        self.assertEqual(self.computed_keys, ['Spam', 'Bacon'])
+        # Failed lookups are not stored in redis.
+        redis_store.set.assert_called_once_with('Spam', 'SPAM', 30)
+        self.assertEqual(self.getCounters(cache, 'l2'), [1, 2])
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,160 @@
+import extendSysPath
+import ModuleBaseTestCase
+import unittest2
+import mock
+import os
+import shutil
+import tempfile
+import Utils
+import BaseModule
+import WriteAheadLog
+import EventBuffer
+
+class StdIn:
+    module_type = "input"
+
+    def __init__(self):
+        self.events = []
+
+    def sendEvent(self, event, apply_common_actions=True):
+        self.events.append(event)
+
+class OutputModule(BaseModule.BaseModule):
+    module_type = "output"
+
+    def __init__(self, module_id, gp=None):
+        BaseModule.BaseModule.__init__(self, gp)
+        self.module_id = module_id
+
+    def getModuleId(self):
+        return self.module_id
+
+class TestEventBuffer(ModuleBaseTestCase.ModuleBaseTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        super(TestEventBuffer, self).setUp(self.getEventBuffer())
+
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def getEventBuffer(self, input_module=None, worker_index=0, gap_timeout=3600):
+        gp = mock.Mock()
+        gp.worker_index = worker_index
+        gp.modules = {'StdOutSink': {'instances': [OutputModule('StdOutSink')]},
+                      'FileSink': {'instances': [OutputModule('FileSink')]}}
+        if input_module:
+            gp.modules['StdIn'] = {'instances': [input_module]}
+        event_buffer = EventBuffer.EventBuffer(gp=gp)
+        event_buffer.configure({'path': self.path, 'segment_size': 1024, 'sync_interval': 60, 'gap_timeout': gap_timeout})
+        event_buffer.initAfterFork()
+        return event_buffer
+
+    def getEvents(self, count):
+        return [Utils.getDefaultEventDict({'data': 'Spam %s' % idx}, caller_class_name='StdIn') for idx in xrange(0, count)]
+
+    def testLogRecoversAfterTornWrite(self):
+        log = WriteAheadLog.WriteAheadLog(os.path.join(self.path, 'torn'))
+        self.assertEquals(log.append(self.getEvents(3)), [0, 1, 2])
+        log.close()
+        segment_path = log.getSegments()[-1][1]
+        with open(segment_path, 'ab') as segment_file:
+            segment_file.write(log.header.pack(3, 100, 0) + 'Eggs')
+        log = WriteAheadLog.WriteAheadLog(os.path.join(self.path, 'torn'))
+        self.assertEquals(log.next_offset, 3)
+        self.assertEquals([event['data'] for offset, event in log.readEvents()], ['Spam 0', 'Spam 1', 'Spam 2'])
+        self.assertEquals(log.append(self.getEvents(1)), [3])
+        log.close()
+
+    def testSegmentsAreTruncatedWhenAcknowledged(self):
+        self.checkConfiguration()
+        events = self.getEvents(50)
+        for event in events:
+            self.test_object.append([event])
+        self.assertEquals(events[-1]['gambolputty']['event_log'], ('process_0', 49))
+        segment_count = len(self.test_object.log.getSegments())
+        self.assertTrue(segment_count > 2)
+        self.test_object.acknowledge('StdOutSink', events[:25])
+        self.test_object.acknowledge('FileSink', events)
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 25)
+        self.assertTrue(len(self.test_object.log.getSegments()) < segment_count)
+        self.assertEquals([offset for offset, _ in self.test_object.log.readEvents(25)], range(25, 50))
+        self.test_object.acknowledge('StdOutSink', events)
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(len(self.test_object.log.getSegments()), 1)
+
+    def testConsumerWithoutAcknowledgementsKeepsEvents(self):
+        events = self.getEvents(10)
+        self.test_object.append(events)
+        self.test_object.acknowledge('StdOutSink', events)
+        self.test_object.writeAcknowledgements()
+        # FileSink did not acknowledge anything yet.
+        self.assertEquals(self.test_object.log.getPendingOffset(), 0)
+
+    def testAcknowledgedRangesOutOfOrder(self):
+        events = self.getEvents(10)
+        self.test_object.append(events)
+        # E.g. two threads of a pool, the second one flushed first.
+        self.test_object.acknowledge('StdOutSink', events[5:])
+        self.test_object.acknowledge('FileSink', events)
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 0)
+        self.test_object.acknowledge('StdOutSink', events[:5])
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 10)
+
+    def testAcknowledgementsOfSeveralProcesses(self):
+        events = self.getEvents(10)
+        self.test_object.append(events)
+        worker = self.getEventBuffer(worker_index=1)
+        self.test_object.acknowledge('StdOutSink', events[::2])
+        worker.acknowledge('StdOutSink', events[1::2])
+        worker.acknowledge('FileSink', events)
+        self.test_object.writeAcknowledgements()
+        worker.writeAcknowledgements()
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 10)
+        # The acknowledgements below the base offset are not needed anymore, e.g. those of a retired worker.
+        self.assertEquals(os.listdir(self.test_object.log.acks_path), [])
+        worker.shutDown()
+
+    def testGapsExpire(self):
+        self.test_object.shutDown()
+        self.test_object = self.getEventBuffer(gap_timeout=0)
+        events = self.getEvents(10)
+        self.test_object.append(events)
+        # Event 3 was filtered on its way to StdOutSink.
+        self.test_object.acknowledge('StdOutSink', events[:3] + events[4:8])
+        self.test_object.acknowledge('FileSink', events)
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 8)
+
+    def testBufferedDataIsAcknowledged(self):
+        events = self.getEvents(3)
+        self.test_object.append(events)
+        gp = mock.Mock()
+        gp.event_log = self.test_object
+        # Sinks that send formatted data buffer the events along with it.
+        OutputModule('StdOutSink', gp).acknowledgeBufferedEvents([('Spam', event) for event in events])
+        self.test_object.acknowledge('FileSink', events)
+        self.test_object.writeAcknowledgements()
+        self.assertEquals(self.test_object.log.getPendingOffset(), 3)
+
+    def testUnacknowledgedEventsAreReplayed(self):
+        events = self.getEvents(10)
+        self.test_object.append(events)
+        self.test_object.acknowledge('StdOutSink', events[:6])
+        self.test_object.acknowledge('FileSink', events)
+        self.test_object.shutDown()
+        input_module = StdIn()
+        event_buffer = self.getEventBuffer(input_module)
+        self.assertEquals(event_buffer.replayEvents(), 4)
+        self.assertEquals([event['data'] for event in input_module.events], ['Spam 6', 'Spam 7', 'Spam 8', 'Spam 9'])
+        # Replayed events are logged again by the input module, the old ones will not be replayed a second time.
+        self.assertEquals(event_buffer.log.getPendingOffset(), 10)
+        event_buffer.shutDown()
+
+if __name__ == '__main__':
+    unittest2.main()
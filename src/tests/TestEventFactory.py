@@ -0,0 +1,37 @@
+import extendSysPath
+import os
+import unittest2
+import Utils
+
+class TestEventFactory(unittest2.TestCase):
+
+    def setUp(self):
+        self.event_factory = Utils.EventFactory(caller_class_name='TestEventFactory')
+
+    def testGetEvent(self):
+        event = self.event_factory.getEvent({'data': 'Spam, egg, spam, spam, bacon and spam'}, received_from='127.0.0.1')
+        self.assertTrue(isinstance(event, Utils.KeyDotNotationDict))
+        self.assertEquals(event['data'], 'Spam, egg, spam, spam, bacon and spam')
+        self.assertEquals(event['gambolputty.source_module'], 'TestEventFactory')
+        self.assertEquals(event['gambolputty.received_from'], '127.0.0.1')
+        self.assertEquals(event['gambolputty.event_type'], 'Unknown')
+        self.assertEquals(event['gambolputty.pid'], os.getpid())
+        self.assertEquals(event['gambolputty.received_by'], Utils.MY_HOSTNAME)
+
+    def testGetEventWithoutData(self):
+        event = self.event_factory.getEvent()
+        self.assertEquals(event['data'], '')
+        event = self.event_factory.getEvent({'Lobster': 'Thermidor'})
+        self.assertEquals(event['data'], '')
+        self.assertEquals(event['Lobster'], 'Thermidor')
+
+    def testEventIdsAreUnique(self):
+        event_ids = set([self.event_factory.getEvent()['gambolputty.event_id'] for _ in xrange(0, 1000)])
+        self.assertEquals(len(event_ids), 1000)
+        other_event_factory = Utils.EventFactory(caller_class_name='TestEventFactory')
+        self.assertTrue(other_event_factory.getEventId() not in event_ids)
+
+    def testInitEventIds(self):
+        event_id = self.event_factory.getEventId()
+        self.event_factory.initEventIds()
+        self.assertNotEquals(event_id[:22], self.event_factory.getEventId()[:22])
@@ -0,0 +1,71 @@
+import extendSysPath
+import copy
+import json
+import cPickle
+import unittest2
+import Utils
+
+class TestEventMetadata(unittest2.TestCase):
+
+    def setUp(self):
+        self.event = Utils.EventFactory(caller_class_name='TestEventMetadata').getEvent({'data': 'Spam, egg, spam, spam, bacon and spam'}, received_from='127.0.0.1')
+
+    def testDotNotationAccess(self):
+        self.assertTrue(isinstance(self.event['gambolputty'], Utils.EventMetadata))
+        self.assertEquals(self.event['gambolputty.source_module'], 'TestEventMetadata')
+        self.assertEquals(self.event['gambolputty']['received_from'], '127.0.0.1')
+        self.event['gambolputty.event_type'] = 'spam'
+        self.assertEquals(self.event['gambolputty']['event_type'], 'spam')
+        self.assertTrue('gambolputty.event_id' in self.event)
+        self.assertFalse('gambolputty.holy_grail' in self.event)
+        self.assertEquals(self.event.get('gambolputty.holy_grail', 'Ni'), 'Ni')
+
+    def testExtraFields(self):
+        self.event['gambolputty']['knights'] = ['Lancelot', 'Galahad']
+        self.assertEquals(self.event['gambolputty.knights.1'], 'Galahad')
+        del self.event['gambolputty.knights']
+        self.assertFalse('knights' in self.event['gambolputty'])
+
+    def testCopy(self):
+        event_copy = self.event.copy()
+        self.assertNotEquals(event_copy['gambolputty.event_id'], self.event['gambolputty.event_id'])
+        event_copy['gambolputty.event_type'] = 'spam'
+        self.assertEquals(self.event['gambolputty.event_type'], 'Unknown')
+        self.assertEquals(copy.deepcopy(self.event['gambolputty']), self.event['gambolputty'])
+
+    def testPackUnpackEvents(self):
+        packed_events = Utils.packEvents([self.event, self.event])
+        events = Utils.unpackEvents(packed_events)
+        self.assertEquals(len(events), 2)
+        # Metadata is only unpacked on first access.
+        self.assertTrue(events[0]['gambolputty'].packed is not None)
+        self.assertEquals(events[0]['gambolputty.event_id'], self.event['gambolputty.event_id'])
+        self.assertTrue(events[0]['gambolputty'].packed is None)
+        self.assertEquals(events[1]['gambolputty'], self.event['gambolputty'])
+        self.assertEquals(events[1]['data'], self.event['data'])
+        # Untouched metadata is passed on as is.
+        self.assertEquals(Utils.packEvents([events[1]]), Utils.packEvents([self.event]))
+
+    def testPackedSizeIsSmaller(self):
+        plain_event = dict(self.event)
+        plain_event['gambolputty'] = self.event['gambolputty'].toDict()
+        self.assertTrue(len(Utils.packEvents([self.event])) < len(Utils.packEvents([plain_event])))
+
+    def testSerialize(self):
+        self.assertEquals(json.loads(json.dumps(self.event, default=Utils.serializeDefault))['gambolputty']['received_from'], '127.0.0.1')
+        # ujson and yajl do not support a default function.
+        serializable_event = Utils.getSerializableEvent(self.event)
+        self.assertEquals(serializable_event['gambolputty']['received_from'], '127.0.0.1')
+        self.assertTrue(isinstance(self.event['gambolputty'], Utils.EventMetadata))
+        self.assertEquals(cPickle.loads(cPickle.dumps(self.event['gambolputty'])), self.event['gambolputty'])
+
+    def testPackUnpackEventsColumnar(self):
+        other_event = Utils.EventFactory(caller_class_name='TestEventMetadata').getEvent({'data': 'Lobster Thermidor', 'Truffle': 'Pate'})
+        packed_events = Utils.packEvents([self.event, other_event, self.event], columnar=True)
+        events = Utils.unpackEvents(packed_events)
+        self.assertEquals(len(events), 3)
+        self.assertTrue(isinstance(events[0], Utils.KeyDotNotationDict))
+        self.assertEquals(events[0], self.event)
+        self.assertEquals(events[1], other_event)
+        self.assertFalse('Truffle' in events[2])
+        self.assertEquals(events[2]['gambolputty.event_id'], self.event['gambolputty.event_id'])
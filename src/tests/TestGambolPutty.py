@@ -0,0 +1,226 @@
+import extendSysPath
+import time
+import yaml
+import tempfile
+import shutil
+import Queue
+import multiprocessing.queues
+import mock
+import unittest2
+import tornado.ioloop
+import GambolPutty
+
+class TestGambolPutty(unittest2.TestCase):
+
+    def getGambolPutty(self, configuration):
+        gp = GambolPutty.GambolPutty(None)
+        gp.setConfiguration(configuration, merge=False)
+        gp.configureGlobal()
+        gp.initModulesFromConfig()
+        gp.setDefaultReceivers()
+        gp.configureModules()
+        gp.initEventStream()
+        return gp
+
+    def getInputQueue(self, gp, module_name):
+        return gp.modules[module_name]['instances'][0].getInputQueue()
+
+    def testSingleProcessHasNoQueues(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 1}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'AddDateTime': {}},
+                                  {'StdOutSink': {}}])
+        self.assertEquals(gp.getAllQueues(), {})
+
+    def testThreadPoolGetsSimpleQueue(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 1}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'AddDateTime': {'pool_size': 4}},
+                                  {'StdOutSink': {}}])
+        self.assertTrue(isinstance(self.getInputQueue(gp, 'AddDateTime'), Queue.Queue))
+        self.assertFalse(self.getInputQueue(gp, 'StdOutSink'))
+        self.assertEquals(gp.getProcessGroup('AddDateTime'), 'master')
+
+    def testProcessPoolGetsMultiProcessQueues(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 1}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'AddDateTime': {'pool_size': 4, 'pool_type': 'process'}},
+                                  {'StdOutSink': {}}])
+        self.assertEquals(gp.getProcessGroup('AddDateTime'), 'pool_AddDateTime')
+        self.assertTrue(isinstance(self.getInputQueue(gp, 'AddDateTime'), multiprocessing.queues.Queue))
+        self.assertTrue(isinstance(self.getInputQueue(gp, 'StdOutSink'), multiprocessing.queues.Queue))
+        gp.process_groups = ['pool_AddDateTime']
+        self.assertEquals([module_name for module_name, _ in gp.getModulesInProcess()], ['AddDateTime'])
+
+    def testAutoscaleWorkers(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 1, 'max_workers': 2, 'queue_size': 10}},
+                                  {'StdIn': {}},
+                                  {'AddDateTime': {}},
+                                  {'StdOutSink': {}}])
+        gp.alive = True
+        spawner_commands = []
+        gp.sendToWorkerSpawner = lambda command, argument=None: spawner_commands.append((command, argument)) or 4711
+        gp.getWorkerCpuUsage = lambda: .05
+        queue = self.getInputQueue(gp, 'AddDateTime')
+        for _ in xrange(0, 9):
+            queue.put('')
+        time.sleep(.1)
+        gp.autoscaleWorkers()
+        gp.autoscaleWorkers()
+        self.assertEquals(spawner_commands, [('start', 1)])
+        self.assertEquals(gp.worker_pids, [4711])
+        while queue.qsize():
+            queue.get()
+        gp.autoscaleWorkers()
+        self.assertEquals(spawner_commands, [('start', 1), ('stop', 4711)])
+        self.assertEquals(gp.worker_pids, [])
+
+    def testInvalidQueueEncodingIsRejected(self):
+        gp = GambolPutty.GambolPutty(None)
+        self.assertFalse(gp.setConfiguration([{'Global': {'queue_encoding': 'column'}}, {'StdIn': {}}], merge=False))
+        self.assertTrue(gp.setConfiguration([{'Global': {'queue_encoding': 'columns'}}, {'StdIn': {}}], merge=False))
+
+    def testCpusForWorker(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 4, 'cpu_affinity': True, 'master_cpus': [0]}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'StdOutSink': {}}])
+        with mock.patch('multiprocessing.cpu_count', return_value=4):
+            self.assertEquals([gp.getCpusForWorker(idx) for idx in range(0, 5)], [[0], [1], [2], [3], [1]])
+        gp.numa_aware = True
+        with mock.patch('Utils.getNumaNodes', return_value=[[0, 1, 2, 3], [4, 5, 6, 7]]):
+            self.assertEquals([gp.getCpusForWorker(idx) for idx in range(0, 4)], [[0], [1, 2, 3], [4, 5, 6, 7], [1, 2, 3]])
+
+    def testEachWorkerGetsItsOwnEventLog(self):
+        path = tempfile.mkdtemp()
+        gp = self.getGambolPutty([{'Global': {'workers': 3}},
+                                  {'EventBuffer': {'path': path}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'StdOutSink': {}}])
+        event_buffer = gp.modules['EventBuffer']['instances'][0]
+        processes = []
+        log_ids = []
+        def initModulesAfterFork():
+            event_buffer.initAfterFork()
+            log_ids.append(event_buffer.log_id)
+        # Run the forked processes one after another in this process.
+        with mock.patch('multiprocessing.Process', side_effect=lambda target, args: processes.append((target, args)) or mock.Mock()), \
+             mock.patch.object(gp, 'initModulesAfterFork', side_effect=initModulesAfterFork), \
+             mock.patch.object(gp, 'runModules'), \
+             mock.patch('signal.signal'), \
+             mock.patch('tornado.ioloop.IOLoop.instance'):
+            gp.runWorkers()
+            for target, args in processes:
+                target(*args)
+        self.assertEquals(sorted(log_ids), ['process_0', 'process_1', 'process_2'])
+        shutil.rmtree(path)
+
+    def testReloadOnlyRebuildsChangedModules(self):
+        configuration = [{'Global': {'workers': 1}},
+                         {'StdIn': {}},
+                         {'AddDateTime': {}},
+                         {'StdOutSink': {}}]
+        config_file = tempfile.NamedTemporaryFile(suffix='.conf')
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp = GambolPutty.GambolPutty(config_file.name)
+        gp.configureGlobal()
+        gp.initModulesFromConfig()
+        gp.setDefaultReceivers()
+        gp.configureModules()
+        gp.initEventStream()
+        gp.process_groups = []
+        std_in = gp.modules['StdIn']['instances'][0]
+        add_date_time = gp.modules['AddDateTime']['instances'][0]
+        configuration[2] = {'AddDateTime': {'target_field': 'reloaded'}}
+        config_file.seek(0)
+        config_file.truncate()
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp.reload()
+        self.assertIs(gp.modules['StdIn']['instances'][0], std_in)
+        self.assertIsNot(gp.modules['AddDateTime']['instances'][0], add_date_time)
+        self.assertIs(std_in.receivers['AddDateTime'], gp.modules['AddDateTime']['instances'][0])
+        self.assertEquals(gp.modules['AddDateTime']['instances'][0].getConfigurationValue('target_field'), 'reloaded')
+        configuration[0] = {'Global': {'workers': 2}}
+        config_file.seek(0)
+        config_file.truncate()
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp.is_master = lambda: True
+        gp.restart = mock.Mock()
+        gp.reload()
+        self.assertEquals(gp.restart.call_count, 1)
+        self.assertEquals(gp.modules['AddDateTime']['configuration_snapshot']['target_field'], 'reloaded')
+
+    def testReloadRebuildsModulesReferencingChangedModules(self):
+        configuration = [{'Global': {'workers': 1}},
+                         {'KeyValueStore': {'backend': 'DictStore'}},
+                         {'StdIn': {}},
+                         {'Throttle': {'key': '$(data)', 'backend': 'KeyValueStore'}},
+                         {'StdOutSink': {}}]
+        config_file = tempfile.NamedTemporaryFile(suffix='.conf')
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp = GambolPutty.GambolPutty(config_file.name)
+        gp.configureGlobal()
+        gp.initModulesFromConfig()
+        gp.setDefaultReceivers()
+        gp.configureModules()
+        gp.initEventStream()
+        gp.process_groups = []
+        std_in = gp.modules['StdIn']['instances'][0]
+        throttle = gp.modules['Throttle']['instances'][0]
+        configuration[1] = {'KeyValueStore': {'backend': 'DictStore', 'backlog_size': 100}}
+        config_file.seek(0)
+        config_file.truncate()
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp.reload()
+        self.assertIs(gp.modules['StdIn']['instances'][0], std_in)
+        self.assertIsNot(gp.modules['Throttle']['instances'][0], throttle)
+        self.assertIs(gp.modules['Throttle']['instances'][0].persistence_backend, gp.modules['KeyValueStore']['instances'][0])
+        self.assertIs(std_in.receivers['Throttle'], gp.modules['Throttle']['instances'][0])
+
+    def testReloadRewiresDroppedQueues(self):
+        configuration = [{'Global': {'workers': 1}},
+                         {'StdIn': {}},
+                         {'AddDateTime': {'pool_size': 4}},
+                         {'StdOutSink': {}}]
+        config_file = tempfile.NamedTemporaryFile(suffix='.conf')
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp = GambolPutty.GambolPutty(config_file.name)
+        gp.configureGlobal()
+        gp.initModulesFromConfig()
+        gp.setDefaultReceivers()
+        gp.configureModules()
+        gp.initEventStream()
+        gp.process_groups = []
+        std_in = gp.modules['StdIn']['instances'][0]
+        self.assertTrue(isinstance(std_in.receivers['AddDateTime'], Queue.Queue))
+        # Without pool_size, the receiver does not get a queue anymore.
+        configuration[2] = {'AddDateTime': {}}
+        config_file.seek(0)
+        config_file.truncate()
+        config_file.write(yaml.dump(configuration))
+        config_file.flush()
+        gp.reload()
+        self.assertIs(gp.modules['StdIn']['instances'][0], std_in)
+        self.assertIs(std_in.receivers['AddDateTime'], gp.modules['AddDateTime']['instances'][0])
+
+
+    def testReplacedModulesAreDrainedWithoutBlocking(self):
+        gp = self.getGambolPutty([{'Global': {'workers': 1}},
+                                  {'Spam': {'events_count': 1}},
+                                  {'StdOutSink': {}}])
+        old_instance = mock.Mock()
+        old_instance.receivers = {}
+        old_instance.getInputQueue.return_value = queue = Queue.Queue()
+        queue.put('Spam')
+        gp.drainReplacedInstances([('RemovedModule', old_instance)])
+        self.assertEquals(old_instance.shutDown.call_count, 0)
+        queue.get()
+        io_loop = tornado.ioloop.IOLoop.instance()
+        io_loop.add_timeout(io_loop.time() + .7, io_loop.stop)
+        io_loop.start()
+        self.assertEquals(old_instance.shutDown.call_count, 1)
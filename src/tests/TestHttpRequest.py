@@ -1,51 +1,166 @@
 import extendSysPath
 import ModuleBaseTestCase
 import mock
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
 import Utils
 import HttpRequest
 import RedisStore
 
+class TestRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections open.
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.client_ports.add(self.client_address[1])
+        if self.path.startswith('/slow'):
+            time.sleep(.3)
+        body = "Response for %s" % self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestHttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
 class TestHttpRequest(ModuleBaseTestCase.ModuleBaseTestCase):
 
     def setUp(self):
         super(TestHttpRequest, self).setUp(HttpRequest.HttpRequest(gp=ModuleBaseTestCase.MockGambolPutty()))
 
+    def startHttpServer(self):
+        self.http_server = TestHttpServer(('127.0.0.1', 0), TestRequestHandler)
+        self.http_server.requests = []
+        self.http_server.client_ports = set()
+        server_thread = threading.Thread(target=self.http_server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        return "http://127.0.0.1:%s" % self.http_server.server_port
+
+    def getEvents(self, count, timeout=10):
+        wait_until = time.time() + timeout
+        while len(self.receiver.events) < count and time.time() < wait_until:
+            time.sleep(.01)
+        return self.receiver.events
+
     def testQuery(self):
         self.test_object.configure({'url': 'http://www.google.com'})
         self.checkConfiguration()
-        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'})):
+        self.test_object.start()
+        self.test_object.receiveEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'}))
+        for event in self.getEvents(1):
             self.assertTrue('gambolputty_http_request' in event and len(event['gambolputty_http_request']) > 0)
 
     def testQueryTargetField(self):
         self.test_object.configure({'url': 'http://www.google.com',
                                     'target_field': 'Johann Gambolputty'})
         self.checkConfiguration()
-        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'})):
+        self.test_object.start()
+        self.test_object.receiveEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'}))
+        for event in self.getEvents(1):
             self.assertTrue('Johann Gambolputty' in event and len(event['Johann Gambolputty']) > 0)
 
     def testDynamicQueryTargetField(self):
         self.test_object.configure({'url': '$(schema)://$(host)',
                                     'target_field': 'Johann Gambolputty'})
         self.checkConfiguration()
+        self.test_object.start()
         data_dict = Utils.getDefaultEventDict({'TreeNodeID': '1',
                                               'schema': 'http',
                                               'host': 'www.google.com'})
-        for event in self.test_object.handleEvent(data_dict):
+        self.test_object.receiveEvent(data_dict)
+        for event in self.getEvents(1):
             self.assertTrue('Johann Gambolputty' in event and len(event['Johann Gambolputty']) > 0)
 
     def testHttpsQuery(self):
         self.test_object.configure({'url': 'https://www.google.com'})
         self.checkConfiguration()
-        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'})):
+        self.test_object.start()
+        self.test_object.receiveEvent(Utils.getDefaultEventDict({'TreeNodeID': '1'}))
+        for event in self.getEvents(1):
             self.assertTrue('gambolputty_http_request' in event and len(event['gambolputty_http_request']) > 0)
 
     def testHttpsQueryDynamicTargetField(self):
         self.test_object.configure({'url': 'https://www.google.com',
                                     'target_field': '$(surname) Gambolputty'})
         self.checkConfiguration()
-        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'TreeNodeID': '1', 'surname': 'Johann'})):
+        self.test_object.start()
+        self.test_object.receiveEvent(Utils.getDefaultEventDict({'TreeNodeID': '1', 'surname': 'Johann'}))
+        for event in self.getEvents(1):
             self.assertTrue('Johann Gambolputty' in event and len(event['Johann Gambolputty']) > 0)
 
+    def testIdenticalRequestsInFlightAreShared(self):
+        url = self.startHttpServer()
+        self.test_object.configure({'url': url + '$(path)'})
+        self.checkConfiguration()
+        self.test_object.start()
+        for path in ['/slow', '/slow', '/slow', '/fast']:
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'path': path}))
+        events = self.getEvents(4)
+        # Events are sent on as soon as their response arrived.
+        self.assertEqual([event['gambolputty_http_request'] for event in events], ['Response for /fast'] + ['Response for /slow'] * 3)
+        self.assertEqual(sorted(self.http_server.requests), ['/fast', '/slow'])
+
+    def testInputOrdering(self):
+        url = self.startHttpServer()
+        self.test_object.configure({'url': '$(url)',
+                                    'ordering': 'input',
+                                    'concurrency': 2})
+        self.checkConfiguration()
+        self.test_object.start()
+        for path in ['/slow', '/fast', None, '/fast2']:
+            # Events without the url field are not requested.
+            event_data = {'url': url + path, 'path': path} if path else {'path': path}
+            self.test_object.receiveEvent(Utils.getDefaultEventDict(event_data))
+        events = self.getEvents(4)
+        self.assertEqual([event['path'] for event in events], ['/slow', '/fast', None, '/fast2'])
+        self.assertFalse('gambolputty_http_request' in events[2])
+
+    def testEventsAreSentByTheModuleThread(self):
+        url = self.startHttpServer()
+        self.test_object.configure({'url': url + '/$(counter)',
+                                    'concurrency': 4})
+        self.checkConfiguration()
+        self.test_object.start()
+        sending_threads = set()
+        receive_event = self.receiver.receiveEvent
+        self.receiver.receiveEvent = lambda event: sending_threads.add(threading.current_thread()) or receive_event(event)
+        for counter in xrange(0, 20):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'counter': counter}))
+        self.assertEqual(len(self.getEvents(20)), 20)
+        self.assertEqual(sending_threads, set([self.test_object]))
+
+    def testConnectionsAreReused(self):
+        url = self.startHttpServer()
+        self.test_object.configure({'url': url + '/$(counter)',
+                                    'concurrency': 1})
+        self.checkConfiguration()
+        self.test_object.start()
+        for counter in xrange(0, 10):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'counter': counter}))
+        self.assertEqual(len(self.getEvents(10)), 10)
+        self.assertEqual(len(self.http_server.requests), 10)
+        self.assertEqual(len(self.http_server.client_ports), 1)
+
+    def testResponsesAreCached(self):
+        url = self.startHttpServer()
+        self.test_object.configure({'url': url + '$(path)'})
+        self.checkConfiguration()
+        self.test_object.start()
+        for path in ['/cached', '/cached']:
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'path': path}))
+            self.getEvents(1)
+        events = self.getEvents(2)
+        self.assertEqual([event['gambolputty_http_request'] for event in events], ['Response for /cached'] * 2)
+        self.assertEqual(self.http_server.requests, ['/cached'])
+
     def testRedis(self):
         rc = RedisStore.RedisStore(gp=mock.Mock())
         rc.configure({'server': 'es-01.dbap.de'})
@@ -56,6 +171,15 @@ class TestHttpRequest(ModuleBaseTestCase.ModuleBaseTestCase):
                                     'redis_key': '$(surname)',
                                     'redis_ttl': 5})
         self.checkConfiguration()
-        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'TreeNodeID': '1', 'surname': 'Johann'})):
+        self.test_object.start()
+        self.test_object.receiveEvent(Utils.getDefaultEventDict({'TreeNodeID': '1', 'surname': 'Johann'}))
+        for event in self.getEvents(1):
             redis_entry = rc.get('Johann')
-            self.assertEquals(event['Johann Gambolputty'], redis_entry)
\ No newline at end of file
+            self.assertEquals(event['Johann Gambolputty'], redis_entry)
+
+    def tearDown(self):
+        if hasattr(self, 'http_server'):
+            self.test_object.shutDown()
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
@@ -1,4 +1,5 @@
 import time
+import cPickle
 import extendSysPath
 import ModuleBaseTestCase
 import mock
@@ -36,6 +37,31 @@ class TestKeyValueStore(ModuleBaseTestCase.ModuleBaseTestCase):
         self.test_object.delete(key)
         self.assertRaises(KeyError, self.test_object.get, key)
 
+    def testPickledValuesOfFormerVersionsCanBeRead(self):
+        self.test_object.configure({})
+        self.checkConfiguration()
+        self.test_object.set('Gambol', cPickle.dumps({'Putty': {'Composer': True}}), pickle=False)
+        self.assertEquals(self.test_object.get('Gambol'), {'Putty': {'Composer': True}})
+
+    def testSetAndGetMany(self):
+        self.test_object.configure({})
+        self.checkConfiguration()
+        self.test_object.setMany({'Gambol': 'Putty', 'Johann': {'Composer': True}})
+        self.assertEquals(self.test_object.getMany(['Gambol', 'Spam', 'Johann']), ['Putty', None, {'Composer': True}])
+
+    def testBufferedValuesAreReadBeforeFlush(self):
+        self.test_object.configure({'batch_size': 100, 'store_interval_in_secs': 60})
+        self.checkConfiguration()
+        self.test_object.set_buffer.stopInterval()
+        self.test_object.set('Gambol', 'Putty')
+        self.test_object.set('Johann', 'Gambolputty')
+        self.test_object.delete('Johann')
+        self.assertEquals(self.test_object.get('Gambol'), 'Putty')
+        self.assertRaises(KeyError, self.test_object.kv_store.get, 'Gambol')
+        self.test_object.set_buffer.flush()
+        self.assertEquals(self.test_object.get('Gambol'), 'Putty')
+        self.assertRaises(KeyError, self.test_object.get, 'Johann')
+
     def testRedisBackendSimpleValue(self):
         self.test_object.configure({'backend': 'RedisStore',
                                     'server': 'localhost'})
@@ -1,8 +1,11 @@
 import extendSysPath
+import hmac
+import hashlib
 import ModuleBaseTestCase
 import mock
 import ModifyFields
 import Utils
+import StatisticCollector
 
 class TestModifyFields(ModuleBaseTestCase.ModuleBaseTestCase):
 
@@ -150,6 +153,163 @@ class TestModifyFields(ModuleBaseTestCase.ModuleBaseTestCase):
             self.assertEqual(event, expected)
 
 
+    def receiveBatch(self, events):
+        receiver = mock.Mock()
+        self.test_object.addReceiver('MockReceiver', receiver)
+        self.test_object.receiveEventBatch(events)
+        return receiver.receiveEventBatch.call_args[0][0]
+
+    def testCastBatch(self):
+        self.test_object.configure({'action': 'cast_to_int',
+                                    'source_fields': ['castable', 'not-existing']})
+        values = ['1', '2.5', 3, 'Three shall be the number thou shalt count'] * 40
+        events = [Utils.getDefaultEventDict({'castable': value}) for value in values]
+        events.append(Utils.getDefaultEventDict({}))
+        events = self.receiveBatch(events)
+        self.assertEquals([event['castable'] for event in events[:4]], [1, 2, 3, 0])
+        self.assertEquals(len(events), 161)
+        self.assertTrue('castable' not in events[-1])
+
+    def testCastBatchWithoutNumpy(self):
+        with mock.patch.object(ModifyFields, 'numpy_available', False):
+            self.test_object.configure({'action': 'cast_to_float',
+                                        'source_fields': ['castable']})
+        events = self.receiveBatch([Utils.getDefaultEventDict({'castable': value}) for value in ['1.5', 2] * 50])
+        self.assertEquals([event['castable'] for event in events[:2]], [1.5, 2.0])
+
+    def testMapBatch(self):
+        self.test_object.configure({'action': 'map',
+                                    'source_field': 'http_status',
+                                    'map': {100: 'Continue',
+                                            200: 'OK'}
+                                  })
+        events = self.receiveBatch([Utils.getDefaultEventDict({'http_status': 200}),
+                                    Utils.getDefaultEventDict({'http_status': 404}),
+                                    Utils.getDefaultEventDict({})])
+        self.assertEquals(events[0]['http_status_mapped'], 'OK')
+        self.assertTrue('http_status_mapped' not in events[1])
+        self.assertTrue('http_status_mapped' not in events[2])
+
+    def testRename(self):
+        self.default_dict['old_name'] = 'Spam'
+        self.test_object.configure({'action': 'rename',
+                                    'source_field': 'old_name',
+                                    'target_field': 'new_name'})
+        for event in self.test_object.handleEvent(self.default_dict):
+            self.assertTrue('old_name' not in event)
+            self.assertEquals(event['new_name'], 'Spam')
+
+    def testPlan(self):
+        self.test_object.configure({'action': 'plan',
+                                    'actions': [{'action': 'delete', 'source_fields': ['delme']},
+                                                {'action': 'rename', 'source_field': 'status', 'target_field': 'http.status'},
+                                                {'action': 'cast_to_int', 'source_fields': ['http.status', 'bytes', 'not-existing']},
+                                                {'action': 'map', 'source_field': 'http.status', 'map': {200: 'OK'}, 'target_field': 'http.text'},
+                                                {'action': 'insert', 'target_field': 'request', 'value': '$(method) $(http.text)'},
+                                                {'action': 'hash', 'source_fields': ['user'], 'target_fields': ['user_hash']}]})
+        event = Utils.getDefaultEventDict({'delme': 1, 'status': '200', 'bytes': 'many', 'method': 'GET', 'http': {}, 'user': 'Nobody inspects the spammish repetition'})
+        for event in self.test_object.handleEvent(event):
+            self.assertTrue('delme' not in event and 'status' not in event)
+            self.assertEquals(event['http'], {'status': 200, 'text': 'OK'})
+            self.assertEquals(event['bytes'], 0)
+            self.assertEquals(event['request'], 'GET OK')
+            self.assertEquals(event['user_hash'], 'bb649c83dd1ea5c9d9dec9a18df0ffe9')
+
+    def testPlanBatch(self):
+        self.test_object.configure({'action': 'plan',
+                                    'actions': [{'action': 'cast_to_float', 'source_fields': ['bytes']},
+                                                {'action': 'insert', 'target_field': 'unit', 'value': 'bytes'}]})
+        events = self.receiveBatch([Utils.getDefaultEventDict({'bytes': str(counter)}) for counter in xrange(0, 10)])
+        self.assertEquals([event['bytes'] for event in events], [float(counter) for counter in xrange(0, 10)])
+        self.assertTrue(all(event['unit'] == 'bytes' for event in events))
+
+    def testKeyValue(self):
+        self.default_dict['kv'] = 'date=2015-05-10 srcip=10.1.100.11 action="accept" msg="Connection \\"allowed\\" by policy" no_value'
+        self.test_object.configure({'action': 'key_value',
+                                    'source_field': 'kv',
+                                    'line_separator': ' ',
+                                    'kv_separator': '=',
+                                    'target_field': 'fw'})
+        for event in self.test_object.handleEvent(self.default_dict):
+            self.assertEquals(event['fw'], {'date': '2015-05-10', 'srcip': '10.1.100.11', 'action': 'accept', 'msg': 'Connection "allowed" by policy'})
+
+    def testKeyValueWithPrefixAndWhitelist(self):
+        self.default_dict['kv'] = "user: 'Johann Gambolputty'; status: 200; bytes: 3395"
+        self.test_object.configure({'action': 'key_value',
+                                    'source_field': 'kv',
+                                    'line_separator': '; ',
+                                    'kv_separator': ': ',
+                                    'prefix': 'kv_',
+                                    'whitelist': ['user', 'status']})
+        for event in self.test_object.handleEvent(self.default_dict):
+            self.assertEquals(event['kv_user'], 'Johann Gambolputty')
+            self.assertEquals(event['kv_status'], '200')
+            self.assertTrue('kv_bytes' not in event)
+
+    def testKeyValueRegexWithWhitelist(self):
+        self.default_dict['url'] = 'spam=1&eggs=2&bacon=3'
+        self.test_object.configure({'action': 'key_value_regex',
+                                    'source_field': 'url',
+                                    'regex': '([^=&?]+)=([^&=?]+)',
+                                    'whitelist': ['spam', 'bacon']})
+        for event in self.test_object.handleEvent(self.default_dict):
+            self.assertEquals((event['spam'], event['bacon']), ('1', '3'))
+            self.assertTrue('eggs' not in event)
+
+    def testKeyValueRejectsEmptySeparators(self):
+        self.test_object.configure({'action': 'key_value',
+                                    'source_field': 'kv',
+                                    'line_separator': '',
+                                    'kv_separator': '='})
+        self.assertTrue(self.test_object.gp.shutDown.called)
+
+    def testKeyValueRegexNeedsTwoGroups(self):
+        self.test_object.configure({'action': 'key_value_regex',
+                                    'source_field': 'url',
+                                    'regex': '([^=&?]+)=[^&=?]+'})
+        self.assertTrue(self.test_object.gp.shutDown.called)
+
+    def testHmacSha1Hash(self):
+        self.test_object.configure({'action': 'hash',
+                                    'algorithm': 'sha1',
+                                    'hmac_key': 'Spam',
+                                    'source_fields': ['hash_me']})
+        expected = hmac.new('Spam', 'Nobody inspects the spammish repetition', hashlib.sha1).hexdigest()
+        for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'hash_me': 'Nobody inspects the spammish repetition'})):
+            self.assertEqual(event['hash_me'], expected)
+
+    def testHashCache(self):
+        self.test_object.configure({'action': 'hash',
+                                    'source_fields': ['hash_me']})
+        stats_collector = StatisticCollector.StatisticCollector()
+        for counter_name in [self.test_object.cache_hits_counter, self.test_object.cache_misses_counter]:
+            stats_collector.resetCounter(counter_name)
+        for value in ['Spam', 'Eggs', 'Spam', 'Spam']:
+            for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'hash_me': value})):
+                self.assertEqual(event['hash_me'], hashlib.md5(value).hexdigest())
+        self.assertEqual(stats_collector.getCounter(self.test_object.cache_hits_counter), 2)
+        self.assertEqual(stats_collector.getCounter(self.test_object.cache_misses_counter), 2)
+
+    def testHashCacheKeepsEqualValuesOfDifferentTypesApart(self):
+        self.test_object.configure({'action': 'hash',
+                                    'source_fields': ['hash_me']})
+        for value in [1, 1.0, True, 1]:
+            for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'hash_me': value})):
+                self.assertEqual(event['hash_me'], hashlib.md5(str(value)).hexdigest())
+        events = self.receiveBatch([Utils.getDefaultEventDict({'hash_me': value}) for value in [1, 1.0, True]])
+        self.assertEqual([event['hash_me'] for event in events], [hashlib.md5(value).hexdigest() for value in ['1', '1.0', 'True']])
+
+    def testHashBatch(self):
+        self.test_object.configure({'action': 'anonymize',
+                                    'cache_size': 0,
+                                    'source_fields': ['hash_me'],
+                                    'target_fields': ['hashed']})
+        with mock.patch.object(self.test_object, 'hash_func', wraps=self.test_object.hash_func) as hash_func:
+            events = self.receiveBatch([Utils.getDefaultEventDict({'hash_me': value}) for value in ['Spam', 'Eggs', 'Spam', ['Bacon']]] + [Utils.getDefaultEventDict({})])
+        # Each distinct hashable value is only hashed once per batch.
+        self.assertEqual(hash_func.call_count, 3)
+        self.assertEqual([event.get('hashed', None) for event in events], [hashlib.md5('Spam').hexdigest(), hashlib.md5('Eggs').hexdigest(), hashlib.md5('Spam').hexdigest(), hashlib.md5("['Bacon']").hexdigest(), None])
+
     def __testQueueCommunication(self):
         config = {'source_fields': ['data'],
                   'action': 'keep'  }
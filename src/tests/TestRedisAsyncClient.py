@@ -0,0 +1,120 @@
+import extendSysPath
+import time
+import threading
+import unittest2
+import tornado.ioloop
+import RedisAsyncClient
+import RedisStandIn
+
+
+class TestRedisAsyncClient(unittest2.TestCase):
+
+    def setUp(self):
+        self.redis_stand_in = RedisStandIn.RedisStandIn()
+        self.io_loop = tornado.ioloop.IOLoop()
+        self.io_loop_thread = threading.Thread(target=self.io_loop.start)
+        self.io_loop_thread.daemon = True
+        self.io_loop_thread.start()
+        self.replies = []
+
+    def getClient(self, **kwargs):
+        self.client = RedisAsyncClient.AsyncRedisClient(('127.0.0.1', self.redis_stand_in.port), self.io_loop, **kwargs)
+        return self.client
+
+    def waitFor(self, condition, timeout=5):
+        wait_until = time.time() + timeout
+        while not condition() and time.time() < wait_until:
+            time.sleep(.01)
+
+    def testParser(self):
+        parser = RedisAsyncClient.RedisReplyParser()
+        data = "+OK\r\n:42\r\n$-1\r\n$5\r\nSp\r\nm\r\n*2\r\n*1\r\n$4\r\nEggs\r\n:1\r\n-ERR no bacon\r\n"
+        replies = []
+        # Feed the replies in small pieces.
+        for idx in xrange(0, len(data), 3):
+            parser.feed(data[idx:idx + 3])
+            while True:
+                try:
+                    replies.append(parser.getReply())
+                except RedisAsyncClient.IncompleteReply:
+                    break
+        self.assertEqual(replies[:5], ['OK', 42, None, 'Sp\r\nm', [['Eggs'], 1]])
+        self.assertIsInstance(replies[5], RedisAsyncClient.RedisError)
+        self.assertEqual(str(replies[5]), 'ERR no bacon')
+        self.assertEqual(len(replies), 6)
+
+    def testPipelinedCommands(self):
+        client = self.getClient()
+        for idx in xrange(0, 500):
+            client.execute(('SET', 'spam:%s' % idx, idx))
+            client.execute(('GET', 'spam:%s' % idx), self.replies.append)
+        self.waitFor(lambda: len(self.replies) == 500)
+        self.assertEqual(self.replies, [str(idx) for idx in xrange(0, 500)])
+        # All commands went over one connection.
+        self.assertEqual(len(self.redis_stand_in.connections), 1)
+
+    def testExecuteMany(self):
+        client = self.getClient()
+        client.executeMany([('RPUSH', 'spam', 'egg', 'bacon'), ('LRANGE', 'spam', 0, -1), ('NOSUCHCOMMAND',)], self.replies.append)
+        self.waitFor(lambda: self.replies)
+        self.assertEqual(self.replies[0][:2], [2, ['egg', 'bacon']])
+        self.assertIsInstance(self.replies[0][2], RedisAsyncClient.RedisError)
+
+    def testConnectionPool(self):
+        client = self.getClient(pool_size=2)
+        connection = client.getConnection()
+        connection.execute(('BLPOP', 'spam', 0), self.replies.append)
+        # The blocking pop does not hold back commands on the pooled connections.
+        for idx in xrange(0, 4):
+            client.execute(('ECHO', idx), self.replies.append)
+        self.waitFor(lambda: len(self.replies) == 4)
+        self.assertEqual(sorted(self.replies), ['0', '1', '2', '3'])
+        self.assertEqual(len(self.redis_stand_in.connections), 3)
+        client.execute(('RPUSH', 'spam', 'egg'))
+        self.waitFor(lambda: len(self.replies) == 5)
+        self.assertEqual(self.replies[4], ['spam', 'egg'])
+        client.releaseConnection(connection)
+        self.assertIs(client.getConnection(), connection)
+
+    def testReconnect(self):
+        client = self.getClient(reconnect_interval=.1)
+        client.execute(('SET', 'spam', 'egg'), self.replies.append)
+        self.waitFor(lambda: self.replies)
+        self.redis_stand_in.dropConnections()
+        self.waitFor(lambda: not client.connections[0].connected)
+        # Commands executed while disconnected are sent after the reconnect.
+        client.execute(('GET', 'spam'), self.replies.append)
+        self.waitFor(lambda: len(self.replies) == 2)
+        self.assertEqual(self.replies, ['OK', 'egg'])
+
+    def testResubscribe(self):
+        client = self.getClient(reconnect_interval=.1)
+        client.subscribe(['spam'], self.replies.append)
+        self.waitFor(lambda: self.replies)
+        client.execute(('PUBLISH', 'spam', 'egg'))
+        self.waitFor(lambda: len(self.replies) == 2)
+        self.redis_stand_in.dropConnections()
+        self.waitFor(lambda: len(self.replies) == 3)
+        client.execute(('PUBLISH', 'spam', 'bacon'))
+        self.waitFor(lambda: len(self.replies) == 4)
+        self.assertEqual(self.replies, [['subscribe', 'spam', 1], ['message', 'spam', 'egg'],
+                                        ['subscribe', 'spam', 1], ['message', 'spam', 'bacon']])
+
+    def testPendingRepliesFailOnConnectionLoss(self):
+        client = self.getClient(reconnect_interval=.1)
+        client.getConnection().execute(('BLPOP', 'spam', 0), self.replies.append)
+        self.waitFor(lambda: len(self.redis_stand_in.commands) == 1)
+        self.redis_stand_in.dropConnections()
+        self.waitFor(lambda: self.replies)
+        self.assertIsInstance(self.replies[0], RedisAsyncClient.ConnectionError)
+
+    def tearDown(self):
+        if hasattr(self, 'client'):
+            self.client.close(wait_for_replies=False)
+        self.io_loop.add_callback(self.io_loop.stop)
+        self.io_loop_thread.join(5)
+        self.io_loop.close(all_fds=True)
+        self.redis_stand_in.stop()
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -1,9 +1,9 @@
-import sys
 import time
 import extendSysPath
 import mock
 import redis
 import ModuleBaseTestCase
+import RedisStandIn
 import RedisChannel
 
 
@@ -11,14 +11,8 @@ class TestRedisChannel(ModuleBaseTestCase.ModuleBaseTestCase):
 
     def setUp(self):
         super(TestRedisChannel, self).setUp(RedisChannel.RedisChannel(gp=mock.Mock()))
-        self.redis_host = 'localhost'
-        self.redis_port = 6379
-        try:
-            self.client = redis.Redis(host=self.redis_host, port=self.redis_port)
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error('Could no connect to redis server at %s:%s. Exception: %s, Error: %s.' % (self.redis_host, self.redis_port, etype, evalue))
-            sys.exit(255)
+        self.redis_stand_in = RedisStandIn.RedisStandIn()
+        self.client = redis.StrictRedis(host='127.0.0.1', port=self.redis_stand_in.port)
 
     """
     - RedisChannel:
@@ -32,9 +26,13 @@ class TestRedisChannel(ModuleBaseTestCase.ModuleBaseTestCase):
     """
     def test(self):
         self.test_object.configure({'channel': 'TestChannel',
-                                    'server': 'localhost'})
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port})
         self.checkConfiguration()
+        self.test_object.initAfterFork()
         self.startTornadoEventLoop()
+        # Wait for the subscription.
+        time.sleep(.5)
         data = "It's my belief that these sheep are laborin' under the misapprehension that they're birds."
         for _ in range(0, 500):
             self.client.publish('TestChannel', data)
@@ -45,4 +43,8 @@ class TestRedisChannel(ModuleBaseTestCase.ModuleBaseTestCase):
             counter += 1
         self.assertTrue(event != False)
         self.assertEqual(counter, 500)
-        self.assertEqual(event['data'], data)
\ No newline at end of file
+        self.assertEqual(event['data'], data)
+
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        self.redis_stand_in.stop()
\ No newline at end of file
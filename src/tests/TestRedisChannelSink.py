@@ -0,0 +1,117 @@
+import time
+import json
+import threading
+import extendSysPath
+import mock
+import msgpack
+import ModuleBaseTestCase
+import RedisStandIn
+import RedisAsyncClient
+import Utils
+import RedisChannelSink
+
+
+class TestRedisChannelSink(ModuleBaseTestCase.ModuleBaseTestCase):
+
+    def setUp(self):
+        super(TestRedisChannelSink, self).setUp(RedisChannelSink.RedisChannelSink(gp=ModuleBaseTestCase.MockGambolPutty()))
+        self.redis_stand_in = RedisStandIn.RedisStandIn()
+
+    def getPublishCommands(self, count, timeout=5):
+        wait_until = time.time() + timeout
+        while time.time() < wait_until:
+            commands = [command for command in self.redis_stand_in.commands if command[0] == 'PUBLISH']
+            if len(commands) >= count:
+                break
+            time.sleep(.01)
+        return commands
+
+    def testPublishIsPipelinedPerChannel(self):
+        self.test_object.configure({'channel': 'Channel$(channel)',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)',
+                                    'batch_size': 6})
+        self.checkConfiguration()
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        for idx in xrange(0, 6):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann %s' % idx, 'channel': idx % 2}))
+        commands = self.getPublishCommands(6)
+        self.assertEqual([command[1:] for command in commands], [['Channel0', 'Johann 0'], ['Channel0', 'Johann 2'], ['Channel0', 'Johann 4'],
+                                                                 ['Channel1', 'Johann 1'], ['Channel1', 'Johann 3'], ['Channel1', 'Johann 5']])
+
+    def testSerializers(self):
+        for serializer, deserialize in [('msgpack', msgpack.unpackb), ('json', json.loads)]:
+            self.redis_stand_in.commands = []
+            self.test_object.configure({'channel': 'TestChannel',
+                                        'server': '127.0.0.1',
+                                        'port': self.redis_stand_in.port,
+                                        'serializer': serializer,
+                                        'batch_size': 1})
+            self.checkConfiguration()
+            self.test_object.initAfterFork()
+            self.startTornadoEventLoop()
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann'}))
+            event = deserialize(self.getPublishCommands(1)[0][2])
+            self.assertEqual(event['name'], 'Johann')
+            self.assertEqual(event['gambolputty']['event_type'], 'Unknown')
+            self.test_object.shutDown()
+
+    def testDefaultSerializerKeepsFormat(self):
+        self.test_object.configure({'channel': 'TestChannel',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'batch_size': 1})
+        self.checkConfiguration()
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        event = Utils.getDefaultEventDict({'name': 'Johann'})
+        self.test_object.receiveEvent(event)
+        self.assertEqual(self.getPublishCommands(1)[0][2], str(event))
+
+    def testBackPressure(self):
+        self.test_object.configure({'channel': 'TestChannel',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)',
+                                    'batch_size': 10,
+                                    'store_interval_in_secs': 1,
+                                    'backlog_size': 20})
+        self.checkConfiguration()
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        port = self.redis_stand_in.port
+        self.redis_stand_in.stop()
+        def sendEvents():
+            for idx in xrange(0, 50):
+                self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann %s' % idx}))
+        sending_thread = threading.Thread(target=sendEvents)
+        sending_thread.daemon = True
+        sending_thread.start()
+        time.sleep(1)
+        # Handling of events blocks, as long as redis is not reachable.
+        self.assertTrue(sending_thread.is_alive())
+        self.redis_stand_in = RedisStandIn.RedisStandIn(port)
+        sending_thread.join(10)
+        self.assertFalse(sending_thread.is_alive())
+        commands = self.getPublishCommands(50)
+        self.assertEqual([command[2] for command in commands], ['Johann %s' % idx for idx in xrange(0, 50)])
+
+    def testOnlyUnsentEventsAreRetried(self):
+        self.test_object.configure({'channel': 'TestChannel',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)'})
+        self.checkConfiguration()
+        buffered_data = [('TestChannel', 'Johann %s' % idx, Utils.getDefaultEventDict({})) for idx in xrange(0, 3)]
+        replies = [1, RedisAsyncClient.RedisError('ERR refused'), RedisAsyncClient.ConnectionError('Lost connection')]
+        self.test_object.client = mock.Mock(executeMany=lambda commands, callback: callback(replies))
+        callback = mock.Mock()
+        self.test_object.storeData(buffered_data, callback)
+        # The published event is not sent twice, the refused one is dropped.
+        callback.assert_called_once_with(True, [buffered_data[2]])
+
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        self.redis_stand_in.stop()
@@ -2,6 +2,7 @@
 import extendSysPath
 import ModuleBaseTestCase
 import mock
+import Utils
 import RedisStore
 
 
@@ -25,5 +26,46 @@ class TestRedisStore(ModuleBaseTestCase.ModuleBaseTestCase):
         test = rc.get('Johann Gambolputty')
         self.assertEquals(test, value)
 
+    def getStoreWithMockedClient(self, configuration={}):
+        configuration = dict({'server': 'es-01.dbap.de'}, **configuration)
+        with mock.patch.object(RedisStore.redis, 'StrictRedis'):
+            self.test_object.configure(configuration)
+        self.checkConfiguration()
+        return self.test_object.getClient()
+
+    def testSetManyUsesOnePipeline(self):
+        client = self.getStoreWithMockedClient()
+        self.test_object.setMany({'Johann': {'Gambolputty': True}, 'Ulm': u'M\xfcnster'}, ttl=10)
+        self.assertEqual(client.pipeline.call_count, 1)
+        pipe = client.pipeline.return_value
+        pipe.mset.assert_called_once_with({'Johann': Utils.packValue({'Gambolputty': True}), 'Ulm': Utils.packValue(u'M\xfcnster')})
+        self.assertEqual(sorted(call[0] for call in pipe.expire.call_args_list), [('Johann', 10), ('Ulm', 10)])
+        pipe.execute.assert_called_once_with()
+
+    def testGetMany(self):
+        client = self.getStoreWithMockedClient()
+        client.mget.return_value = [Utils.packValue(['Johann', u'Gambolputty']), None]
+        self.assertEqual(self.test_object.getMany(['Johann', 'Ulm']), [['Johann', u'Gambolputty'], None])
+        client.mget.assert_called_once_with(['Johann', 'Ulm'])
+
+    def testBufferedValuesAreReadBeforeFlush(self):
+        client = self.getStoreWithMockedClient({'batch_size': 100, 'store_interval_in_secs': 60})
+        self.test_object.set_buffer.stopInterval()
+        client.mget.return_value = [None]
+        self.test_object.set('Johann', 'Gambol', 10)
+        self.test_object.set('Johann', 'Gambolputty', 10)
+        self.test_object.set('Ulm', 'Bratwurst')
+        self.assertEqual(self.test_object.get('Johann'), 'Gambolputty')
+        self.assertEqual(self.test_object.getMany(['Johann', 'Spam']), ['Gambolputty', None])
+        client.mget.assert_called_once_with(['Spam'])
+        self.assertEqual(self.test_object.pop('Ulm'), 'Bratwurst')
+        self.assertFalse(client.get.called)
+        self.test_object.set_buffer.flush()
+        # Only the latest value of each key is sent.
+        pipe = client.pipeline.return_value
+        pipe.mset.assert_called_once_with({'Johann': Utils.packValue('Gambolputty')})
+        pipe.expire.assert_called_once_with('Johann', 10)
+        self.assertEqual(self.test_object.buffered_values, {})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
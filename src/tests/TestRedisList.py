@@ -1,9 +1,11 @@
-import sys
 import time
+import threading
 import extendSysPath
 import mock
 import redis
+import tornado.ioloop
 import ModuleBaseTestCase
+import RedisStandIn
 import RedisList
 
 
@@ -11,14 +13,8 @@ class TestRedisList(ModuleBaseTestCase.ModuleBaseTestCase):
 
     def setUp(self):
         super(TestRedisList, self).setUp(RedisList.RedisList(gp=mock.Mock()))
-        self.redis_host = 'localhost'
-        self.redis_port = 6379
-        try:
-            self.client = redis.Redis(host=self.redis_host, port=self.redis_port)
-        except:
-            etype, evalue, etb = sys.exc_info()
-            self.logger.error('Could no connect to redis server at %s:%s. Exception: %s, Error: %s.' % (self.redis_host, self.redis_port, etype, evalue))
-            sys.exit(255)
+        self.redis_stand_in = RedisStandIn.RedisStandIn()
+        self.client = redis.StrictRedis(host='127.0.0.1', port=self.redis_stand_in.port)
 
     """
     - RedisList:
@@ -28,14 +24,18 @@ class TestRedisList(ModuleBaseTestCase.ModuleBaseTestCase):
         db:                       # <default: 0; type: integer; is: optional>
         password:                 # <default: None; type: None||string; is: optional>
         timeout:                  # <default: 0; type: integer; is: optional>
+        batch_size:               # <default: 100; type: integer; is: optional>
         receivers:
           - NextModule
     """
     def test(self):
         self.test_object.configure({'lists': ['TestList'],
-                                    'server': 'localhost'})
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port})
         self.checkConfiguration()
+        self.test_object.initAfterFork()
         self.test_object.start()
+        self.startTornadoEventLoop()
         data = "It's my belief that these sheep are laborin' under the misapprehension that they're birds."
         for _ in range(0, 500):
             self.client.rpush('TestList', data)
@@ -46,4 +46,76 @@ class TestRedisList(ModuleBaseTestCase.ModuleBaseTestCase):
             counter += 1
         self.assertTrue(event != False)
         self.assertEqual(counter, 500)
-        self.assertEqual(event['data'], data)
\ No newline at end of file
+        self.assertEqual(event['data'], data)
+
+    def testBatchPops(self):
+        self.test_object.configure({'lists': ['TestList', 'OtherTestList'],
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'batch_size': 100})
+        self.checkConfiguration()
+        self.client.rpush('TestList', *['Spam %s' % idx for idx in xrange(0, 150)])
+        self.client.rpush('OtherTestList', *['Eggs %s' % idx for idx in xrange(0, 20)])
+        self.test_object.initAfterFork()
+        self.test_object.start()
+        self.startTornadoEventLoop()
+        time.sleep(.5)
+        # Pushed after the lists were drained, this one is received via BLPOP.
+        self.client.rpush('TestList', 'Bacon')
+        time.sleep(.5)
+        events = self.receiver.events
+        self.assertEqual(len(events), 171)
+        self.assertEqual([event['data'] for event in events if event['received_from'] == 'TestList'],
+                         ['Spam %s' % idx for idx in xrange(0, 150)] + ['Bacon'])
+        commands = [command[0] for command in self.redis_stand_in.commands if command[0] in ('EXEC', 'BLPOP')]
+        self.assertEqual(commands, ['EXEC', 'EXEC', 'EXEC', 'BLPOP', 'EXEC', 'BLPOP'])
+
+    def testSlowReceiversDoNotBlockTheIOLoop(self):
+        self.test_object.configure({'lists': ['TestList'],
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'batch_size': 100})
+        self.checkConfiguration()
+        self.client.rpush('TestList', *['Spam %s' % idx for idx in xrange(0, 1000)])
+        receiver_released = threading.Event()
+        received_events = []
+        self.receiver.receiveEventBatch = lambda events: receiver_released.wait(5) and received_events.extend(events)
+        self.test_object.initAfterFork()
+        self.test_object.start()
+        self.startTornadoEventLoop()
+        time.sleep(.5)
+        io_loop_alive = threading.Event()
+        tornado.ioloop.IOLoop.instance().add_callback(io_loop_alive.set)
+        self.assertTrue(io_loop_alive.wait(1))
+        # One batch is being sent, two more are queued.
+        self.assertEqual(len([command for command in self.redis_stand_in.commands if command[0] == 'EXEC']), 3)
+        receiver_released.set()
+        time.sleep(.5)
+        self.assertEqual([event['data'] for event in received_events], ['Spam %s' % idx for idx in xrange(0, 1000)])
+
+    def testPoppedEventsAreSentOnShutdown(self):
+        self.test_object.configure({'lists': ['TestList'],
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'batch_size': 100})
+        self.checkConfiguration()
+        self.client.rpush('TestList', *['Spam %s' % idx for idx in xrange(0, 1000)])
+        receiver_released = threading.Event()
+        received_events = []
+        self.receiver.receiveEventBatch = lambda events: receiver_released.wait(5) and received_events.extend(events)
+        self.test_object.initAfterFork()
+        self.test_object.start()
+        self.startTornadoEventLoop()
+        time.sleep(.5)
+        # One batch is being sent, two more are queued.
+        shut_down = threading.Thread(target=self.test_object.shutDown)
+        shut_down.start()
+        receiver_released.set()
+        shut_down.join(5)
+        self.assertFalse(shut_down.is_alive())
+        self.assertEqual([event['data'] for event in received_events], ['Spam %s' % idx for idx in xrange(0, 300)])
+        self.assertEqual(self.client.llen('TestList'), 700)
+
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        self.redis_stand_in.stop()
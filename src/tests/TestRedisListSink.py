@@ -0,0 +1,75 @@
+import time
+import extendSysPath
+import mock
+import ModuleBaseTestCase
+import RedisStandIn
+import Utils
+import RedisListSink
+
+
+class TestRedisListSink(ModuleBaseTestCase.ModuleBaseTestCase):
+
+    def setUp(self):
+        super(TestRedisListSink, self).setUp(RedisListSink.RedisListSink(gp=ModuleBaseTestCase.MockGambolPutty()))
+        self.redis_stand_in = RedisStandIn.RedisStandIn()
+
+    def getPushedValues(self, count, timeout=5):
+        wait_until = time.time() + timeout
+        while len(self.redis_stand_in.data.get('TestList', [])) < count and time.time() < wait_until:
+            time.sleep(.01)
+        return self.redis_stand_in.data.get('TestList', [])
+
+    def testBatchesArePushed(self):
+        self.test_object.configure({'list': 'TestList',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)',
+                                    'batch_size': 10,
+                                    'store_interval_in_secs': 1})
+        self.checkConfiguration()
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        for idx in xrange(0, 25):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann %s' % idx}))
+        # The last 5 events are pushed after store_interval_in_secs.
+        self.assertEqual(self.getPushedValues(25, timeout=10), ['Johann %s' % idx for idx in xrange(0, 25)])
+        self.assertEqual([len(command) - 2 for command in self.redis_stand_in.commands if command[0] == 'RPUSH'], [10, 10, 5])
+
+    def testBatchIsResentAfterReconnect(self):
+        self.test_object.configure({'list': 'TestList',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)',
+                                    'batch_size': 5,
+                                    'store_interval_in_secs': 1})
+        self.checkConfiguration()
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        self.redis_stand_in.stop()
+        for idx in xrange(0, 5):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann %s' % idx}))
+        time.sleep(.5)
+        self.redis_stand_in = RedisStandIn.RedisStandIn(self.redis_stand_in.port)
+        self.assertEqual(self.getPushedValues(5, timeout=10), ['Johann %s' % idx for idx in xrange(0, 5)])
+
+    def testRefusedBatchIsDropped(self):
+        self.test_object.configure({'list': 'TestList',
+                                    'server': '127.0.0.1',
+                                    'port': self.redis_stand_in.port,
+                                    'format': '$(name)',
+                                    'batch_size': 5,
+                                    'store_interval_in_secs': 1})
+        self.checkConfiguration()
+        self.redis_stand_in.data['TestList'] = 'Spam'
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        for idx in xrange(0, 5):
+            self.test_object.receiveEvent(Utils.getDefaultEventDict({'name': 'Johann %s' % idx}))
+        time.sleep(1.5)
+        # A WRONGTYPE error is not retried.
+        self.assertEqual(len([command for command in self.redis_stand_in.commands if command[0] == 'RPUSH']), 1)
+        self.assertEqual(self.test_object.buffer.bufsize(), 0)
+
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        self.redis_stand_in.stop()
\ No newline at end of file
@@ -20,3 +20,30 @@ class TestSpam(ModuleBaseTestCase.ModuleBaseTestCase):
         for event in self.receiver.getEvent():
             count += 1
         self.assertEquals(count, 985)
+
+
+    def testSpamTemplatesInBatches(self):
+        self.test_object.configure({'event': {'data': 'Spam $(template_id)'},
+                                    'template_count': 3,
+                                    'batch_size': 100,
+                                    'events_count': 1000})
+        self.checkConfiguration()
+        self.test_object.start()
+        time.sleep(1)
+        events = list(self.receiver.getEvent())
+        self.assertEquals(len(events), 1000)
+        self.assertEquals(set([event['data'] for event in events]), set(['Spam 0', 'Spam 1', 'Spam 2']))
+        self.assertEquals(len(set([event['gambolputty']['event_id'] for event in events])), 1000)
+        self.assertTrue('timestamp' in events[0])
+
+    def testSpamRate(self):
+        self.test_object.configure({'event': {'Lobster': 'Thermidor'},
+                                    'rate': 100,
+                                    'burst': 1,
+                                    'events_count': 50})
+        self.checkConfiguration()
+        self.test_object.start()
+        time.sleep(.2)
+        self.assertTrue(len(self.receiver.events) < 50)
+        time.sleep(1)
+        self.assertEquals(len(self.receiver.events), 50)
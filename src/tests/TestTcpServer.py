@@ -46,6 +46,30 @@ class TestTcpServer(ModuleBaseTestCase.ModuleBaseTestCase):
         event.pop('gambolputty')
         self.assertDictEqual(event, expected_ret_val)
 
+    def testReusePort(self):
+        self.test_object.configure({'port': 5353,
+                                    'reuse_port': True})
+        self.checkConfiguration()
+        self.assertEquals(self.test_object.sockets, [])
+        self.test_object.initAfterFork()
+        self.startTornadoEventLoop()
+        time.sleep(.1)
+        # A second process may bind the same port.
+        other_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        other_socket.setsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_REUSEPORT', 15), 1)
+        other_socket.bind(('', 5353))
+        other_socket.close()
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(1)
+        s.connect(('localhost', 5353))
+        s.sendall("Spam\n")
+        s.close()
+        time.sleep(.5)
+        event = False
+        for event in self.receiver.getEvent():
+            pass
+        self.assertEquals(event['data'], 'Spam')
+
     def testATlsTcpConnection(self):
         self.test_object.configure({'port': 5252,
                                     'tls': True,
@@ -2,7 +2,9 @@ import extendSysPath
 import ModuleBaseTestCase
 import unittest
 import mock
+import multiprocessing
 import Utils
+import StatisticCollector
 import UserAgentParser
 
 class TestUserAgentParser(ModuleBaseTestCase.ModuleBaseTestCase):
@@ -32,6 +34,38 @@ class TestUserAgentParser(ModuleBaseTestCase.ModuleBaseTestCase):
         for event in self.test_object.handleEvent(event):
             self.assert_('http_user_agent_data' in event and event['http_user_agent_data']['device']['family'] == "Spider")
 
+    def testTwoLevelCache(self):
+        self.test_object.configure({'source_fields': 'user_agent',
+                                    'cache_size': 1})
+        self.checkConfiguration()
+        self.test_object.gp.worker_index = 0
+        self.test_object.setCacheCounterNames()
+        stats_collector = StatisticCollector.StatisticCollector()
+        for counter_names in self.test_object.cache_counters.values():
+            for counter_name in counter_names:
+                stats_collector.resetCounter(counter_name)
+        user_agents = ["Mozilla/5.0 (Windows NT 6.0; rv:33.0) Gecko/20100101 Firefox/33.0",
+                       "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+                       "Mozilla/5.0 (Windows NT 6.0; rv:33.0) Gecko/20100101 Firefox/33.0",
+                       "Mozilla/5.0 (Windows NT 6.0; rv:33.0) Gecko/20100101 Firefox/33.0"]
+        for user_agent in user_agents:
+            for event in self.test_object.handleEvent(Utils.getDefaultEventDict({'user_agent': user_agent})):
+                self.assertEqual(event['user_agent_info']['user_agent']['family'], "Googlebot" if "Googlebot" in user_agent else "Firefox")
+        l1_hits, l1_misses = self.test_object.cache_counters['l1']
+        l2_hits, l2_misses = self.test_object.cache_counters['l2']
+        self.assertEqual([stats_collector.getCounter(name) for name in [l1_hits, l1_misses, l2_hits, l2_misses]], [1, 3, 1, 2])
+
+    def testSharedMemoryCacheIsSharedWithForkedProcesses(self):
+        cache = Utils.SharedMemoryCache(size=16, slot_size=128)
+        process = multiprocessing.Process(target=cache.set, args=(u'Spam', {'family': u'Eggs', 'major': None}))
+        process.start()
+        process.join()
+        self.assertEqual(cache.get('Spam'), {'family': u'Eggs', 'major': None})
+        self.assertFalse(cache.set('Spam', 'Eggs' * 100))
+        self.assertRaises(KeyError, cache.get, 'Bacon')
+        cache.unset('Spam')
+        self.assertRaises(KeyError, cache.get, 'Spam')
+
     def tearDown(self):
         pass
 
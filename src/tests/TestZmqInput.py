@@ -6,6 +6,7 @@ import socket
 import zmq
 import extendSysPath
 import Zmq
+import ZmqSink
 import Utils
 
 
@@ -14,6 +15,17 @@ class TestZmqInput(ModuleBaseTestCase.ModuleBaseTestCase):
     def setUp(self):
         super(TestZmqInput, self).setUp(Zmq.Zmq(gp=mock.Mock()))
 
+    def tearDown(self):
+        ModuleBaseTestCase.ModuleBaseTestCase.tearDown(self)
+        # The module thread closes its socket on its own, wait for it before the next test starts.
+        if self.test_object.is_alive():
+            self.test_object.join()
+
+    def waitForEvents(self, count, timeout=10):
+        wait_until = time.time() + timeout
+        while len(self.receiver.events) < count and time.time() < wait_until:
+            time.sleep(.01)
+
     def testZmqPull(self):
         ipaddr, port = self.getFreePortoOLocalhost()
         self.test_object.configure({'address': '%s:%s' % (ipaddr, port),
@@ -28,7 +40,7 @@ class TestZmqInput(ModuleBaseTestCase.ModuleBaseTestCase):
         expected_ret_val = Utils.getDefaultEventDict({'data': 'A comfy chair is not an effective method of torture!'})
         expected_ret_val.pop('gambolputty')
         event = False
-        time.sleep(.1)
+        self.waitForEvents(5000)
         counter = 0
         for event in self.receiver.getEvent():
             counter += 1
@@ -45,8 +57,12 @@ class TestZmqInput(ModuleBaseTestCase.ModuleBaseTestCase):
         self.test_object.start()
         message = 'Test A comfy chair is not an effective method of torture!'
         sender = self.getZmqSocket(ipaddr, port, 'pub')
-        for _ in range(0, 5000):
-            sender.send(message)
+        # Messages published before the subscription arrived are dropped, publish until the first ones arrive.
+        wait_until = time.time() + 10
+        while not self.receiver.hasEvents() and time.time() < wait_until:
+            for _ in range(0, 100):
+                sender.send(message)
+            time.sleep(.01)
         sender.close()
         expected_ret_val = Utils.getDefaultEventDict({'data': 'A comfy chair is not an effective method of torture!',
                                                       'topic': 'Test'})
@@ -91,7 +107,66 @@ class TestZmqInput(ModuleBaseTestCase.ModuleBaseTestCase):
         expected_ret_val.pop('gambolputty')
         self.assertTrue(self.receiver.hasEvents() is False)
 
+    def testZmqPullBatch(self):
+        ipaddr, port = self.getFreePortoOLocalhost()
+        self.test_object.configure({'address': '%s:%s' % (ipaddr, port),
+                                    'pattern': 'pull'})
+        self.checkConfiguration()
+        self.test_object.start()
+        events = [Utils.getDefaultEventDict({'data': 'A comfy chair is not an effective method of torture!', 'count': idx}) for idx in xrange(0, 500)]
+        sender = self.getZmqSocket(ipaddr, port, 'push')
+        for _ in range(0, 10):
+            sender.send_multipart(Utils.packZmqBatch(events))
+        # Formatted strings are set as event data.
+        sender.send_multipart(Utils.packZmqBatch(['Spam', 'Eggs']))
+        self.waitForEvents(5002)
+        sender.close()
+        received_events = list(self.receiver.getEvent())
+        self.assertEqual(len(received_events), 5002)
+        # Events keep their metadata.
+        self.assertEqual(received_events[499]['gambolputty']['event_id'], events[499]['gambolputty']['event_id'])
+        self.assertEqual(received_events[499]['count'], 499)
+        self.assertEqual([event['data'] for event in received_events[-2:]], ['Spam', 'Eggs'])
+
+    def testZmqSubBatchWithTopic(self):
+        ipaddr, port = self.getFreePortoOLocalhost()
+        self.test_object.configure({'address': '%s:%s' % (ipaddr, port),
+                                    'pattern': 'sub',
+                                    'topic': 'Test'})
+        self.checkConfiguration()
+        self.test_object.start()
+        sender = self.getZmqSocket(ipaddr, port, 'pub')
+        # Messages published before the subscription arrived are dropped.
+        time.sleep(.2)
+        events = [Utils.getDefaultEventDict({'data': 'A comfy chair is not an effective method of torture!'})]
+        for _ in range(0, 100):
+            sender.send_multipart(Utils.packZmqBatch(events, 'Test'))
+            sender.send_multipart(Utils.packZmqBatch(events, 'NotThere'))
+        time.sleep(.2)
+        sender.close()
+        self.assertTrue(self.receiver.hasEvents())
+        for event in self.receiver.getEvent():
+            self.assertEqual(event['topic'], 'Test')
 
+    def testZmqSinkRoundTrip(self):
+        ipaddr, port = self.getFreePortoOLocalhost()
+        self.test_object.configure({'address': '%s:%s' % (ipaddr, port),
+                                    'pattern': 'pull'})
+        self.checkConfiguration()
+        self.test_object.start()
+        zmq_sink = ZmqSink.ZmqSink(gp=mock.Mock())
+        zmq_sink.configure({'server': '%s:%s' % (ipaddr, port),
+                            'batch_size': 100,
+                            'send_batches': True})
+        zmq_sink.initAfterFork()
+        for idx in range(0, 1000):
+            for _ in zmq_sink.handleEvent(Utils.getDefaultEventDict({'data': 'Spam', 'count': idx})):
+                pass
+        self.waitForEvents(1000)
+        zmq_sink.shutDown()
+        received_events = list(self.receiver.getEvent())
+        self.assertEqual(len(received_events), 1000)
+        self.assertEqual([event['count'] for event in received_events], range(0, 1000))
 
     def getZmqSocket(self, host, port, mode):
         context = zmq.Context()